@@ -1,12 +1,25 @@
 """Admin API endpoints."""
+from typing import Optional
+
 from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import PlainTextResponse
 from pydantic import BaseModel
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.db.models import User
 from app.dependencies.admin import require_admin
 from app.dependencies import get_db
+from app.dependencies.read_db import get_read_db
+from app.db import pool_monitor, replica
+from app.services import data_lifecycle, profiler, retention_service, session_manager, tracing
 from app.services.admin_service import AdminService
 from app.services.metrics_collector import MetricsCollector
+from app.services.metrics_store import fleet_collector
+from app.services.overload import overload_controller
+from app.services.job_store import JobStore, job_to_dict
+from app.services.retention_service import RetentionService
+from app.services.session_manager import SessionManager
+from app.services.stats_service import StatsService
+from app.services.usage_tracker import UsageService
 
 router = APIRouter(prefix="/admin", tags=["管理"])
 
@@ -16,30 +29,47 @@ router = APIRouter(prefix="/admin", tags=["管理"])
 @router.get("/dashboard")
 async def get_dashboard(
     admin: User = Depends(require_admin),
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
 ):
     svc = AdminService(db)
     return await svc.get_dashboard_stats()
 
 
+@router.post("/dashboard/refresh")
+async def refresh_dashboard(
+    admin: User = Depends(require_admin),
+    db: AsyncSession = Depends(get_db),
+):
+    return await StatsService(db).refresh_dashboard_stats()
+
+
 # --- Users ---
 
 @router.get("/users")
 async def list_users(
     limit: int = 50,
     offset: int = 0,
+    sort: str = "created_at",
+    order: str = "desc",
+    cursor: Optional[str] = None,
     admin: User = Depends(require_admin),
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
 ):
     svc = AdminService(db)
-    return await svc.get_user_list(limit=limit, offset=offset)
+    try:
+        return await svc.get_user_list(
+            limit=max(1, min(limit, 200)), offset=max(0, offset),
+            sort=sort, order=order, cursor=cursor,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 
 @router.get("/users/{user_id}")
 async def get_user_detail(
     user_id: str,
     admin: User = Depends(require_admin),
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
 ):
     svc = AdminService(db)
     result = await svc.get_user_detail(user_id)
@@ -74,7 +104,7 @@ async def update_user(
 
 # --- User data management ---
 
-@router.delete("/users/{user_id}")
+@router.delete("/users/{user_id}", status_code=202)
 async def delete_user(
     user_id: str,
     admin: User = Depends(require_admin),
@@ -90,7 +120,7 @@ async def delete_user(
     return result
 
 
-@router.delete("/users/{user_id}/data")
+@router.delete("/users/{user_id}/data", status_code=202)
 async def clear_user_data(
     user_id: str,
     admin: User = Depends(require_admin),
@@ -103,6 +133,18 @@ async def clear_user_data(
     return result
 
 
+@router.get("/data-jobs/{job_id}")
+async def get_data_job(
+    job_id: str,
+    admin: User = Depends(require_admin),
+    db: AsyncSession = Depends(get_db),
+):
+    job = await data_lifecycle.get_job_status(db, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return {**job_to_dict(job), "running": data_lifecycle.is_running()}
+
+
 # --- Reset ---
 
 @router.delete("/reset-all")
@@ -111,8 +153,93 @@ async def reset_all_data(
     db: AsyncSession = Depends(get_db),
 ):
     svc = AdminService(db)
-    deleted = await svc.reset_all_data()
-    return {"deleted": deleted}
+    return await svc.reset_all_data()
+
+
+# --- Retention ---
+
+@router.get("/retention/preview")
+async def preview_retention(
+    days: int | None = None,
+    admin: User = Depends(require_admin),
+    db: AsyncSession = Depends(get_db),
+):
+    svc = RetentionService(db)
+    result = await svc.preview(days=days)
+    result["running"] = retention_service.is_running()
+    return result
+
+
+@router.post("/retention/run")
+async def run_retention(
+    days: int | None = None,
+    mode: str | None = None,
+    admin: User = Depends(require_admin),
+):
+    if mode is not None and mode not in retention_service.RETENTION_MODES:
+        raise HTTPException(status_code=400, detail=f"Unknown mode: {mode}")
+    if not retention_service.trigger_retention_job(days=days, mode=mode):
+        raise HTTPException(status_code=409, detail="Retention job already running")
+    return {"started": True}
+
+
+@router.get("/retention/status")
+async def get_retention_status(
+    admin: User = Depends(require_admin),
+):
+    return {
+        "running": retention_service.is_running(),
+        "last_run": retention_service.get_last_report(),
+    }
+
+
+# --- Session cleanup ---
+
+@router.get("/sessions/cleanup/preview")
+async def preview_session_cleanup(
+    days: int | None = None,
+    admin: User = Depends(require_admin),
+    db: AsyncSession = Depends(get_db),
+):
+    result = await SessionManager(db).cleanup_old_sessions(days=days, dry_run=True)
+    result["running"] = session_manager.is_cleanup_running()
+    return result
+
+
+@router.post("/sessions/cleanup/run")
+async def run_session_cleanup(
+    days: int | None = None,
+    admin: User = Depends(require_admin),
+):
+    if not session_manager.trigger_session_cleanup_job(days=days):
+        raise HTTPException(status_code=409, detail="Session cleanup already running")
+    return {"started": True}
+
+
+# --- LLM usage ---
+
+@router.get("/usage/top-users")
+async def get_top_usage_users(
+    days: int = 7,
+    limit: int = 20,
+    order_by: str = "total_tokens",
+    admin: User = Depends(require_admin),
+    db: AsyncSession = Depends(get_read_db),
+):
+    try:
+        return await UsageService(db).top_users(days=days, limit=limit, order_by=order_by)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get("/usage/users/{user_id}")
+async def get_user_usage(
+    user_id: str,
+    days: int = 30,
+    admin: User = Depends(require_admin),
+    db: AsyncSession = Depends(get_read_db),
+):
+    return await UsageService(db).user_usage(user_id, days=days)
 
 
 # --- System ---
@@ -138,6 +265,7 @@ async def get_system_health(
         "uptime_seconds": round(collector.get_uptime()),
         "neuromemory_version": neuromemory.__version__,
         "db_pool": pool_info,
+        "read_replica": replica.status(),
     }
 
 
@@ -146,7 +274,7 @@ async def get_api_stats(
     hours: int = 24,
     admin: User = Depends(require_admin),
 ):
-    collector = MetricsCollector()
+    collector, _ = await fleet_collector(("api", "streams"))
     return collector.get_api_stats(last_seconds=hours * 3600)
 
 
@@ -155,7 +283,7 @@ async def get_llm_stats(
     hours: int = 24,
     admin: User = Depends(require_admin),
 ):
-    collector = MetricsCollector()
+    collector, _ = await fleet_collector(("llm",))
     return collector.get_llm_stats(last_seconds=hours * 3600)
 
 
@@ -164,5 +292,92 @@ async def get_embedding_stats(
     hours: int = 24,
     admin: User = Depends(require_admin),
 ):
-    collector = MetricsCollector()
+    collector, _ = await fleet_collector(("embedding",))
     return collector.get_embedding_stats(last_seconds=hours * 3600)
+
+
+@router.get("/system/recall-stats")
+async def get_recall_stats(
+    hours: int = 24,
+    admin: User = Depends(require_admin),
+):
+    collector, _ = await fleet_collector(("recall",))
+    return collector.get_recall_stats(last_seconds=hours * 3600)
+
+
+@router.get("/system/traces")
+async def get_traces(
+    limit: int = 20,
+    admin: User = Depends(require_admin),
+):
+    return {"traces": tracing.recent_traces(limit=limit)}
+
+
+@router.post("/system/profile")
+async def run_profile(
+    seconds: float = 10,
+    hz: int = 100,
+    all_threads: bool = False,
+    format: str = "json",
+    admin: User = Depends(require_admin),
+):
+    # 只采样处理本请求的 worker 进程；format=collapsed 可直接交给 flamegraph.pl / speedscope
+    try:
+        result = await profiler.profile(seconds=seconds, hz=hz, all_threads=all_threads)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    if format == "collapsed":
+        return PlainTextResponse(result.collapsed())
+    return result.to_dict()
+
+
+@router.get("/system/loop-lag")
+async def get_loop_lag(
+    limit: int = 20,
+    admin: User = Depends(require_admin),
+):
+    monitor = profiler.loop_monitor
+    return {**monitor.stats(limit=limit), "top_frames": monitor.top_frames()}
+
+
+@router.get("/system/overload")
+async def get_overload(admin: User = Depends(require_admin)):
+    # 本 worker 的降级级别与信号（多 worker 时各自独立）
+    return overload_controller.status()
+
+
+@router.get("/system/job-stats")
+async def get_job_stats(
+    hours: int = 24,
+    admin: User = Depends(require_admin),
+    db: AsyncSession = Depends(get_db),
+):
+    stats = MetricsCollector().get_job_stats(last_seconds=hours * 3600)
+    stats["recent"] = [job_to_dict(j) for j in await JobStore(db).list_recent()]
+    return stats
+
+
+@router.get("/system/cache-stats")
+async def get_cache_stats(
+    admin: User = Depends(require_admin),
+):
+    collector, _ = await fleet_collector(())
+    return collector.get_cache_stats()
+
+
+@router.get("/system/db-pools")
+async def get_db_pools(
+    admin: User = Depends(require_admin),
+):
+    return await pool_monitor.pool_report()
+
+
+@router.get("/system/slow-queries")
+async def get_slow_queries(
+    limit: int = 20,
+    order_by: str = "total",
+    admin: User = Depends(require_admin),
+):
+    return MetricsCollector().get_sql_stats(limit=limit, order_by=order_by)
@@ -1,15 +1,42 @@
 """认证 API 端点"""
-from fastapi import APIRouter, Depends, HTTPException, status, Response
+import math
+from fastapi import APIRouter, Depends, HTTPException, Request, status, Response
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from pydantic import BaseModel, EmailStr
 from datetime import datetime
+from app.config import settings
 from app.dependencies import get_db
-from app.services.auth_service import get_password_hash, verify_password, create_access_token
+from app.services.auth_service import (
+    PasswordHashBusy, get_password_hash_async, verify_password_async, create_access_token,
+)
+from app.services.rate_limiter import RateLimiter, client_ip
 from app.db.models import User
 
 router = APIRouter(prefix="/auth", tags=["认证"])
 
+# 撞库等突发请求在进入 bcrypt 之前就被拒绝，避免占满哈希线程池
+ip_limiter = RateLimiter("auth_ip", settings.LOGIN_RATE_LIMIT_PER_IP, period=60)
+username_limiter = RateLimiter("auth_username", settings.LOGIN_RATE_LIMIT_PER_USERNAME, period=60)
+
+
+def _check_rate_limit(limiter: RateLimiter, key: str) -> None:
+    retry_after = limiter.hit(key)
+    if retry_after > 0:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="尝试次数过多，请稍后再试",
+            headers={"Retry-After": str(math.ceil(retry_after))},
+        )
+
+
+def _hash_busy() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="服务繁忙，请稍后再试",
+        headers={"Retry-After": "1"},
+    )
+
 
 class RegisterRequest(BaseModel):
     """注册请求"""
@@ -38,8 +65,10 @@ async def options_handler():
 
 
 @router.post("/register", response_model=TokenResponse)
-async def register(req: RegisterRequest, db: AsyncSession = Depends(get_db)):
+async def register(req: RegisterRequest, request: Request, db: AsyncSession = Depends(get_db)):
     """用户注册"""
+    _check_rate_limit(ip_limiter, client_ip(request))
+
     # 检查用户名是否已存在
     result = await db.execute(select(User).where(User.username == req.username))
     if result.scalar_one_or_none():
@@ -51,10 +80,14 @@ async def register(req: RegisterRequest, db: AsyncSession = Depends(get_db)):
         raise HTTPException(status_code=400, detail="邮箱已被使用")
 
     # 创建用户
+    try:
+        hashed_password = await get_password_hash_async(req.password)
+    except PasswordHashBusy:
+        raise _hash_busy()
     user = User(
         username=req.username,
         email=req.email,
-        hashed_password=get_password_hash(req.password)
+        hashed_password=hashed_password
     )
     db.add(user)
     await db.commit()
@@ -66,12 +99,22 @@ async def register(req: RegisterRequest, db: AsyncSession = Depends(get_db)):
 
 
 @router.post("/login", response_model=TokenResponse)
-async def login(req: LoginRequest, db: AsyncSession = Depends(get_db)):
+async def login(req: LoginRequest, request: Request, db: AsyncSession = Depends(get_db)):
     """用户登录"""
+    _check_rate_limit(ip_limiter, client_ip(request))
+    _check_rate_limit(username_limiter, req.username.lower())
+
     result = await db.execute(select(User).where(User.username == req.username))
     user = result.scalar_one_or_none()
 
-    if not user or not verify_password(req.password, user.hashed_password):
+    password_ok = False
+    if user:
+        try:
+            password_ok = await verify_password_async(req.password, user.hashed_password)
+        except PasswordHashBusy:
+            raise _hash_busy()
+
+    if not password_ok:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="用户名或密码错误"
@@ -6,10 +6,16 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, desc, func as sql_func, or_, case
 from typing import Optional, List
 from datetime import datetime
+from app.config import settings
 from app.db.models import User, Session, Message
+from app.db.database import AsyncSessionLocal
 from app.dependencies import get_db
+from app.dependencies.read_db import get_read_db
 from app.dependencies.auth import get_current_user
 from app.services.conversation_engine import conversation_engine
+from app.services.overload import overload_controller
+from app.services.retention_service import decompress_debug_payload
+from app.services.archive_service import ArchiveService
 import logging
 import json
 
@@ -32,6 +38,7 @@ class ChatResponse(BaseModel):
     memories_recalled: int
     insights_used: int
     history_messages_count: int = 0
+    degradation_level: int = 0  # 过载降级级别（0 为正常，见 overload.py）
     debug_info: Optional[dict] = None  # 调试信息（仅debug_mode=True时返回）
 
 
@@ -88,6 +95,12 @@ def _build_debug_info(msg) -> Optional[dict]:
         return None
     meta = msg.meta
     timings = meta.get("timings")
+    system_prompt = msg.system_prompt
+    # 超过保留期的调试数据已压缩归档（见 retention_service）
+    if not timings and getattr(msg, "debug_archive", None):
+        archived = decompress_debug_payload(msg.debug_archive)
+        timings = archived.get("timings")
+        system_prompt = archived.get("system_prompt")
     if not timings:
         return None
     return {
@@ -95,7 +108,8 @@ def _build_debug_info(msg) -> Optional[dict]:
         "temperature": meta.get("temperature"),
         "max_tokens": meta.get("max_tokens"),
         "history_count": meta.get("history_messages_count", 0),
-        "system_prompt": msg.system_prompt,
+        "degradation_level": meta.get("degradation_level", 0),
+        "system_prompt": system_prompt,
         "timings": timings,
     }
 
@@ -125,6 +139,45 @@ def _get_pinned(session: Session) -> bool:
     return False
 
 
+async def _count_messages(db: AsyncSession, session: Session) -> int:
+    """会话消息数（已归档会话从 messages_archive 读取）"""
+    if session.archived_at is not None:
+        return await ArchiveService(db).archived_message_count(session.id)
+    result = await db.execute(
+        select(sql_func.count(Message.id)).where(Message.session_id == session.id)
+    )
+    return result.scalar() or 0
+
+
+async def _load_messages(db: AsyncSession, session: Session) -> List[Message]:
+    """按时间顺序读取会话消息
+
+    冷会话需要先回填（写操作）；只读副本上的会话改用主库完成回填和读取。
+    """
+    if session.archived_at is not None and db.info.get("replica"):
+        async with AsyncSessionLocal() as primary:
+            primary_session = await primary.get(Session, session.id)
+            if primary_session is None:
+                return []
+            return await _load_messages(primary, primary_session)
+
+    await ArchiveService(db).ensure_hot(session)
+    result = await db.execute(
+        select(Message).where(Message.session_id == session.id).order_by(Message.created_at)
+    )
+    return list(result.scalars().all())
+
+
+def _reject_if_overloaded() -> None:
+    """过载到最高级时拒绝新对话（503），在召回记忆和调用 LLM 之前"""
+    if overload_controller.should_shed():
+        raise HTTPException(
+            status_code=503,
+            detail="服务繁忙，请稍后再试",
+            headers={"Retry-After": str(settings.OVERLOAD_COOLDOWN)},
+        )
+
+
 @router.post("/sessions", response_model=SessionResponse)
 async def create_session(
     request: SessionCreate,
@@ -162,7 +215,7 @@ async def create_session(
 async def search_sessions(
     q: str = Query(..., min_length=1),
     current_user: User = Depends(get_current_user),
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
     """按 title 和消息 content 模糊搜索会话"""
     try:
@@ -200,11 +253,7 @@ async def search_sessions(
 
         session_responses = []
         for session in sessions:
-            msg_count_stmt = select(sql_func.count(Message.id)).where(
-                Message.session_id == session.id
-            )
-            msg_result = await db.execute(msg_count_stmt)
-            message_count = msg_result.scalar() or 0
+            message_count = await _count_messages(db, session)
 
             session_responses.append(SessionResponse(
                 id=session.id,
@@ -225,7 +274,7 @@ async def search_sessions(
 @router.get("/sessions", response_model=List[SessionResponse])
 async def list_sessions(
     current_user: User = Depends(get_current_user),
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
     """获取用户的会话列表（置顶会话排前面）"""
     try:
@@ -239,11 +288,7 @@ async def list_sessions(
         # 获取每个会话的消息数量
         session_responses = []
         for session in sessions:
-            msg_count_stmt = select(sql_func.count(Message.id)).where(
-                Message.session_id == session.id
-            )
-            msg_result = await db.execute(msg_count_stmt)
-            message_count = msg_result.scalar() or 0
+            message_count = await _count_messages(db, session)
 
             session_responses.append(SessionResponse(
                 id=session.id,
@@ -268,7 +313,7 @@ async def list_sessions(
 async def get_session_messages(
     session_id: str,
     current_user: User = Depends(get_current_user),
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
     """获取会话的消息历史"""
     try:
@@ -283,13 +328,8 @@ async def get_session_messages(
         if not session:
             raise HTTPException(status_code=404, detail="会话不存在")
 
-        # 获取消息列表
-        msg_stmt = select(Message).where(
-            Message.session_id == session_id
-        ).order_by(Message.created_at)
-
-        msg_result = await db.execute(msg_stmt)
-        messages = msg_result.scalars().all()
+        # 获取消息列表（冷会话先回填）
+        messages = await _load_messages(db, session)
 
         return [MessageResponse(
             id=msg.id,
@@ -314,7 +354,7 @@ async def get_session_messages(
 async def export_session(
     session_id: str,
     current_user: User = Depends(get_current_user),
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
     """导出会话（session + messages JSON）"""
     try:
@@ -328,12 +368,8 @@ async def export_session(
         if not session:
             raise HTTPException(status_code=404, detail="会话不存在")
 
-        # 获取消息
-        msg_stmt = select(Message).where(
-            Message.session_id == session_id
-        ).order_by(Message.created_at)
-        msg_result = await db.execute(msg_stmt)
-        messages = msg_result.scalars().all()
+        # 获取消息（冷会话先回填）
+        messages = await _load_messages(db, session)
 
         # 消息数量
         message_count = len(messages)
@@ -398,11 +434,7 @@ async def update_session(
         await db.commit()
         await db.refresh(session)
 
-        msg_count_stmt = select(sql_func.count(Message.id)).where(
-            Message.session_id == session.id
-        )
-        msg_result = await db.execute(msg_count_stmt)
-        message_count = msg_result.scalar() or 0
+        message_count = await _count_messages(db, session)
 
         return SessionResponse(
             id=session.id,
@@ -471,6 +503,8 @@ async def generate_title(
         if not session:
             raise HTTPException(status_code=404, detail="会话不存在")
 
+        await ArchiveService(db).ensure_hot(session)
+
         # 获取第一条用户消息
         msg_stmt = select(Message).where(
             Message.session_id == session_id,
@@ -513,6 +547,7 @@ async def chat(
     需要 JWT 认证。user_id 从 token 中获取。
     如果不提供 session_id，会自动创建新会话。
     """
+    _reject_if_overloaded()
     try:
         # 如果没有提供 session_id，创建新会话
         session_id = request.session_id
@@ -534,6 +569,9 @@ async def chat(
             if not session:
                 raise HTTPException(status_code=404, detail="会话不存在")
 
+            # 冷会话先回填消息，对话历史才完整
+            await ArchiveService(db).ensure_hot(session)
+
         # 调用对话引擎
         result = await conversation_engine.chat(
             user_id=current_user.id,
@@ -551,7 +589,8 @@ async def chat(
             session_id=session_id,
             memories_recalled=result["memories_recalled"],
             insights_used=result["insights_used"],
-            history_messages_count=result.get("history_messages_count", 0)
+            history_messages_count=result.get("history_messages_count", 0),
+            degradation_level=result.get("degradation_level", 0),
         )
 
         # 添加调试信息
@@ -582,6 +621,9 @@ async def chat_stream(
     - done: 生成完成，包含完整响应和调试信息
     - error: 错误信息
     """
+    # SSE 一旦开始状态码就是 200，过载拒绝必须在返回 StreamingResponse 之前
+    _reject_if_overloaded()
+
     async def event_generator():
         try:
             # 验证或创建会话
@@ -603,6 +645,7 @@ async def chat_stream(
                 if not session:
                     yield f"data: {json.dumps({'type': 'error', 'error': '会话不存在'})}\n\n"
                     return
+                await ArchiveService(db).ensure_hot(session)
 
             # 调用流式对话引擎
             async for chunk in conversation_engine.chat_stream(
@@ -619,11 +662,8 @@ async def chat_stream(
                 elif isinstance(chunk, dict):
                     # 完成事件：注入 session_title 和 is_new_session
                     if chunk.get("type") == "done":
-                        # 获取会话标题
-                        sess_stmt = select(Session).where(Session.id == session_id)
-                        sess_result = await db.execute(sess_stmt)
-                        sess = sess_result.scalar_one_or_none()
-                        chunk["session_title"] = sess.title if sess else None
+                        # 会话标题复用上面鉴权时取到的 Session，不再额外查询
+                        chunk["session_title"] = session.title
                         chunk["is_new_session"] = is_new_session
                     yield f"data: {json.dumps(chunk)}\n\n"
 
@@ -8,11 +8,17 @@ from app.config import settings
 # 创建异步引擎
 engine = create_async_engine(
     settings.DATABASE_URL,
-    echo=settings.DEBUG,
+    echo=settings.SQL_ECHO,
     future=True,
     pool_pre_ping=True,
-    pool_size=10,
-    max_overflow=20,
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
+    pool_timeout=settings.DB_POOL_TIMEOUT,
+    # pg_stat_activity 中区分 Me2 与 NeuroMemory 的连接（/admin/system/db-pools）
+    connect_args=(
+        {"server_settings": {"application_name": "me2"}}
+        if settings.DATABASE_URL.startswith("postgresql+asyncpg") else {}
+    ),
 )
 
 # 创建会话工厂
@@ -45,4 +51,6 @@ async def init_db():
 
 async def close_db():
     """关闭数据库连接"""
+    from app.db.replica import close_replica
     await engine.dispose()
+    await close_replica()
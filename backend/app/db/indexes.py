@@ -0,0 +1,287 @@
+"""
+托管索引
+
+集中声明 Me2 热点查询需要的复合索引，并提供：
+- ensure_indexes(): 以 CREATE INDEX CONCURRENTLY 幂等创建（不阻塞写入），
+  并重建之前 CONCURRENTLY 失败留下的 INVALID 索引
+- check_hot_queries(): 对每个热点查询执行 EXPLAIN，标记大表上的顺序扫描
+
+命令行入口见 backend/manage.py（python manage.py indexes [--check]）。
+新库通过 models.py 中的 __table_args__ 由 create_all 直接建好同名索引。
+"""
+import json
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Optional
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class IndexSpec:
+    """索引定义"""
+    name: str
+    table: str
+    columns: tuple[str, ...]
+    unique: bool = False
+    where: Optional[str] = None
+    reason: str = ""
+
+    def create_sql(self, concurrently: bool = True) -> str:
+        unique = "UNIQUE " if self.unique else ""
+        conc = "CONCURRENTLY " if concurrently else ""
+        sql = (
+            f"CREATE {unique}INDEX {conc}IF NOT EXISTS {self.name} "
+            f"ON {self.table} ({', '.join(self.columns)})"
+        )
+        if self.where:
+            sql += f" WHERE {self.where}"
+        return sql
+
+
+@dataclass(frozen=True)
+class HotQuery:
+    """需要走索引的热点查询（使用固定样例参数做 EXPLAIN）"""
+    name: str
+    sql: str
+    source: str = ""
+
+
+# 与 models.py __table_args__ 保持一致
+MANAGED_INDEXES: list[IndexSpec] = [
+    IndexSpec(
+        name="ix_messages_session_created",
+        table="messages",
+        columns=("session_id", "created_at"),
+        reason="会话历史：WHERE session_id ORDER BY created_at",
+    ),
+    IndexSpec(
+        name="ix_messages_user_created",
+        table="messages",
+        columns=("user_id", "created_at"),
+        reason="管理后台按用户统计消息、会话内容搜索",
+    ),
+    IndexSpec(
+        name="ix_sessions_user_last_active",
+        table="sessions",
+        columns=("user_id", "last_active_at"),
+        reason="会话列表：WHERE user_id ORDER BY last_active_at DESC",
+    ),
+]
+
+# 被上面复合索引覆盖（前缀列相同）的旧单列索引，仅在 --drop-redundant 时删除
+REDUNDANT_INDEXES: list[str] = [
+    "ix_messages_session_id",
+    "ix_sessions_user_id",
+]
+
+_SAMPLE_ID = "'00000000-0000-0000-0000-000000000000'"
+
+HOT_QUERIES: list[HotQuery] = [
+    HotQuery(
+        name="chat_history",
+        sql=f"SELECT * FROM messages WHERE session_id = {_SAMPLE_ID} "
+            f"ORDER BY created_at ASC LIMIT 20",
+        source="ConversationEngine.chat / chat_stream",
+    ),
+    HotQuery(
+        name="session_messages",
+        sql=f"SELECT * FROM messages WHERE session_id = {_SAMPLE_ID} ORDER BY created_at",
+        source="GET /chat/sessions/{id}/messages",
+    ),
+    HotQuery(
+        name="session_message_count",
+        sql=f"SELECT count(id) FROM messages WHERE session_id = {_SAMPLE_ID}",
+        source="GET /chat/sessions",
+    ),
+    HotQuery(
+        name="session_list",
+        sql=f"SELECT * FROM sessions WHERE user_id = {_SAMPLE_ID} "
+            f"ORDER BY last_active_at DESC",
+        source="GET /chat/sessions",
+    ),
+    HotQuery(
+        name="session_first_user_message",
+        sql=f"SELECT * FROM messages WHERE session_id = {_SAMPLE_ID} AND role = 'user' "
+            f"ORDER BY created_at LIMIT 1",
+        source="POST /chat/sessions/{id}/generate-title",
+    ),
+    HotQuery(
+        name="admin_user_message_count",
+        sql=f"SELECT count(id) FROM messages WHERE user_id = {_SAMPLE_ID}",
+        source="AdminService.get_user_list / get_user_detail",
+    ),
+    HotQuery(
+        name="admin_user_session_count",
+        sql=f"SELECT count(id) FROM sessions WHERE user_id = {_SAMPLE_ID}",
+        source="AdminService.get_user_list / get_user_detail",
+    ),
+    HotQuery(
+        name="admin_messages_7d",
+        sql="SELECT count(id) FROM messages WHERE created_at >= now() - interval '7 days'",
+        source="StatsService.compute_dashboard_stats",
+    ),
+    HotQuery(
+        name="session_content_search",
+        sql=f"SELECT DISTINCT session_id FROM messages WHERE user_id = {_SAMPLE_ID} "
+            f"AND content ILIKE '%keyword%'",
+        source="GET /chat/sessions/search",
+    ),
+    HotQuery(
+        name="retention_pending",
+        sql="SELECT id FROM messages WHERE role = 'assistant' "
+            "AND created_at < now() - interval '30 days' "
+            "AND system_prompt IS NOT NULL ORDER BY created_at, id LIMIT 500",
+        source="RetentionService.run",
+    ),
+]
+
+
+@dataclass
+class IndexResult:
+    name: str
+    status: str  # "created" | "exists" | "rebuilt" | "dropped" | "failed"
+    detail: str = ""
+
+
+@dataclass
+class QueryCheck:
+    name: str
+    source: str
+    seq_scans: list[dict[str, Any]] = field(default_factory=list)
+    indexes_used: list[str] = field(default_factory=list)
+    total_cost: float = 0.0
+    error: Optional[str] = None
+
+    @property
+    def flagged(self) -> bool:
+        return bool(self.seq_scans) or self.error is not None
+
+
+async def _index_state(conn, name: str) -> Optional[bool]:
+    """返回索引是否有效；不存在时返回 None"""
+    result = await conn.execute(
+        text(
+            "SELECT i.indisvalid FROM pg_index i "
+            "JOIN pg_class c ON c.oid = i.indexrelid "
+            "WHERE c.relname = :name"
+        ),
+        {"name": name},
+    )
+    row = result.first()
+    return None if row is None else bool(row[0])
+
+
+async def ensure_indexes(
+    engine: AsyncEngine,
+    specs: Optional[list[IndexSpec]] = None,
+    drop_redundant: bool = False,
+) -> list[IndexResult]:
+    """幂等创建托管索引
+
+    CREATE INDEX CONCURRENTLY 不能在事务中执行，这里使用 AUTOCOMMIT 连接。
+    """
+    specs = specs if specs is not None else MANAGED_INDEXES
+    results: list[IndexResult] = []
+
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+
+        for spec in specs:
+            try:
+                state = await _index_state(conn, spec.name)
+                if state is True:
+                    results.append(IndexResult(spec.name, "exists"))
+                    continue
+                if state is False:
+                    # 上次 CONCURRENTLY 构建中断留下的 INVALID 索引
+                    await conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {spec.name}"))
+                await conn.execute(text(spec.create_sql(concurrently=True)))
+                results.append(IndexResult(spec.name, "rebuilt" if state is False else "created"))
+                logger.info(f"索引就绪: {spec.name}")
+            except Exception as e:
+                logger.warning(f"创建索引 {spec.name} 失败: {e}")
+                results.append(IndexResult(spec.name, "failed", str(e)))
+
+        if drop_redundant:
+            for name in REDUNDANT_INDEXES:
+                try:
+                    if await _index_state(conn, name) is None:
+                        continue
+                    await conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+                    results.append(IndexResult(name, "dropped"))
+                except Exception as e:
+                    results.append(IndexResult(name, "failed", str(e)))
+
+    return results
+
+
+def _walk_plan(node: dict[str, Any], visit) -> None:
+    visit(node)
+    for child in node.get("Plans", []) or []:
+        _walk_plan(child, visit)
+
+
+async def _table_rows(conn, table: str) -> float:
+    result = await conn.execute(
+        text("SELECT reltuples FROM pg_class WHERE relname = :t AND relkind IN ('r', 'p')"),
+        {"t": table},
+    )
+    row = result.first()
+    return float(row[0]) if row and row[0] is not None else 0.0
+
+
+async def check_hot_queries(
+    engine: AsyncEngine,
+    queries: Optional[list[HotQuery]] = None,
+    min_rows: int = 1000,
+) -> list[QueryCheck]:
+    """对热点查询执行 EXPLAIN，标记行数 >= min_rows 的表上的顺序扫描
+
+    小表上的 Seq Scan 是优化器的正常选择，不算问题。
+    """
+    queries = queries if queries is not None else HOT_QUERIES
+    checks: list[QueryCheck] = []
+
+    async with engine.connect() as conn:
+        row_cache: dict[str, float] = {}
+
+        for q in queries:
+            check = QueryCheck(name=q.name, source=q.source)
+            try:
+                result = await conn.execute(text(f"EXPLAIN (FORMAT JSON) {q.sql}"))
+                raw = result.scalar()
+                plan_doc = json.loads(raw) if isinstance(raw, str) else raw
+                plan = plan_doc[0]["Plan"]
+                check.total_cost = float(plan.get("Total Cost", 0))
+
+                seq_nodes: list[dict[str, Any]] = []
+
+                def visit(node):
+                    node_type = node.get("Node Type", "")
+                    if node_type == "Seq Scan":
+                        seq_nodes.append(node)
+                    elif "Index" in node_type and node.get("Index Name"):
+                        check.indexes_used.append(node["Index Name"])
+
+                _walk_plan(plan, visit)
+
+                for node in seq_nodes:
+                    table = node.get("Relation Name", "")
+                    if table not in row_cache:
+                        row_cache[table] = await _table_rows(conn, table)
+                    if row_cache[table] >= min_rows:
+                        check.seq_scans.append({
+                            "table": table,
+                            "estimated_table_rows": int(row_cache[table]),
+                            "filter": node.get("Filter"),
+                        })
+            except Exception as e:
+                check.error = str(e)
+                await conn.rollback()
+            checks.append(check)
+
+    return checks
@@ -0,0 +1,113 @@
+"""
+数据库版本化迁移（Alembic）
+
+启动时只比较 alembic_version 与代码中的 head 版本：
+- 一致：不执行任何 DDL，直接启动
+- 落后且 AUTO_MIGRATE=True：持有 advisory lock 后升级（多实例同时启动只有一个执行）
+- 落后且 AUTO_MIGRATE=False：记录警告，需通过 python manage.py migrate 升级
+"""
+import logging
+from functools import lru_cache
+from pathlib import Path
+from typing import Optional
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+BACKEND_DIR = Path(__file__).resolve().parents[2]
+
+# 迁移锁的 advisory lock key（任意固定值）
+MIGRATION_LOCK_KEY = 0x4D65325F  # "Me2_"
+
+
+def _alembic_config():
+    from alembic.config import Config
+
+    cfg = Config(str(BACKEND_DIR / "alembic.ini"))
+    cfg.set_main_option("script_location", str(BACKEND_DIR / "migrations"))
+    cfg.attributes["configure_logger"] = False
+    return cfg
+
+
+@lru_cache(maxsize=1)
+def get_head_revision() -> Optional[str]:
+    """代码中的最新迁移版本（进程内缓存）"""
+    from alembic.script import ScriptDirectory
+
+    return ScriptDirectory.from_config(_alembic_config()).get_current_head()
+
+
+async def get_current_revision(conn) -> Optional[str]:
+    """数据库当前记录的迁移版本，未初始化时返回 None"""
+    exists = await conn.scalar(text("SELECT to_regclass('alembic_version') IS NOT NULL"))
+    if not exists:
+        return None
+    return await conn.scalar(text("SELECT version_num FROM alembic_version LIMIT 1"))
+
+
+def _upgrade(sync_conn, revision: str) -> None:
+    from alembic import command
+
+    cfg = _alembic_config()
+    cfg.attributes["connection"] = sync_conn
+    command.upgrade(cfg, revision)
+
+
+def _stamp(sync_conn, revision: str) -> None:
+    from alembic import command
+
+    cfg = _alembic_config()
+    cfg.attributes["connection"] = sync_conn
+    command.stamp(cfg, revision)
+
+
+async def run_migrations(engine: AsyncEngine, revision: str = "head") -> tuple[Optional[str], Optional[str]]:
+    """在 advisory lock 保护下升级到指定版本，返回 (升级前版本, 升级后版本)"""
+    async with engine.connect() as conn:
+        # 会话级锁，跨越迁移内部的多次提交
+        await conn.execute(text("SELECT pg_advisory_lock(:key)"), {"key": MIGRATION_LOCK_KEY})
+        await conn.commit()
+        try:
+            before = await get_current_revision(conn)
+            await conn.commit()
+            if before != get_head_revision() or revision != "head":
+                await conn.run_sync(_upgrade, revision)
+            after = await get_current_revision(conn)
+            await conn.commit()
+        finally:
+            await conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": MIGRATION_LOCK_KEY})
+            await conn.commit()
+    return before, after
+
+
+async def stamp(engine: AsyncEngine, revision: str) -> None:
+    """仅记录版本号，不执行迁移（用于已手工迁移的数据库）"""
+    async with engine.connect() as conn:
+        await conn.run_sync(_stamp, revision)
+        await conn.commit()
+
+
+async def ensure_schema(engine: AsyncEngine) -> None:
+    """启动时检查数据库版本，版本一致时不执行任何 DDL"""
+    head = get_head_revision()
+    async with engine.connect() as conn:
+        current = await get_current_revision(conn)
+
+    if current == head:
+        logger.info(f"✅ 数据库版本已是最新 ({head})")
+        return
+
+    if not settings.AUTO_MIGRATE:
+        logger.warning(
+            f"⚠️  数据库版本 {current} 落后于 {head}，"
+            f"请运行 python manage.py migrate"
+        )
+        return
+
+    logger.info(f"📦 数据库迁移: {current} → {head}")
+    before, after = await run_migrations(engine)
+    logger.info(f"✅ 数据库迁移完成: {before} → {after}")
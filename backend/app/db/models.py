@@ -1,7 +1,7 @@
 """
 数据库模型定义
 """
-from sqlalchemy import Column, String, DateTime, Boolean, Text, ForeignKey, JSON
+from sqlalchemy import Column, String, DateTime, Date, Boolean, Integer, BigInteger, Float, Text, ForeignKey, JSON, LargeBinary, Index
 from sqlalchemy.sql import func
 from app.db.database import Base
 import uuid
@@ -31,21 +31,31 @@ class Session(Base):
     __tablename__ = "sessions"
 
     id = Column(String, primary_key=True, default=generate_uuid)
-    user_id = Column(String, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
+    user_id = Column(String, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
     title = Column(String(200), nullable=True)  # 会话标题
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     last_active_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
     is_active = Column(Boolean, default=True, nullable=False)
     meta = Column(JSON, nullable=True)  # 额外元数据（标签、置顶等）
+    archived_at = Column(DateTime(timezone=True), nullable=True)  # 消息已移入 messages_archive
+
+    # 复合索引（定义与 app/db/indexes.py MANAGED_INDEXES 一致）
+    __table_args__ = (
+        Index("ix_sessions_user_last_active", "user_id", "last_active_at"),
+    )
 
 
 class Message(Base):
-    """消息表 - 存储完整的对话上下文（包括 prompt 和召回的记忆）"""
+    """消息表 - 存储完整的对话上下文（包括 prompt 和召回的记忆）
+
+    生产库可用 python manage.py partition-messages 转换为按 created_at 的月分区表
+    （主键变为 (id, created_at)），见 app/db/partitions.py。
+    """
     __tablename__ = "messages"
 
     id = Column(String, primary_key=True, default=generate_uuid)
-    session_id = Column(String, ForeignKey("sessions.id", ondelete="CASCADE"), nullable=False, index=True)
+    session_id = Column(String, ForeignKey("sessions.id", ondelete="CASCADE"), nullable=False)
     user_id = Column(String, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
     role = Column(String(20), nullable=False)  # 'user' | 'assistant'
 
@@ -60,4 +70,137 @@ class Message(Base):
     # 元数据
     meta = Column(JSON, nullable=True)  # memories_count, temperature, tokens 等
 
+    # 过期调试数据的压缩归档（zlib 压缩的 JSON，见 retention_service）
+    debug_archive = Column(LargeBinary, nullable=True)
+
     created_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
+
+    # 复合索引（定义与 app/db/indexes.py MANAGED_INDEXES 一致）
+    __table_args__ = (
+        Index("ix_messages_session_created", "session_id", "created_at"),
+        Index("ix_messages_user_created", "user_id", "created_at"),
+    )
+
+
+class MessageArchive(Base):
+    """冷会话归档表 - 长期不活跃会话的全部消息压缩为一行，访问时回填到 messages"""
+    __tablename__ = "messages_archive"
+
+    session_id = Column(String, ForeignKey("sessions.id", ondelete="CASCADE"), primary_key=True)
+    user_id = Column(String, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
+    message_count = Column(Integer, nullable=False, default=0)
+    first_message_at = Column(DateTime(timezone=True), nullable=True)
+    last_message_at = Column(DateTime(timezone=True), nullable=True)
+    payload = Column(LargeBinary, nullable=False)  # zlib 压缩的消息行 JSON（见 archive_service）
+    archived_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class Job(Base):
+    """后台任务表 - 记录可分批、可恢复的维护任务（会话清理等）的参数与进度"""
+    __tablename__ = "jobs"
+
+    id = Column(String, primary_key=True, default=generate_uuid)
+    kind = Column(String(50), nullable=False)  # 'session_cleanup' 等
+    status = Column(String(20), nullable=False, default="running")  # queued | running | paused | failed | completed
+    params = Column(JSON, nullable=True)  # 启动参数（恢复时沿用，如截止时间）
+    progress = Column(JSON, nullable=True)  # 已处理数量等
+    cursor = Column(JSON, nullable=True)  # 键集分页游标，中断后从此处继续
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (
+        Index("ix_jobs_kind_status", "kind", "status"),
+    )
+
+
+class StatsSnapshot(Base):
+    """统计快照表 - 定时任务预先计算的管理后台统计，仪表盘按主键读取一行"""
+    __tablename__ = "stats_snapshots"
+
+    name = Column(String(50), primary_key=True)  # 'dashboard' 等
+    data = Column(JSON, nullable=False)
+    refreshed_at = Column(DateTime(timezone=True), nullable=False)
+    duration_ms = Column(Float, nullable=True)  # 本次计算耗时
+
+
+class MetricWorker(Base):
+    """指标进程表 - 每个 worker 进程一行，记录最近一次写入指标的时间和实时状态（METRICS_SHARED）"""
+    __tablename__ = "metric_workers"
+
+    worker_id = Column(String(100), primary_key=True)  # 主机名-pid-随机后缀，'(retired)' 为已退出进程的累计值
+    started_at = Column(DateTime(timezone=True), nullable=False)
+    last_flush_at = Column(DateTime(timezone=True), nullable=False)
+    counters = Column(JSON, nullable=True)  # 启动以来的计数（缓存命中、连接池等待等）
+    gauges = Column(JSON, nullable=True)  # 当前值（连接池占用、进行中的后台任务）
+
+
+class MetricWindow(Base):
+    """指标窗口表 - 各 worker 的每分钟 / 每小时聚合与启动以来的累计值（resolution=0）"""
+    __tablename__ = "metric_windows"
+
+    worker_id = Column(String(100), primary_key=True)
+    kind = Column(String(20), primary_key=True)  # api | streams | llm | embedding | recall
+    resolution = Column(Integer, primary_key=True)  # 60 | 3600 | 0（累计）
+    window_start = Column(Integer, primary_key=True)  # 窗口开始的 Unix 时间（秒）
+    window_end = Column(Integer, nullable=False)
+    series = Column(JSON, nullable=False)  # [[key, 聚合], ...]
+
+    __table_args__ = (
+        Index("ix_metric_windows_end", "kind", "window_end"),
+    )
+
+
+class LLMUsageEvent(Base):
+    """LLM 用量明细表 - 每次 LLM 调用一行（批量异步写入，保留 USAGE_EVENT_RETENTION_DAYS 天）"""
+    __tablename__ = "llm_usage_events"
+
+    id = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True, autoincrement=True)
+    created_at = Column(DateTime(timezone=True), nullable=False)
+    user_id = Column(String(36), nullable=True)  # 请求之外的调用为空
+    endpoint = Column(String(200), nullable=False)  # 路由模板，如 POST /api/v1/chat/stream
+    model = Column(String(100), nullable=False)
+    prompt_tokens = Column(Integer, nullable=False, default=0)
+    completion_tokens = Column(Integer, nullable=False, default=0)
+    cache_hit_tokens = Column(Integer, nullable=False, default=0)  # 命中服务端前缀缓存的 prompt tokens
+    duration_ms = Column(Float, nullable=False)
+    success = Column(Boolean, nullable=False, default=True)
+
+    __table_args__ = (
+        Index("ix_llm_usage_events_user_created", "user_id", "created_at"),
+        Index("ix_llm_usage_events_created", "created_at"),
+    )
+
+
+class LLMUsageDaily(Base):
+    """LLM 用量日汇总表 - 按 (日期, 用户, 接口, 模型) 累加，长期保留"""
+    __tablename__ = "llm_usage_daily"
+
+    day = Column(Date, primary_key=True)  # UTC 日期
+    user_id = Column(String(36), primary_key=True)  # '(none)' 为请求之外的调用
+    endpoint = Column(String(200), primary_key=True)
+    model = Column(String(100), primary_key=True)
+    calls = Column(Integer, nullable=False, default=0)
+    failures = Column(Integer, nullable=False, default=0)
+    prompt_tokens = Column(BigInteger, nullable=False, default=0)
+    completion_tokens = Column(BigInteger, nullable=False, default=0)
+    cache_hit_tokens = Column(BigInteger, nullable=False, default=0)
+    duration_ms_total = Column(Float, nullable=False, default=0)
+    duration_ms_max = Column(Float, nullable=False, default=0)
+
+    __table_args__ = (
+        Index("ix_llm_usage_daily_user_day", "user_id", "day"),
+    )
+
+
+class RateLimitBucket(Base):
+    """限流令牌桶表 - RATE_LIMIT_SHARED 时各 worker 共享的令牌桶，闲置的桶由定时任务删除"""
+    __tablename__ = "rate_limit_buckets"
+
+    key = Column(String(255), primary_key=True)  # 限流器名:用户或 IP
+    tokens = Column(Float, nullable=False)
+    capacity = Column(Float, nullable=False)
+    rate = Column(Float, nullable=False)  # 每秒补充的令牌数
+    allowed = Column(Boolean, nullable=False)  # 最近一次请求是否放行
+    updated_at = Column(DateTime(timezone=True), nullable=False)
@@ -0,0 +1,284 @@
+"""
+messages 表按月分区（RANGE created_at）
+
+- convert_messages_to_partitioned(): 把现有 messages 堆表在线转换为分区表
+  1. 新建分区表 messages_partitioned（主键 (id, created_at)，外键/索引齐全）
+  2. 在旧表上挂镜像触发器，转换期间的 INSERT/UPDATE/DELETE 同步写入新表
+  3. 按 (created_at, id) 键集分批回填，每批单独提交（FOR KEY SHARE 防止与并发删除竞争）
+  4. 短暂持有 ACCESS EXCLUSIVE 锁交换表名，旧表保留为 messages_legacy
+- ensure_partitions(): 提前创建未来几个月的分区（定时任务）
+- detach_empty_partitions(): 分离并删除早于保留期且已清空的旧分区（冷会话归档后）
+
+命令行入口: python manage.py partition-messages
+"""
+import asyncio
+import logging
+from datetime import date, datetime, timezone
+from typing import Any, Callable, Optional
+
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+logger = logging.getLogger(__name__)
+
+PARENT = "messages"
+STAGING = "messages_partitioned"
+LEGACY = "messages_legacy"
+DEFAULT_PARTITION = "messages_default"
+
+BACKFILL_MAX_RETRIES = 5
+
+# 分区表上的索引：(临时名, 最终名, 列)
+PARTITIONED_INDEXES = [
+    ("ix_messages_p_session_created", "ix_messages_session_created", "session_id, created_at"),
+    ("ix_messages_p_user_created", "ix_messages_user_created", "user_id, created_at"),
+    ("ix_messages_p_created_at", "ix_messages_created_at", "created_at"),
+]
+
+
+def month_start(d: date | datetime) -> date:
+    return date(d.year, d.month, 1)
+
+
+def add_months(d: date, months: int) -> date:
+    total = d.year * 12 + (d.month - 1) + months
+    return date(total // 12, total % 12 + 1, 1)
+
+
+def partition_name(start: date, parent: str = PARENT) -> str:
+    return f"{parent}_p{start.year:04d}_{start.month:02d}"
+
+
+def _create_partition_sql(parent: str, start: date) -> str:
+    end = add_months(start, 1)
+    return (
+        f"CREATE TABLE IF NOT EXISTS {partition_name(start)} PARTITION OF {parent} "
+        f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+    )
+
+
+async def is_partitioned(conn, table: str = PARENT) -> bool:
+    relkind = await conn.scalar(
+        text("SELECT relkind::text FROM pg_class WHERE relname = :t AND relnamespace = 'public'::regnamespace"),
+        {"t": table},
+    )
+    return relkind == "p"
+
+
+async def list_partitions(conn, parent: str = PARENT) -> list[dict[str, Any]]:
+    """列出分区及其范围、估算行数"""
+    result = await conn.execute(
+        text(
+            "SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) AS bound, c.reltuples "
+            "FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+            "JOIN pg_class p ON p.oid = i.inhparent "
+            "WHERE p.relname = :parent ORDER BY c.relname"
+        ),
+        {"parent": parent},
+    )
+    return [
+        {"name": r.relname, "bound": r.bound, "estimated_rows": max(int(r.reltuples), 0)}
+        for r in result
+    ]
+
+
+async def ensure_partitions(engine: AsyncEngine, months_ahead: int = 2) -> list[str]:
+    """确保当前月及未来 months_ahead 个月的分区存在（未分区时不做任何事）"""
+    created: list[str] = []
+    async with engine.begin() as conn:
+        if not await is_partitioned(conn):
+            return created
+        existing = {p["name"] for p in await list_partitions(conn)}
+        start = month_start(datetime.now(timezone.utc))
+        for i in range(months_ahead + 1):
+            m = add_months(start, i)
+            name = partition_name(m)
+            if name not in existing:
+                await conn.execute(text(_create_partition_sql(PARENT, m)))
+                created.append(name)
+    if created:
+        logger.info(f"创建 messages 分区: {', '.join(created)}")
+    return created
+
+
+async def detach_empty_partitions(engine: AsyncEngine, older_than: date) -> list[str]:
+    """分离并删除早于 older_than 且已无数据的月分区"""
+    dropped: list[str] = []
+    async with engine.connect() as conn:
+        if not await is_partitioned(conn):
+            return dropped
+        partitions = await list_partitions(conn)
+        await conn.commit()
+        for p in partitions:
+            name = p["name"]
+            if name == DEFAULT_PARTITION or not name.startswith(f"{PARENT}_p"):
+                continue
+            year, month = int(name[-7:-3]), int(name[-2:])
+            if add_months(date(year, month, 1), 1) > older_than:
+                continue
+            has_rows = await conn.scalar(text(f"SELECT EXISTS (SELECT 1 FROM {name})"))
+            if has_rows:
+                await conn.commit()
+                continue
+            await conn.execute(text(f"ALTER TABLE {PARENT} DETACH PARTITION {name}"))
+            await conn.execute(text(f"DROP TABLE {name}"))
+            await conn.commit()
+            dropped.append(name)
+    if dropped:
+        logger.info(f"删除空的旧分区: {', '.join(dropped)}")
+    return dropped
+
+
+_MIRROR_FUNCTION = f"""
+CREATE OR REPLACE FUNCTION {STAGING}_mirror() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('DELETE', 'UPDATE') THEN
+        DELETE FROM {STAGING} WHERE id = OLD.id AND created_at = OLD.created_at;
+        IF TG_OP = 'DELETE' THEN
+            RETURN OLD;
+        END IF;
+    END IF;
+    INSERT INTO {STAGING} SELECT (NEW).* ON CONFLICT DO NOTHING;
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql
+"""
+
+_BACKFILL_SQL = f"""
+WITH batch AS (
+    SELECT * FROM {PARENT}
+    WHERE (created_at, id) > (:after_ts, :after_id)
+    ORDER BY created_at, id
+    LIMIT :limit
+    FOR KEY SHARE
+), ins AS (
+    INSERT INTO {STAGING} SELECT * FROM batch ON CONFLICT DO NOTHING
+)
+SELECT count(*) AS n, max(created_at) AS last_ts,
+       (SELECT id FROM batch ORDER BY created_at DESC, id DESC LIMIT 1) AS last_id
+FROM batch
+"""
+
+
+async def convert_messages_to_partitioned(
+    engine: AsyncEngine,
+    batch_size: int = 5000,
+    months_ahead: int = 2,
+    progress: Optional[Callable[[int], None]] = None,
+) -> dict[str, Any]:
+    """在线把 messages 转换为按月分区表，返回统计信息
+
+    可重复执行：已转换时直接返回；中途中断后重新运行会从头回填
+    （ON CONFLICT DO NOTHING 保证已复制的行不会重复）。
+    """
+    async with engine.connect() as conn:
+        if await is_partitioned(conn):
+            await conn.commit()
+            return {"status": "already_partitioned"}
+
+        # 1. 分区表结构
+        min_ts = await conn.scalar(text(f"SELECT min(created_at) FROM {PARENT}"))
+        await conn.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {STAGING} "
+            f"(LIKE {PARENT} INCLUDING DEFAULTS INCLUDING CONSTRAINTS) "
+            f"PARTITION BY RANGE (created_at)"
+        ))
+        await conn.execute(text(
+            f"UPDATE {PARENT} SET created_at = now() WHERE created_at IS NULL"
+        ))
+        await conn.execute(text(f"ALTER TABLE {STAGING} ALTER COLUMN created_at SET NOT NULL"))
+        has_pk = await conn.scalar(text(
+            f"SELECT EXISTS (SELECT 1 FROM pg_constraint "
+            f"WHERE conrelid = '{STAGING}'::regclass AND contype = 'p')"
+        ))
+        if not has_pk:
+            await conn.execute(text(f"ALTER TABLE {STAGING} ADD PRIMARY KEY (id, created_at)"))
+            await conn.execute(text(
+                f"ALTER TABLE {STAGING} ADD CONSTRAINT {STAGING}_session_id_fkey "
+                f"FOREIGN KEY (session_id) REFERENCES sessions(id) ON DELETE CASCADE"
+            ))
+            await conn.execute(text(
+                f"ALTER TABLE {STAGING} ADD CONSTRAINT {STAGING}_user_id_fkey "
+                f"FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE"
+            ))
+
+        first = month_start(min_ts or datetime.now(timezone.utc))
+        last = add_months(month_start(datetime.now(timezone.utc)), months_ahead)
+        m = first
+        while m <= last:
+            await conn.execute(text(_create_partition_sql(STAGING, m).replace(
+                partition_name(m, STAGING), partition_name(m)
+            )))
+            m = add_months(m, 1)
+        await conn.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {DEFAULT_PARTITION} PARTITION OF {STAGING} DEFAULT"
+        ))
+        for tmp_name, _final, columns in PARTITIONED_INDEXES:
+            await conn.execute(text(f"CREATE INDEX IF NOT EXISTS {tmp_name} ON {STAGING} ({columns})"))
+
+        # 2. 镜像触发器
+        await conn.execute(text(_MIRROR_FUNCTION))
+        await conn.execute(text(f"DROP TRIGGER IF EXISTS {STAGING}_mirror ON {PARENT}"))
+        await conn.execute(text(
+            f"CREATE TRIGGER {STAGING}_mirror AFTER INSERT OR UPDATE OR DELETE ON {PARENT} "
+            f"FOR EACH ROW EXECUTE FUNCTION {STAGING}_mirror()"
+        ))
+        await conn.commit()
+        logger.info("分区表与镜像触发器已就绪，开始回填")
+
+        # 3. 分批回填
+        copied = 0
+        after_ts = datetime(1970, 1, 1, tzinfo=timezone.utc)
+        after_id = ""
+        retries = 0
+        while True:
+            try:
+                row = (await conn.execute(
+                    text(_BACKFILL_SQL),
+                    {"after_ts": after_ts, "after_id": after_id, "limit": batch_size},
+                )).one()
+                await conn.commit()
+            except DBAPIError as e:
+                # 与并发写入死锁时 PostgreSQL 会中止其中一方，回滚后重试同一批
+                await conn.rollback()
+                retries += 1
+                if retries > BACKFILL_MAX_RETRIES:
+                    raise
+                logger.warning(f"回填批次失败，重试 ({retries}/{BACKFILL_MAX_RETRIES}): {e}")
+                await asyncio.sleep(0.5 * retries)
+                continue
+            retries = 0
+            if not row.n:
+                break
+            copied += row.n
+            after_ts, after_id = row.last_ts, row.last_id
+            if progress:
+                progress(copied)
+
+        # 4. 交换表名
+        await conn.execute(text(f"LOCK TABLE {PARENT} IN ACCESS EXCLUSIVE MODE"))
+        await conn.execute(text(f"DROP TRIGGER IF EXISTS {STAGING}_mirror ON {PARENT}"))
+        await conn.execute(text(f"DROP FUNCTION IF EXISTS {STAGING}_mirror()"))
+        legacy_indexes = await conn.execute(text(
+            f"SELECT indexname FROM pg_indexes WHERE tablename = '{PARENT}'"
+        ))
+        for (index_name,) in legacy_indexes.all():
+            await conn.execute(text(f"ALTER INDEX {index_name} RENAME TO {index_name}_legacy"))
+        await conn.execute(text(f"ALTER TABLE {PARENT} RENAME TO {LEGACY}"))
+        await conn.execute(text(f"ALTER TABLE {STAGING} RENAME TO {PARENT}"))
+        await conn.execute(text(f"ALTER INDEX {STAGING}_pkey RENAME TO {PARENT}_pkey"))
+        for tmp_name, final_name, _columns in PARTITIONED_INDEXES:
+            await conn.execute(text(f"ALTER INDEX {tmp_name} RENAME TO {final_name}"))
+        await conn.commit()
+
+        partitions = await list_partitions(conn)
+        await conn.commit()
+
+    logger.info(f"messages 分区转换完成: 复制 {copied} 行, {len(partitions)} 个分区")
+    return {
+        "status": "converted",
+        "copied_rows": copied,
+        "partitions": [p["name"] for p in partitions],
+        "legacy_table": LEGACY,
+    }
@@ -0,0 +1,209 @@
+"""
+数据库连接池监控与自动容量
+
+同一个数据库上有多组连接池：Me2 的主库引擎、NeuroMemory 自己的引擎，以及可选的只读副本。
+instrument_engine 给每个连接池挂上：
+- 等待时间：包装 pool.connect()，记录从申请到拿到连接的耗时和超时次数（直方图）
+- 占用时间：pool checkout/checkin 事件，按当前请求的接口（或 background）汇总
+
+数据写入 MetricsCollector，pool_report() 汇总各连接池的实时占用、容量上限和服务端连接数，
+供 /admin/system/db-pools 使用。
+
+DB_POOL_AUTO 开启时，auto_size_pool 在启动时读取 max_connections，按 worker 数和
+滚动发布的重叠代数算出每个 worker 的连接预算，扣除 NeuroMemory 连接池后重建主库连接池。
+"""
+import logging
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+from sqlalchemy import event, text
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.util import greenlet_spawn
+
+from app.config import settings
+from app.services.metrics_collector import MetricsCollector
+from app.services.overload import overload_controller
+from app.services.tracing import record_span
+
+logger = logging.getLogger(__name__)
+
+# 当前请求的 ASGI scope（metrics 中间件设置），路由匹配后 scope["endpoint"] 为接口函数
+request_scope: ContextVar[Optional[dict]] = ContextVar("request_scope", default=None)
+
+_engines: dict[str, AsyncEngine] = {}
+
+
+def _endpoint_label() -> str:
+    scope = request_scope.get()
+    if scope is None:
+        return "background"
+    endpoint = scope.get("endpoint")
+    if endpoint is None:
+        return "unmatched"
+    return f"{endpoint.__module__.rsplit('.', 1)[-1]}.{endpoint.__name__}"
+
+
+def instrument_engine(engine: AsyncEngine, name: str) -> None:
+    """给引擎的连接池挂上等待/占用时间统计（同名重复调用无效）"""
+    if name in _engines:
+        return
+    pool = engine.sync_engine.pool
+    collector = MetricsCollector()
+
+    connect = pool.connect
+
+    def timed_connect():
+        started = time.perf_counter()
+        try:
+            conn = connect()
+        except PoolTimeoutError:
+            wait_ms = (time.perf_counter() - started) * 1000
+            collector.record_pool_checkout(name, wait_ms, timed_out=True)
+            overload_controller.observe_pool_wait(wait_ms)
+            raise
+        ended = time.perf_counter()
+        collector.record_pool_checkout(name, (ended - started) * 1000)
+        overload_controller.observe_pool_wait((ended - started) * 1000)
+        if ended - started >= 0.001:
+            # 只有真正排队等待时才计入 trace，避免每次 checkout 都产生一个 span
+            record_span("db.pool_wait", started, ended, pool=name)
+        return conn
+
+    pool.connect = timed_connect
+
+    @event.listens_for(pool, "checkout")
+    def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+        connection_record.info["pool_checkout"] = (time.perf_counter(), _endpoint_label())
+
+    @event.listens_for(pool, "checkin")
+    def _on_checkin(dbapi_connection, connection_record):
+        checkout = connection_record.info.pop("pool_checkout", None)
+        if checkout is not None:
+            started, endpoint = checkout
+            collector.record_pool_hold(name, endpoint, (time.perf_counter() - started) * 1000)
+
+    _engines[name] = engine
+
+
+def pool_snapshot(engine: AsyncEngine) -> dict:
+    """连接池当前状态"""
+    pool = engine.sync_engine.pool
+    if not hasattr(pool, "checkedout"):
+        return {"pool_class": type(pool).__name__, "capacity": 0}
+    size = pool.size()
+    max_overflow = pool._max_overflow
+    return {
+        "pool_class": type(pool).__name__,
+        "size": size,
+        "max_overflow": max_overflow,
+        "capacity": size + max(max_overflow, 0),
+        "checked_in": pool.checkedin(),
+        "checked_out": pool.checkedout(),
+        "overflow": pool.overflow(),
+        "timeout": pool.timeout(),
+    }
+
+
+def pool_snapshots() -> dict[str, dict]:
+    """所有已挂载监控的连接池的当前状态"""
+    return {name: pool_snapshot(engine) for name, engine in _engines.items()}
+
+
+async def server_connections(engine: AsyncEngine) -> dict:
+    """服务端视角：max_connections 和按 application_name/state 分组的当前连接数"""
+    async with engine.connect() as conn:
+        max_connections = int(await conn.scalar(text("SHOW max_connections")))
+        rows = (await conn.execute(text("""
+            SELECT coalesce(nullif(application_name, ''), backend_type) AS app,
+                   coalesce(state, 'n/a') AS state, count(*) AS n
+            FROM pg_stat_activity
+            GROUP BY 1, 2
+            ORDER BY 3 DESC
+        """))).all()
+    return {
+        "max_connections": max_connections,
+        "total": sum(r.n for r in rows),
+        "by_application": [{"application": r.app, "state": r.state, "count": r.n} for r in rows],
+    }
+
+
+async def pool_report() -> dict:
+    """各连接池的实时占用 + 统计 + 服务端连接数"""
+    stats = MetricsCollector().get_pool_stats()["pools"]
+    pools = {}
+    for name, engine in _engines.items():
+        pools[name] = {**pool_snapshot(engine), **stats.get(name, {})}
+
+    report = {
+        "workers": settings.WEB_CONCURRENCY * settings.APP_INSTANCES,
+        "auto_sized": settings.DB_POOL_AUTO,
+        "pools": pools,
+        # 本进程所有连接池的上限之和 × worker 数 = 整体可能打开的连接数
+        "process_capacity": sum(p["capacity"] for p in pools.values()),
+    }
+    report["fleet_capacity"] = report["process_capacity"] * report["workers"]
+
+    primary = _engines.get("me2")
+    if primary is not None:
+        try:
+            report["server"] = await server_connections(primary)
+        except Exception as e:
+            report["server"] = {"error": str(e)}
+    return report
+
+
+def plan_pool_size(max_connections: int, other_pools: int) -> tuple[int, int]:
+    """按连接预算计算主库连接池 (pool_size, max_overflow)
+
+    other_pools 是同一进程里连接同一数据库的其他连接池容量（NeuroMemory）。
+    常驻连接与溢出连接按 1:2 分配（与默认的 10/20 一致）。
+    """
+    workers = max(1, settings.WEB_CONCURRENCY * settings.APP_INSTANCES)
+    overlap = max(1, settings.DB_POOL_DEPLOY_OVERLAP)
+    budget = max(0, max_connections - settings.DB_RESERVED_CONNECTIONS)
+    per_worker = budget // (workers * overlap) - other_pools
+    if per_worker < 1:
+        return 1, 0
+    pool_size = max(1, per_worker // 3)
+    return pool_size, per_worker - pool_size
+
+
+async def resize_pool(engine: AsyncEngine, pool_size: int, max_overflow: int) -> None:
+    """用新的容量重建连接池（参数与 QueuePool.recreate 相同，事件监听随 dispatch 保留）"""
+    sync_engine = engine.sync_engine
+    old = sync_engine.pool
+    sync_engine.pool = type(old)(
+        old._creator,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pre_ping=old._pre_ping,
+        use_lifo=old._pool.use_lifo,
+        timeout=old._timeout,
+        recycle=old._recycle,
+        echo=old.echo,
+        logging_name=old._orig_logging_name,
+        reset_on_return=old._reset_on_return,
+        _dispatch=old.dispatch,
+        dialect=old._dialect,
+    )
+    await greenlet_spawn(old.dispose)
+
+
+async def auto_size_pool(engine: AsyncEngine, other_engines: list[AsyncEngine]) -> tuple[int, int]:
+    """DB_POOL_AUTO：读取 max_connections，重建主库连接池（需在 instrument_engine 之前调用）"""
+    async with engine.connect() as conn:
+        max_connections = int(await conn.scalar(text("SHOW max_connections")))
+    other = sum(pool_snapshot(e)["capacity"] for e in other_engines)
+    pool_size, max_overflow = plan_pool_size(max_connections, other)
+    await resize_pool(engine, pool_size, max_overflow)
+    logger.info(
+        f"🔌 连接池自动容量: max_connections={max_connections} "
+        f"workers={settings.WEB_CONCURRENCY * settings.APP_INSTANCES} "
+        f"overlap={settings.DB_POOL_DEPLOY_OVERLAP} neuromemory={other} "
+        f"→ pool_size={pool_size} max_overflow={max_overflow}"
+    )
+    if pool_size + max_overflow < 5:
+        logger.warning("⚠️  每个 worker 的连接预算很小，考虑减少 worker 数或调大 max_connections")
+    return pool_size, max_overflow
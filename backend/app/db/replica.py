@@ -0,0 +1,160 @@
+"""
+读写分离路由
+
+配置 DATABASE_READ_URL 后，会话列表、消息历史、管理后台等只读接口通过
+app.dependencies.read_db.get_read_db 读取只读副本，聊天写入不再和这些查询抢主库。
+
+以下情况读请求回退主库：
+- 未配置副本，或最近一次延迟检查失败 / 还没检查过
+- 副本延迟超过 REPLICA_MAX_LAG 秒（由定时任务 replica_lag 更新）
+- 当前用户在 READ_YOUR_WRITES_WINDOW 秒内提交过写事务（读己之写）
+
+写事务的记录是进程内的：多 worker 部署时，用户在 A 进程写入后立刻由 B 进程处理读请求，
+B 只受延迟检查保护（最多看到 REPLICA_MAX_LAG 秒前的数据）。
+"""
+import logging
+import time
+from collections import OrderedDict
+from contextvars import ContextVar
+from typing import Optional
+
+from sqlalchemy import event, text
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session as OrmSession
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+MAX_TRACKED_USERS = 100_000
+
+read_engine = (
+    create_async_engine(
+        settings.DATABASE_READ_URL,
+        echo=settings.SQL_ECHO,
+        future=True,
+        pool_pre_ping=True,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+        connect_args=(
+            {"server_settings": {"application_name": "me2-read"}}
+            if settings.DATABASE_READ_URL.startswith("postgresql+asyncpg") else {}
+        ),
+    )
+    if settings.DATABASE_READ_URL
+    else None
+)
+
+ReadSessionLocal = (
+    async_sessionmaker(
+        read_engine,
+        class_=AsyncSession,
+        expire_on_commit=False,
+        autocommit=False,
+        autoflush=False,
+        info={"replica": True},
+    )
+    if read_engine is not None
+    else None
+)
+
+# 当前请求的用户（get_current_user 设置），用于把提交的写事务归到用户名下
+current_user_id: ContextVar[Optional[str]] = ContextVar("current_user_id", default=None)
+
+_recent_writes: OrderedDict[str, float] = OrderedDict()  # user_id -> 最近一次提交的 monotonic 时间
+
+_lag_state: dict = {
+    "healthy": False,
+    "lag_seconds": None,
+    "checked_at": None,
+    "error": None,
+}
+
+# 副本上执行：非恢复模式（同一实例配置两次）或 WAL 已全部回放时延迟为 0
+_LAG_SQL = text("""
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+""")
+
+
+def mark_write(user_id: str) -> None:
+    """记录用户刚提交了写事务"""
+    _recent_writes[user_id] = time.monotonic()
+    _recent_writes.move_to_end(user_id)
+    while len(_recent_writes) > MAX_TRACKED_USERS:
+        _recent_writes.popitem(last=False)
+
+
+def has_recent_write(user_id: str) -> bool:
+    written_at = _recent_writes.get(user_id)
+    return written_at is not None and time.monotonic() - written_at < settings.READ_YOUR_WRITES_WINDOW
+
+
+@event.listens_for(OrmSession, "after_commit")
+def _track_commit(session: OrmSession) -> None:
+    # 只读副本上的会话不会提交写入；其余提交都视为当前用户的写操作
+    if session.info.get("replica"):
+        return
+    user_id = current_user_id.get()
+    if user_id:
+        mark_write(user_id)
+
+
+def replica_available() -> bool:
+    """副本已配置、最近一次检查成功且延迟在允许范围内"""
+    if read_engine is None or not _lag_state["healthy"]:
+        return False
+    return _lag_state["lag_seconds"] <= settings.REPLICA_MAX_LAG
+
+
+def use_replica(user_id: Optional[str]) -> bool:
+    """该用户的读请求是否可以走副本"""
+    if not replica_available():
+        return False
+    return not (user_id and has_recent_write(user_id))
+
+
+async def check_replica_lag() -> dict:
+    """查询副本回放延迟，更新路由状态（定时任务 replica_lag）"""
+    if read_engine is None:
+        return status()
+    was_available = replica_available()
+    try:
+        async with read_engine.connect() as conn:
+            lag = float(await conn.scalar(_LAG_SQL))
+        _lag_state.update(healthy=True, lag_seconds=lag, error=None)
+    except Exception as e:
+        _lag_state.update(healthy=False, lag_seconds=None, error=str(e))
+    _lag_state["checked_at"] = time.time()
+
+    available = replica_available()
+    if available != was_available:
+        if available:
+            logger.info(f"📗 只读副本可用，延迟 {_lag_state['lag_seconds']:.2f}s")
+        else:
+            logger.warning(
+                f"📕 只读副本不可用，读请求回退主库: "
+                f"lag={_lag_state['lag_seconds']} error={_lag_state['error']}"
+            )
+    return status()
+
+
+def status() -> dict:
+    """副本状态（管理后台 /admin/system/health）"""
+    return {
+        "configured": read_engine is not None,
+        "available": replica_available(),
+        "max_lag_seconds": settings.REPLICA_MAX_LAG,
+        "read_your_writes_window": settings.READ_YOUR_WRITES_WINDOW,
+        "recent_writers": len(_recent_writes),
+        **_lag_state,
+    }
+
+
+async def close_replica() -> None:
+    if read_engine is not None:
+        await read_engine.dispose()
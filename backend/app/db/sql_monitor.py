@@ -0,0 +1,125 @@
+"""
+SQL 语句监控
+
+替代 echo=True 打印所有 SQL：基于引擎的 before/after_cursor_execute 事件，
+- 按语句指纹（去掉字面量、参数占位符和 IN 列表长度后的 SQL）汇总次数和耗时，写入 MetricsCollector
+- 超过 SQL_SLOW_MS 的语句以 WARNING 记录，参数只保留类型和长度
+- 其余语句按 SQL_SAMPLE_RATE 的比例抽样以 INFO 记录
+- 请求内的语句作为 db span 计入 trace（见 app/services/tracing.py）
+
+/admin/system/slow-queries 返回按总耗时（或平均/最大耗时）排序的指纹。
+需要逐条查看所有 SQL 时设置 SQL_ECHO=True（开销大，仅限本地调试）。
+"""
+import hashlib
+import logging
+import random
+import re
+import time
+from functools import lru_cache
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from app.config import settings
+from app.services.metrics_collector import MetricsCollector
+from app.services.tracing import record_span
+
+logger = logging.getLogger("app.sql")
+
+_instrumented: set[str] = set()
+
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r"(?<![\w$])-?\d+(?:\.\d+)?\b")
+_PLACEHOLDER_RE = re.compile(r"\$\d+|%\(\w+\)s|(?<![:\w]):\w+|\?")
+_ITEM = r"\?(?:::\w+(?:\[\])?)?"  # 占位符，可带 ::TYPE 转换（asyncpg 展开的 IN 列表）
+_IN_RE = re.compile(rf"\bIN\s*\(\s*{_ITEM}(?:\s*,\s*{_ITEM})*\s*\)", re.IGNORECASE)
+_LIST_RE = re.compile(rf"\(\s*{_ITEM}(?:\s*,\s*{_ITEM})+\s*\)")
+_VALUES_RE = re.compile(r"(\(\.\.\.\))(?:\s*,\s*\(\.\.\.\))+")
+_SPACE_RE = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=4096)
+def fingerprint(statement: str) -> tuple[str, str]:
+    """返回 (指纹 ID, 规范化 SQL)；同一类语句不论参数和 IN 列表长度都得到相同指纹"""
+    normalized = _STRING_RE.sub("?", statement)
+    normalized = _PLACEHOLDER_RE.sub("?", normalized)
+    normalized = _NUMBER_RE.sub("?", normalized)
+    normalized = _IN_RE.sub("IN (...)", normalized)
+    normalized = _LIST_RE.sub("(...)", normalized)
+    normalized = _VALUES_RE.sub(r"\1", normalized)
+    normalized = _SPACE_RE.sub(" ", normalized).strip()
+    digest = hashlib.sha1(normalized.encode("utf-8")).hexdigest()[:12]
+    return digest, normalized
+
+
+def _redact_value(value) -> str:
+    if value is None:
+        return "NULL"
+    if isinstance(value, (str, bytes, list, tuple, dict)):
+        return f"<{type(value).__name__}:{len(value)}>"
+    return f"<{type(value).__name__}>"
+
+
+def redact_parameters(parameters) -> str:
+    """参数只保留类型和长度，避免把消息内容、密码哈希等写进日志"""
+    if isinstance(parameters, list):  # executemany
+        first = redact_parameters(parameters[0]) if parameters else ""
+        return f"{first} ×{len(parameters)}"
+    if isinstance(parameters, dict):
+        return "{" + ", ".join(f"{k}={_redact_value(v)}" for k, v in parameters.items()) + "}"
+    if isinstance(parameters, tuple):
+        return "(" + ", ".join(_redact_value(v) for v in parameters) + ")"
+    return _redact_value(parameters)
+
+
+def _short(sql: str, limit: int = 500) -> str:
+    sql = _SPACE_RE.sub(" ", sql).strip()
+    return sql if len(sql) <= limit else sql[:limit] + " …"
+
+
+def instrument_engine(engine: AsyncEngine, name: str) -> None:
+    """给引擎挂上 SQL 耗时统计与慢查询日志（同名重复调用无效）"""
+    if name in _instrumented:
+        return
+    _instrumented.add(name)
+    if settings.SQL_SAMPLE_RATE > 0:
+        # 根 logger 在 DEBUG=False 时是 WARNING，抽样日志需要单独放开
+        logger.setLevel(logging.INFO)
+    collector = MetricsCollector()
+    sync_engine = engine.sync_engine
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        context._sql_started = time.perf_counter()
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, "_sql_started", None)
+        if started is not None:
+            ended = time.perf_counter()
+            _record(name, statement, parameters, (ended - started) * 1000, error=False)
+            # 当前请求的 trace 中记一个 db span（无 trace 时为空操作）
+            record_span("db", started, ended, engine=name, fp=fingerprint(statement)[0])
+
+    @event.listens_for(sync_engine, "handle_error")
+    def _on_error(exception_context):
+        started = getattr(exception_context.execution_context, "_sql_started", None)
+        if started is not None and exception_context.statement:
+            _record(
+                name, exception_context.statement, exception_context.parameters,
+                (time.perf_counter() - started) * 1000, error=True,
+            )
+
+    def _record(engine_name: str, statement: str, parameters, duration_ms: float, error: bool):
+        fp, normalized = fingerprint(statement)
+        collector.record_sql(engine_name, fp, normalized, duration_ms, error)
+        if duration_ms >= settings.SQL_SLOW_MS:
+            logger.warning(
+                f"🐢 慢 SQL {duration_ms:.1f}ms [{engine_name}] fp={fp}: "
+                f"{_short(statement)} | params={redact_parameters(parameters)}"
+            )
+        elif settings.SQL_SAMPLE_RATE > 0 and random.random() < settings.SQL_SAMPLE_RATE:
+            logger.info(
+                f"SQL {duration_ms:.1f}ms [{engine_name}] fp={fp}: "
+                f"{_short(statement)} | params={redact_parameters(parameters)}"
+            )
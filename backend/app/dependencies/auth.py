@@ -2,9 +2,10 @@
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
 from app.dependencies import get_db
-from app.services.auth_service import verify_token
+from app.db.replica import current_user_id
+from app.services import user_cache
+from app.services.tracing import span
 from app.db.models import User
 
 security = HTTPBearer()
@@ -14,9 +15,13 @@ async def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(security),
     db: AsyncSession = Depends(get_db)
 ) -> User:
-    """从 JWT token 获取当前用户"""
-    token = credentials.credentials
-    payload = verify_token(token)
+    """从 JWT token 获取当前用户（token 解码结果和用户信息走进程内缓存）"""
+    with span("auth"):
+        return await _authenticate(credentials.credentials, db)
+
+
+async def _authenticate(token: str, db: AsyncSession) -> User:
+    payload = user_cache.get_token_payload(token)
 
     if not payload:
         raise HTTPException(
@@ -33,8 +38,7 @@ async def get_current_user(
             headers={"WWW-Authenticate": "Bearer"}
         )
 
-    result = await db.execute(select(User).where(User.id == user_id))
-    user = result.scalar_one_or_none()
+    user = await user_cache.get_user(db, user_id)
 
     if not user:
         raise HTTPException(
@@ -43,4 +47,6 @@ async def get_current_user(
             headers={"WWW-Authenticate": "Bearer"}
         )
 
+    # 读写分离：本请求内提交的写事务记到该用户名下（读己之写）
+    current_user_id.set(user.id)
     return user
@@ -0,0 +1,28 @@
+"""只读数据库会话依赖（读写分离，见 app/db/replica.py）"""
+from typing import AsyncGenerator
+
+from fastapi import Depends
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.db import replica
+from app.db.models import User
+from app.dependencies import get_db
+from app.dependencies.auth import get_current_user
+
+
+async def get_read_db(
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+) -> AsyncGenerator[AsyncSession, None]:
+    """只读接口使用：副本可用且用户近期没有写入时读副本，否则复用主库会话
+
+    返回的会话可能连接副本，不能用于写入；需要写入时判断 db.info.get("replica")。
+    """
+    if not replica.use_replica(current_user.id):
+        yield db
+        return
+
+    async with replica.ReadSessionLocal() as session:
+        try:
+            yield session
+        finally:
+            await session.close()
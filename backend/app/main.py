@@ -4,9 +4,8 @@ Me2 FastAPI 主应用
 from fastapi import FastAPI
 from contextlib import asynccontextmanager
 from app.config import settings
-from app.db.database import init_db, close_db
+from app.db.database import close_db
 import logging
-import time
 
 # 配置日志
 logging.basicConfig(
@@ -42,40 +41,13 @@ async def lifespan(app: FastAPI):
     # ========== 启动时 ==========
     logger.info("🚀 Me2 启动中...")
 
-    # 1. 初始化数据库（Me2 用户表）
-    logger.info("📦 初始化数据库...")
-    await init_db()
+    # 1. 数据库 schema：只比较版本号，最新时不执行任何 DDL
+    logger.info("📦 检查数据库版本...")
+    from app.db.database import engine
+    from app.db.migrations import ensure_schema
+    await ensure_schema(engine)
 
-    # 1.5 数据库迁移：补齐缺失的列（create_all 不会给已有表加新列）
-    try:
-        from sqlalchemy import text
-        from app.db.database import engine
-        migrations = [
-            # users 表
-            "ALTER TABLE users ADD COLUMN IF NOT EXISTS is_admin BOOLEAN DEFAULT FALSE NOT NULL",
-            # emotion_profiles 表 (neuromemory 0.6.0 新增列)
-            "ALTER TABLE emotion_profiles ADD COLUMN IF NOT EXISTS last_reflected_at TIMESTAMPTZ",
-            "ALTER TABLE emotion_profiles ADD COLUMN IF NOT EXISTS latest_state_period VARCHAR(50)",
-            "ALTER TABLE emotion_profiles ADD COLUMN IF NOT EXISTS latest_state_valence FLOAT",
-            "ALTER TABLE emotion_profiles ADD COLUMN IF NOT EXISTS latest_state_arousal FLOAT",
-            "ALTER TABLE emotion_profiles ADD COLUMN IF NOT EXISTS latest_state_updated_at TIMESTAMPTZ",
-            "ALTER TABLE emotion_profiles ADD COLUMN IF NOT EXISTS valence_avg FLOAT",
-            "ALTER TABLE emotion_profiles ADD COLUMN IF NOT EXISTS arousal_avg FLOAT",
-            "ALTER TABLE emotion_profiles ADD COLUMN IF NOT EXISTS emotion_triggers JSONB",
-            "ALTER TABLE emotion_profiles ADD COLUMN IF NOT EXISTS source_memory_ids UUID[]",
-            "ALTER TABLE emotion_profiles ADD COLUMN IF NOT EXISTS source_count INTEGER",
-        ]
-        async with engine.begin() as conn:
-            for sql in migrations:
-                try:
-                    await conn.execute(text(sql))
-                except Exception:
-                    pass  # 表可能不存在，跳过
-        logger.info("✅ 数据库迁移完成")
-    except Exception as e:
-        logger.warning(f"⚠️  数据库迁移失败: {e}")
-
-    # 1.6 确保默认 admin 账号存在
+    # 1.5 确保默认 admin 账号存在
     try:
         from sqlalchemy import select
         from app.db.database import AsyncSessionLocal
@@ -160,7 +132,7 @@ async def lifespan(app: FastAPI):
             ),
             reflection_interval=settings.NEUROMEMORY_REFLECTION_INTERVAL,
             graph_enabled=settings.NEUROMEMORY_GRAPH_ENABLED,
-            echo=settings.DEBUG,
+            echo=settings.SQL_ECHO,
         )
         await nm.init()
         logger.info("✅ NeuroMemory 初始化完成")
@@ -168,6 +140,119 @@ async def lifespan(app: FastAPI):
         logger.error(f"❌ NeuroMemory 初始化失败: {e}")
         raise
 
+    # 2.5 连接池：自动容量 + 监控（NeuroMemory 使用自己的引擎，一并纳入统计）
+    from app.db import pool_monitor, replica
+    nm_engine = getattr(getattr(nm, "_db", None), "engine", None)
+    if settings.DB_POOL_AUTO:
+        try:
+            await pool_monitor.auto_size_pool(engine, [nm_engine] if nm_engine is not None else [])
+        except Exception as e:
+            logger.warning(f"⚠️  连接池自动容量失败，沿用 DB_POOL_SIZE/DB_MAX_OVERFLOW: {e}")
+    pool_monitor.instrument_engine(engine, "me2")
+    if nm_engine is not None:
+        pool_monitor.instrument_engine(nm_engine, "neuromemory")
+    else:
+        logger.warning("⚠️  未找到 NeuroMemory 的数据库引擎，连接池监控只包含 Me2")
+    if replica.read_engine is not None:
+        pool_monitor.instrument_engine(replica.read_engine, "me2_read")
+
+    # 2.6 SQL 耗时统计与慢查询日志
+    from app.db import sql_monitor
+    sql_monitor.instrument_engine(engine, "me2")
+    if nm_engine is not None:
+        sql_monitor.instrument_engine(nm_engine, "neuromemory")
+    if replica.read_engine is not None:
+        sql_monitor.instrument_engine(replica.read_engine, "me2_read")
+
+    # 3. 启动后台定时任务
+    from app.services.scheduler import scheduler
+    if settings.DEBUG_PAYLOAD_RETENTION_ENABLED:
+        from app.services.retention_service import run_retention_job
+        scheduler.add_job(
+            "debug_payload_retention",
+            interval=settings.DEBUG_PAYLOAD_RETENTION_INTERVAL,
+            func=run_retention_job,
+            initial_delay=60,
+        )
+    from app.services.archive_service import run_archive_job, run_partition_maintenance
+    scheduler.add_job(
+        "message_partitions",
+        interval=24 * 3600,
+        func=run_partition_maintenance,
+        initial_delay=30,
+    )
+    if settings.MESSAGE_ARCHIVE_ENABLED:
+        scheduler.add_job(
+            "message_archive",
+            interval=settings.MESSAGE_ARCHIVE_INTERVAL,
+            func=run_archive_job,
+            initial_delay=120,
+        )
+    if settings.SESSION_CLEANUP_ENABLED:
+        from app.services.session_manager import run_session_cleanup_job
+        scheduler.add_job(
+            "session_cleanup",
+            interval=settings.SESSION_CLEANUP_INTERVAL,
+            func=run_session_cleanup_job,
+            initial_delay=180,
+        )
+    from app.services.data_lifecycle import run_user_deletion_jobs
+    scheduler.add_job(
+        "data_deletion",
+        interval=settings.DATA_DELETE_RESUME_INTERVAL,
+        func=run_user_deletion_jobs,
+        initial_delay=45,
+    )
+    from app.services.stats_service import run_stats_refresh_job
+    scheduler.add_job(
+        "dashboard_stats",
+        interval=settings.STATS_REFRESH_INTERVAL,
+        func=run_stats_refresh_job,
+        initial_delay=20,
+    )
+    if settings.METRICS_SHARED:
+        from app.services.metrics_store import run_metrics_flush_job
+        scheduler.add_job(
+            "metrics_flush",
+            interval=settings.METRICS_FLUSH_INTERVAL,
+            func=run_metrics_flush_job,
+            initial_delay=settings.METRICS_FLUSH_INTERVAL,
+        )
+    if settings.USAGE_TRACKING_ENABLED:
+        from app.services.usage_tracker import run_usage_flush_job, run_usage_retention_job
+        scheduler.add_job(
+            "usage_flush",
+            interval=settings.USAGE_FLUSH_INTERVAL,
+            func=run_usage_flush_job,
+            initial_delay=settings.USAGE_FLUSH_INTERVAL,
+        )
+        scheduler.add_job(
+            "usage_retention",
+            interval=24 * 3600,
+            func=run_usage_retention_job,
+            initial_delay=300,
+        )
+    if settings.RATE_LIMIT_SHARED:
+        from app.services.rate_limit_middleware import run_rate_limit_cleanup_job
+        scheduler.add_job(
+            "rate_limit_cleanup",
+            interval=3600,
+            func=run_rate_limit_cleanup_job,
+            initial_delay=600,
+        )
+    if replica.read_engine is not None:
+        scheduler.add_job(
+            "replica_lag",
+            interval=settings.REPLICA_LAG_CHECK_INTERVAL,
+            func=replica.check_replica_lag,
+        )
+    scheduler.start()
+
+    # 事件循环阻塞监控
+    from app.services.profiler import loop_monitor
+    if settings.LOOP_MONITOR_ENABLED:
+        loop_monitor.start()
+
     logger.info("✅ Me2 启动完成")
 
     yield
@@ -175,6 +260,33 @@ async def lifespan(app: FastAPI):
     # ========== 关闭时 ==========
     logger.info("👋 Me2 关闭中...")
 
+    # 停止后台任务
+    await scheduler.stop()
+    await loop_monitor.stop()
+
+    # 多 worker 指标：退出前写入最后一批
+    if settings.METRICS_SHARED:
+        from app.services.metrics_store import run_metrics_flush_job
+        try:
+            await run_metrics_flush_job()
+        except Exception as e:
+            logger.warning(f"⚠️  指标写入失败: {e}")
+
+    # LLM 用量：退出前写入缓冲区中的事件
+    if settings.USAGE_TRACKING_ENABLED:
+        from app.services.usage_tracker import run_usage_flush_job
+        try:
+            await run_usage_flush_job()
+        except Exception as e:
+            logger.warning(f"⚠️  LLM 用量写入失败: {e}")
+
+    from app.services.auth_service import shutdown_hash_executor
+    shutdown_hash_executor()
+
+    # trace 文件：等待写入线程写完已排队的 trace
+    from app.services.tracing import flush_exports
+    flush_exports()
+
     # 关闭 NeuroMemory
     if nm:
         logger.info("🧠 关闭 NeuroMemory...")
@@ -216,25 +328,21 @@ class CORSHandler(BaseHTTPMiddleware):
         response.headers["Access-Control-Expose-Headers"] = "*"
         return response
 
+# 接口限流与 LLM 配额（在 CORS 之内，429 响应同样带 CORS 头）
+from app.services.rate_limit_middleware import RateLimitMiddleware
+
+app.add_middleware(RateLimitMiddleware)
 app.add_middleware(CORSHandler)
 
-# API metrics middleware
-from app.services.metrics_collector import MetricsCollector
-
-@app.middleware("http")
-async def metrics_middleware(request, call_next):
-    start = time.time()
-    response = await call_next(request)
-    duration_ms = (time.time() - start) * 1000
-    # Only track API routes
-    if request.url.path.startswith("/api/"):
-        MetricsCollector().record_api(
-            path=request.url.path,
-            method=request.method,
-            status_code=response.status_code,
-            duration_ms=duration_ms,
-        )
-    return response
+# API metrics middleware（按路由模板归类，流式响应记录首字节时间和总时长）
+from app.services.request_metrics import RequestMetricsMiddleware
+
+app.add_middleware(RequestMetricsMiddleware)
+
+# 请求 trace（Server-Timing 响应头，慢请求导出，见 app/services/tracing.py）
+from app.services.tracing import TracingMiddleware
+
+app.add_middleware(TracingMiddleware)
 
 # 注册路由
 from app.api.v1 import admin, auth, chat, memories
@@ -276,6 +384,36 @@ async def health():
     return {"status": "healthy", "neuromemory": nm_status}
 
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics(request: Request):
+    """Prometheus / OpenMetrics 指标"""
+    from app.db import pool_monitor
+    from app.db.database import AsyncSessionLocal
+    from app.services import metrics_exporter
+    from app.services.job_store import JobStore
+    from app.services.metrics_store import fleet_collector
+
+    if not settings.METRICS_ENABLED:
+        return Response(status_code=404)
+    if settings.METRICS_TOKEN and request.headers.get("authorization") != f"Bearer {settings.METRICS_TOKEN}":
+        return Response(status_code=401)
+
+    try:
+        async with AsyncSessionLocal() as session:
+            jobs = await JobStore(session).count_unfinished()
+    except Exception as e:
+        logger.warning(f"⚠️  /metrics 读取任务队列失败: {e}")
+        jobs = None
+
+    openmetrics = metrics_exporter.wants_openmetrics(request.headers.get("accept"))
+    collector, pools = await fleet_collector(totals_only=True)
+    if pools is None:
+        pools = pool_monitor.pool_snapshots()
+    body = metrics_exporter.render_metrics(openmetrics, pools=pools, jobs=jobs, collector=collector)
+    content_type = metrics_exporter.OPENMETRICS_CONTENT_TYPE if openmetrics else metrics_exporter.TEXT_CONTENT_TYPE
+    return Response(body, headers={"Content-Type": content_type})
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(
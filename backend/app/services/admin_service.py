@@ -2,14 +2,54 @@
 Admin Service - 管理后台业务逻辑
 提供仪表盘统计、用户管理等功能
 """
-from datetime import datetime, timedelta, timezone
+import base64
+import json
+from datetime import datetime, timezone
 from typing import Any, Optional
 
-from sqlalchemy import select, func, and_, text, desc, delete
+from sqlalchemy import (
+    select, func, desc, inspect, literal, tuple_, table, column, DateTime,
+)
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.db.models import User, Session, Message
-from app.services.auth_service import get_password_hash
+from app.db.models import User, Session, Message, MessageArchive
+from app.services import data_lifecycle, user_cache
+from app.services.job_store import job_to_dict
+from app.services.stats_service import StatsService
+
+# 用户列表可排序的字段
+USER_SORT_FIELDS = (
+    "created_at", "last_login", "last_active",
+    "message_count", "session_count", "memory_count",
+)
+_NULLABLE_TIME_FIELDS = ("last_login", "last_active")
+_EPOCH = literal(datetime(1970, 1, 1, tzinfo=timezone.utc), DateTime(timezone=True))
+
+# NeuroMemory 管理的 embeddings 表（只用到这两列）
+_embeddings = table("embeddings", column("user_id"), column("memory_type"))
+_embeddings_table_exists = False
+
+
+def _encode_cursor(sort_value: Any, user_id: str) -> str:
+    if isinstance(sort_value, datetime):
+        sort_value = sort_value.isoformat()
+    raw = json.dumps([sort_value, user_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str, sort: str) -> tuple[Any, str]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        sort_value, user_id = json.loads(base64.urlsafe_b64decode(padded))
+        if sort in ("created_at", *_NULLABLE_TIME_FIELDS):
+            sort_value = datetime.fromisoformat(sort_value)
+            if sort_value.tzinfo is None:  # SQLite 不保存时区
+                sort_value = sort_value.replace(tzinfo=timezone.utc)
+        else:
+            sort_value = int(sort_value)
+        return sort_value, str(user_id)
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
 
 
 class AdminService:
@@ -19,197 +59,174 @@ class AdminService:
         self.db = db
 
     async def get_dashboard_stats(self) -> dict[str, Any]:
-        """获取仪表盘全局统计"""
-        now = datetime.now(timezone.utc)
-        seven_days_ago = now - timedelta(days=7)
-
-        # 用户统计
-        total_users_result = await self.db.execute(select(func.count(User.id)))
-        total_users = total_users_result.scalar() or 0
-
-        active_users_result = await self.db.execute(
-            select(func.count(User.id)).where(User.last_login >= seven_days_ago)
-        )
-        active_users_7d = active_users_result.scalar() or 0
-
-        admin_count_result = await self.db.execute(
-            select(func.count(User.id)).where(User.is_admin == True)  # noqa: E712
-        )
-        admin_count = admin_count_result.scalar() or 0
-
-        # 会话统计
-        total_sessions_result = await self.db.execute(select(func.count(Session.id)))
-        total_sessions = total_sessions_result.scalar() or 0
-
-        active_sessions_result = await self.db.execute(
-            select(func.count(Session.id)).where(
-                Session.last_active_at >= seven_days_ago
+        """获取仪表盘全局统计（读取定时任务预先计算的快照，见 stats_service）"""
+        return await StatsService(self.db).get_dashboard_stats()
+
+    async def _embeddings_available(self) -> bool:
+        """embeddings 表由 NeuroMemory 创建，可能不存在（例如测试库）"""
+        global _embeddings_table_exists
+        if not _embeddings_table_exists:
+            _embeddings_table_exists = await self.db.run_sync(
+                lambda s: inspect(s.connection()).has_table("embeddings")
             )
+        return _embeddings_table_exists
+
+    async def _user_stat_columns(self) -> dict[str, Any]:
+        """每个用户的统计列（关联子查询，分别走 user_id 索引，一条语句里算完）"""
+        hot_messages = (
+            select(func.count(Message.id))
+            .where(Message.user_id == User.id)
+            .correlate(User)
+            .scalar_subquery()
         )
-        active_sessions_7d = active_sessions_result.scalar() or 0
-
-        # 消息统计
-        total_messages_result = await self.db.execute(select(func.count(Message.id)))
-        total_messages = total_messages_result.scalar() or 0
-
-        messages_7d_result = await self.db.execute(
-            select(func.count(Message.id)).where(
-                Message.created_at >= seven_days_ago
-            )
+        archived_messages = (
+            select(func.coalesce(func.sum(MessageArchive.message_count), 0))
+            .where(MessageArchive.user_id == User.id)
+            .correlate(User)
+            .scalar_subquery()
         )
-        messages_7d = messages_7d_result.scalar() or 0
-
-        # 记忆统计
-        memory_stats = await self._get_memory_stats()
-
+        if await self._embeddings_available():
+            memory_count = (
+                select(func.count())
+                .select_from(_embeddings)
+                .where(_embeddings.c.user_id == User.id)
+                .correlate(User)
+                .scalar_subquery()
+            )
+        else:
+            memory_count = literal(0)
         return {
-            "users": {
-                "total": total_users,
-                "active_7d": active_users_7d,
-                "admin_count": admin_count,
-            },
-            "sessions": {
-                "total": total_sessions,
-                "active_7d": active_sessions_7d,
-            },
-            "messages": {
-                "total": total_messages,
-                "last_7d": messages_7d,
-            },
-            "memories": memory_stats,
-        }
-
-    async def _get_memory_stats(self) -> dict[str, Any]:
-        """查询 NeuroMemory embeddings 表获取记忆统计"""
-        stats: dict[str, Any] = {
-            "total": 0,
-            "by_type": {},
-            "graph_nodes": 0,
-            "graph_edges": 0,
+            "session_count": (
+                select(func.count(Session.id))
+                .where(Session.user_id == User.id)
+                .correlate(User)
+                .scalar_subquery()
+            ),
+            "message_count": hot_messages + archived_messages,
+            "memory_count": memory_count,
+            "last_active": (
+                select(func.max(Session.last_active_at))
+                .where(Session.user_id == User.id)
+                .correlate(User)
+                .scalar_subquery()
+            ),
         }
 
-        # 查询 embeddings 表 (NeuroMemory 管理的表)
-        try:
-            result = await self.db.execute(
-                text("SELECT memory_type, COUNT(*) as cnt FROM embeddings GROUP BY memory_type")
-            )
-            rows = result.fetchall()
-            total = 0
-            by_type = {}
-            for row in rows:
-                memory_type = row[0] or "unknown"
-                count = row[1]
-                by_type[memory_type] = count
-                total += count
-            stats["total"] = total
-            stats["by_type"] = by_type
-        except Exception:
-            # embeddings 表可能不存在
-            pass
-
-        # 查询 graph 相关表
-        try:
-            result = await self.db.execute(text("SELECT COUNT(*) FROM graph_nodes"))
-            stats["graph_nodes"] = result.scalar() or 0
-        except Exception:
-            pass
-
-        try:
-            result = await self.db.execute(text("SELECT COUNT(*) FROM graph_edges"))
-            stats["graph_edges"] = result.scalar() or 0
-        except Exception:
-            pass
-
-        return stats
-
     async def get_user_list(
-        self, limit: int = 20, offset: int = 0
+        self,
+        limit: int = 20,
+        offset: int = 0,
+        sort: str = "created_at",
+        order: str = "desc",
+        cursor: Optional[str] = None,
     ) -> dict[str, Any]:
-        """获取用户列表（分页），附带每个用户的统计信息"""
-        # 总数
-        total_result = await self.db.execute(select(func.count(User.id)))
-        total = total_result.scalar() or 0
-
-        # 用户列表
-        users_result = await self.db.execute(
-            select(User)
-            .order_by(desc(User.created_at))
-            .limit(limit)
-            .offset(offset)
-        )
-        users = users_result.scalars().all()
+        """获取用户列表，附带每个用户的统计信息
 
-        items = []
-        for user in users:
-            # 每个用户的会话数
-            session_count_result = await self.db.execute(
-                select(func.count(Session.id)).where(Session.user_id == user.id)
+        排序在 SQL 中完成（sort 见 USER_SORT_FIELDS）；传入上一页返回的 next_cursor
+        按 (排序值, id) 做 keyset 分页，不传时兼容 offset 分页。
+        """
+        if sort not in USER_SORT_FIELDS:
+            raise ValueError(f"Unknown sort field: {sort}")
+        if order not in ("asc", "desc"):
+            raise ValueError(f"Unknown order: {order}")
+
+        total = await self.db.scalar(select(func.count(User.id))) or 0
+
+        stats = await self._user_stat_columns()
+        row = (
+            select(
+                User.id, User.username, User.email, User.is_admin,
+                User.created_at, User.last_login,
+                *(expr.label(name) for name, expr in stats.items()),
             )
-            session_count = session_count_result.scalar() or 0
-
-            # 每个用户的消息数
-            message_count_result = await self.db.execute(
-                select(func.count(Message.id)).where(Message.user_id == user.id)
+            .subquery("user_stats")
+        )
+        sort_key = row.c[sort]
+        if sort in _NULLABLE_TIME_FIELDS:
+            # 从未登录/没有会话的用户排在最后（desc）或最前（asc），keyset 比较不能有 NULL
+            sort_key = func.coalesce(sort_key, _EPOCH)
+
+        query = select(row, sort_key.label("sort_key"))
+        if cursor:
+            last_value, last_id = _decode_cursor(cursor, sort)
+            after = tuple_(sort_key, row.c.id)
+            query = query.where(
+                after < tuple_(last_value, last_id) if order == "desc"
+                else after > tuple_(last_value, last_id)
             )
-            message_count = message_count_result.scalar() or 0
-
-            items.append({
-                "id": user.id,
-                "username": user.username,
-                "email": user.email,
-                "is_admin": user.is_admin,
-                "created_at": user.created_at.isoformat() if user.created_at else None,
-                "last_login": user.last_login.isoformat() if user.last_login else None,
-                "session_count": session_count,
-                "message_count": message_count,
-            })
+        if order == "desc":
+            query = query.order_by(sort_key.desc(), row.c.id.desc())
+        else:
+            query = query.order_by(sort_key.asc(), row.c.id.asc())
+        if not cursor:
+            query = query.offset(offset)
+        rows = (await self.db.execute(query.limit(limit + 1))).all()
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = _encode_cursor(rows[-1].sort_key, rows[-1].id)
+
+        items = [
+            {
+                "id": r.id,
+                "username": r.username,
+                "email": r.email,
+                "is_admin": r.is_admin,
+                "created_at": r.created_at.isoformat() if r.created_at else None,
+                "last_login": r.last_login.isoformat() if r.last_login else None,
+                "last_active": r.last_active.isoformat() if r.last_active else None,
+                "session_count": r.session_count or 0,
+                "message_count": r.message_count or 0,
+                "memory_count": r.memory_count or 0,
+            }
+            for r in rows
+        ]
 
         return {
             "total": total,
             "limit": limit,
             "offset": offset,
+            "sort": sort,
+            "order": order,
+            "next_cursor": next_cursor,
             "items": items,
         }
 
     async def get_user_detail(self, user_id: str) -> Optional[dict[str, Any]]:
         """获取单个用户的详细信息，包括最近会话"""
-        # 查询用户
-        user_result = await self.db.execute(
-            select(User).where(User.id == user_id)
-        )
-        user = user_result.scalar_one_or_none()
-        if not user:
+        # 用户及其汇总统计（一条语句）
+        stats = await self._user_stat_columns()
+        row = (await self.db.execute(
+            select(User, *(expr.label(name) for name, expr in stats.items()))
+            .where(User.id == user_id)
+        )).first()
+        if row is None:
             return None
-
-        # 会话数
-        session_count_result = await self.db.execute(
-            select(func.count(Session.id)).where(Session.user_id == user_id)
+        user = row.User
+
+        # 最近 10 个会话及各自的消息数（热表 + 已归档）
+        hot_count = (
+            select(func.count(Message.id))
+            .where(Message.session_id == Session.id)
+            .correlate(Session)
+            .scalar_subquery()
         )
-        session_count = session_count_result.scalar() or 0
-
-        # 消息数
-        message_count_result = await self.db.execute(
-            select(func.count(Message.id)).where(Message.user_id == user_id)
+        archived_count = (
+            select(MessageArchive.message_count)
+            .where(MessageArchive.session_id == Session.id)
+            .correlate(Session)
+            .scalar_subquery()
         )
-        message_count = message_count_result.scalar() or 0
-
-        # 最近 10 个会话
-        recent_sessions_result = await self.db.execute(
-            select(Session)
+        recent_sessions = (await self.db.execute(
+            select(Session, (hot_count + func.coalesce(archived_count, 0)).label("message_count"))
             .where(Session.user_id == user_id)
             .order_by(desc(Session.last_active_at))
             .limit(10)
-        )
-        recent_sessions = recent_sessions_result.scalars().all()
+        )).all()
 
         sessions_data = []
-        for s in recent_sessions:
-            # 每个会话的消息数
-            msg_count_result = await self.db.execute(
-                select(func.count(Message.id)).where(Message.session_id == s.id)
-            )
-            msg_count = msg_count_result.scalar() or 0
-
+        for s, msg_count in recent_sessions:
             # 会话标题：优先用 title 字段，其次从 meta 中取
             title = s.title
             if not title and s.meta and isinstance(s.meta, dict):
@@ -222,23 +239,19 @@ class AdminService:
                 "created_at": s.created_at.isoformat() if s.created_at else None,
                 "last_active_at": s.last_active_at.isoformat() if s.last_active_at else None,
                 "is_active": s.is_active,
-                "message_count": msg_count,
+                "message_count": msg_count or 0,
             })
 
         # 用户记忆统计（按类型）
-        memory_count = 0
         memory_by_type: dict[str, int] = {}
-        try:
+        if row.memory_count:
             result = await self.db.execute(
-                text("SELECT memory_type, COUNT(*) as cnt FROM embeddings WHERE user_id = :uid GROUP BY memory_type"),
-                {"uid": user_id},
+                select(_embeddings.c.memory_type, func.count())
+                .where(_embeddings.c.user_id == user_id)
+                .group_by(_embeddings.c.memory_type)
             )
-            for row in result.fetchall():
-                mtype = row[0] or "unknown"
-                memory_by_type[mtype] = row[1]
-                memory_count += row[1]
-        except Exception:
-            pass
+            for mtype, cnt in result.all():
+                memory_by_type[mtype or "unknown"] = cnt
 
         return {
             "id": user.id,
@@ -248,9 +261,10 @@ class AdminService:
             "created_at": user.created_at.isoformat() if user.created_at else None,
             "updated_at": user.updated_at.isoformat() if user.updated_at else None,
             "last_login": user.last_login.isoformat() if user.last_login else None,
-            "session_count": session_count,
-            "message_count": message_count,
-            "memory_count": memory_count,
+            "last_active": row.last_active.isoformat() if row.last_active else None,
+            "session_count": row.session_count or 0,
+            "message_count": row.message_count or 0,
+            "memory_count": row.memory_count or 0,
             "memory_by_type": memory_by_type,
             "recent_sessions": sessions_data,
         }
@@ -281,6 +295,7 @@ class AdminService:
 
         await self.db.commit()
         await self.db.refresh(user)
+        user_cache.invalidate_user(user_id)
 
         return {
             "id": user.id,
@@ -290,110 +305,30 @@ class AdminService:
             "updated_at": user.updated_at.isoformat() if user.updated_at else None,
         }
 
-    async def delete_user(self, user_id: str, current_admin_id: str) -> dict[str, Any]:
+    async def delete_user(self, user_id: str, current_admin_id: str) -> Optional[dict[str, Any]]:
         """
         删除用户及其所有数据。不能删除自己。
-        先用 nm.delete_user_data() 清理 NeuroMemory 数据，
-        再 CASCADE 删除用户（自动清 sessions/messages）。
+        只登记后台删除任务并返回任务信息，数据由 data_lifecycle 分批删除，最后删除账号。
         """
         if user_id == current_admin_id:
             raise ValueError("不能删除自己的账号")
+        return await self._enqueue_deletion(user_id, delete_account=True)
 
-        user_result = await self.db.execute(
-            select(User).where(User.id == user_id)
-        )
-        user = user_result.scalar_one_or_none()
-        if not user:
-            return None
-
-        username = user.username
-
-        # 用 NeuroMemory 公开 API 清理其管理的所有表
-        from app.main import nm
-        try:
-            await nm.delete_user_data(user_id)
-        except Exception:
-            pass
-
-        # 删除用户（CASCADE 自动清 sessions -> messages）
-        await self.db.execute(delete(User).where(User.id == user_id))
-        await self.db.commit()
-
-        return {"user_id": user_id, "username": username, "deleted": True}
-
-    async def clear_user_data(self, user_id: str) -> dict[str, Any]:
+    async def clear_user_data(self, user_id: str) -> Optional[dict[str, Any]]:
         """
         清空用户数据（保留用户账号）。
-        用 nm.delete_user_data() 清理 NeuroMemory 管理的数据，
-        再手动清 Me2 自己的 sessions/messages。
+        与 delete_user 相同走后台分批删除任务，只是不删除账号。
         """
-        user_result = await self.db.execute(
-            select(User).where(User.id == user_id)
-        )
-        user = user_result.scalar_one_or_none()
+        return await self._enqueue_deletion(user_id, delete_account=False)
+
+    async def _enqueue_deletion(self, user_id: str, delete_account: bool) -> Optional[dict[str, Any]]:
+        user = await self.db.get(User, user_id)
         if not user:
             return None
+        job = await data_lifecycle.enqueue_user_deletion(self.db, user, delete_account)
+        data_lifecycle.trigger_user_deletion_jobs()
+        return {"user_id": user_id, "username": user.username, "job": job_to_dict(job)}
 
-        deleted: dict[str, int] = {}
-
-        # 消息（通过 user_id）
-        result = await self.db.execute(delete(Message).where(Message.user_id == user_id))
-        deleted["messages"] = result.rowcount
-
-        # 会话
-        result = await self.db.execute(delete(Session).where(Session.user_id == user_id))
-        deleted["sessions"] = result.rowcount
-
-        await self.db.commit()
-
-        # 用 NeuroMemory 公开 API 清理其管理的所有表
-        from app.main import nm
-        try:
-            nm_result = await nm.delete_user_data(user_id)
-            nm_deleted = nm_result.get("deleted", {})
-            deleted.update(nm_deleted)
-        except Exception:
-            pass
-
-        return {"user_id": user_id, "username": user.username, "deleted": deleted}
-
-    async def reset_all_data(self) -> dict[str, int]:
-        """
-        清空所有业务数据并重建默认 admin 账号。
-        按外键依赖顺序逐表清空，返回每个表删除的行数。
-        """
-        # 按外键依赖顺序：先删子表，再删父表
-        tables = [
-            "messages",
-            "sessions",
-            "conversation_sessions",
-            "conversations",
-            "embeddings",
-            "documents",
-            "graph_edges",
-            "graph_nodes",
-            "key_values",
-            "emotion_profiles",
-            "users",
-        ]
-
-        deleted: dict[str, int] = {}
-        for table in tables:
-            try:
-                result = await self.db.execute(text(f"DELETE FROM {table}"))
-                deleted[table] = result.rowcount
-            except Exception:
-                # 表可能不存在，跳过
-                deleted[table] = 0
-
-        # 重建默认 admin 账号
-        admin_user = User(
-            username="admin",
-            email="admin@me2.app",
-            hashed_password=get_password_hash("Me2Admin@2026"),
-            is_admin=True,
-        )
-        self.db.add(admin_user)
-        await self.db.commit()
-
-        return deleted
+    async def reset_all_data(self) -> dict[str, Any]:
+        """清空所有业务数据并重建默认 admin 账号（TRUNCATE，见 data_lifecycle）"""
+        return await data_lifecycle.reset_all_data(self.db)
@@ -0,0 +1,266 @@
+"""
+冷会话归档
+
+长期不活跃会话的消息占据了 messages 表的大部分体积，却几乎不会被读取。
+归档任务把这类会话的全部消息压缩成 messages_archive 的一行，并从 messages
+中删除；用户再次打开会话（历史消息、导出、继续聊天）时由 ensure_hot() 原样
+回填，消息 id / created_at 不变。
+
+messages 已按月分区时（python manage.py partition-messages），归档完成后
+顺带分离并删除早于归档期限且已清空的月分区。
+
+注意：会话内容搜索（/chat/sessions/search）只覆盖未归档的消息。
+"""
+import asyncio
+import base64
+import json
+import logging
+import time
+import zlib
+from datetime import datetime, timedelta, timezone
+from typing import Any, Optional
+
+from sqlalchemy import select, delete, insert, update, func, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.db.models import Message, MessageArchive, Session
+
+logger = logging.getLogger(__name__)
+
+_MESSAGE_COLUMNS = [c.name for c in Message.__table__.columns]
+_DATETIME_COLUMNS = {"created_at"}
+_BINARY_COLUMNS = {"debug_archive"}
+
+# 最近一次运行结果（供管理命令 / admin 查询）
+_last_report: Optional[dict[str, Any]] = None
+_run_lock = asyncio.Lock()
+
+
+def pack_messages(rows: list[dict[str, Any]]) -> bytes:
+    """把消息行序列化为 zlib 压缩的 JSON"""
+    encoded = []
+    for row in rows:
+        item = {}
+        for name in _MESSAGE_COLUMNS:
+            value = row.get(name)
+            if value is not None and name in _DATETIME_COLUMNS:
+                value = value.isoformat()
+            elif value is not None and name in _BINARY_COLUMNS:
+                value = base64.b64encode(value).decode("ascii")
+            item[name] = value
+        encoded.append(item)
+    raw = json.dumps(encoded, ensure_ascii=False, default=str).encode("utf-8")
+    return zlib.compress(raw, 6)
+
+
+def unpack_messages(blob: bytes) -> list[dict[str, Any]]:
+    """pack_messages 的逆操作"""
+    rows = json.loads(zlib.decompress(blob).decode("utf-8"))
+    for row in rows:
+        for name in _DATETIME_COLUMNS:
+            if row.get(name):
+                row[name] = datetime.fromisoformat(row[name])
+        for name in _BINARY_COLUMNS:
+            if row.get(name):
+                row[name] = base64.b64decode(row[name])
+    return rows
+
+
+class ArchiveService:
+    """冷会话归档服务"""
+
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    @staticmethod
+    def _cutoff(days: int) -> datetime:
+        return datetime.now(timezone.utc) - timedelta(days=days)
+
+    async def archive_session(self, session_id: str) -> int:
+        """归档单个会话，返回归档的消息数（已归档或无消息时返回 0）"""
+        session = (await self.db.execute(
+            select(Session).where(Session.id == session_id).with_for_update()
+        )).scalar_one_or_none()
+        if session is None or session.archived_at is not None:
+            await self.db.rollback()
+            return 0
+
+        result = await self.db.execute(
+            select(Message.__table__)
+            .where(Message.session_id == session_id)
+            .order_by(Message.created_at, Message.id)
+        )
+        rows = [dict(r._mapping) for r in result]
+        if not rows:
+            await self.db.rollback()
+            return 0
+
+        await self.db.execute(insert(MessageArchive).values(
+            session_id=session_id,
+            user_id=session.user_id,
+            message_count=len(rows),
+            first_message_at=rows[0]["created_at"],
+            last_message_at=rows[-1]["created_at"],
+            payload=pack_messages(rows),
+        ))
+        await self.db.execute(delete(Message).where(Message.session_id == session_id))
+        session.archived_at = datetime.now(timezone.utc)
+        await self.db.commit()
+        return len(rows)
+
+    async def ensure_hot(self, session: Session) -> int:
+        """会话已归档时把消息回填到 messages，返回回填的消息数"""
+        if session.archived_at is None:
+            return 0
+
+        archive = (await self.db.execute(
+            select(MessageArchive)
+            .where(MessageArchive.session_id == session.id)
+            .with_for_update()
+        )).scalar_one_or_none()
+
+        restored = 0
+        if archive is not None:
+            rows = unpack_messages(archive.payload)
+            if rows:
+                await self.db.execute(insert(Message), rows)
+            restored = len(rows)
+            await self.db.execute(
+                delete(MessageArchive).where(MessageArchive.session_id == session.id)
+            )
+
+        await self.db.execute(
+            update(Session).where(Session.id == session.id).values(archived_at=None)
+        )
+        await self.db.commit()
+        await self.db.refresh(session)
+        logger.info(f"回填归档会话: {session.id} ({restored} 条消息)")
+        return restored
+
+    async def archived_message_count(self, session_id: str) -> int:
+        count = await self.db.scalar(
+            select(MessageArchive.message_count).where(MessageArchive.session_id == session_id)
+        )
+        return count or 0
+
+    async def preview(self, days: Optional[int] = None) -> dict[str, Any]:
+        """待归档的会话数和消息数（不修改数据）"""
+        days = days if days is not None else settings.MESSAGE_ARCHIVE_AFTER_DAYS
+        cutoff = self._cutoff(days)
+        sessions, messages = (await self.db.execute(
+            select(func.count(func.distinct(Session.id)), func.count(Message.id))
+            .select_from(Session)
+            .join(Message, Message.session_id == Session.id)
+            .where(Session.archived_at.is_(None), Session.last_active_at < cutoff)
+        )).one()
+        return {
+            "days": days,
+            "cutoff": cutoff.isoformat(),
+            "sessions": int(sessions or 0),
+            "messages": int(messages or 0),
+            "last_run": _last_report,
+        }
+
+    async def run(
+        self,
+        days: Optional[int] = None,
+        batch_size: Optional[int] = None,
+        batch_sleep: Optional[float] = None,
+        max_batches: Optional[int] = None,
+    ) -> dict[str, Any]:
+        """按批次归档超过 days 天未活跃的会话"""
+        global _last_report
+
+        days = days if days is not None else settings.MESSAGE_ARCHIVE_AFTER_DAYS
+        batch_size = batch_size or settings.MESSAGE_ARCHIVE_BATCH_SIZE
+        batch_sleep = settings.MESSAGE_ARCHIVE_BATCH_SLEEP if batch_sleep is None else batch_sleep
+
+        cutoff = self._cutoff(days)
+        started = time.time()
+        report: dict[str, Any] = {
+            "days": days,
+            "cutoff": cutoff.isoformat(),
+            "started_at": datetime.now(timezone.utc).isoformat(),
+            "sessions": 0,
+            "messages": 0,
+            "batches": 0,
+            "dropped_partitions": [],
+            "completed": False,
+        }
+
+        # 键集分页游标：(last_active_at, id)
+        cursor: Optional[tuple[datetime, str]] = None
+
+        while max_batches is None or report["batches"] < max_batches:
+            stmt = (
+                select(Session.id, Session.last_active_at)
+                .where(Session.archived_at.is_(None), Session.last_active_at < cutoff)
+                .order_by(Session.last_active_at, Session.id)
+                .limit(batch_size)
+            )
+            if cursor is not None:
+                stmt = stmt.where(tuple_(Session.last_active_at, Session.id) > tuple_(*cursor))
+            candidates = (await self.db.execute(stmt)).all()
+            await self.db.commit()
+            if not candidates:
+                report["completed"] = True
+                break
+
+            for row in candidates:
+                archived = await self.archive_session(row.id)
+                if archived:
+                    report["sessions"] += 1
+                    report["messages"] += archived
+
+            report["batches"] += 1
+            cursor = (candidates[-1].last_active_at, candidates[-1].id)
+
+            if len(candidates) < batch_size:
+                report["completed"] = True
+                break
+            if batch_sleep > 0:
+                await asyncio.sleep(batch_sleep)
+
+        if report["completed"] and self.db.bind.dialect.name == "postgresql":
+            from app.db.partitions import detach_empty_partitions
+            report["dropped_partitions"] = await detach_empty_partitions(
+                self.db.bind, cutoff.date()
+            )
+
+        report["duration_seconds"] = round(time.time() - started, 3)
+        _last_report = report
+        logger.info(
+            f"冷会话归档完成: {report['sessions']} 个会话, "
+            f"{report['messages']} 条消息, {report['batches']} 批"
+        )
+        return report
+
+
+def is_running() -> bool:
+    return _run_lock.locked()
+
+
+def get_last_report() -> Optional[dict[str, Any]]:
+    return _last_report
+
+
+async def run_archive_job(**kwargs) -> Optional[dict[str, Any]]:
+    """使用独立数据库会话执行一次归档任务（定时任务 / 管理命令共用）"""
+    if _run_lock.locked():
+        logger.info("冷会话归档任务正在运行，跳过本次触发")
+        return None
+
+    from app.db.database import AsyncSessionLocal
+
+    async with _run_lock:
+        async with AsyncSessionLocal() as db:
+            return await ArchiveService(db).run(**kwargs)
+
+
+async def run_partition_maintenance() -> list[str]:
+    """提前创建未来月份的 messages 分区（未分区时为空操作）"""
+    from app.db.database import engine
+    from app.db.partitions import ensure_partitions
+
+    return await ensure_partitions(engine, months_ahead=settings.MESSAGE_PARTITION_MONTHS_AHEAD)
@@ -1,8 +1,11 @@
 """认证服务 - 密码加密和 JWT token 管理"""
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
+from typing import Optional
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from app.config import settings
+import asyncio
 import logging
 
 logger = logging.getLogger(__name__)
@@ -10,6 +13,68 @@ logger = logging.getLogger(__name__)
 # 密码加密上下文
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+# bcrypt 每次约 200ms CPU，在事件循环里同步执行会卡住同一 worker 上的所有 SSE 流。
+# 异步接口把计算放到专用线程池（bcrypt 计算期间释放 GIL），并用信号量限制排队数量。
+_hash_executor: Optional[ThreadPoolExecutor] = None
+_hash_semaphores: dict[asyncio.AbstractEventLoop, asyncio.Semaphore] = {}
+
+
+class PasswordHashBusy(Exception):
+    """密码哈希线程池排队已满"""
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _hash_executor
+    if _hash_executor is None:
+        _hash_executor = ThreadPoolExecutor(
+            max_workers=settings.PASSWORD_HASH_WORKERS,
+            thread_name_prefix="bcrypt",
+        )
+    return _hash_executor
+
+
+def _get_semaphore() -> asyncio.Semaphore:
+    # 信号量绑定事件循环，按循环分别创建（测试中每个用例可能使用新的循环）
+    loop = asyncio.get_running_loop()
+    semaphore = _hash_semaphores.get(loop)
+    if semaphore is None:
+        for old in [l for l in _hash_semaphores if l.is_closed()]:
+            del _hash_semaphores[old]
+        semaphore = _hash_semaphores[loop] = asyncio.Semaphore(settings.PASSWORD_HASH_MAX_PENDING)
+    return semaphore
+
+
+async def _run_in_hash_pool(func, *args):
+    semaphore = _get_semaphore()
+    try:
+        await asyncio.wait_for(semaphore.acquire(), timeout=settings.PASSWORD_HASH_QUEUE_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise PasswordHashBusy()
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_get_executor(), func, *args)
+    finally:
+        semaphore.release()
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """验证密码（在线程池中执行，不阻塞事件循环）"""
+    return await _run_in_hash_pool(verify_password, plain_password, hashed_password)
+
+
+async def get_password_hash_async(password: str) -> str:
+    """加密密码（在线程池中执行，不阻塞事件循环）"""
+    return await _run_in_hash_pool(get_password_hash, password)
+
+
+def shutdown_hash_executor() -> None:
+    """应用关闭时释放线程池"""
+    global _hash_executor
+    if _hash_executor is not None:
+        _hash_executor.shutdown(wait=False, cancel_futures=True)
+    _hash_executor = None
+    _hash_semaphores.clear()
+
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """验证密码"""
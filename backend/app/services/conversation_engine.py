@@ -3,10 +3,15 @@ import asyncio
 import logging
 import time
 from typing import Dict, Any
+from datetime import datetime, timedelta, timezone
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import insert, update, func
 from app.services.llm_client import LLMClient
-from app.db.models import Message, Session
+from app.services.metrics_collector import MetricsCollector
+from app.services.overload import Degradation, overload_controller
+from app.services.session_manager import SessionManager
+from app.services.tracing import create_background_task, current_trace, record_span, server_timing, span
+from app.db.models import Message, Session, generate_uuid
 
 logger = logging.getLogger(__name__)
 
@@ -18,11 +23,20 @@ class ConversationEngine:
         """初始化对话引擎"""
         self.llm = LLMClient()
 
-    async def _recall_memories(self, nm, user_id: str, message: str, timings: dict | None = None):
+    async def _recall_memories(
+        self,
+        nm,
+        user_id: str,
+        message: str,
+        timings: dict | None = None,
+        limit: int = 20,
+        skip_graph: bool = False,
+    ):
         """统一的记忆召回逻辑（非流式和流式共用）
 
         手动拆分 nm.recall() 的内部步骤以获取子阶段计时，
         便于在调试面板中展示各步骤耗时瓶颈。
+        过载降级时由调用方减小 limit、跳过图谱搜索（skip_graph）。
         """
         from neuromemory.services.search import DEFAULT_DECAY_RATE
         from neuromemory.services.temporal import TemporalExtractor
@@ -30,9 +44,8 @@ class ConversationEngine:
         recall_timings = {}
 
         # 1. Embedding
-        t0 = time.time()
-        query_embedding = await nm._cached_embed(message)
-        recall_timings['embedding'] = time.time() - t0
+        with span("recall.embedding", recall_timings, key="embedding"):
+            query_embedding = await nm._cached_embed(message)
 
         # 2. 时间解析
         temporal = TemporalExtractor()
@@ -41,41 +54,35 @@ class ConversationEngine:
 
         # 3. 并行搜索（分别计时每个子任务）
         async def _timed_vector():
-            t = time.time()
-            res = await nm._fetch_vector_memories(
-                user_id, message, 20, query_embedding, event_after, event_before, _decay,
-            )
-            recall_timings['vector_search'] = time.time() - t
-            return res
+            with span("recall.vector_search", recall_timings, key="vector_search"):
+                return await nm._fetch_vector_memories(
+                    user_id, message, limit, query_embedding, event_after, event_before, _decay,
+                )
 
         async def _timed_profile():
-            t = time.time()
-            res = await nm._fetch_user_profile(user_id)
-            recall_timings['profile_fetch'] = time.time() - t
-            return res
+            with span("recall.profile_fetch", recall_timings, key="profile_fetch"):
+                return await nm._fetch_user_profile(user_id)
 
         async def _timed_graph():
-            t = time.time()
-            res = await nm._fetch_graph_memories(user_id, message, 20)
-            recall_timings['graph_search'] = time.time() - t
-            return res
+            with span("recall.graph_search", recall_timings, key="graph_search"):
+                return await nm._fetch_graph_memories(user_id, message, limit)
 
-        t0 = time.time()
+        use_graph = nm._graph_enabled and not skip_graph
         coros = [_timed_vector(), _timed_profile()]
-        if nm._graph_enabled:
+        if use_graph:
             coros.append(_timed_graph())
 
-        results = await asyncio.gather(*coros, return_exceptions=True)
-        recall_timings['parallel_search'] = time.time() - t0
+        with span("recall.parallel_search", recall_timings, key="parallel_search"):
+            results = await asyncio.gather(*coros, return_exceptions=True)
 
         vector_results = results[0] if not isinstance(results[0], Exception) else []
         user_profile = results[1] if not isinstance(results[1], Exception) else {}
         graph_results = []
-        if nm._graph_enabled and len(results) > 2:
+        if use_graph and len(results) > 2:
             graph_results = results[2] if not isinstance(results[2], Exception) else []
 
         # 4. 合并去重 + 图谱增强（与 nm.recall 内部逻辑一致）
-        t0 = time.time()
+        t0 = time.perf_counter()
 
         graph_triples = [
             (t.get("subject", "").lower(), t.get("relation", ""), t.get("object", "").lower())
@@ -131,15 +138,87 @@ class ConversationEngine:
             for r in graph_results
             if r.get("subject") and r.get("relation") and r.get("object")
         ]
-        recall_timings['merge'] = time.time() - t0
+        t1 = time.perf_counter()
+        recall_timings['merge'] = t1 - t0
+        record_span("recall.merge", t0, t1)
 
         recall_timings['vector_count'] = len(vector_results)
         recall_timings['graph_count'] = len(graph_results)
+        MetricsCollector().record_recall(recall_timings)
 
         if timings is not None:
             timings['recall_detail'] = recall_timings
 
-        return merged[:20], graph_context, user_profile
+        return merged[:limit], graph_context, user_profile
+
+    async def _persist_turn(
+        self,
+        db: AsyncSession,
+        *,
+        user_id: str,
+        session_id: str,
+        message: str,
+        response: str,
+        system_prompt: str,
+        memories: list[dict],
+        history_count: int,
+        timings: dict,
+        user_created_at: datetime,
+        degradation: Degradation | None = None,
+    ) -> None:
+        """写入一轮对话：一条多行 INSERT + 一条 UPDATE sessions，然后提交
+
+        用户消息和 AI 回复显式指定 created_at，保证同一事务内的两行
+        按时间排序时顺序稳定（数据库 now() 在事务内是同一个值）。
+        """
+        degradation = degradation or Degradation()
+        assistant_created_at = max(
+            datetime.now(timezone.utc), user_created_at + timedelta(microseconds=1)
+        )
+        user_row = {
+            "id": generate_uuid(),
+            "session_id": session_id,
+            "user_id": user_id,
+            "role": "user",
+            "content": message,
+            "system_prompt": None,
+            "recalled_memories": None,
+            "meta": None,
+            "created_at": user_created_at,
+        }
+        assistant_row = {
+            "id": generate_uuid(),
+            "session_id": session_id,
+            "user_id": user_id,
+            "role": "assistant",
+            "content": response,
+            "system_prompt": system_prompt,
+            "recalled_memories": [{
+                "content": m["content"],
+                "score": m.get("score", 0),
+                "memory_type": m.get("memory_type", ""),
+                "created_at": m.get("created_at").isoformat() if m.get("created_at") else None,
+                "metadata": m.get("metadata", {})
+            } for m in memories],
+            "meta": {
+                "memories_count": len(memories),
+                "temperature": 0.8,
+                "max_tokens": degradation.max_tokens,
+                "model": "deepseek-chat",
+                "history_messages_count": history_count,
+                "degradation_level": degradation.level,
+                "timings": timings
+            },
+            "created_at": assistant_created_at,
+        }
+
+        await db.execute(insert(Message).values([user_row, assistant_row]))
+        await db.execute(
+            update(Session)
+            .where(Session.id == session_id)
+            .values(last_active_at=func.now())
+        )
+        await db.commit()
 
     async def chat(
         self,
@@ -150,63 +229,51 @@ class ConversationEngine:
         debug_mode: bool = False
     ) -> Dict[str, Any]:
         """处理对话 - 温暖、懂用户的回复"""
+        # 本轮的降级方案（过载时减少召回/历史/max_tokens，见 overload.py）
+        degradation = overload_controller.begin()
         try:
             timings = {}
-            start_time = time.time()
+            start_time = time.perf_counter()
 
             from app.main import nm
 
             # === 1. 获取历史消息 ===
-            step_start = time.time()
-            stmt = select(Message).where(
-                Message.session_id == session_id
-            ).order_by(Message.created_at.asc()).limit(20)
-            result = await db.execute(stmt)
-            history = result.scalars().all()
-            timings['fetch_history'] = time.time() - step_start
+            with span("fetch_history", timings):
+                history = await SessionManager(db).get_messages(
+                    session_id, limit=degradation.history_limit
+                )
 
             history_messages = [
-                {"role": msg.role, "content": msg.content}
+                {"role": msg["role"], "content": msg["content"]}
                 for msg in history
             ]
             logger.info(f"获取历史消息: {len(history_messages)} 条")
 
-            # === 2. 保存用户消息 ===
-            step_start = time.time()
-            user_msg = Message(
-                session_id=session_id,
-                user_id=user_id,
-                role="user",
-                content=message
-            )
-            db.add(user_msg)
-            await db.flush()
-            timings['save_user_message'] = time.time() - step_start
+            # 用户消息与 AI 回复在最后一次性写入（见 _persist_turn）
+            user_created_at = datetime.now(timezone.utc)
 
             # === 3. 召回记忆（一次 recall 获取所有上下文）===
-            step_start = time.time()
-            memories, graph_context, user_profile = await self._recall_memories(
-                nm, user_id, message, timings=timings
-            )
-            timings['recall_memories'] = time.time() - step_start
+            with span("recall_memories", timings):
+                memories, graph_context, user_profile = await self._recall_memories(
+                    nm, user_id, message, timings=timings,
+                    limit=degradation.recall_k, skip_graph=degradation.skip_graph,
+                )
             logger.info(f"召回 {len(memories)} 条记忆 + {len(graph_context)} 条图谱")
 
             # === 4. 构建 system prompt（按类型分层）===
-            step_start = time.time()
-            system_prompt = self._build_prompt(memories, graph_context, user_profile)
-            timings['build_prompt'] = time.time() - step_start
+            with span("build_prompt", timings):
+                system_prompt = self._build_prompt(memories, graph_context, user_profile)
 
             # === 5. 调用 LLM ===
-            step_start = time.time()
-            llm_result = await self.llm.generate(
-                prompt=message,
-                system_prompt=system_prompt,
-                history_messages=history_messages,
-                temperature=0.8,
-                max_tokens=500,
-                return_debug_info=debug_mode
-            )
-            timings['llm_generate'] = time.time() - step_start
+            with span("llm_generate", timings):
+                llm_result = await self.llm.generate(
+                    prompt=message,
+                    system_prompt=system_prompt,
+                    history_messages=history_messages,
+                    temperature=0.8,
+                    max_tokens=degradation.max_tokens,
+                    return_debug_info=debug_mode
+                )
 
             if debug_mode and isinstance(llm_result, dict):
                 response = llm_result["response"]
@@ -215,41 +282,21 @@ class ConversationEngine:
                 response = llm_result
                 debug_info = None
 
-            # === 6. 保存 AI 回复 ===
-            step_start = time.time()
-            ai_msg = Message(
-                session_id=session_id,
-                user_id=user_id,
-                role="assistant",
-                content=response,
-                system_prompt=system_prompt,
-                recalled_memories=[{
-                    "content": m["content"],
-                    "score": m.get("score", 0),
-                    "memory_type": m.get("memory_type", ""),
-                    "created_at": m.get("created_at").isoformat() if m.get("created_at") else None,
-                    "metadata": m.get("metadata", {})
-                } for m in memories],
-                meta={
-                    "memories_count": len(memories),
-                    "temperature": 0.8,
-                    "max_tokens": 500,
-                    "model": "deepseek-chat",
-                    "history_messages_count": len(history_messages),
-                    "timings": timings
-                }
-            )
-            db.add(ai_msg)
-
-            from sqlalchemy.sql import func
-            stmt_session = select(Session).where(Session.id == session_id)
-            result_session = await db.execute(stmt_session)
-            session = result_session.scalar_one_or_none()
-            if session:
-                session.last_active_at = func.now()
-
-            await db.commit()
-            timings['save_to_db'] = time.time() - step_start
+            # === 6. 保存本轮对话 ===
+            with span("save_to_db", timings):
+                await self._persist_turn(
+                    db,
+                    user_id=user_id,
+                    session_id=session_id,
+                    message=message,
+                    response=response,
+                    system_prompt=system_prompt,
+                    memories=memories,
+                    history_count=len(history_messages),
+                    timings=timings,
+                    user_created_at=user_created_at,
+                    degradation=degradation,
+                )
 
             # === 7. 异步同步到 NeuroMemory（不阻塞响应）===
             async def _sync_neuromemory():
@@ -261,17 +308,20 @@ class ConversationEngine:
                     )
                 except Exception as e:
                     logger.error(f"NeuroMemory 同步失败: {e}", exc_info=True)
-            asyncio.create_task(_sync_neuromemory())
+            MetricsCollector().track_background(
+                "neuromemory_sync", create_background_task("neuromemory_sync", _sync_neuromemory())
+            )
             timings['sync_neuromemory'] = 0  # 异步执行，不计入响应时间
 
-            timings['total'] = time.time() - start_time
+            timings['total'] = time.perf_counter() - start_time
             logger.info(f"对话处理完成: 总耗时: {timings['total']:.3f}s")
 
             result = {
                 "response": response,
                 "memories_recalled": len(memories),
                 "insights_used": 0,
-                "history_messages_count": len(history_messages)
+                "history_messages_count": len(history_messages),
+                "degradation_level": degradation.level,
             }
 
             if debug_mode and debug_info:
@@ -287,6 +337,8 @@ class ConversationEngine:
                 "response": "抱歉，我遇到了一些问题，请稍后再试。",
                 "error": str(e)
             }
+        finally:
+            degradation.end()
 
     def _build_prompt(
         self,
@@ -402,112 +454,79 @@ class ConversationEngine:
         debug_mode: bool = False
     ):
         """流式对话处理"""
+        degradation = overload_controller.begin()
         try:
             from app.main import nm
 
             timings = {}
-            start_time = time.time()
+            start_time = time.perf_counter()
 
             # === 1. 获取历史 ===
-            step_start = time.time()
-            stmt = select(Message).where(
-                Message.session_id == session_id
-            ).order_by(Message.created_at.asc()).limit(20)
-            result = await db.execute(stmt)
-            history = result.scalars().all()
-            timings['fetch_history'] = time.time() - step_start
+            with span("fetch_history", timings):
+                history = await SessionManager(db).get_messages(
+                    session_id, limit=degradation.history_limit
+                )
 
             history_messages = [
-                {"role": msg.role, "content": msg.content}
+                {"role": msg["role"], "content": msg["content"]}
                 for msg in history
             ]
 
-            # === 2. 保存用户消息 ===
-            step_start = time.time()
-            user_msg = Message(
-                session_id=session_id,
-                user_id=user_id,
-                role="user",
-                content=message
-            )
-            db.add(user_msg)
-            await db.flush()
-            timings['save_user_message'] = time.time() - step_start
+            # 用户消息与 AI 回复在最后一次性写入（见 _persist_turn）
+            user_created_at = datetime.now(timezone.utc)
 
             # === 3. 召回记忆（一次 recall）===
-            step_start = time.time()
-            try:
-                memories, graph_context, user_profile = await self._recall_memories(
-                    nm, user_id, message, timings=timings
-                )
-            except Exception as e:
-                logger.warning(f"记忆召回失败: {e}")
-                memories = []
-                graph_context = []
-                user_profile = {}
-            timings['recall_memories'] = time.time() - step_start
+            with span("recall_memories", timings) as recall_span:
+                try:
+                    memories, graph_context, user_profile = await self._recall_memories(
+                        nm, user_id, message, timings=timings,
+                        limit=degradation.recall_k, skip_graph=degradation.skip_graph,
+                    )
+                except Exception as e:
+                    logger.warning(f"记忆召回失败: {e}")
+                    recall_span.set(error=type(e).__name__)
+                    memories = []
+                    graph_context = []
+                    user_profile = {}
 
             # === 4. 构建 prompt ===
-            step_start = time.time()
-            system_prompt = self._build_prompt(memories, graph_context, user_profile)
-            timings['build_prompt'] = time.time() - step_start
+            with span("build_prompt", timings):
+                system_prompt = self._build_prompt(memories, graph_context, user_profile)
 
             # === 5. 流式 LLM ===
-            step_start = time.time()
-            stream_generator = await self.llm.generate(
-                prompt=message,
-                system_prompt=system_prompt,
-                history_messages=history_messages,
-                temperature=0.8,
-                max_tokens=500,
-                stream=True
-            )
-
-            full_response = ""
-            async for chunk in stream_generator:
-                if isinstance(chunk, dict) and chunk.get("done"):
-                    break
-                else:
-                    full_response += chunk
-                    yield chunk
+            with span("llm_generate", timings):
+                stream_generator = await self.llm.generate(
+                    prompt=message,
+                    system_prompt=system_prompt,
+                    history_messages=history_messages,
+                    temperature=0.8,
+                    max_tokens=degradation.max_tokens,
+                    stream=True
+                )
 
-            timings['llm_generate'] = time.time() - step_start
+                full_response = ""
+                async for chunk in stream_generator:
+                    if isinstance(chunk, dict) and chunk.get("done"):
+                        break
+                    else:
+                        full_response += chunk
+                        yield chunk
 
             # === 6. 保存和同步 ===
-            step_start = time.time()
-            ai_msg = Message(
-                session_id=session_id,
-                user_id=user_id,
-                role="assistant",
-                content=full_response,
-                system_prompt=system_prompt,
-                recalled_memories=[{
-                    "content": m["content"],
-                    "score": m.get("score", 0),
-                    "memory_type": m.get("memory_type", ""),
-                    "created_at": m.get("created_at").isoformat() if m.get("created_at") else None,
-                    "metadata": m.get("metadata", {})
-                } for m in memories],
-                meta={
-                    "memories_count": len(memories),
-                    "temperature": 0.8,
-                    "max_tokens": 500,
-                    "model": "deepseek-chat",
-                    "history_messages_count": len(history_messages),
-                    "timings": timings
-                }
-            )
-            db.add(ai_msg)
-
-            from sqlalchemy.sql import func
-            stmt_session = select(Session).where(Session.id == session_id)
-            result_session = await db.execute(stmt_session)
-            session = result_session.scalar_one_or_none()
-            if session:
-                session.last_active_at = func.now()
-
-            await db.commit()
-            timings['save_to_db'] = time.time() - step_start
+            with span("save_to_db", timings):
+                await self._persist_turn(
+                    db,
+                    user_id=user_id,
+                    session_id=session_id,
+                    message=message,
+                    response=full_response,
+                    system_prompt=system_prompt,
+                    memories=memories,
+                    history_count=len(history_messages),
+                    timings=timings,
+                    user_created_at=user_created_at,
+                    degradation=degradation,
+                )
 
             # 异步同步到 NeuroMemory（不阻塞响应）
             async def _sync_neuromemory():
@@ -519,9 +538,11 @@ class ConversationEngine:
                     )
                 except Exception as e:
                     logger.error(f"NeuroMemory 同步失败: {e}", exc_info=True)
-            asyncio.create_task(_sync_neuromemory())
+            MetricsCollector().track_background(
+                "neuromemory_sync", create_background_task("neuromemory_sync", _sync_neuromemory())
+            )
 
-            timings['total'] = time.time() - start_time
+            timings['total'] = time.perf_counter() - start_time
 
             # === 完成信号 ===
             recalled_summaries = [
@@ -540,14 +561,21 @@ class ConversationEngine:
                 "memories_recalled": len(memories),
                 "insights_used": 0,
                 "history_messages_count": len(history_messages),
-                "recalled_summaries": recalled_summaries
+                "recalled_summaries": recalled_summaries,
+                "degradation_level": degradation.level,
             }
 
+            # 响应头里的 Server-Timing 只含首字节前的阶段，完整分阶段耗时随 done 事件下发
+            trace = current_trace()
+            if trace is not None:
+                done_data["trace_id"] = trace.trace_id
+                done_data["server_timing"] = server_timing(trace)
+
             if debug_mode:
                 done_data["debug_info"] = {
                     "model": "deepseek-chat",
                     "temperature": 0.8,
-                    "max_tokens": 500,
+                    "max_tokens": degradation.max_tokens,
                     "messages": [{"role": "system", "content": system_prompt}] +
                                history_messages +
                                [{"role": "user", "content": message}],
@@ -566,6 +594,8 @@ class ConversationEngine:
                 "type": "error",
                 "error": str(e)
             }
+        finally:
+            degradation.end()
 
 
 # 全局单例
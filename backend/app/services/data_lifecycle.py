@@ -0,0 +1,317 @@
+"""
+数据生命周期：全量重置与按用户删除
+
+- reset_all_data：PostgreSQL 上用一条 TRUNCATE ... RESTART IDENTITY CASCADE 清空所有业务表，
+  不逐行删除、不产生大量 WAL 和死元组
+- 删除用户 / 清空用户数据：接口只在 jobs 表登记一个 queued 任务并立即返回任务 ID，
+  后台任务按表分批删除（每批 DATA_DELETE_BATCH_SIZE 行，单独提交），进度与游标
+  （已完成的表）随每批一起写入 jobs 行。进程中断后，定时任务 data_deletion 会接管
+  未完成的任务从当前表继续；删除条件只依赖 user_id，重复执行是安全的。
+"""
+import asyncio
+import logging
+import time
+from typing import Any, Optional
+
+from sqlalchemy import select, delete, inspect, table, column, text, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.db.models import User, Job
+from app.services import user_cache
+from app.services.auth_service import get_password_hash_async
+from app.services.job_store import JobStore
+from app.services.metrics_collector import MetricsCollector
+
+logger = logging.getLogger(__name__)
+
+DELETE_JOB_KIND = "user_data_delete"
+
+# 按外键依赖顺序：先删子表，再删父表（NeuroMemory 的表可能不存在）
+RESET_TABLES = [
+    "messages",
+    "messages_archive",
+    "sessions",
+    "conversation_sessions",
+    "conversations",
+    "embeddings",
+    "documents",
+    "graph_edges",
+    "graph_nodes",
+    "key_values",
+    "emotion_profiles",
+    "stats_snapshots",
+    "llm_usage_events",
+    "llm_usage_daily",
+    "users",
+]
+
+# 按用户分批删除的表（大表在前；sessions 放在 messages 之后，避免 CASCADE 一次删完）
+USER_TABLES = [
+    "graph_edges",
+    "graph_nodes",
+    "embeddings",
+    "documents",
+    "key_values",
+    "emotion_profiles",
+    "conversation_sessions",
+    "conversations",
+    "messages",
+    "messages_archive",
+    "sessions",
+    "llm_usage_events",
+    "llm_usage_daily",
+]
+
+_run_lock = asyncio.Lock()
+_run_task: Optional[asyncio.Task] = None
+
+
+async def _existing_tables(db: AsyncSession, names: list[str]) -> dict[str, dict[str, Any]]:
+    """返回存在的表及其主键列、是否有 user_id 列"""
+    def _inspect(sync_session):
+        insp = inspect(sync_session.connection())
+        found = {}
+        for name in names:
+            if not insp.has_table(name):
+                continue
+            columns = {c["name"] for c in insp.get_columns(name)}
+            found[name] = {
+                "pk": insp.get_pk_constraint(name).get("constrained_columns") or [],
+                "has_user_id": "user_id" in columns,
+            }
+        return found
+
+    return await db.run_sync(_inspect)
+
+
+async def reset_all_data(db: AsyncSession) -> dict[str, Any]:
+    """清空所有业务数据并重建默认 admin 账号
+
+    PostgreSQL 上对所有存在的表执行一条 TRUNCATE（行数取自 pg_class 估算）；
+    其他数据库（测试用 SQLite）逐表 DELETE。
+    """
+    tables = list(await _existing_tables(db, RESET_TABLES))
+    deleted: dict[str, int] = {}
+
+    if db.get_bind().dialect.name == "postgresql":
+        rows = await db.execute(
+            text(
+                "SELECT relname, GREATEST(reltuples, 0)::bigint FROM pg_class "
+                "WHERE relkind IN ('r', 'p') AND relname = ANY(:tables) "
+                "AND relnamespace = 'public'::regnamespace"
+            ),
+            {"tables": tables},
+        )
+        deleted = {name: count for name, count in rows.all()}
+        await db.execute(text(f"TRUNCATE TABLE {', '.join(tables)} RESTART IDENTITY CASCADE"))
+        estimated = True
+    else:
+        for name in tables:
+            result = await db.execute(text(f"DELETE FROM {name}"))
+            deleted[name] = result.rowcount
+        estimated = False
+
+    # 重建默认 admin 账号
+    db.add(User(
+        username="admin",
+        email="admin@me2.app",
+        hashed_password=await get_password_hash_async("Me2Admin@2026"),
+        is_admin=True,
+    ))
+    await db.commit()
+    user_cache.clear()
+
+    logger.warning(f"🧹 已重置所有数据: {', '.join(tables)}")
+    return {"truncated": tables, "deleted": deleted, "estimated": estimated}
+
+
+async def enqueue_user_deletion(db: AsyncSession, user: User, delete_account: bool) -> Job:
+    """登记删除任务；同一用户已有未完成的任务时返回该任务"""
+    store = JobStore(db)
+    for job in await store.list_resumable(DELETE_JOB_KIND):
+        if job.params.get("user_id") == user.id:
+            if delete_account and not job.params.get("delete_account"):
+                job.params = {**job.params, "delete_account": True}
+                await db.commit()
+            return job
+    return await store.create(
+        DELETE_JOB_KIND,
+        {"user_id": user.id, "username": user.username, "delete_account": delete_account},
+        status="queued",
+    )
+
+
+class UserDataDeleter:
+    """按表分批删除一个用户的所有数据"""
+
+    def __init__(self, db: AsyncSession, nm=None):
+        self.db = db
+        self._nm = nm
+
+    async def _delete_batch(self, name: str, meta: dict[str, Any], user_id: str, batch_size: int) -> int:
+        pk = meta["pk"]
+        t = table(name, column("user_id"), *(column(c) for c in pk if c != "user_id"))
+        if not pk:
+            # 没有主键的表无法分批定位行，一次删除
+            result = await self.db.execute(delete(t).where(t.c.user_id == user_id))
+            return result.rowcount or 0
+        keys = [t.c[c] for c in pk]
+        chunk = select(*keys).where(t.c.user_id == user_id).limit(batch_size)
+        target = keys[0] if len(keys) == 1 else tuple_(*keys)
+        result = await self.db.execute(
+            delete(t).where(target.in_(chunk)).execution_options(synchronize_session=False)
+        )
+        return result.rowcount or 0
+
+    async def run(
+        self,
+        job: Job,
+        batch_size: Optional[int] = None,
+        batch_sleep: Optional[float] = None,
+        max_batches: Optional[int] = None,
+    ) -> dict[str, Any]:
+        """执行（或继续）一个删除任务，返回任务报告
+
+        job.cursor 为已删完的表数；max_batches 达到后任务暂停，下次继续。
+        """
+        batch_size = batch_size or settings.DATA_DELETE_BATCH_SIZE
+        batch_sleep = settings.DATA_DELETE_BATCH_SLEEP if batch_sleep is None else batch_sleep
+        job_id = job.id
+        user_id = job.params["user_id"]
+        delete_account = job.params.get("delete_account", False)
+
+        store = JobStore(self.db)
+        metrics = MetricsCollector()
+        progress = {"tables": {}, "deleted": 0, "batches": 0, "stage": None, **(job.progress or {})}
+        progress["attempts"] = progress.get("attempts", 0) + 1
+        done = job.cursor or 0
+        started = time.time()
+        run_batches = 0
+        status = "completed"
+
+        try:
+            tables = await _existing_tables(self.db, USER_TABLES)
+            while done < len(USER_TABLES):
+                name = USER_TABLES[done]
+                meta = tables.get(name)
+                progress["stage"] = name
+                if meta is not None and meta["has_user_id"]:
+                    while True:
+                        if max_batches is not None and run_batches >= max_batches:
+                            status = "paused"
+                            break
+                        count = await self._delete_batch(name, meta, user_id, batch_size)
+                        progress["tables"][name] = progress["tables"].get(name, 0) + count
+                        progress["deleted"] += count
+                        progress["batches"] += 1
+                        run_batches += 1
+                        store.save_progress(job, progress, done)
+                        await self.db.commit()
+                        metrics.record_job_progress(DELETE_JOB_KIND, job_id=job_id, **progress)
+                        if count < batch_size:
+                            break
+                        if batch_sleep > 0:
+                            await asyncio.sleep(batch_sleep)
+                    if status == "paused":
+                        break
+                done += 1
+                store.save_progress(job, progress, done)
+                await self.db.commit()
+
+            if status == "completed":
+                # 剩余的 NeuroMemory 数据（上面没有覆盖到的表）交给其公开 API
+                progress["stage"] = "neuromemory"
+                nm = self._nm
+                if nm is None:
+                    from app.main import nm
+                if nm is not None:
+                    nm_result = await nm.delete_user_data(user_id) or {}
+                    for key, count in (nm_result.get("deleted") or {}).items():
+                        progress["tables"][key] = progress["tables"].get(key, 0) + (count or 0)
+
+                if delete_account:
+                    progress["stage"] = "users"
+                    await self.db.execute(delete(User).where(User.id == user_id))
+                    user_cache.invalidate_user(user_id)
+                progress["stage"] = None
+                store.save_progress(job, progress, done, status="running")
+                await self.db.commit()
+        except Exception as e:
+            await self.db.rollback()
+            status = "failed"
+            store.save_progress(job, progress, done, status="failed")
+            await store.finish(job, status, error=str(e))
+            logger.error(f"用户数据删除失败 {user_id}（任务 {job_id}）: {e}")
+            raise
+        finally:
+            metrics.record_job(
+                DELETE_JOB_KIND,
+                processed=progress["deleted"],
+                batches=run_batches,
+                duration_ms=(time.time() - started) * 1000,
+                status=status,
+            )
+
+        await store.finish(job, status)
+        logger.info(
+            f"用户数据删除{'完成' if status == 'completed' else '暂停'}: {user_id} "
+            f"{progress['deleted']} 行, {progress['batches']} 批"
+        )
+        return {
+            "job_id": job_id,
+            "status": status,
+            "user_id": user_id,
+            "delete_account": delete_account,
+            **progress,
+            "duration_seconds": round(time.time() - started, 3),
+        }
+
+
+async def run_user_deletion_jobs() -> Optional[list[dict[str, Any]]]:
+    """依次执行所有未完成的删除任务（接口触发 / 定时任务接管中断的任务）"""
+    if _run_lock.locked():
+        return None
+
+    from app.db.database import AsyncSessionLocal
+
+    reports = []
+    async with _run_lock:
+        async with AsyncSessionLocal() as db:
+            store = JobStore(db)
+            # 执行期间新登记的任务在下一轮被取到，直到没有可执行的任务
+            while True:
+                claimed = False
+                for job in await store.list_resumable(DELETE_JOB_KIND):
+                    attempts = (job.progress or {}).get("attempts", 0)
+                    if job.status == "failed" and attempts >= settings.DATA_DELETE_MAX_ATTEMPTS:
+                        continue
+                    if not await store.claim(job, stale_after=settings.DATA_DELETE_STALE_SECONDS):
+                        continue  # 其他 worker 正在执行
+                    claimed = True
+                    try:
+                        reports.append(await UserDataDeleter(db).run(job))
+                    except Exception:
+                        pass  # 已记录在任务中，按 DATA_DELETE_MAX_ATTEMPTS 重试
+                if not claimed:
+                    break
+    return reports
+
+
+def is_running() -> bool:
+    return _run_lock.locked() or bool(_run_task and not _run_task.done())
+
+
+def trigger_user_deletion_jobs() -> None:
+    """在后台执行删除任务（已在运行时，正在运行的那一轮会取到新任务）"""
+    global _run_task
+    if is_running():
+        return
+    _run_task = asyncio.create_task(run_user_deletion_jobs())
+
+
+async def get_job_status(db: AsyncSession, job_id: str) -> Optional[Job]:
+    job = await JobStore(db).get(job_id)
+    if job is None or job.kind != DELETE_JOB_KIND:
+        return None
+    return job
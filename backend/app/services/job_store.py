@@ -0,0 +1,132 @@
+"""
+可恢复的后台任务记录（jobs 表）
+
+批量维护任务（会话清理等）每处理完一批就把游标和进度写入 jobs 行，
+与该批的数据修改在同一个事务中提交。进程被中断后，下一次运行通过
+get_resumable() 找到未完成的任务，沿用原参数从游标处继续。
+"""
+from datetime import datetime, timedelta, timezone
+from typing import Any, Optional
+
+from sqlalchemy import select, update, func, or_, and_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db.models import Job
+
+# 可以继续执行的状态（queued 为已提交未开始，running 表示上次运行时进程被中断）
+RESUMABLE_STATUSES = ("queued", "running", "paused", "failed")
+
+
+class JobStore:
+    """jobs 表读写"""
+
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    async def create(
+        self, kind: str, params: Optional[dict[str, Any]] = None, status: str = "running"
+    ) -> Job:
+        job = Job(kind=kind, status=status, params=params or {}, progress={})
+        self.db.add(job)
+        await self.db.commit()
+        await self.db.refresh(job)
+        return job
+
+    async def get(self, job_id: str) -> Optional[Job]:
+        return await self.db.get(Job, job_id)
+
+    async def get_resumable(self, kind: str) -> Optional[Job]:
+        """最近一个未完成的同类任务"""
+        result = await self.db.execute(
+            select(Job)
+            .where(Job.kind == kind, Job.status.in_(RESUMABLE_STATUSES))
+            .order_by(Job.created_at.desc())
+            .limit(1)
+        )
+        return result.scalar_one_or_none()
+
+    async def list_resumable(self, kind: str) -> list[Job]:
+        """所有未完成的同类任务（按提交顺序）"""
+        result = await self.db.execute(
+            select(Job)
+            .where(Job.kind == kind, Job.status.in_(RESUMABLE_STATUSES))
+            .order_by(Job.created_at)
+        )
+        return list(result.scalars().all())
+
+    async def count_unfinished(self) -> dict[tuple[str, str], int]:
+        """未完成任务数，按 (kind, status) 分组（任务队列深度）"""
+        result = await self.db.execute(
+            select(Job.kind, Job.status, func.count())
+            .where(Job.status.in_(RESUMABLE_STATUSES))
+            .group_by(Job.kind, Job.status)
+        )
+        return {(kind, status): n for kind, status, n in result.all()}
+
+    async def claim(self, job: Job, stale_after: float) -> bool:
+        """把任务标记为 running 并归当前进程执行
+
+        多个 worker 同时扫描时只有一个能更新成功；running 状态的任务只有在
+        stale_after 秒内没有进度更新（原进程已中断）时才能被接管。
+        """
+        now = datetime.now(timezone.utc)
+        result = await self.db.execute(
+            update(Job)
+            .where(
+                Job.id == job.id,
+                or_(
+                    Job.status.in_(("queued", "paused", "failed")),
+                    and_(Job.status == "running", Job.updated_at < now - timedelta(seconds=stale_after)),
+                ),
+            )
+            .values(status="running", updated_at=now)
+            .execution_options(synchronize_session=False)
+        )
+        await self.db.commit()
+        if result.rowcount != 1:
+            return False
+        await self.db.refresh(job)
+        return True
+
+    async def list_recent(self, kind: Optional[str] = None, limit: int = 20) -> list[Job]:
+        stmt = select(Job).order_by(Job.created_at.desc()).limit(limit)
+        if kind:
+            stmt = stmt.where(Job.kind == kind)
+        return list((await self.db.execute(stmt)).scalars().all())
+
+    def save_progress(
+        self,
+        job: Job,
+        progress: dict[str, Any],
+        cursor: Optional[Any] = None,
+        status: str = "running",
+    ) -> None:
+        """更新进度（不提交，由调用方与本批数据修改一起提交）"""
+        job.progress = dict(progress)
+        if cursor is not None:
+            job.cursor = cursor
+        job.status = status
+        job.error = None
+        job.updated_at = datetime.now(timezone.utc)
+
+    async def finish(self, job: Job, status: str = "completed", error: Optional[str] = None) -> None:
+        job.status = status
+        job.error = error
+        job.updated_at = datetime.now(timezone.utc)
+        if status == "completed":
+            job.finished_at = datetime.now(timezone.utc)
+        await self.db.commit()
+
+
+def job_to_dict(job: Job) -> dict[str, Any]:
+    return {
+        "id": job.id,
+        "kind": job.kind,
+        "status": job.status,
+        "params": job.params,
+        "progress": job.progress,
+        "error": job.error,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "updated_at": job.updated_at.isoformat() if job.updated_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+    }
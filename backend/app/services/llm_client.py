@@ -3,6 +3,7 @@ LLM 客户端封装
 
 提供统一的 LLM 调用接口
 """
+import asyncio
 import logging
 import json
 import time
@@ -10,6 +11,9 @@ from typing import Optional, List, Dict, Any
 from openai import AsyncOpenAI
 from app.config import settings
 from app.services.metrics_collector import MetricsCollector
+from app.services import usage_tracker
+from app.services.overload import overload_controller
+from app.services.tracing import record_span
 
 logger = logging.getLogger(__name__)
 
@@ -99,39 +103,69 @@ class LLMClient:
                 # 返回异步生成器
                 async def stream_generator():
                     full_response = ""
-                    llm_start = time.time()
+                    llm_start = time.perf_counter()
+                    first_token = None
                     prompt_tokens = 0
                     completion_tokens = 0
+                    cache_hits = 0
+                    usage_received = False
+                    error = None
+                    aborted = False
                     try:
                         async for chunk in await self.client.chat.completions.create(**kwargs):
                             if chunk.usage:
+                                usage_received = True
                                 prompt_tokens = chunk.usage.prompt_tokens or 0
                                 completion_tokens = chunk.usage.completion_tokens or 0
+                                cache_hits = usage_tracker.cache_hit_tokens(chunk.usage)
                             if not chunk.choices:
                                 continue
                             if chunk.choices[0].delta.content:
                                 content = chunk.choices[0].delta.content
+                                if first_token is None:
+                                    first_token = time.perf_counter()
                                 full_response += content
                                 yield content
-
-                        llm_duration = (time.time() - llm_start) * 1000
+                    except (GeneratorExit, asyncio.CancelledError):
+                        # 客户端断开 / 停止生成：不算调用失败，但服务商照样计费，同样要记账
+                        aborted = True
+                        raise
+                    except Exception as e:
+                        error = type(e).__name__
+                        raise
+                    finally:
+                        llm_end = time.perf_counter()
+                        if not usage_received:
+                            # 没收到最后的 usage 块（流被中途取消），按已发送的内容估算
+                            prompt_tokens = usage_tracker.estimate_prompt_tokens(messages)
+                            completion_tokens = usage_tracker.estimate_tokens(full_response)
                         MetricsCollector().record_llm(
                             model=kwargs.get("model", "unknown"),
                             prompt_tokens=prompt_tokens,
                             completion_tokens=completion_tokens,
-                            duration_ms=llm_duration,
-                            success=True,
+                            duration_ms=(llm_end - llm_start) * 1000,
+                            success=error is None,
                         )
-                    except Exception:
-                        llm_duration = (time.time() - llm_start) * 1000
-                        MetricsCollector().record_llm(
-                            model=kwargs.get("model", "unknown"),
-                            prompt_tokens=prompt_tokens,
-                            completion_tokens=completion_tokens,
-                            duration_ms=llm_duration,
-                            success=False,
+                        usage_tracker.record(
+                            kwargs.get("model", "unknown"), prompt_tokens, completion_tokens,
+                            (llm_end - llm_start) * 1000, success=error is None, cache_hits=cache_hits,
                         )
-                        raise
+                        # 过载判断看首 token 延迟（总耗时随回复长度变化）
+                        overload_controller.observe_llm(((first_token or llm_end) - llm_start) * 1000)
+                        if error is not None:
+                            record_span("llm.stream", llm_start, llm_end, model=self.model, error=error)
+                        elif aborted:
+                            record_span(
+                                "llm.stream", llm_start, llm_end, model=self.model, aborted=True,
+                                prompt_tokens=prompt_tokens, completion_tokens=completion_tokens,
+                            )
+
+                    if first_token is not None:
+                        record_span("llm.ttft", llm_start, first_token, model=self.model)
+                    record_span(
+                        "llm.stream", llm_start, llm_end, model=self.model,
+                        prompt_tokens=prompt_tokens, completion_tokens=completion_tokens,
+                    )
 
                     # 流结束后返回调试信息（如果需要）
                     if return_debug_info:
@@ -151,27 +185,46 @@ class LLMClient:
                 return stream_generator()
 
             # 非流式生成（原有逻辑）
-            llm_start = time.time()
+            llm_start = time.perf_counter()
             try:
                 response = await self.client.chat.completions.create(**kwargs)
-                llm_duration = (time.time() - llm_start) * 1000
+                llm_end = time.perf_counter()
                 usage = response.usage
                 MetricsCollector().record_llm(
                     model=kwargs.get("model", "unknown"),
                     prompt_tokens=usage.prompt_tokens if usage else 0,
                     completion_tokens=usage.completion_tokens if usage else 0,
-                    duration_ms=llm_duration,
+                    duration_ms=(llm_end - llm_start) * 1000,
+                    success=True,
+                )
+                usage_tracker.record(
+                    kwargs.get("model", "unknown"),
+                    usage.prompt_tokens if usage else 0,
+                    usage.completion_tokens if usage else 0,
+                    (llm_end - llm_start) * 1000,
                     success=True,
+                    cache_hits=usage_tracker.cache_hit_tokens(usage),
+                )
+                overload_controller.observe_llm((llm_end - llm_start) * 1000)
+                record_span(
+                    "llm.generate", llm_start, llm_end, model=self.model,
+                    prompt_tokens=usage.prompt_tokens if usage else 0,
+                    completion_tokens=usage.completion_tokens if usage else 0,
                 )
             except Exception as e:
-                llm_duration = (time.time() - llm_start) * 1000
+                llm_end = time.perf_counter()
                 MetricsCollector().record_llm(
                     model=kwargs.get("model", "unknown"),
                     prompt_tokens=0,
                     completion_tokens=0,
-                    duration_ms=llm_duration,
+                    duration_ms=(llm_end - llm_start) * 1000,
                     success=False,
                 )
+                usage_tracker.record(
+                    kwargs.get("model", "unknown"), 0, 0, (llm_end - llm_start) * 1000, success=False,
+                )
+                overload_controller.observe_llm((llm_end - llm_start) * 1000)
+                record_span("llm.generate", llm_start, llm_end, model=self.model, error=type(e).__name__)
                 raise
 
             generated_text = response.choices[0].message.content.strip()
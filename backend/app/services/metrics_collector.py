@@ -1,151 +1,529 @@
 """In-memory metrics collector for API and LLM monitoring.
 
-Uses a ring buffer of data points (last 24h). Resets on server restart.
+API, LLM and embedding calls are kept as streaming aggregates (per-minute windows for
+the last hour, hourly roll-ups for 24h, see metrics_streaming), so recording never
+allocates a per-call object and queries cost O(windows), not O(calls).
+get_totals() returns the since-startup aggregates used by the /metrics exporter
+(metrics_exporter). Resets on server restart.
+
+Each worker process has its own collector; with METRICS_SHARED the windows are
+flushed to Postgres and merged into a fleet-wide view (metrics_store, view()).
 """
+import asyncio
 import time
 import threading
 from collections import defaultdict, deque
 from dataclasses import dataclass, field
 
+from app.services.metrics_streaming import StreamingHistogram, WindowedAggregates
 
-@dataclass
-class ApiMetric:
-    path: str
-    method: str
-    status_code: int
-    duration_ms: float
-    timestamp: float = field(default_factory=time.time)
 
+# Upper bounds (ms) of the connection-pool wait histogram; the last bucket is +Inf.
+POOL_WAIT_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
 
-@dataclass
-class EmbeddingMetric:
-    model: str
-    text_count: int
-    duration_ms: float
-    success: bool
-    timestamp: float = field(default_factory=time.time)
+
+def _new_pool_stat() -> dict:
+    return {
+        "checkouts": 0,
+        "timeouts": 0,
+        "wait_total_ms": 0.0,
+        "wait_max_ms": 0.0,
+        "wait_buckets": [0] * (len(POOL_WAIT_BUCKETS_MS) + 1),
+        "hold": defaultdict(lambda: {"count": 0, "total_ms": 0.0, "max_ms": 0.0}),
+    }
+
+
+def _bucket_quantile(buckets: list[int], q: float) -> float | None:
+    """Upper bound of the bucket containing the q-quantile (None if in the overflow bucket)."""
+    total = sum(buckets)
+    if not total:
+        return 0.0
+    rank = q * total
+    seen = 0
+    for i, n in enumerate(buckets):
+        seen += n
+        if seen >= rank:
+            return float(POOL_WAIT_BUCKETS_MS[i]) if i < len(POOL_WAIT_BUCKETS_MS) else None
+    return None
+
+
+# Quantiles reported for latency histograms.
+QUANTILES = (0.5, 0.9, 0.95, 0.99)
+
+
+_STATUS_CLASSES = tuple(f"{i}xx" for i in range(10))
+
+
+def _status_class(status_code: int) -> str:
+    return _STATUS_CLASSES[status_code // 100] if 0 <= status_code < 1000 else "other"
+
+
+def _latency_summary(hist: StreamingHistogram) -> dict:
+    p50, p90, p95, p99 = hist.quantiles(QUANTILES)
+    return {
+        "count": hist.count,
+        "avg_ms": round(hist.mean, 1),
+        "p50_ms": round(p50, 1),
+        "p90_ms": round(p90, 1),
+        "p95_ms": round(p95, 1),
+        "p99_ms": round(p99, 1),
+        "max_ms": round(hist.max, 1),
+    }
+
+
+class StreamAggregate:
+    __slots__ = ("ttfb", "duration", "chunks", "incomplete")
+
+    def __init__(self):
+        self.ttfb = StreamingHistogram()
+        self.duration = StreamingHistogram()
+        self.chunks = 0
+        self.incomplete = 0
+
+    def merge(self, other: "StreamAggregate") -> None:
+        self.ttfb.merge(other.ttfb)
+        self.duration.merge(other.duration)
+        self.chunks += other.chunks
+        self.incomplete += other.incomplete
+
+
+class LLMAggregate:
+    __slots__ = ("duration", "failures", "prompt_tokens", "completion_tokens")
+
+    def __init__(self):
+        self.duration = StreamingHistogram()
+        self.failures = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+
+    def merge(self, other: "LLMAggregate") -> None:
+        self.duration.merge(other.duration)
+        self.failures += other.failures
+        self.prompt_tokens += other.prompt_tokens
+        self.completion_tokens += other.completion_tokens
+
+
+class EmbeddingAggregate:
+    __slots__ = ("duration", "failures", "texts")
+
+    def __init__(self):
+        self.duration = StreamingHistogram()
+        self.failures = 0
+        self.texts = 0
+
+    def merge(self, other: "EmbeddingAggregate") -> None:
+        self.duration.merge(other.duration)
+        self.failures += other.failures
+        self.texts += other.texts
 
 
 @dataclass
-class LLMMetric:
-    model: str
-    prompt_tokens: int
-    completion_tokens: int
+class JobMetric:
+    name: str
+    processed: int
+    batches: int
     duration_ms: float
-    success: bool
+    status: str
     timestamp: float = field(default_factory=time.time)
 
 
 class MetricsCollector:
     """Singleton in-memory metrics store."""
 
+    # windowed series -> aggregate factory (attribute is "_" + name)
+    WINDOWED = {
+        "api": StreamingHistogram,
+        "streams": StreamAggregate,
+        "llm": LLMAggregate,
+        "embedding": EmbeddingAggregate,
+        "recall": StreamingHistogram,
+    }
+
     _instance = None
     _lock = threading.Lock()
-    MAX_POINTS = 100_000  # ~24h at moderate traffic
+    MAX_API_SERIES = 500  # (method, path, status class) per minute; more are folded into "(other)"
+    MAX_SQL_FINGERPRINTS = 2000  # further fingerprints are folded into "other"
 
     def __new__(cls):
         with cls._lock:
             if cls._instance is None:
                 cls._instance = super().__new__(cls)
-                cls._instance._api_metrics = deque(maxlen=cls.MAX_POINTS)
-                cls._instance._llm_metrics = deque(maxlen=cls.MAX_POINTS)
-                cls._instance._embedding_metrics = deque(maxlen=cls.MAX_POINTS)
+                cls._instance._api = WindowedAggregates(
+                    StreamingHistogram,
+                    max_series=cls.MAX_API_SERIES,
+                    overflow_key=lambda key: (key[0], "(other)", key[2]),
+                )
+                cls._instance._streams = WindowedAggregates(StreamAggregate, max_series=cls.MAX_API_SERIES)
+                cls._instance._llm = WindowedAggregates(LLMAggregate)
+                cls._instance._embedding = WindowedAggregates(EmbeddingAggregate)
+                cls._instance._recall = WindowedAggregates(StreamingHistogram, max_series=50)
+                cls._instance._background = defaultdict(lambda: {"started": 0, "failed": 0, "inflight": 0})
+                cls._instance._job_metrics = deque(maxlen=1000)
+                cls._instance._job_progress = {}
+                cls._instance._cache_counters = defaultdict(lambda: {"hits": 0, "misses": 0})
+                cls._instance._pool_stats = defaultdict(_new_pool_stat)
+                cls._instance._sql_stats = {}
                 cls._instance._start_time = time.time()
             return cls._instance
 
     def record_api(self, path: str, method: str, status_code: int, duration_ms: float):
-        self._api_metrics.append(ApiMetric(path, method, status_code, duration_ms))
+        self._api.get((method, path, _status_class(status_code))).record(duration_ms)
+
+    def record_stream(self, path: str, method: str, ttfb_ms: float, duration_ms: float,
+                      chunks: int, completed: bool = True):
+        """Record a streamed response: time to first body byte and until the last chunk."""
+        agg = self._streams.get(f"{method} {path}")
+        agg.ttfb.record(ttfb_ms)
+        agg.duration.record(duration_ms)
+        agg.chunks += chunks
+        if not completed:
+            agg.incomplete += 1
 
     def record_llm(self, model: str, prompt_tokens: int, completion_tokens: int,
                    duration_ms: float, success: bool):
-        self._llm_metrics.append(LLMMetric(model, prompt_tokens, completion_tokens,
-                                            duration_ms, success))
+        agg = self._llm.get(model)
+        agg.duration.record(duration_ms)
+        agg.prompt_tokens += prompt_tokens or 0
+        agg.completion_tokens += completion_tokens or 0
+        if not success:
+            agg.failures += 1
 
     def record_embedding(self, model: str, text_count: int, duration_ms: float, success: bool):
-        self._embedding_metrics.append(EmbeddingMetric(model, text_count, duration_ms, success))
+        agg = self._embedding.get(model)
+        agg.duration.record(duration_ms)
+        agg.texts += text_count
+        if not success:
+            agg.failures += 1
+
+    def record_recall(self, stages: dict):
+        """Record memory recall sub-stage timings ({stage: seconds}, *_count keys skipped)."""
+        for stage, seconds in stages.items():
+            if not stage.endswith("_count"):
+                self._recall.get(stage).record(seconds * 1000)
+
+    def track_background(self, kind: str, task: asyncio.Task) -> asyncio.Task:
+        """Count a fire-and-forget task as in flight until it finishes."""
+        counters = self._background[kind]
+        counters["started"] += 1
+        counters["inflight"] += 1
+
+        def _done(t: asyncio.Task):
+            counters["inflight"] -= 1
+            if t.cancelled() or t.exception() is not None:
+                counters["failed"] += 1
+
+        task.add_done_callback(_done)
+        return task
+
+    def record_job_progress(self, name: str, **progress):
+        """Live progress of a running background job (replaced on each batch)."""
+        self._job_progress[name] = {**progress, "updated_at": time.time()}
+
+    def record_job(self, name: str, processed: int, batches: int,
+                   duration_ms: float, status: str):
+        """Record a finished background job run and clear its live progress."""
+        self._job_metrics.append(JobMetric(name, processed, batches, duration_ms, status))
+        self._job_progress.pop(name, None)
+
+    def record_cache(self, name: str, hit: bool):
+        """Count a cache lookup (plain counters: called on every authenticated request)."""
+        self._cache_counters[name]["hits" if hit else "misses"] += 1
+
+    def record_pool_checkout(self, pool: str, wait_ms: float, timed_out: bool = False):
+        """Record how long a caller waited for a pooled DB connection."""
+        stat = self._pool_stats[pool]
+        if timed_out:
+            stat["timeouts"] += 1
+        else:
+            stat["checkouts"] += 1
+        stat["wait_total_ms"] += wait_ms
+        stat["wait_max_ms"] = max(stat["wait_max_ms"], wait_ms)
+        i = 0
+        while i < len(POOL_WAIT_BUCKETS_MS) and wait_ms > POOL_WAIT_BUCKETS_MS[i]:
+            i += 1
+        stat["wait_buckets"][i] += 1
+
+    def record_pool_hold(self, pool: str, endpoint: str, hold_ms: float):
+        """Record how long an endpoint (or background job) held a DB connection."""
+        hold = self._pool_stats[pool]["hold"][endpoint]
+        hold["count"] += 1
+        hold["total_ms"] += hold_ms
+        hold["max_ms"] = max(hold["max_ms"], hold_ms)
+
+    def record_sql(self, engine: str, fingerprint: str, statement: str,
+                   duration_ms: float, error: bool = False):
+        """Aggregate one executed SQL statement under its fingerprint."""
+        key = (engine, fingerprint)
+        stat = self._sql_stats.get(key)
+        if stat is None:
+            if len(self._sql_stats) >= self.MAX_SQL_FINGERPRINTS:
+                key = (engine, "other")
+                statement = "(fingerprint limit reached)"
+                stat = self._sql_stats.get(key)
+            if stat is None:
+                stat = self._sql_stats[key] = {
+                    "statement": statement, "count": 0, "errors": 0,
+                    "total_ms": 0.0, "max_ms": 0.0,
+                }
+        stat["count"] += 1
+        stat["total_ms"] += duration_ms
+        stat["max_ms"] = max(stat["max_ms"], duration_ms)
+        if error:
+            stat["errors"] += 1
 
     def get_uptime(self) -> float:
         return time.time() - self._start_time
 
     def get_api_stats(self, last_seconds: int = 86400) -> dict:
         """Get API performance stats for the given time window."""
-        cutoff = time.time() - last_seconds
-        recent = [m for m in self._api_metrics if m.timestamp > cutoff]
-
-        if not recent:
+        series = self._api.collect(last_seconds)
+        if not series:
             return {"total_requests": 0, "endpoints": {}}
 
-        by_endpoint: dict[str, list[float]] = defaultdict(list)
-        for m in recent:
-            key = f"{m.method} {m.path}"
-            by_endpoint[key].append(m.duration_ms)
+        by_endpoint: dict[str, StreamingHistogram] = defaultdict(StreamingHistogram)
+        errors: dict[str, int] = defaultdict(int)
+        by_status_class: dict[str, int] = defaultdict(int)
+        for (method, path, status_class), hist in series.items():
+            key = f"{method} {path}"
+            by_endpoint[key].merge(hist)
+            by_status_class[status_class] += hist.count
+            if status_class in ("4xx", "5xx"):
+                errors[key] += hist.count
 
         endpoints = {}
-        for key, durations in sorted(by_endpoint.items(), key=lambda x: -len(x[1])):
-            sorted_d = sorted(durations)
-            p95_idx = int(len(sorted_d) * 0.95)
-            endpoints[key] = {
-                "count": len(durations),
-                "avg_ms": round(sum(durations) / len(durations), 1),
-                "p95_ms": round(sorted_d[min(p95_idx, len(sorted_d) - 1)], 1),
-            }
-
-        error_count = sum(1 for m in recent if m.status_code >= 400)
+        for key, hist in sorted(by_endpoint.items(), key=lambda x: -x[1].count):
+            endpoints[key] = {**_latency_summary(hist), "errors": errors.get(key, 0)}
 
         return {
-            "total_requests": len(recent),
-            "error_count": error_count,
+            "total_requests": sum(by_status_class.values()),
+            "error_count": sum(errors.values()),
+            "by_status_class": dict(sorted(by_status_class.items())),
             "endpoints": endpoints,
+            "streams": self.get_stream_stats(last_seconds),
         }
 
+    def get_stream_stats(self, last_seconds: int = 86400) -> dict:
+        """Streamed responses per endpoint (endpoint latency above is their TTFB)."""
+        streams = {}
+        for key, agg in sorted(self._streams.collect(last_seconds).items(),
+                               key=lambda x: -x[1].duration.count):
+            streams[key] = {
+                "count": agg.duration.count,
+                "incomplete": agg.incomplete,
+                "avg_chunks": round(agg.chunks / agg.duration.count, 1),
+                "ttfb": _latency_summary(agg.ttfb),
+                "duration": _latency_summary(agg.duration),
+            }
+        return streams
+
     def get_llm_stats(self, last_seconds: int = 86400) -> dict:
         """Get LLM call stats for the given time window."""
-        cutoff = time.time() - last_seconds
-        recent = [m for m in self._llm_metrics if m.timestamp > cutoff]
+        by_model = self._llm.collect(last_seconds)
+        total = LLMAggregate()
+        for agg in by_model.values():
+            total.merge(agg)
+        calls = total.duration.count
 
-        if not recent:
+        if not calls:
             return {"total_calls": 0, "total_prompt_tokens": 0,
                     "total_completion_tokens": 0, "avg_duration_ms": 0,
                     "failure_rate": 0}
 
-        total_prompt = sum(m.prompt_tokens for m in recent)
-        total_completion = sum(m.completion_tokens for m in recent)
-        avg_duration = sum(m.duration_ms for m in recent) / len(recent)
-        failures = sum(1 for m in recent if not m.success)
-
         # Today's calls
         today_start = time.time() - (time.time() % 86400)
-        today_calls = sum(1 for m in recent if m.timestamp > today_start)
+        today_calls = sum(a.duration.count for a in self._llm.collect(since=today_start).values())
 
         return {
-            "total_calls": len(recent),
+            "total_calls": calls,
             "today_calls": today_calls,
-            "total_prompt_tokens": total_prompt,
-            "total_completion_tokens": total_completion,
-            "avg_duration_ms": round(avg_duration, 1),
-            "failure_rate": round(failures / len(recent), 4) if recent else 0,
+            "total_prompt_tokens": total.prompt_tokens,
+            "total_completion_tokens": total.completion_tokens,
+            "avg_duration_ms": round(total.duration.mean, 1),
+            "failure_rate": round(total.failures / calls, 4),
+            "latency": _latency_summary(total.duration),
+            "models": {
+                model: {
+                    **_latency_summary(agg.duration),
+                    "failures": agg.failures,
+                    "prompt_tokens": agg.prompt_tokens,
+                    "completion_tokens": agg.completion_tokens,
+                }
+                for model, agg in by_model.items()
+            },
         }
 
     def get_embedding_stats(self, last_seconds: int = 86400) -> dict:
         """Get Embedding call stats for the given time window."""
-        cutoff = time.time() - last_seconds
-        recent = [m for m in self._embedding_metrics if m.timestamp > cutoff]
+        by_model = self._embedding.collect(last_seconds)
+        total = EmbeddingAggregate()
+        for agg in by_model.values():
+            total.merge(agg)
+        calls = total.duration.count
 
-        if not recent:
+        if not calls:
             return {"total_calls": 0, "total_texts": 0, "avg_duration_ms": 0,
                     "failure_rate": 0}
 
-        total_texts = sum(m.text_count for m in recent)
-        avg_duration = sum(m.duration_ms for m in recent) / len(recent)
-        failures = sum(1 for m in recent if not m.success)
-
         today_start = time.time() - (time.time() % 86400)
-        today_calls = sum(1 for m in recent if m.timestamp > today_start)
+        today_calls = sum(a.duration.count for a in self._embedding.collect(since=today_start).values())
 
         return {
-            "total_calls": len(recent),
+            "total_calls": calls,
             "today_calls": today_calls,
-            "total_texts": total_texts,
-            "avg_duration_ms": round(avg_duration, 1),
-            "failure_rate": round(failures / len(recent), 4) if recent else 0,
+            "total_texts": total.texts,
+            "avg_duration_ms": round(total.duration.mean, 1),
+            "failure_rate": round(total.failures / calls, 4),
+            "latency": _latency_summary(total.duration),
+        }
+
+    def get_recall_stats(self, last_seconds: int = 86400) -> dict:
+        """Get memory recall sub-stage latencies for the given time window."""
+        return {
+            stage: _latency_summary(hist)
+            for stage, hist in sorted(self._recall.collect(last_seconds).items())
+        }
+
+    def get_totals(self) -> dict:
+        """Raw aggregates since startup (monotonic, for the Prometheus exporter)."""
+        return {
+            "api": self._api.totals(),
+            "streams": self._streams.totals(),
+            "llm": self._llm.totals(),
+            "embedding": self._embedding.totals(),
+            "recall": self._recall.totals(),
+            "caches": {name: dict(c) for name, c in self._cache_counters.items()},
+            "pools": dict(self._pool_stats),
+            "background": {kind: dict(c) for kind, c in self._background.items()},
+        }
+
+    def windows(self, kind: str):
+        """The WindowedAggregates (or MergedWindows in a view) behind a WINDOWED kind."""
+        return getattr(self, f"_{kind}")
+
+    def get_counters(self) -> dict:
+        """JSON-safe since-startup counters that are not windowed (summed across workers)."""
+        pools = {}
+        for name, stat in self._pool_stats.items():
+            pools[name] = {**stat, "wait_buckets": list(stat["wait_buckets"]),
+                           "hold": {endpoint: dict(h) for endpoint, h in stat["hold"].items()}}
+        return {
+            "caches": {name: dict(c) for name, c in self._cache_counters.items()},
+            "pools": pools,
+            "background": {kind: {"started": c["started"], "failed": c["failed"]}
+                           for kind, c in self._background.items()},
+        }
+
+    def get_gauges(self) -> dict:
+        """JSON-safe current values (summed across live workers)."""
+        return {"background_inflight": {kind: c["inflight"] for kind, c in self._background.items()}}
+
+    def view(self, windows: dict, counters: dict, background_inflight: dict) -> "MetricsCollector":
+        """Read-only collector over merged data (not the singleton; record_* must not be called)."""
+        view = object.__new__(MetricsCollector)
+        view.__dict__.update(self.__dict__)
+        for kind, merged in windows.items():
+            setattr(view, f"_{kind}", merged)
+        view._cache_counters = counters.get("caches", {})
+        view._pool_stats = counters.get("pools", {})
+        view._background = {
+            kind: {**c, "inflight": background_inflight.get(kind, 0)}
+            for kind, c in counters.get("background", {}).items()
+        }
+        return view
+
+    def get_job_stats(self, last_seconds: int = 86400) -> dict:
+        """Get background job runs for the given time window plus live progress."""
+        cutoff = time.time() - last_seconds
+        recent = [m for m in self._job_metrics if m.timestamp > cutoff]
+
+        by_job: dict[str, list[JobMetric]] = defaultdict(list)
+        for m in recent:
+            by_job[m.name].append(m)
+
+        jobs = {}
+        for name, runs in by_job.items():
+            last = runs[-1]
+            jobs[name] = {
+                "runs": len(runs),
+                "processed": sum(r.processed for r in runs),
+                "batches": sum(r.batches for r in runs),
+                "avg_duration_ms": round(sum(r.duration_ms for r in runs) / len(runs), 1),
+                "last_status": last.status,
+                "last_run_at": last.timestamp,
+            }
+
+        return {
+            "running": dict(self._job_progress),
+            "jobs": jobs,
+        }
+
+    def get_cache_stats(self) -> dict:
+        """Get hit/miss counters for in-process caches since startup."""
+        caches = {}
+        for name, c in self._cache_counters.items():
+            total = c["hits"] + c["misses"]
+            caches[name] = {
+                "hits": c["hits"],
+                "misses": c["misses"],
+                "hit_rate": round(c["hits"] / total, 4) if total else 0,
+            }
+        return {"caches": caches}
+
+    def get_pool_stats(self) -> dict:
+        """Get connection-pool wait histograms and per-endpoint hold times since startup."""
+        pools = {}
+        for name, stat in self._pool_stats.items():
+            attempts = stat["checkouts"] + stat["timeouts"]
+            buckets = stat["wait_buckets"]
+            labels = [f"le_{b}ms" for b in POOL_WAIT_BUCKETS_MS] + ["le_inf"]
+            hold = {
+                endpoint: {
+                    "count": h["count"],
+                    "avg_ms": round(h["total_ms"] / h["count"], 1),
+                    "max_ms": round(h["max_ms"], 1),
+                    "total_s": round(h["total_ms"] / 1000, 1),
+                }
+                for endpoint, h in sorted(stat["hold"].items(), key=lambda x: -x[1]["total_ms"])
+            }
+            pools[name] = {
+                "checkouts": stat["checkouts"],
+                "timeouts": stat["timeouts"],
+                "wait": {
+                    "avg_ms": round(stat["wait_total_ms"] / attempts, 2) if attempts else 0,
+                    "p95_ms": _bucket_quantile(buckets, 0.95),
+                    "p99_ms": _bucket_quantile(buckets, 0.99),
+                    "max_ms": round(stat["wait_max_ms"], 1),
+                    "histogram": dict(zip(labels, buckets)),
+                },
+                "hold_by_endpoint": hold,
+            }
+        return {"pools": pools}
+
+    def get_sql_stats(self, limit: int = 20, order_by: str = "total") -> dict:
+        """Get the top-N SQL fingerprints since startup, ordered by total/avg/max time or count."""
+        sort_keys = {
+            "total": lambda s: s["total_ms"],
+            "avg": lambda s: s["total_ms"] / s["count"],
+            "max": lambda s: s["max_ms"],
+            "count": lambda s: s["count"],
+        }
+        sort_key = sort_keys.get(order_by, sort_keys["total"])
+        items = sorted(self._sql_stats.items(), key=lambda x: -sort_key(x[1]))[:limit]
+        return {
+            "fingerprints": len(self._sql_stats),
+            "statements": sum(s["count"] for s in self._sql_stats.values()),
+            "total_ms": round(sum(s["total_ms"] for s in self._sql_stats.values()), 1),
+            "top": [
+                {
+                    "engine": engine,
+                    "fingerprint": fp,
+                    "statement": stat["statement"],
+                    "count": stat["count"],
+                    "errors": stat["errors"],
+                    "total_ms": round(stat["total_ms"], 1),
+                    "avg_ms": round(stat["total_ms"] / stat["count"], 2),
+                    "max_ms": round(stat["max_ms"], 1),
+                }
+                for (engine, fp), stat in items
+            ],
         }
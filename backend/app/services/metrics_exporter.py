@@ -0,0 +1,250 @@
+"""
+GET /metrics 的 Prometheus / OpenMetrics 文本输出
+
+不依赖客户端库，直接输出 MetricsCollector 启动以来的累计值（get_totals）：计数器和直方图在进程
+生命周期内单调递增，进程重启时抓取端会看到计数器归零，与其他 Prometheus 目标一致。
+
+标签组合数量有上限：API 序列按路由模板、方法和状态码类别区分（最多
+MetricsCollector.MAX_API_SERIES 个，超出归入 "(other)"），LLM / embedding 按模型，召回按阶段名。
+流式直方图按桶中点换算到固定的 le 桶，距离桶边界约 1.6% 以内的样本可能计入相邻的桶。
+
+开启 METRICS_SHARED 时数据覆盖所有 worker（metrics_store），否则只有响应这次抓取的进程。
+
+抓取端在 Accept 头中请求时输出 OpenMetrics 1.0，否则输出 Prometheus 0.0.4 文本格式。
+"""
+import time
+from typing import Iterable, Optional
+
+from app.config import settings
+from app.services.metrics_collector import POOL_WAIT_BUCKETS_MS, MetricsCollector
+from app.services.metrics_streaming import StreamingHistogram
+from app.services.overload import overload_controller
+from app.services.profiler import loop_monitor
+
+OPENMETRICS_CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+TEXT_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# 直方图各桶的上界（秒）
+HTTP_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+LLM_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 30, 60, 120)
+EMBEDDING_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+RECALL_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+POOL_WAIT_BUCKETS = tuple(ms / 1000 for ms in POOL_WAIT_BUCKETS_MS)
+
+
+def wants_openmetrics(accept: Optional[str]) -> bool:
+    return bool(accept) and "application/openmetrics-text" in accept
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _le(bound: float) -> str:
+    return repr(float(bound))
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, int) or float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Writer:
+    def __init__(self, openmetrics: bool):
+        self.openmetrics = openmetrics
+        self.lines: list[str] = []
+
+    def family(self, name: str, kind: str, help_text: str) -> None:
+        # OpenMetrics 的计数器 family 名不带 _total 后缀
+        if kind == "counter" and not self.openmetrics:
+            name += "_total"
+        self.lines.append(f"# HELP {name} {help_text}")
+        self.lines.append(f"# TYPE {name} {kind}")
+
+    def sample(self, name: str, labels: dict, value: float) -> None:
+        if labels:
+            label_str = ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items())
+            self.lines.append(f"{name}{{{label_str}}} {_number(value)}")
+        else:
+            self.lines.append(f"{name} {_number(value)}")
+
+    def histogram(self, name: str, labels: dict, hist: StreamingHistogram,
+                  bounds: Iterable[float], scale: float = 1000) -> None:
+        """毫秒的 StreamingHistogram -> 以秒为单位的 le 桶（scale 为每单位的毫秒数）"""
+        bounds = tuple(bounds)
+        counts = hist.cumulative_counts([b * scale for b in bounds])
+        for bound, count in zip(bounds, counts):
+            self.sample(f"{name}_bucket", {**labels, "le": _le(bound)}, count)
+        self.sample(f"{name}_bucket", {**labels, "le": "+Inf"}, hist.count)
+        self.sample(f"{name}_count", labels, hist.count)
+        self.sample(f"{name}_sum", labels, hist.total / scale)
+
+    def render(self) -> str:
+        if self.openmetrics:
+            self.lines.append("# EOF")
+        return "\n".join(self.lines) + "\n"
+
+
+def _write_api(w: _Writer, totals: dict) -> None:
+    w.family("me2_http_request_duration_seconds", "histogram",
+             "API request latency (streamed responses: time to first byte)")
+    for (method, route, status_class), hist in sorted(totals["api"].items()):
+        labels = {"method": method, "route": route, "status_class": status_class}
+        w.histogram("me2_http_request_duration_seconds", labels, hist, HTTP_BUCKETS)
+
+    streams = sorted(totals["streams"].items())
+    w.family("me2_http_stream_duration_seconds", "histogram",
+             "Streamed response duration until the last chunk")
+    for key, agg in streams:
+        method, route = key.split(" ", 1)
+        w.histogram("me2_http_stream_duration_seconds", {"method": method, "route": route},
+                    agg.duration, HTTP_BUCKETS)
+    w.family("me2_http_stream_chunks", "counter", "Body chunks sent by streamed responses")
+    for key, agg in streams:
+        method, route = key.split(" ", 1)
+        w.sample("me2_http_stream_chunks_total", {"method": method, "route": route}, agg.chunks)
+    w.family("me2_http_stream_incomplete", "counter",
+             "Streamed responses that ended before the final chunk")
+    for key, agg in streams:
+        method, route = key.split(" ", 1)
+        w.sample("me2_http_stream_incomplete_total", {"method": method, "route": route}, agg.incomplete)
+
+
+def _write_llm(w: _Writer, totals: dict) -> None:
+    llm = sorted(totals["llm"].items())
+    w.family("me2_llm_request_duration_seconds", "histogram", "LLM call latency")
+    for model, agg in llm:
+        w.histogram("me2_llm_request_duration_seconds", {"model": model}, agg.duration, LLM_BUCKETS)
+    w.family("me2_llm_tokens", "counter", "LLM tokens by type")
+    for model, agg in llm:
+        w.sample("me2_llm_tokens_total", {"model": model, "type": "prompt"}, agg.prompt_tokens)
+        w.sample("me2_llm_tokens_total", {"model": model, "type": "completion"}, agg.completion_tokens)
+    w.family("me2_llm_failures", "counter", "Failed LLM calls")
+    for model, agg in llm:
+        w.sample("me2_llm_failures_total", {"model": model}, agg.failures)
+
+    embedding = sorted(totals["embedding"].items())
+    w.family("me2_embedding_request_duration_seconds", "histogram", "Embedding call latency")
+    for model, agg in embedding:
+        w.histogram("me2_embedding_request_duration_seconds", {"model": model},
+                    agg.duration, EMBEDDING_BUCKETS)
+    w.family("me2_embedding_texts", "counter", "Texts embedded")
+    for model, agg in embedding:
+        w.sample("me2_embedding_texts_total", {"model": model}, agg.texts)
+    w.family("me2_embedding_failures", "counter", "Failed embedding calls")
+    for model, agg in embedding:
+        w.sample("me2_embedding_failures_total", {"model": model}, agg.failures)
+
+    w.family("me2_recall_stage_duration_seconds", "histogram", "Memory recall sub-stage latency")
+    for stage, hist in sorted(totals["recall"].items()):
+        w.histogram("me2_recall_stage_duration_seconds", {"stage": stage}, hist, RECALL_BUCKETS)
+
+
+def _write_pools(w: _Writer, totals: dict, pools: dict) -> None:
+    gauges = (
+        ("checked_out", "Connections currently checked out"),
+        ("checked_in", "Idle connections in the pool"),
+        ("overflow", "Connections opened beyond pool_size"),
+        ("capacity", "pool_size + max_overflow"),
+    )
+    for field, help_text in gauges:
+        w.family(f"me2_db_pool_{field}", "gauge", help_text)
+        for name, snapshot in sorted(pools.items()):
+            if field in snapshot:
+                # 连接池填满之前 QueuePool.overflow() 从 -pool_size 开始计
+                w.sample(f"me2_db_pool_{field}", {"pool": name}, max(snapshot[field], 0))
+
+    stats = sorted(totals["pools"].items())
+    w.family("me2_db_pool_wait_seconds", "histogram", "Time spent waiting for a pooled connection")
+    for name, stat in stats:
+        cumulative = 0
+        for bound, n in zip(POOL_WAIT_BUCKETS, stat["wait_buckets"]):
+            cumulative += n
+            w.sample("me2_db_pool_wait_seconds_bucket", {"pool": name, "le": _le(bound)}, cumulative)
+        attempts = stat["checkouts"] + stat["timeouts"]
+        w.sample("me2_db_pool_wait_seconds_bucket", {"pool": name, "le": "+Inf"}, attempts)
+        w.sample("me2_db_pool_wait_seconds_count", {"pool": name}, attempts)
+        w.sample("me2_db_pool_wait_seconds_sum", {"pool": name}, stat["wait_total_ms"] / 1000)
+    w.family("me2_db_pool_timeouts", "counter", "Connection checkouts that timed out")
+    for name, stat in stats:
+        w.sample("me2_db_pool_timeouts_total", {"pool": name}, stat["timeouts"])
+    w.family("me2_db_pool_hold_seconds", "summary", "Time connections were held, by endpoint")
+    for name, stat in stats:
+        for endpoint, hold in sorted(stat["hold"].items()):
+            labels = {"pool": name, "endpoint": endpoint}
+            w.sample("me2_db_pool_hold_seconds_count", labels, hold["count"])
+            w.sample("me2_db_pool_hold_seconds_sum", labels, hold["total_ms"] / 1000)
+
+
+def _write_background(w: _Writer, totals: dict, jobs: Optional[dict]) -> None:
+    background = sorted(totals["background"].items())
+    w.family("me2_background_tasks_inflight", "gauge", "Fire-and-forget tasks not finished yet")
+    for kind, c in background:
+        w.sample("me2_background_tasks_inflight", {"kind": kind}, c["inflight"])
+    w.family("me2_background_tasks_started", "counter", "Fire-and-forget tasks started")
+    for kind, c in background:
+        w.sample("me2_background_tasks_started_total", {"kind": kind}, c["started"])
+    w.family("me2_background_tasks_failed", "counter", "Fire-and-forget tasks that raised or were cancelled")
+    for kind, c in background:
+        w.sample("me2_background_tasks_failed_total", {"kind": kind}, c["failed"])
+
+    if jobs is not None:
+        w.family("me2_jobs_unfinished", "gauge", "Resumable jobs (jobs table) by kind and status")
+        for (kind, status), n in sorted(jobs.items()):
+            w.sample("me2_jobs_unfinished", {"kind": kind, "status": status}, n)
+
+    w.family("me2_cache_lookups", "counter", "In-process cache lookups")
+    for name, c in sorted(totals["caches"].items()):
+        w.sample("me2_cache_lookups_total", {"cache": name, "result": "hit"}, c["hits"])
+        w.sample("me2_cache_lookups_total", {"cache": name, "result": "miss"}, c["misses"])
+
+
+def _write_loop(w: _Writer) -> None:
+    # 即使开启 METRICS_SHARED 也只统计本进程：阻塞是单个 worker 事件循环的问题
+    stats = loop_monitor.stats(limit=0)
+    w.family("me2_event_loop_stalls", "counter", "Event-loop stalls longer than LOOP_LAG_THRESHOLD_MS")
+    w.sample("me2_event_loop_stalls_total", {}, stats["stalls"])
+    w.family("me2_event_loop_stalled_seconds", "counter", "Total duration of event-loop stalls")
+    w.sample("me2_event_loop_stalled_seconds_total", {}, stats["total_stalled_ms"] / 1000)
+    w.family("me2_event_loop_max_lag_seconds", "gauge", "Longest event-loop stall since startup")
+    w.sample("me2_event_loop_max_lag_seconds", {}, stats["max_lag_ms"] / 1000)
+
+
+def _write_overload(w: _Writer) -> None:
+    # 只统计本进程：每个 worker 按自己的信号降级（overload.py）
+    status = overload_controller.status()
+    w.family("me2_overload_level", "gauge", "Current chat degradation level (0 normal, 5 shedding)")
+    w.sample("me2_overload_level", {}, status["level"])
+    w.family("me2_overload_chat_inflight", "gauge", "Chat turns in progress")
+    w.sample("me2_overload_chat_inflight", {}, status["signals"]["inflight"])
+    w.family("me2_overload_chat_turns", "counter", "Chat turns started, by degradation level")
+    for level, n in status["turns_by_level"].items():
+        w.sample("me2_overload_chat_turns_total", {"level": str(level)}, n)
+    w.family("me2_overload_shed", "counter", "Chat requests rejected with 503 while overloaded")
+    w.sample("me2_overload_shed_total", {}, status["shed"])
+
+
+def render_metrics(openmetrics: bool = False, pools: Optional[dict] = None,
+                   jobs: Optional[dict] = None, collector: Optional[MetricsCollector] = None) -> str:
+    """所有指标的文本输出
+
+    pools 为 pool_monitor.pool_snapshots()，jobs 为 JobStore.count_unfinished()
+    （为 None 时不输出，例如数据库不可用），collector 为 metrics_store.fleet_collector()
+    汇总所有 worker 的视图（默认只有本进程）。
+    """
+    totals = (collector or MetricsCollector()).get_totals()
+    w = _Writer(openmetrics)
+    w.family("me2_build_info", "gauge", "Application version")
+    w.sample("me2_build_info", {"version": settings.APP_VERSION}, 1)
+    w.family("me2_process_start_time_seconds", "gauge", "Unix time the process started")
+    w.sample("me2_process_start_time_seconds", {}, round(time.time() - MetricsCollector().get_uptime(), 3))
+    _write_api(w, totals)
+    _write_llm(w, totals)
+    _write_pools(w, totals, pools or {})
+    _write_background(w, totals, jobs)
+    _write_loop(w)
+    _write_overload(w)
+    return w.render()
@@ -0,0 +1,331 @@
+"""
+通过 Postgres 汇总多个 worker 的指标（METRICS_SHARED）
+
+MetricsCollector 是进程内的，多个 uvicorn/gunicorn worker 时每个进程只看到自己那部分流量。
+每个 worker 每 METRICS_FLUSH_INTERVAL 秒写入一次自己的数据（定时任务 metrics_flush）：
+
+- metric_windows：每个 (worker, 类别, 分钟或小时窗口) 一行，与内存中的 WindowedAggregates 对应，
+  另有 resolution=0 的一行保存进程累计值。只写入上次之后有变化的窗口；已汇总进小时行的分钟行
+  在同一事务中删除
+- metric_workers：心跳，以及不分窗口的计数（缓存命中、连接池等待）和瞬时值（连接池占用、
+  进行中的后台任务）
+
+读取方（管理后台统计、/metrics）把所有 worker 的行与本进程内存中的数据合并
+（本进程的内存数据比它写入的行更新，见 fleet_collector）。
+
+超过 retire_after() 秒（3 个写入周期，至少 1 分钟）没有写入的 worker 由下一个写入的 worker 清退：
+开启 METRICS_PERSIST 时其累计值和计数合并到 "(retired)" 行，窗口保留到自然过期，
+统计在重启后不丢失、导出的计数器保持单调递增；未开启时直接删除其所有行。
+"""
+import asyncio
+import copy
+import logging
+import os
+import socket
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, Optional
+
+from sqlalchemy import and_, delete, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.db.models import MetricWindow, MetricWorker
+from app.services.metrics_collector import MetricsCollector
+from app.services.metrics_streaming import (
+    MergedWindows,
+    WindowedAggregates,
+    dump_series,
+    load_series,
+    merge_series,
+)
+
+logger = logging.getLogger(__name__)
+
+RETIRED = "(retired)"
+FINE = WindowedAggregates.FINE_SECONDS
+COARSE = WindowedAggregates.COARSE_SECONDS
+HISTORY_SECONDS = 25 * COARSE  # 小时窗口覆盖 24 小时加上当前小时
+
+_run_lock = asyncio.Lock()
+_worker: Optional[tuple[int, str]] = None
+_started_at = datetime.now(timezone.utc)
+# 每个类别已写入的最新分钟起点 / 小时终点（更早的窗口不会再变化）
+_flushed_fine: dict[str, float] = {}
+_flushed_coarse: dict[tuple[str, float], float] = {}
+
+
+def worker_id() -> str:
+    """主机名-pid-随机后缀，fork 之后重新生成（gunicorn --preload）"""
+    global _worker
+    pid = os.getpid()
+    if _worker is None or _worker[0] != pid:
+        _worker = (pid, f"{socket.gethostname()[:60]}-{pid}-{uuid.uuid4().hex[:8]}")
+    return _worker[1]
+
+
+def retire_after() -> float:
+    return max(3 * settings.METRICS_FLUSH_INTERVAL, 60)
+
+
+def _sum_into(target: dict, source: dict) -> None:
+    """把 source 中的数值叶子累加到 target（*max_ms 的 key 取最大值）"""
+    for key, value in source.items():
+        if isinstance(value, dict):
+            _sum_into(target.setdefault(key, {}), value)
+        elif isinstance(value, list):
+            existing = target.get(key)
+            target[key] = [a + b for a, b in zip(existing, value)] if existing else list(value)
+        elif isinstance(value, bool) or not isinstance(value, (int, float)):
+            target.setdefault(key, value)
+        elif key.endswith("max_ms"):
+            target[key] = max(target.get(key, 0), value)
+        else:
+            target[key] = target.get(key, 0) + value
+
+
+def _local_gauges(collector: MetricsCollector) -> dict:
+    from app.db import pool_monitor
+
+    return {**collector.get_gauges(), "pools": pool_monitor.pool_snapshots()}
+
+
+class MetricsStore:
+    """metric_workers / metric_windows 的读写"""
+
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    async def flush(self, collector: MetricsCollector) -> int:
+        """写入本 worker 有变化的窗口、累计值和心跳，返回写入的窗口行数"""
+        me = worker_id()
+        now = datetime.now(timezone.utc)
+        now_ts = now.timestamp()
+        written = 0
+        fine_marks: dict[str, float] = {}
+        coarse_marks: dict[tuple[str, float], float] = {}
+
+        for kind in collector.WINDOWED:
+            windows, totals = collector.windows(kind).export()
+            fine_starts = [start for resolution, start, _, _ in windows if resolution == FINE]
+            coarse_starts = [start for resolution, start, _, _ in windows if resolution == COARSE]
+            for resolution, start, end, series in windows:
+                if resolution == FINE and start < _flushed_fine.get(kind, 0):
+                    continue
+                if resolution == COARSE and _flushed_coarse.get((kind, start)) == end:
+                    continue
+                await self.db.merge(MetricWindow(
+                    worker_id=me, kind=kind, resolution=resolution,
+                    window_start=int(start), window_end=int(end), series=dump_series(series),
+                ))
+                written += 1
+                if resolution == COARSE:
+                    coarse_marks[(kind, start)] = end
+            await self.db.merge(MetricWindow(
+                worker_id=me, kind=kind, resolution=0,
+                window_start=0, window_end=int(now_ts), series=dump_series(totals),
+            ))
+            # 已汇总进小时行的分钟行，以及已过期的小时行
+            await self.db.execute(
+                delete(MetricWindow)
+                .where(
+                    MetricWindow.worker_id == me,
+                    MetricWindow.kind == kind,
+                    or_(
+                        and_(MetricWindow.resolution == FINE,
+                             MetricWindow.window_start < min(fine_starts, default=now_ts)),
+                        and_(MetricWindow.resolution == COARSE,
+                             MetricWindow.window_start < min(coarse_starts, default=now_ts)),
+                    ),
+                )
+                .execution_options(synchronize_session=False)
+            )
+            if fine_starts:
+                fine_marks[kind] = max(fine_starts)
+
+        await self.db.merge(MetricWorker(
+            worker_id=me, started_at=_started_at, last_flush_at=now,
+            counters=collector.get_counters(), gauges=_local_gauges(collector),
+        ))
+        await self.db.commit()
+
+        _flushed_fine.update(fine_marks)
+        _flushed_coarse.update(coarse_marks)
+        for key in [key for key in _flushed_coarse if key[1] < now_ts - HISTORY_SECONDS]:
+            del _flushed_coarse[key]
+        return written
+
+    async def retire_stale_workers(self) -> int:
+        """合并（METRICS_PERSIST）或删除已停止写入的 worker，返回处理的个数"""
+        now = datetime.now(timezone.utc)
+        result = await self.db.execute(
+            select(MetricWorker)
+            .where(
+                MetricWorker.worker_id.notin_((RETIRED, worker_id())),
+                MetricWorker.last_flush_at < now - timedelta(seconds=retire_after()),
+            )
+            .with_for_update(skip_locked=True)
+        )
+        stale = list(result.scalars().all())
+        if not stale:
+            return 0
+        ids = [w.worker_id for w in stale]
+
+        if settings.METRICS_PERSIST:
+            retired = await self.db.get(MetricWorker, RETIRED, with_for_update=True)
+            if retired is None:
+                retired = MetricWorker(worker_id=RETIRED, started_at=min(w.started_at for w in stale))
+                self.db.add(retired)
+            counters = copy.deepcopy(retired.counters or {})
+            for w in stale:
+                _sum_into(counters, w.counters or {})
+            retired.counters = counters
+            retired.gauges = {}
+            retired.last_flush_at = now
+
+            rows = (await self.db.execute(
+                select(MetricWindow)
+                .where(MetricWindow.worker_id.in_(ids + [RETIRED]), MetricWindow.resolution == 0)
+                .with_for_update()
+            )).scalars().all()
+            totals: dict[str, dict] = {}
+            for row in rows:
+                factory = MetricsCollector.WINDOWED.get(row.kind)
+                if factory is not None:
+                    merge_series(totals.setdefault(row.kind, {}), load_series(factory, row.series), factory)
+            for row in rows:
+                await self.db.delete(row)
+            await self.db.flush()
+            for kind, series in totals.items():
+                self.db.add(MetricWindow(
+                    worker_id=RETIRED, kind=kind, resolution=0,
+                    window_start=0, window_end=int(now.timestamp()), series=dump_series(series),
+                ))
+        else:
+            await self.db.execute(
+                delete(MetricWindow)
+                .where(MetricWindow.worker_id.in_(ids))
+                .execution_options(synchronize_session=False)
+            )
+
+        for w in stale:
+            await self.db.delete(w)
+        await self.db.commit()
+        logger.info(f"已合并退出的指标进程: {', '.join(ids)}")
+        return len(stale)
+
+    async def delete_expired(self) -> None:
+        """删除所有 worker 超出 24 小时历史的窗口"""
+        await self.db.execute(
+            delete(MetricWindow)
+            .where(
+                MetricWindow.kind.in_(tuple(MetricsCollector.WINDOWED)),
+                MetricWindow.resolution > 0,
+                MetricWindow.window_end < int(time.time() - HISTORY_SECONDS),
+            )
+            .execution_options(synchronize_session=False)
+        )
+        await self.db.commit()
+
+    async def fleet_view(
+        self,
+        collector: MetricsCollector,
+        kinds: Iterable[str],
+        totals_only: bool = False,
+    ) -> tuple[MetricsCollector, dict]:
+        """汇总所有 worker 数据的 collector 视图，以及相加后的连接池瞬时值
+
+        kinds：从数据库读取的分窗口类别（其余类别只用本进程的数据）；
+        totals_only：不读取分钟 / 小时窗口（/metrics 只需要累计值）。
+        """
+        me = worker_id()
+        live_since = datetime.now(timezone.utc) - timedelta(seconds=retire_after())
+        workers = (await self.db.execute(
+            select(MetricWorker).where(MetricWorker.worker_id != me)
+        )).scalars().all()
+        included = [
+            w for w in workers
+            if settings.METRICS_PERSIST or (w.worker_id != RETIRED and _aware(w.last_flush_at) >= live_since)
+        ]
+        ids = [w.worker_id for w in included]
+
+        kinds = tuple(kinds)
+        merged = {kind: MergedWindows(collector.WINDOWED[kind]) for kind in kinds}
+        for kind in kinds:
+            windows, totals = collector.windows(kind).export()
+            for _, _, end, series in windows:
+                merged[kind].add_window(end, series)
+            merged[kind].add_totals(totals)
+
+        if kinds and (ids or settings.METRICS_PERSIST):
+            query = select(MetricWindow).where(MetricWindow.worker_id != me, MetricWindow.kind.in_(kinds))
+            # 开启 METRICS_PERSIST 时，已清退的 worker（没有 metric_workers 行）的窗口也计入
+            if not settings.METRICS_PERSIST:
+                query = query.where(MetricWindow.worker_id.in_(ids))
+            if totals_only:
+                query = query.where(MetricWindow.resolution == 0)
+            else:
+                query = query.where(or_(
+                    MetricWindow.resolution == 0,
+                    MetricWindow.window_end > int(time.time() - HISTORY_SECONDS),
+                ))
+            for row in (await self.db.execute(query)).scalars():
+                series = load_series(collector.WINDOWED[row.kind], row.series)
+                if row.resolution == 0:
+                    merged[row.kind].add_totals(series)
+                elif not totals_only:
+                    merged[row.kind].add_window(row.window_end, series)
+
+        counters = copy.deepcopy(collector.get_counters())
+        gauges = _local_gauges(collector)
+        for w in included:
+            _sum_into(counters, w.counters or {})
+            if _aware(w.last_flush_at) >= live_since:
+                _sum_into(gauges, w.gauges or {})
+
+        view = collector.view(merged, counters, gauges.get("background_inflight", {}))
+        return view, gauges.get("pools", {})
+
+
+def _aware(value: datetime) -> datetime:
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)  # SQLite 不保存时区
+
+
+async def fleet_collector(
+    kinds: Iterable[str] = tuple(MetricsCollector.WINDOWED),
+    totals_only: bool = False,
+) -> tuple[MetricsCollector, Optional[dict]]:
+    """METRICS_SHARED 时返回整个部署的 (collector, 连接池瞬时值)，否则只有本进程
+
+    只有本进程时连接池瞬时值为 None（用 pool_monitor.pool_snapshots()）。
+    数据库读取失败时退回本进程的 collector。
+    """
+    collector = MetricsCollector()
+    if not settings.METRICS_SHARED:
+        return collector, None
+
+    from app.db.database import AsyncSessionLocal
+
+    try:
+        async with AsyncSessionLocal() as db:
+            return await MetricsStore(db).fleet_view(collector, kinds, totals_only)
+    except Exception as e:
+        logger.warning(f"⚠️  读取其他 worker 的指标失败，只返回本进程数据: {e}")
+        return collector, None
+
+
+async def run_metrics_flush_job() -> Optional[int]:
+    """定时任务：写入本 worker 的指标，清退已退出的 worker，删除过期窗口"""
+    if _run_lock.locked():
+        return None
+
+    from app.db.database import AsyncSessionLocal
+
+    async with _run_lock:
+        async with AsyncSessionLocal() as db:
+            store = MetricsStore(db)
+            written = await store.flush(MetricsCollector())
+            await store.retire_stale_workers()
+            await store.delete_expired()
+    return written
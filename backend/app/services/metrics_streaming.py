@@ -0,0 +1,328 @@
+"""
+MetricsCollector 使用的流式聚合（内存占用固定，与请求量无关）
+
+- StreamingHistogram：对数线性（HDR 式）直方图，每个 2 的幂区间分 2**SUB_BITS 个子桶。
+  记录一个样本 O(1)、不分配对象，分位数误差约 1.6%，两个直方图按桶相加即可合并
+- WindowedAggregates：最近 1 小时按分钟聚合，移出的分钟窗口汇总为小时窗口保留 24 小时；
+  查询只合并与时间范围重叠的 O(窗口数) 个聚合，不扫描原始数据点。
+  每个分钟窗口结束时还会累加到进程级的累计值，供单调递增的导出（Prometheus 计数器/直方图）使用
+- MergedWindows：多个进程导出的窗口（metrics_store）的只读合集，支持同样的 collect() / totals() 查询。
+  dump_series / load_series 负责窗口聚合与 JSON 之间的转换
+"""
+import math
+import threading
+import time
+from collections import deque
+from typing import Callable, Hashable, Iterable, Optional
+
+SUB_BITS = 5
+_SUB = 1 << SUB_BITS
+_ZERO_INDEX = -(1 << 30)  # 0 和负数共用一个桶，排在所有桶之前
+_frexp = math.frexp
+
+
+def _bucket_index(value: float) -> int:
+    if value <= 0:
+        return _ZERO_INDEX
+    mantissa, exponent = _frexp(value)  # value = mantissa * 2**exponent，0.5 <= mantissa < 1
+    return (exponent << SUB_BITS) + int((mantissa - 0.5) * (2 * _SUB))
+
+
+def _bucket_bounds(index: int) -> tuple[float, float]:
+    if index == _ZERO_INDEX:
+        return 0.0, 0.0
+    exponent, sub = divmod(index, _SUB)
+    scale = 2.0 ** exponent
+    return (0.5 + sub / (2 * _SUB)) * scale, (0.5 + (sub + 1) / (2 * _SUB)) * scale
+
+
+class StreamingHistogram:
+    """非负值（毫秒耗时）的对数线性直方图"""
+
+    __slots__ = ("count", "total", "max", "buckets")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets: dict[int, int] = {}
+
+    def record(self, value: float) -> None:
+        # 热路径：内联 _bucket_index
+        self.count += 1
+        self.total += value
+        if value > 0:
+            if value > self.max:
+                self.max = value
+            mantissa, exponent = _frexp(value)
+            index = (exponent << SUB_BITS) + int((mantissa - 0.5) * (2 * _SUB))
+        else:
+            index = _ZERO_INDEX
+        buckets = self.buckets
+        buckets[index] = buckets.get(index, 0) + 1
+
+    def merge(self, other: "StreamingHistogram") -> None:
+        if not self.count:
+            self.buckets = dict(other.buckets)
+        else:
+            buckets = self.buckets
+            for index, n in other.buckets.items():
+                buckets[index] = buckets.get(index, 0) + n
+        self.count += other.count
+        self.total += other.total
+        if other.max > self.max:
+            self.max = other.max
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def quantiles(self, qs: Iterable[float]) -> list[float]:
+        """各分位数的估计值（取桶中点，不超过 max）"""
+        qs = list(qs)
+        if not self.count:
+            return [0.0] * len(qs)
+        targets = sorted((max(1, math.ceil(q * self.count)), i) for i, q in enumerate(qs))
+        results = [0.0] * len(qs)
+        seen = 0
+        t = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            while t < len(targets) and seen >= targets[t][0]:
+                low, high = _bucket_bounds(index)
+                results[targets[t][1]] = min((low + high) / 2, self.max)
+                t += 1
+            if t == len(targets):
+                break
+        return results
+
+    def quantile(self, q: float) -> float:
+        return self.quantiles([q])[0]
+
+    def cumulative_counts(self, bounds: Iterable[float]) -> list[int]:
+        """小于等于各上界（升序）的样本数，按桶中点归属"""
+        bounds = list(bounds)
+        results = [0] * len(bounds)
+        seen = 0
+        b = 0
+        for index in sorted(self.buckets):
+            low, high = _bucket_bounds(index)
+            midpoint = (low + high) / 2
+            while b < len(bounds) and bounds[b] < midpoint:
+                results[b] = seen
+                b += 1
+            if b == len(bounds):
+                return results
+            seen += self.buckets[index]
+        while b < len(bounds):
+            results[b] = seen
+            b += 1
+        return results
+
+
+def dump_aggregate(aggregate) -> dict:
+    """StreamingHistogram 或由直方图和计数组成的聚合转为可 JSON 序列化的 dict"""
+    if isinstance(aggregate, StreamingHistogram):
+        return {
+            "count": aggregate.count,
+            "total": aggregate.total,
+            "max": aggregate.max,
+            "buckets": list(aggregate.buckets.items()),
+        }
+    result = {}
+    for name in aggregate.__slots__:
+        value = getattr(aggregate, name)
+        result[name] = dump_aggregate(value) if isinstance(value, StreamingHistogram) else value
+    return result
+
+
+def load_aggregate(factory: Callable[[], object], data: dict):
+    aggregate = factory()
+    if isinstance(aggregate, StreamingHistogram):
+        aggregate.count = data["count"]
+        aggregate.total = data["total"]
+        aggregate.max = data["max"]
+        aggregate.buckets = {int(index): n for index, n in data["buckets"]}
+        return aggregate
+    for name, value in data.items():
+        if isinstance(getattr(aggregate, name), StreamingHistogram):
+            value = load_aggregate(StreamingHistogram, value)
+        setattr(aggregate, name, value)
+    return aggregate
+
+
+def dump_series(series: dict) -> list:
+    """{key: 聚合} -> [[key, data], ...]（tuple 类型的 key 转为 list）"""
+    return [[list(key) if isinstance(key, tuple) else key, dump_aggregate(aggregate)]
+            for key, aggregate in series.items()]
+
+
+def load_series(factory: Callable[[], object], data: list) -> dict:
+    return {tuple(key) if isinstance(key, list) else key: load_aggregate(factory, value)
+            for key, value in data}
+
+
+def merge_series(target: dict, series: dict, factory: Callable[[], object]) -> None:
+    """把 {key: 聚合} 合并进 target（不限 key 数量，新 key 用 factory() 创建）"""
+    for key, aggregate in series.items():
+        existing = target.get(key)
+        if existing is None:
+            existing = target[key] = factory()
+        existing.merge(aggregate)
+
+
+class WindowedAggregates:
+    """按序列 key 聚合：最近 1 小时按分钟分窗口，更早的按小时汇总保留 24 小时
+
+    factory 创建空聚合，聚合对象需实现 merge(other)。
+    """
+
+    FINE_SECONDS = 60
+    COARSE_SECONDS = 3600
+
+    def __init__(
+        self,
+        factory: Callable[[], object],
+        fine_windows: int = 60,
+        coarse_windows: int = 24,
+        max_series: int = 1000,
+        overflow_key: Optional[Callable[[Hashable], Hashable]] = None,
+        clock: Callable[[], float] = time.time,
+    ):
+        self._factory = factory
+        self._fine_windows = fine_windows
+        self._coarse_windows = coarse_windows
+        self._max_series = max_series
+        self._overflow_key = overflow_key or (lambda key: "other")
+        self._clock = clock
+        self._fine: deque[tuple[float, dict]] = deque()
+        # [小时起点, 序列, 已汇总进来的最新分钟的结束时间]
+        self._coarse: deque[list] = deque()
+        # 所有已结束分钟的累计；当前分钟在读取时再加上
+        self._totals: dict = {}
+        self._lock = threading.Lock()
+
+    def _rotate(self, now: float) -> dict:
+        start = now - now % self.FINE_SECONDS
+        with self._lock:
+            if self._fine and self._fine[-1][0] == start:
+                return self._fine[-1][1]
+            if self._fine:
+                self._merge_into(self._totals, self._fine[-1][1], bounded=True)
+            self._fine.append((start, {}))
+            oldest_fine = start - self._fine_windows * self.FINE_SECONDS
+            while self._fine and self._fine[0][0] <= oldest_fine:
+                self._roll_up(*self._fine.popleft())
+            oldest_coarse = start - (self._coarse_windows + 1) * self.COARSE_SECONDS
+            while self._coarse and self._coarse[0][0] <= oldest_coarse:
+                self._coarse.popleft()
+            return self._fine[-1][1]
+
+    def _roll_up(self, start: float, series: dict) -> None:
+        if not series:
+            return
+        hour = start - start % self.COARSE_SECONDS
+        if not self._coarse or self._coarse[-1][0] != hour:
+            self._coarse.append([hour, {}, hour])
+        self._coarse[-1][2] = start + self.FINE_SECONDS
+        self._merge_into(self._coarse[-1][1], series)
+
+    def _merge_into(self, target: dict, series: dict, bounded: bool = False) -> None:
+        for key, aggregate in series.items():
+            existing = target.get(key)
+            if existing is None:
+                if bounded and len(target) >= self._max_series:
+                    key = self._overflow_key(key)
+                    existing = target.get(key)
+                if existing is None:
+                    existing = target[key] = self._factory()
+            existing.merge(aggregate)
+
+    def get(self, key: Hashable):
+        """key 在当前分钟的聚合（首次使用时创建）"""
+        now = self._clock()
+        fine = self._fine
+        if fine:
+            start, series = fine[-1]
+            if now - start >= self.FINE_SECONDS:
+                series = self._rotate(now)
+        else:
+            series = self._rotate(now)
+        aggregate = series.get(key)
+        if aggregate is None:
+            if len(series) >= self._max_series:
+                key = self._overflow_key(key)
+                aggregate = series.get(key)
+            if aggregate is None:
+                aggregate = series[key] = self._factory()
+        return aggregate
+
+    def collect(self, last_seconds: Optional[float] = None, since: Optional[float] = None) -> dict:
+        """把与 [cutoff, now] 重叠的窗口合并为每个 key 一个聚合
+
+        最早的边界向外取整到包含 cutoff 的窗口（1 小时内按分钟，更早按小时）。
+        小时汇总只包含已移出分钟窗口的数据，两层不会重复计数。
+        """
+        now = self._clock()
+        self._rotate(now)
+        cutoff = since if since is not None else now - (last_seconds or 0)
+        merged: dict = {}
+        with self._lock:
+            windows = [(start + self.FINE_SECONDS, series) for start, series in self._fine]
+            windows += [(end, series) for _, series, end in self._coarse]
+            for end, series in windows:
+                if end > cutoff:
+                    self._merge_into(merged, series)
+        return merged
+
+    def export(self) -> tuple[list[tuple[int, float, float, dict]], dict]:
+        """所有存活窗口的 (粒度, 起点, 终点, 序列)，以及进程累计值"""
+        self._rotate(self._clock())
+        with self._lock:
+            windows = [(self.FINE_SECONDS, start, start + self.FINE_SECONDS, series)
+                       for start, series in self._fine]
+            windows += [(self.COARSE_SECONDS, start, end, series) for start, series, end in self._coarse]
+        return windows, self.totals()
+
+    def totals(self) -> dict:
+        """进程启动以来每个 key 的累计聚合（不过期，只增不减）"""
+        merged: dict = {}
+        with self._lock:
+            self._merge_into(merged, self._totals)
+            if self._fine:
+                self._merge_into(merged, self._fine[-1][1], bounded=True)
+        return merged
+
+
+class MergedWindows:
+    """多个进程的窗口和累计值，按一个 WindowedAggregates 的方式查询
+
+    同一进程的分钟窗口和小时窗口互不重叠（见上面的 collect），不同进程的窗口直接相加，
+    因此任意组合都可以合并。
+    """
+
+    def __init__(self, factory: Callable[[], object], clock: Callable[[], float] = time.time):
+        self._factory = factory
+        self._clock = clock
+        self._windows: list[tuple[float, dict]] = []
+        self._totals: list[dict] = []
+
+    def add_window(self, end: float, series: dict) -> None:
+        self._windows.append((end, series))
+
+    def add_totals(self, series: dict) -> None:
+        self._totals.append(series)
+
+    def collect(self, last_seconds: Optional[float] = None, since: Optional[float] = None) -> dict:
+        cutoff = since if since is not None else self._clock() - (last_seconds or 0)
+        merged: dict = {}
+        for end, series in self._windows:
+            if end > cutoff:
+                merge_series(merged, series, self._factory)
+        return merged
+
+    def totals(self) -> dict:
+        merged: dict = {}
+        for series in self._totals:
+            merge_series(merged, series, self._factory)
+        return merged
@@ -0,0 +1,178 @@
+"""
+过载控制：按负载逐级降级对话，最后以 503 拒绝新对话
+
+信号（每个进程各自统计）：
+- 进行中的对话轮数（begin/end 之间）
+- 最近 OVERLOAD_WINDOW 秒的 LLM 延迟均值（流式取首 token 时间，非流式取总耗时）
+- 最近 OVERLOAD_WINDOW 秒的连接池等待均值
+
+每个信号除以各自的上限（OVERLOAD_MAX_INFLIGHT / OVERLOAD_LLM_LATENCY_MS / OVERLOAD_POOL_WAIT_MS）
+得到压力比，按 LEVEL_STEPS 映射为级别，取最高者：
+
+    0  正常
+    1  跳过图谱搜索
+    2  + 召回条数减半
+    3  + 对话历史减半
+    4  + max_tokens 减半
+    5  新对话直接返回 503（已开始的对话按 4 级执行）
+
+升级立即生效；降级每 OVERLOAD_COOLDOWN 秒最多降一级，避免在阈值附近来回切换。
+每轮对话开始时取一次当前级别（Degradation），级别写入 Message.meta 和 SSE done 事件，
+当前级别和各级别的对话数见 /metrics 与 /admin/system/overload。
+"""
+import time
+from collections import Counter, deque
+from dataclasses import dataclass, field
+from typing import Optional
+
+from app.config import settings
+
+MAX_LEVEL = 5
+SHED_LEVEL = 5
+# 压力比达到 LEVEL_STEPS[i] 时至少为 i + 1 级
+LEVEL_STEPS = (0.6, 0.75, 0.9, 1.0, 1.25)
+MIN_SAMPLES = 3  # 延迟信号至少需要的样本数，避免一次慢调用就触发降级
+MAX_SAMPLES = 2000
+RECALL_K = 20
+MAX_TOKENS = 500
+
+
+@dataclass
+class Degradation:
+    """一轮对话的降级方案（begin 时按当前级别确定，之后不再变化）"""
+    level: int = 0
+    skip_graph: bool = False
+    recall_k: int = RECALL_K
+    history_limit: int = 0
+    max_tokens: int = MAX_TOKENS
+    _controller: Optional["OverloadController"] = field(default=None, repr=False)
+
+    def end(self) -> None:
+        """对话结束（可重复调用）"""
+        if self._controller is not None:
+            self._controller._inflight -= 1
+            self._controller = None
+
+
+def plan_for(level: int) -> Degradation:
+    level = min(level, MAX_LEVEL - 1)
+    history = settings.SESSION_HISTORY_LIMIT
+    return Degradation(
+        level=level,
+        skip_graph=level >= 1,
+        recall_k=RECALL_K // 2 if level >= 2 else RECALL_K,
+        history_limit=max(4, history // 2) if level >= 3 else history,
+        max_tokens=MAX_TOKENS // 2 if level >= 4 else MAX_TOKENS,
+    )
+
+
+def _ratio_level(ratio: float) -> int:
+    level = 0
+    for step in LEVEL_STEPS:
+        if ratio >= step:
+            level += 1
+    return level
+
+
+class _Window:
+    """最近 window 秒的样本均值"""
+
+    def __init__(self):
+        self.samples: deque = deque(maxlen=MAX_SAMPLES)
+
+    def add(self, value: float) -> None:
+        self.samples.append((time.monotonic(), value))
+
+    def mean(self, window: float) -> Optional[float]:
+        cutoff = time.monotonic() - window
+        while self.samples and self.samples[0][0] < cutoff:
+            self.samples.popleft()
+        if len(self.samples) < MIN_SAMPLES:
+            return None
+        return sum(v for _, v in self.samples) / len(self.samples)
+
+
+class OverloadController:
+    """进程内过载控制器"""
+
+    def __init__(self):
+        self._inflight = 0
+        self._llm = _Window()
+        self._pool_wait = _Window()
+        self._level = 0
+        self._lowered_at = 0.0
+        self._computed_at = 0.0
+        self.turns_by_level: Counter = Counter()
+        self.shed = 0
+
+    def observe_llm(self, duration_ms: float) -> None:
+        self._llm.add(duration_ms)
+
+    def observe_pool_wait(self, wait_ms: float) -> None:
+        self._pool_wait.add(wait_ms)
+
+    def signals(self) -> dict[str, Optional[float]]:
+        window = settings.OVERLOAD_WINDOW
+        return {
+            "inflight": self._inflight,
+            "llm_latency_ms": self._llm.mean(window),
+            "pool_wait_ms": self._pool_wait.mean(window),
+        }
+
+    def _pressure_level(self) -> int:
+        s = self.signals()
+        ratios = [s["inflight"] / max(settings.OVERLOAD_MAX_INFLIGHT, 1)]
+        if s["llm_latency_ms"] is not None:
+            ratios.append(s["llm_latency_ms"] / settings.OVERLOAD_LLM_LATENCY_MS)
+        if s["pool_wait_ms"] is not None:
+            ratios.append(s["pool_wait_ms"] / settings.OVERLOAD_POOL_WAIT_MS)
+        return _ratio_level(max(ratios))
+
+    def level(self) -> int:
+        """当前降级级别（0-5），每 0.5 秒最多重新计算一次"""
+        if not settings.OVERLOAD_ENABLED:
+            return 0
+        now = time.monotonic()
+        if now - self._computed_at < 0.5:
+            return self._level
+        self._computed_at = now
+        target = self._pressure_level()
+        if target > self._level:
+            self._level = target
+            self._lowered_at = now
+        elif target < self._level and now - self._lowered_at >= settings.OVERLOAD_COOLDOWN:
+            self._level -= 1
+            self._lowered_at = now
+        return self._level
+
+    def should_shed(self) -> bool:
+        """新对话是否应以 503 拒绝（拒绝时计数）"""
+        if self.level() >= SHED_LEVEL:
+            self.shed += 1
+            return True
+        return False
+
+    def begin(self) -> Degradation:
+        """开始一轮对话：计入进行中，返回本轮的降级方案（结束时调用 end()）"""
+        plan = plan_for(self.level())
+        self._inflight += 1
+        self.turns_by_level[plan.level] += 1
+        plan._controller = self
+        return plan
+
+    def status(self) -> dict:
+        return {
+            "enabled": settings.OVERLOAD_ENABLED,
+            "level": self.level(),
+            "signals": self.signals(),
+            "limits": {
+                "inflight": settings.OVERLOAD_MAX_INFLIGHT,
+                "llm_latency_ms": settings.OVERLOAD_LLM_LATENCY_MS,
+                "pool_wait_ms": settings.OVERLOAD_POOL_WAIT_MS,
+            },
+            "turns_by_level": dict(sorted(self.turns_by_level.items())),
+            "shed": self.shed,
+        }
+
+
+overload_controller = OverloadController()
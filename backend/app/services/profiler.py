@@ -0,0 +1,284 @@
+"""
+按需采样分析与事件循环阻塞监控
+
+两者都基于 sys._current_frames()（直接读取每个线程当前的栈帧，不挂解释器钩子），空闲时没有开销。
+
+- profile(seconds, hz)：临时线程每秒 hz 次采样事件循环线程（或所有线程）的调用栈，
+  返回折叠栈（"frame;frame;frame 次数" 行，flamegraph.pl / speedscope / inferno 的输入格式）
+  和最耗时的函数；采样线程只在分析期间存在
+- LoopMonitor：协程每 LOOP_MONITOR_INTERVAL_MS 心跳一次，看门狗线程检查心跳，
+  事件循环超过 LOOP_LAG_THRESHOLD_MS 没有运行时，在阻塞期间抓取事件循环线程的调用栈，
+  即造成阻塞的回调（bcrypt、JSON 编码、SQL 日志等）。空闲开销：每个周期事件循环上一个定时器、
+  看门狗线程唤醒一次
+
+采样发生在被采样线程的字节码之间（GIL 切换间隔，默认 5ms），在 C 代码中长时间持有 GIL 的
+调用会记在调用它的那一行 Python 代码上。
+"""
+import asyncio
+import logging
+import sys
+import threading
+import time
+from collections import Counter, deque
+from typing import Optional
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+MAX_PROFILE_SECONDS = 120
+MAX_HZ = 1000
+MAX_DEPTH = 128
+RECENT_STALLS = 50
+
+_profile_lock = threading.Lock()
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    module = frame.f_globals.get("__name__", "?")
+    return f"{module}:{code.co_name}:{frame.f_lineno}"
+
+
+def collapse_stack(frame, max_depth: int = MAX_DEPTH) -> str:
+    """栈帧链 -> "外层;...;内层"（折叠栈格式，最外层在前）"""
+    labels = []
+    while frame is not None and len(labels) < max_depth:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    return ";".join(reversed(labels))
+
+
+def _thread_names() -> dict[int, str]:
+    return {t.ident: t.name for t in threading.enumerate()}
+
+
+class Profile:
+    """一次采样分析的结果"""
+
+    def __init__(self, seconds: float, hz: int, all_threads: bool):
+        self.seconds = seconds
+        self.hz = hz
+        self.all_threads = all_threads
+        self.stacks: Counter = Counter()
+        self.samples = 0  # 实际完成的采样轮数
+        self.started = time.time()
+        self.elapsed = 0.0
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {n}\n" for stack, n in self.stacks.most_common())
+
+    def top_functions(self, limit: int = 30) -> list[dict]:
+        """按函数统计：self 为位于栈顶的采样数，total 为出现在栈中任意位置的采样数"""
+        own: Counter = Counter()
+        total: Counter = Counter()
+        for stack, n in self.stacks.items():
+            frames = [label.rsplit(":", 1)[0] for label in stack.split(";")]
+            own[frames[-1]] += n
+            for func in set(frames):
+                total[func] += n
+        all_samples = sum(self.stacks.values()) or 1
+        return [
+            {
+                "function": func,
+                "self": own[func],
+                "total": total[func],
+                "self_pct": round(own[func] * 100 / all_samples, 1),
+                "total_pct": round(total[func] * 100 / all_samples, 1),
+            }
+            for func, _ in total.most_common(limit)
+        ]
+
+    def to_dict(self, limit: int = 30) -> dict:
+        return {
+            "started": self.started,
+            "seconds": round(self.elapsed, 3),
+            "hz": self.hz,
+            "all_threads": self.all_threads,
+            "samples": self.samples,
+            "top": self.top_functions(limit),
+            "collapsed": self.collapsed(),
+        }
+
+
+def _sample(profile: Profile, seconds: float, target: Optional[int]) -> None:
+    me = threading.get_ident()
+    interval = 1.0 / profile.hz
+    names = _thread_names()
+    started = time.perf_counter()
+    deadline = started + seconds
+    next_at = started
+    while True:
+        now = time.perf_counter()
+        if now >= deadline:
+            break
+        for ident, frame in sys._current_frames().items():
+            if ident == me or (target is not None and ident != target):
+                continue
+            name = names.get(ident)
+            if name is None:
+                names = _thread_names()
+                name = names.get(ident, str(ident))
+            stack = collapse_stack(frame)
+            profile.stacks[f"{name};{stack}" if target is None else stack] += 1
+        profile.samples += 1
+        next_at += interval
+        delay = next_at - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        else:
+            next_at = time.perf_counter()
+    profile.elapsed = time.perf_counter() - started
+
+
+def profiling() -> bool:
+    return _profile_lock.locked()
+
+
+async def profile(seconds: float = 10, hz: int = 100, all_threads: bool = False) -> Profile:
+    """采样 seconds 秒的调用栈，不阻塞事件循环
+
+    默认只采样事件循环线程（请求延迟的来源）；all_threads 时采样所有线程，调用栈前加线程名。
+    参数超出范围抛 ValueError，已有分析在运行时抛 RuntimeError。
+    锁由采样线程结束时释放：等待中的请求被取消时采样仍在进行，不能提前开始下一次分析。
+    """
+    if not 0 < seconds <= MAX_PROFILE_SECONDS:
+        raise ValueError(f"seconds 需在 (0, {MAX_PROFILE_SECONDS}] 之间")
+    if not 1 <= hz <= MAX_HZ:
+        raise ValueError(f"hz 需在 [1, {MAX_HZ}] 之间")
+    if not _profile_lock.acquire(blocking=False):
+        raise RuntimeError("本 worker 已有采样分析在运行")
+    try:
+        result = Profile(seconds, hz, all_threads)
+        target = None if all_threads else threading.get_ident()
+        loop = asyncio.get_running_loop()
+        thread_done = loop.create_future()
+
+        def done() -> None:
+            if not thread_done.done():  # 等待方已取消
+                thread_done.set_result(None)
+
+        def run():
+            try:
+                _sample(result, seconds, target)
+            finally:
+                _profile_lock.release()
+                try:
+                    loop.call_soon_threadsafe(done)
+                except RuntimeError:  # 事件循环已关闭
+                    pass
+
+        threading.Thread(target=run, name="me2-profiler", daemon=True).start()
+    except BaseException:
+        _profile_lock.release()
+        raise
+    await thread_done
+    return result
+
+
+class LoopMonitor:
+    """检测事件循环阻塞并记录阻塞位置的调用栈"""
+
+    def __init__(self, threshold_ms: float, interval_ms: float):
+        self.threshold = threshold_ms / 1000
+        self.interval = interval_ms / 1000
+        self.stalls: deque = deque(maxlen=RECENT_STALLS)
+        self.stall_count = 0
+        self.max_lag_ms = 0.0
+        self.total_stalled_ms = 0.0
+        self._last_tick = time.perf_counter()
+        self._pending: Optional[dict] = None  # 看门狗为当前这次阻塞抓取的调用栈
+        self._loop_thread: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stop = threading.Event()
+        self._watchdog: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self._task is not None:
+            return
+        self._loop_thread = threading.get_ident()
+        self._last_tick = time.perf_counter()
+        self._stop.clear()
+        self._task = asyncio.create_task(self._tick())
+        self._watchdog = threading.Thread(target=self._watch, name="me2-loop-watchdog", daemon=True)
+        self._watchdog.start()
+
+    async def stop(self) -> None:
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _tick(self) -> None:
+        while True:
+            before = time.perf_counter()
+            self._last_tick = before
+            await asyncio.sleep(self.interval)
+            now = time.perf_counter()
+            self._last_tick = now
+            lag = now - before - self.interval
+            if lag >= self.threshold:
+                self._record(lag)
+            else:
+                self._pending = None
+
+    def _watch(self) -> None:
+        while not self._stop.wait(self.interval):
+            if self._pending is not None:
+                continue
+            # 心跳迟到超过阈值：事件循环此刻正被阻塞
+            if time.perf_counter() - self._last_tick >= self.interval + self.threshold:
+                frame = sys._current_frames().get(self._loop_thread)
+                if frame is not None:
+                    self._pending = {"captured_at": time.time(), "stack": collapse_stack(frame)}
+
+    def _record(self, lag: float) -> None:
+        lag_ms = lag * 1000
+        pending, self._pending = self._pending, None
+        self.stall_count += 1
+        self.total_stalled_ms += lag_ms
+        self.max_lag_ms = max(self.max_lag_ms, lag_ms)
+        stall = {"at": time.time(), "lag_ms": round(lag_ms, 1)}
+        if pending is not None:
+            stack = pending["stack"]
+            stall["stack"] = stack
+            stall["frame"] = stack.rsplit(";", 1)[-1]
+        self.stalls.append(stall)
+        logger.warning(
+            f"⚠️  事件循环阻塞 {lag_ms:.0f}ms"
+            + (f"，阻塞位置: {stall['frame']}" if "frame" in stall else "")
+        )
+
+    def stats(self, limit: int = 20) -> dict:
+        """启动以来的计数，以及最近的阻塞记录（最新的在前）"""
+        return {
+            "threshold_ms": self.threshold * 1000,
+            "interval_ms": self.interval * 1000,
+            "running": self._task is not None,
+            "stalls": self.stall_count,
+            "total_stalled_ms": round(self.total_stalled_ms, 1),
+            "max_lag_ms": round(self.max_lag_ms, 1),
+            "recent": list(self.stalls)[-limit:][::-1] if limit > 0 else [],
+        }
+
+    def top_frames(self, limit: int = 10) -> list[dict]:
+        """最近阻塞的栈顶位置，按累计阻塞时间排序"""
+        by_frame: dict[str, dict] = {}
+        for stall in self.stalls:
+            frame = stall.get("frame")
+            if frame is None:
+                continue
+            entry = by_frame.setdefault(frame, {"frame": frame, "count": 0, "total_ms": 0.0})
+            entry["count"] += 1
+            entry["total_ms"] = round(entry["total_ms"] + stall["lag_ms"], 1)
+        return sorted(by_frame.values(), key=lambda e: e["total_ms"], reverse=True)[:limit]
+
+
+loop_monitor = LoopMonitor(
+    threshold_ms=settings.LOOP_LAG_THRESHOLD_MS,
+    interval_ms=settings.LOOP_MONITOR_INTERVAL_MS,
+)
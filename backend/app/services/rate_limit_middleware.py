@@ -0,0 +1,147 @@
+"""
+接口限流与 LLM 每日配额中间件
+
+对 /api/ 请求按调用方限流（已登录按 JWT 中的用户 ID，否则按 IP；X-Forwarded-For 只在直连地址是
+TRUSTED_PROXIES 时采用，见 rate_limiter.client_ip），在路由和认证依赖之前拒绝，
+被拒绝的请求不会访问数据库、召回记忆或调用 LLM：
+- 全局桶：每个调用方每分钟最多 RATE_LIMIT_PER_USER 个请求（所有接口合计）
+- 接口桶：RATE_LIMIT_ROUTES 中的接口（路由模板，如 POST /api/v1/chat/stream）各自的每分钟上限
+- LLM 配额：LLM_QUOTA_ROUTES 中的接口在用户当天（UTC）已用 tokens 达到 LLM_DAILY_TOKEN_QUOTA 后拒绝，
+  用量来自 usage_tracker；配额在请求开始前检查，最后一个请求可能略微超出
+
+超限返回 429 和 Retry-After（配额为到 UTC 零点的秒数）。
+令牌桶默认在进程内（rate_limiter.RateLimiter，多 worker 时上限约乘以 worker 数）；
+RATE_LIMIT_SHARED 时放在 Postgres 由所有 worker 共享（rate_limiter.SharedBuckets），
+每个请求多一次数据库往返。
+"""
+import math
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Match
+
+from app.config import settings
+from app.services import usage_tracker, user_cache
+from app.services.rate_limiter import RateLimiter, SharedBuckets, client_ip
+
+user_limiter = RateLimiter("api_user", settings.RATE_LIMIT_PER_USER, period=60)
+_route_limiters: dict[str, RateLimiter] = {}
+
+
+def route_limiter(rule: str) -> RateLimiter:
+    limiter = _route_limiters.get(rule)
+    if limiter is None:
+        limiter = _route_limiters[rule] = RateLimiter(
+            f"api_route:{rule}", settings.RATE_LIMIT_ROUTES[rule], period=60
+        )
+    return limiter
+
+
+def _user_id(scope) -> Optional[str]:
+    """JWT 中的用户 ID（只校验签名和过期时间，解码结果有进程内缓存，不访问数据库）"""
+    for name, value in scope.get("headers", ()):
+        if name == b"authorization":
+            scheme, _, token = value.decode("latin-1").partition(" ")
+            if scheme.lower() != "bearer" or not token:
+                return None
+            payload = user_cache.get_token_payload(token.strip())
+            return payload.get("sub") if payload else None
+    return None
+
+
+def _seconds_until_utc_midnight() -> float:
+    now = datetime.now(timezone.utc)
+    midnight = datetime.combine(now.date() + timedelta(days=1), datetime.min.time(), tzinfo=timezone.utc)
+    return (midnight - now).total_seconds()
+
+
+async def _hit(checks: list[tuple[RateLimiter, str]]) -> float:
+    if settings.RATE_LIMIT_SHARED:
+        from app.db.database import AsyncSessionLocal
+
+        # 数据库错误（包括拿不到连接）时 SharedBuckets 退回进程内计数
+        async with AsyncSessionLocal() as db:
+            return await SharedBuckets(db).hit(checks)
+    return max(limiter.hit(key) for limiter, key in checks)
+
+
+class RateLimitMiddleware:
+    """Pure ASGI middleware：超限请求直接返回 429，不进入路由"""
+
+    def __init__(self, app, path_prefix: str = "/api/"):
+        self.app = app
+        self.path_prefix = path_prefix
+        self._routes: Optional[list] = None
+
+    def _limited_routes(self, app) -> list:
+        """配置了接口桶或 LLM 配额的路由 (route, path)，首次请求时从 app 的路由表中找出"""
+        if self._routes is None:
+            paths = {
+                rule.split(" ", 1)[1]
+                for rule in (*settings.RATE_LIMIT_ROUTES, *settings.LLM_QUOTA_ROUTES)
+            }
+            self._routes = [
+                (route, route.path)
+                for route in getattr(app, "routes", [])
+                if getattr(route, "path", None) in paths
+            ]
+        return self._routes
+
+    def _match(self, scope) -> Optional[str]:
+        """请求匹配到的受限路由模板（"POST /api/v1/chat/stream"），没有则为 None"""
+        for route, path in self._limited_routes(scope.get("app")):
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return f"{scope['method']} {path}"
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http"
+            or not settings.RATE_LIMIT_ENABLED
+            or scope["method"] == "OPTIONS"
+            or not scope["path"].startswith(self.path_prefix)
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        user_id = _user_id(scope)
+        key = f"user:{user_id}" if user_id else f"ip:{client_ip(Request(scope))}"
+        rule = self._match(scope)
+
+        checks = [(user_limiter, key)]
+        if rule in settings.RATE_LIMIT_ROUTES:
+            checks.append((route_limiter(rule), key))
+        retry_after = await _hit(checks)
+        if retry_after > 0:
+            await self._reject(scope, receive, send, "请求过于频繁，请稍后再试", retry_after)
+            return
+
+        quota = settings.LLM_DAILY_TOKEN_QUOTA
+        if user_id and quota > 0 and rule in settings.LLM_QUOTA_ROUTES:
+            if await usage_tracker.tokens_used_today(user_id) >= quota:
+                await self._reject(
+                    scope, receive, send, "今日对话额度已用完，请明天再试", _seconds_until_utc_midnight()
+                )
+                return
+
+        await self.app(scope, receive, send)
+
+    @staticmethod
+    async def _reject(scope, receive, send, detail: str, retry_after: float) -> None:
+        response = JSONResponse(
+            {"detail": detail},
+            status_code=429,
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+        )
+        await response(scope, receive, send)
+
+
+async def run_rate_limit_cleanup_job() -> int:
+    """定时任务：删除闲置的共享令牌桶"""
+    from app.db.database import AsyncSessionLocal
+
+    async with AsyncSessionLocal() as db:
+        return await SharedBuckets(db).delete_idle(idle_seconds=3600)
@@ -0,0 +1,185 @@
+"""
+进程内令牌桶限流
+
+每个 key（IP、用户名等）一个令牌桶：容量 capacity，每 period 秒补满。
+请求消耗一个令牌，桶空时返回需要等待的秒数（用于 429 的 Retry-After）。
+key 数量有上限，超出时淘汰最久未使用的桶。
+
+多 worker 部署时每个进程各自计数，实际上限约为 capacity × worker 数；
+需要全局精确限流时用 SharedBuckets 把令牌桶放在 Postgres（RATE_LIMIT_SHARED）。
+"""
+import ipaddress
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from fastapi import Request
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# 一条语句补充并消耗多个桶：补充量按数据库时钟计算，不受各 worker 本地时钟偏差影响
+_REFILLED = (
+    "LEAST(EXCLUDED.capacity, b.tokens + "
+    "GREATEST(EXTRACT(EPOCH FROM clock_timestamp() - b.updated_at), 0) * EXCLUDED.rate)"
+)
+_SHARED_HIT_SQL = text(f"""
+    INSERT INTO rate_limit_buckets AS b (key, tokens, capacity, rate, allowed, updated_at)
+    SELECT k, c - 1, c, r, true, clock_timestamp()
+    FROM unnest(CAST(:keys AS text[]), CAST(:capacities AS float8[]), CAST(:rates AS float8[])) AS t(k, c, r)
+    ON CONFLICT (key) DO UPDATE SET
+        tokens = {_REFILLED} - CASE WHEN {_REFILLED} >= 1 THEN 1 ELSE 0 END,
+        allowed = {_REFILLED} >= 1,
+        capacity = EXCLUDED.capacity,
+        rate = EXCLUDED.rate,
+        updated_at = clock_timestamp()
+    RETURNING b.tokens, b.rate, b.allowed
+""")
+_SHARED_CLEANUP_SQL = text(
+    "DELETE FROM rate_limit_buckets WHERE updated_at < clock_timestamp() - make_interval(secs => :idle)"
+)
+
+
+class RateLimiter:
+    """按 key 的令牌桶限流器"""
+
+    def __init__(self, name: str, capacity: int, period: float, max_keys: int = 100_000):
+        self.name = name
+        self.capacity = capacity
+        self.period = period
+        self.max_keys = max_keys
+        self._buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()  # key -> (tokens, updated)
+        self._lock = threading.Lock()
+
+    @property
+    def rate(self) -> float:
+        """每秒补充的令牌数"""
+        return self.capacity / self.period
+
+    def hit(self, key: str, cost: float = 1.0) -> float:
+        """消耗令牌；允许时返回 0，否则返回需要等待的秒数"""
+        if self.capacity <= 0:
+            return 0.0
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (float(self.capacity), now))
+            tokens = min(float(self.capacity), tokens + (now - updated) * self.rate)
+            if tokens >= cost:
+                tokens -= cost
+                retry_after = 0.0
+            else:
+                retry_after = (cost - tokens) / self.rate
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return retry_after
+
+    def reset(self, key: Optional[str] = None) -> None:
+        with self._lock:
+            if key is None:
+                self._buckets.clear()
+            else:
+                self._buckets.pop(key, None)
+
+
+class SharedBuckets:
+    """Postgres 中的令牌桶（rate_limit_buckets 表），所有 worker 共享同一份计数
+
+    每次请求一条 INSERT ... ON CONFLICT DO UPDATE，同时检查该请求涉及的所有桶。
+    数据库不可用时退回各 RateLimiter 的进程内计数（宁可放行，也不因限流拒绝所有请求）。
+    """
+
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    async def hit(self, checks: list[tuple[RateLimiter, str]]) -> float:
+        """各桶消耗一个令牌；全部允许时返回 0，否则返回需要等待的最长秒数"""
+        checks = [(limiter, key) for limiter, key in checks if limiter.capacity > 0]
+        if not checks:
+            return 0.0
+        try:
+            rows = (await self.db.execute(_SHARED_HIT_SQL, {
+                "keys": [f"{limiter.name}:{key}" for limiter, key in checks],
+                "capacities": [float(limiter.capacity) for limiter, _ in checks],
+                "rates": [limiter.rate for limiter, _ in checks],
+            })).all()
+            await self.db.commit()
+        except Exception as e:
+            await self.db.rollback()
+            _warn_fallback(e)
+            return max(limiter.hit(key) for limiter, key in checks)
+        return max(
+            (0.0 if allowed else (1 - tokens) / rate) for tokens, rate, allowed in rows
+        )
+
+    async def delete_idle(self, idle_seconds: float) -> int:
+        """删除闲置超过 idle_seconds 的桶（闲置超过补满周期的桶等同于满桶，删除不影响限流）"""
+        result = await self.db.execute(_SHARED_CLEANUP_SQL, {"idle": idle_seconds})
+        await self.db.commit()
+        return result.rowcount or 0
+
+
+_last_fallback_warning = 0.0
+
+
+def _warn_fallback(error: Exception) -> None:
+    global _last_fallback_warning
+    now = time.monotonic()
+    if now - _last_fallback_warning >= 60:  # 数据库故障时每分钟最多一条
+        _last_fallback_warning = now
+        logger.warning(f"⚠️  共享限流不可用，暂用进程内计数: {error}")
+
+
+_trusted_cache: tuple[tuple, list] = ((), [])
+
+
+def _trusted_networks() -> list:
+    """解析 TRUSTED_PROXIES（配置不变时复用上次的结果）"""
+    global _trusted_cache
+    raw = tuple(settings.TRUSTED_PROXIES)
+    if raw != _trusted_cache[0]:
+        networks = []
+        for entry in raw:
+            if entry == "*":
+                networks = ["*"]
+                break
+            try:
+                networks.append(ipaddress.ip_network(entry.strip(), strict=False))
+            except ValueError:
+                logger.warning(f"⚠️  TRUSTED_PROXIES 中的地址无效，已忽略: {entry}")
+        _trusted_cache = (raw, networks)
+    return _trusted_cache[1]
+
+
+def _is_trusted(host: str, networks: list) -> bool:
+    if "*" in networks:
+        return True
+    try:
+        address = ipaddress.ip_address(host)
+    except ValueError:
+        return False
+    return any(address in network for network in networks)
+
+
+def client_ip(request: Request) -> str:
+    """客户端 IP
+
+    直连地址是可信代理（TRUSTED_PROXIES）时，从右往左跳过 X-Forwarded-For 中的可信代理，
+    取第一个不可信的地址；否则请求头可以任意伪造，只用直连地址。
+    """
+    peer = request.client.host if request.client else "unknown"
+    networks = _trusted_networks()
+    forwarded = request.headers.get("x-forwarded-for")
+    if not forwarded or not networks or not _is_trusted(peer, networks):
+        return peer
+    hops = [hop.strip() for hop in forwarded.split(",") if hop.strip()]
+    for hop in reversed(hops):
+        if not _is_trusted(hop, networks):
+            return hop
+    return hops[0] if hops else peer
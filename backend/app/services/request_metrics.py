@@ -0,0 +1,107 @@
+"""
+按接口记录 API 指标的 ASGI 中间件
+
+请求按匹配到的路由模板（/api/v1/chat/sessions/{session_id}/messages）归类，而不是原始路径，
+每个接口一个序列，不会因会话 ID 不同而膨胀；没有匹配到路由的请求统一记为 "(unmatched)"。
+
+没有 Content-Length 的响应（StreamingResponse：SSE /chat/stream、导出等）同时按流式响应记录：
+首个响应体字节的时间，以及发送完最后一块的总耗时（而不是响应头发出的时间）。
+"""
+import time
+from typing import Callable, Optional
+
+from app.db.pool_monitor import request_scope
+from app.services.metrics_collector import MetricsCollector
+
+UNMATCHED = "(unmatched)"
+
+_templates: dict[Callable, str] = {}
+
+
+def _build_templates(app) -> None:
+    """endpoint 函数 -> 路由模板，从 app 的路由表遍历一次生成"""
+    stack = [("", list(getattr(app, "routes", [])))]
+    while stack:
+        prefix, routes = stack.pop()
+        for route in routes:
+            path = getattr(route, "path_format", None) or getattr(route, "path", "")
+            endpoint = getattr(route, "endpoint", None)
+            if endpoint is not None:
+                _templates.setdefault(endpoint, prefix + path)
+            sub_routes = getattr(route, "routes", None)
+            if sub_routes:
+                stack.append((prefix + path, list(sub_routes)))
+
+
+def route_template(scope: dict) -> str:
+    """路由匹配到的接口的路由模板，没有匹配时为 UNMATCHED"""
+    endpoint = scope.get("endpoint")
+    if endpoint is None:
+        return UNMATCHED
+    template = _templates.get(endpoint)
+    if template is None:
+        _build_templates(scope.get("app"))
+        template = _templates.setdefault(endpoint, getattr(endpoint, "__name__", UNMATCHED))
+    return template
+
+
+class RequestMetricsMiddleware:
+    """Pure ASGI middleware（与 BaseHTTPMiddleware 不同，能看到响应体的每一块）"""
+
+    def __init__(self, app, path_prefix: str = "/api/"):
+        self.app = app
+        self.path_prefix = path_prefix
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        # 连接池占用时间按接口归类（路由匹配后 scope 中会有 endpoint）
+        request_scope.set(scope)
+        if not scope["path"].startswith(self.path_prefix):
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status_code = 500
+        first_byte: Optional[float] = None
+        streaming = False
+        chunks = 0
+        completed = False
+
+        async def send_wrapper(message):
+            nonlocal status_code, first_byte, streaming, chunks, completed
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                # BaseHTTPMiddleware 也会把普通响应拆成多块，只有缺少 Content-Length 才是流式响应
+                streaming = not any(k.lower() == b"content-length" for k, _ in message.get("headers", ()))
+            elif message["type"] == "http.response.body":
+                more_body = message.get("more_body", False)
+                if message.get("body"):
+                    chunks += 1
+                    if first_byte is None:
+                        first_byte = time.perf_counter()
+                if not more_body:
+                    completed = True
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            ended = time.perf_counter()
+            route = route_template(scope)
+            method = scope["method"]
+            collector = MetricsCollector()
+            if streaming:
+                ttfb_ms = ((first_byte or ended) - started) * 1000
+                collector.record_api(route, method, status_code, ttfb_ms)
+                collector.record_stream(
+                    route, method,
+                    ttfb_ms=ttfb_ms,
+                    duration_ms=(ended - started) * 1000,
+                    chunks=chunks,
+                    completed=completed,
+                )
+            else:
+                collector.record_api(route, method, status_code, (ended - started) * 1000)
@@ -0,0 +1,267 @@
+"""
+调试数据保留策略
+
+messages 表里体积最大的是 assistant 消息的调试数据：
+system_prompt、recalled_memories 和 meta.timings。它们只在调试面板
+（chat._build_debug_info）里用到，超过保留期后按批次处理：
+
+- strip:    直接删除，仅保留 recalled_memories 的摘要（历史消息的记忆标签仍可展示）
+- compress: 同上，但把完整调试数据 zlib 压缩后写入 debug_archive 列，调试面板仍可查看
+
+每批一次 UPDATE 并提交，批次之间休眠，避免长事务锁住聊天写入。
+"""
+import asyncio
+import json
+import logging
+import time
+import zlib
+from datetime import datetime, timedelta, timezone
+from typing import Any, Optional
+
+from sqlalchemy import select, func, or_, and_, tuple_, update, cast, Text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.db.models import Message
+
+logger = logging.getLogger(__name__)
+
+RETENTION_MODES = ("strip", "compress")
+
+# 最近一次运行结果（供 admin 接口查询）
+_last_report: Optional[dict[str, Any]] = None
+_run_lock = asyncio.Lock()
+_background_task: Optional[asyncio.Task] = None
+
+
+def compress_debug_payload(payload: dict[str, Any]) -> bytes:
+    """压缩调试数据"""
+    raw = json.dumps(payload, ensure_ascii=False, default=str).encode("utf-8")
+    return zlib.compress(raw, 6)
+
+
+def decompress_debug_payload(blob: bytes) -> dict[str, Any]:
+    """解压调试数据，失败时返回空字典"""
+    try:
+        return json.loads(zlib.decompress(blob).decode("utf-8"))
+    except Exception:
+        return {}
+
+
+def summarize_recalled_memories(recalled: Optional[list]) -> Optional[list]:
+    """只保留历史消息展示所需的记忆摘要（与 chat._get_recalled_summaries 一致）"""
+    if not recalled:
+        return recalled
+    return [
+        {
+            "content": (m.get("content") or "")[:100],
+            "score": m.get("score", 0),
+            "memory_type": m.get("memory_type"),
+            "source": m.get("source"),
+        }
+        for m in recalled
+        if isinstance(m, dict)
+    ]
+
+
+def _json_size(value: Any) -> int:
+    if value is None:
+        return 0
+    return len(json.dumps(value, ensure_ascii=False, default=str).encode("utf-8"))
+
+
+def _text_size(value: Optional[str]) -> int:
+    return len(value.encode("utf-8")) if value else 0
+
+
+class RetentionService:
+    """调试数据保留策略服务"""
+
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    @staticmethod
+    def _cutoff(days: int) -> datetime:
+        return datetime.now(timezone.utc) - timedelta(days=days)
+
+    @staticmethod
+    def _pending_filter(cutoff: datetime):
+        """需要处理的消息：超过保留期且仍带有调试数据"""
+        return and_(
+            Message.role == "assistant",
+            Message.created_at < cutoff,
+            or_(
+                Message.system_prompt.isnot(None),
+                Message.meta["timings"].as_string().isnot(None),
+            ),
+        )
+
+    async def preview(self, days: Optional[int] = None) -> dict[str, Any]:
+        """预估待处理的消息数量和调试数据体积（不修改数据）"""
+        days = days if days is not None else settings.DEBUG_PAYLOAD_RETENTION_DAYS
+        cutoff = self._cutoff(days)
+
+        result = await self.db.execute(
+            select(
+                func.count(Message.id),
+                func.coalesce(func.sum(func.length(Message.system_prompt)), 0),
+                func.coalesce(func.sum(func.length(cast(Message.recalled_memories, Text))), 0),
+                func.coalesce(func.sum(func.length(Message.meta["timings"].as_string())), 0),
+            ).where(self._pending_filter(cutoff))
+        )
+        count, prompt_bytes, recalled_bytes, timings_bytes = result.one()
+
+        return {
+            "days": days,
+            "cutoff": cutoff.isoformat(),
+            "mode": settings.DEBUG_PAYLOAD_RETENTION_MODE,
+            "messages": int(count or 0),
+            "estimated_bytes": {
+                "system_prompt": int(prompt_bytes or 0),
+                "recalled_memories": int(recalled_bytes or 0),
+                "timings": int(timings_bytes or 0),
+                "total": int((prompt_bytes or 0) + (recalled_bytes or 0) + (timings_bytes or 0)),
+            },
+            "last_run": _last_report,
+        }
+
+    async def run(
+        self,
+        days: Optional[int] = None,
+        mode: Optional[str] = None,
+        batch_size: Optional[int] = None,
+        batch_sleep: Optional[float] = None,
+        max_batches: Optional[int] = None,
+    ) -> dict[str, Any]:
+        """按批次压缩/删除过期调试数据，返回处理报告"""
+        global _last_report
+
+        days = days if days is not None else settings.DEBUG_PAYLOAD_RETENTION_DAYS
+        mode = mode or settings.DEBUG_PAYLOAD_RETENTION_MODE
+        batch_size = batch_size or settings.DEBUG_PAYLOAD_RETENTION_BATCH_SIZE
+        batch_sleep = settings.DEBUG_PAYLOAD_RETENTION_BATCH_SLEEP if batch_sleep is None else batch_sleep
+        if mode not in RETENTION_MODES:
+            raise ValueError(f"未知的保留模式: {mode}")
+
+        cutoff = self._cutoff(days)
+        started = time.time()
+        report: dict[str, Any] = {
+            "days": days,
+            "mode": mode,
+            "cutoff": cutoff.isoformat(),
+            "started_at": datetime.now(timezone.utc).isoformat(),
+            "messages": 0,
+            "batches": 0,
+            "bytes_before": 0,
+            "bytes_after": 0,
+            "reclaimed_bytes": 0,
+            "completed": False,
+        }
+
+        # 键集分页游标：(created_at, id)
+        cursor: Optional[tuple[datetime, str]] = None
+
+        while max_batches is None or report["batches"] < max_batches:
+            stmt = (
+                select(
+                    Message.id,
+                    Message.created_at,
+                    Message.system_prompt,
+                    Message.recalled_memories,
+                    Message.meta,
+                )
+                .where(self._pending_filter(cutoff))
+                .order_by(Message.created_at, Message.id)
+                .limit(batch_size)
+            )
+            if cursor is not None:
+                stmt = stmt.where(tuple_(Message.created_at, Message.id) > tuple_(*cursor))
+
+            rows = (await self.db.execute(stmt)).all()
+            if not rows:
+                report["completed"] = True
+                break
+
+            updates = []
+            for row in rows:
+                meta = dict(row.meta or {})
+                timings = meta.pop("timings", None)
+                summaries = summarize_recalled_memories(row.recalled_memories)
+
+                before = (
+                    _text_size(row.system_prompt)
+                    + _json_size(row.recalled_memories)
+                    + _json_size(timings)
+                )
+                archive = None
+                if mode == "compress":
+                    archive = compress_debug_payload({
+                        "system_prompt": row.system_prompt,
+                        "recalled_memories": row.recalled_memories,
+                        "timings": timings,
+                    })
+                after = _json_size(summaries) + (len(archive) if archive else 0)
+
+                meta["debug_compacted"] = mode
+                updates.append({
+                    "id": row.id,
+                    "system_prompt": None,
+                    "recalled_memories": summaries,
+                    "meta": meta,
+                    "debug_archive": archive,
+                })
+                report["bytes_before"] += before
+                report["bytes_after"] += after
+
+            # ORM 按主键批量 UPDATE（executemany，一次往返）
+            await self.db.execute(update(Message), updates)
+            await self.db.commit()
+
+            report["messages"] += len(rows)
+            report["batches"] += 1
+            cursor = (rows[-1].created_at, rows[-1].id)
+
+            if len(rows) < batch_size:
+                report["completed"] = True
+                break
+            if batch_sleep > 0:
+                await asyncio.sleep(batch_sleep)
+
+        report["reclaimed_bytes"] = report["bytes_before"] - report["bytes_after"]
+        report["duration_seconds"] = round(time.time() - started, 3)
+        _last_report = report
+        logger.info(
+            f"调试数据保留任务完成: {report['messages']} 条消息, "
+            f"{report['batches']} 批, 回收 {report['reclaimed_bytes']} 字节"
+        )
+        return report
+
+
+def is_running() -> bool:
+    return _run_lock.locked() or bool(_background_task and not _background_task.done())
+
+
+def get_last_report() -> Optional[dict[str, Any]]:
+    return _last_report
+
+
+async def run_retention_job(**kwargs) -> Optional[dict[str, Any]]:
+    """使用独立数据库会话执行一次保留任务（定时任务 / admin 触发共用）"""
+    if _run_lock.locked():
+        logger.info("调试数据保留任务正在运行，跳过本次触发")
+        return None
+
+    from app.db.database import AsyncSessionLocal
+
+    async with _run_lock:
+        async with AsyncSessionLocal() as db:
+            return await RetentionService(db).run(**kwargs)
+
+
+def trigger_retention_job(**kwargs) -> bool:
+    """在后台启动保留任务，已在运行时返回 False"""
+    global _background_task
+    if _run_lock.locked() or (_background_task and not _background_task.done()):
+        return False
+    _background_task = asyncio.create_task(run_retention_job(**kwargs))
+    return True
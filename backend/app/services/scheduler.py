@@ -0,0 +1,86 @@
+"""
+后台定时任务调度器
+
+在应用进程内以 asyncio task 周期性执行维护任务（保留策略、清理等），
+生命周期由 main.lifespan 管理。任务异常只记录日志，不会中断调度。
+"""
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class PeriodicJob:
+    """周期任务定义"""
+    name: str
+    interval: float  # 秒
+    func: Callable[[], Awaitable[object]]
+    initial_delay: float = 0.0
+    task: Optional[asyncio.Task] = field(default=None, repr=False)
+
+
+class Scheduler:
+    """进程内周期任务调度器"""
+
+    def __init__(self):
+        self._jobs: dict[str, PeriodicJob] = {}
+        self._started = False
+
+    def add_job(
+        self,
+        name: str,
+        interval: float,
+        func: Callable[[], Awaitable[object]],
+        initial_delay: float = 0.0,
+    ) -> None:
+        """注册周期任务（同名任务会被覆盖）"""
+        job = PeriodicJob(name=name, interval=interval, func=func, initial_delay=initial_delay)
+        old = self._jobs.get(name)
+        if old and old.task:
+            old.task.cancel()
+        self._jobs[name] = job
+        if self._started:
+            job.task = asyncio.create_task(self._run(job))
+
+    def jobs(self) -> list[str]:
+        return list(self._jobs)
+
+    def start(self) -> None:
+        """启动所有已注册任务"""
+        if self._started:
+            return
+        self._started = True
+        for job in self._jobs.values():
+            job.task = asyncio.create_task(self._run(job))
+        if self._jobs:
+            logger.info(f"⏰ 后台任务已启动: {', '.join(self._jobs)}")
+
+    async def stop(self) -> None:
+        """取消所有任务并等待退出"""
+        tasks = [job.task for job in self._jobs.values() if job.task]
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+        for job in self._jobs.values():
+            job.task = None
+        self._started = False
+
+    async def _run(self, job: PeriodicJob) -> None:
+        if job.initial_delay:
+            await asyncio.sleep(job.initial_delay)
+        while True:
+            try:
+                await job.func()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"后台任务 {job.name} 执行失败: {e}", exc_info=True)
+            await asyncio.sleep(job.interval)
+
+
+# 全局单例
+scheduler = Scheduler()
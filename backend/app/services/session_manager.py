@@ -4,17 +4,46 @@
 from typing import List, Dict, Any, Optional
 from datetime import datetime, timedelta, timezone
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, update
-from app.db.models import Session
+from sqlalchemy import select, insert, update, delete, func, and_, tuple_, text
+from app.db.models import Session, Message, generate_uuid
 from app.config import settings
+from app.services.job_store import JobStore
+from app.services.metrics_collector import MetricsCollector
+import asyncio
 import logging
 import json
+import time
 
 logger = logging.getLogger(__name__)
 
+CLEANUP_JOB_KIND = "session_cleanup"
+
+# sessions.meta 是 JSON 列：PostgreSQL 转为 jsonb 用 || 合并，SQLite（测试）用 json_patch
+_CONTEXT_MERGE_SQL = {
+    "postgresql": (
+        "UPDATE sessions SET meta = jsonb_set("
+        "COALESCE(meta::jsonb, '{}'::jsonb), '{context}', "
+        "COALESCE(meta::jsonb -> 'context', '{}'::jsonb) || CAST(:ctx AS jsonb)"
+        ")::json WHERE id = :id"
+    ),
+    "sqlite": (
+        "UPDATE sessions SET meta = json_set("
+        "COALESCE(meta, '{}'), '$.context', "
+        "json(json_patch(COALESCE(json_extract(meta, '$.context'), '{}'), :ctx))"
+        ") WHERE id = :id"
+    ),
+}
+_cleanup_lock = asyncio.Lock()
+_cleanup_task: Optional[asyncio.Task] = None
+
 
 class SessionManager:
-    """会话管理器"""
+    """会话管理器
+
+    消息以追加方式写入 messages 表（每条一次 INSERT，与会话长度无关），
+    读取时通过 (session_id, created_at) 复合索引取最近 N 条；
+    会话上下文保存在 sessions.meta["context"]，由 SQL 端 JSON 合并更新。
+    """
 
     def __init__(self, db: AsyncSession):
         self.db = db
@@ -29,11 +58,11 @@ class SessionManager:
         Returns:
             Session 对象
         """
-        # 查找活跃会话
+        # 最近活跃的会话（走 ix_sessions_user_last_active）
         stmt = select(Session).where(
             Session.user_id == user_id,
-            Session.is_active == True
-        ).order_by(Session.last_activity_at.desc())
+            Session.is_active == True  # noqa: E712
+        ).order_by(Session.last_active_at.desc()).limit(1)
         result = await self.db.execute(stmt)
         session = result.scalar_one_or_none()
 
@@ -42,19 +71,16 @@ class SessionManager:
             timeout_threshold = datetime.now(timezone.utc) - timedelta(
                 seconds=settings.SESSION_TIMEOUT
             )
-            if session.last_activity_at < timeout_threshold:
+            last_active = session.last_active_at
+            if last_active is not None and last_active.tzinfo is None:
+                last_active = last_active.replace(tzinfo=timezone.utc)
+            if last_active is not None and last_active < timeout_threshold:
                 # 会话超时，结束旧会话
                 await self.end_session(session.id)
                 session = None
 
         if not session:
-            # 创建新会话
-            session = Session(
-                user_id=user_id,
-                messages=[],
-                context={},
-                message_count=0
-            )
+            session = Session(user_id=user_id)
             self.db.add(session)
             await self.db.commit()
             await self.db.refresh(session)
@@ -68,45 +94,44 @@ class SessionManager:
         role: str,
         content: str,
         metadata: Optional[Dict[str, Any]] = None
-    ) -> None:
+    ) -> str:
         """
-        添加消息到会话
+        追加消息到会话
+
+        一次 UPDATE（刷新活跃时间并取回 user_id）加一次 INSERT，
+        开销与会话已有消息数无关。
 
         Args:
             session_id: 会话 ID
             role: 角色 (user/assistant)
             content: 消息内容
-            metadata: 元数据
-        """
-        stmt = select(Session).where(Session.id == session_id)
-        result = await self.db.execute(stmt)
-        session = result.scalar_one_or_none()
+            metadata: 元数据（写入 Message.meta）
 
-        if not session:
+        Returns:
+            新消息 ID
+        """
+        user_id = await self.db.scalar(
+            update(Session)
+            .where(Session.id == session_id)
+            .values(last_active_at=func.now())
+            .returning(Session.user_id)
+        )
+        if user_id is None:
+            await self.db.rollback()
             raise ValueError(f"会话不存在: {session_id}")
 
-        # 构建消息对象
-        message = {
-            "role": role,
-            "content": content,
-            "timestamp": datetime.now(timezone.utc).isoformat(),
-            "metadata": metadata or {}
-        }
-
-        # 添加消息
-        messages = session.messages or []
-        messages.append(message)
-
-        # 限制消息数量
-        if len(messages) > settings.MAX_SESSION_MESSAGES:
-            messages = messages[-settings.MAX_SESSION_MESSAGES:]
-
-        # 更新会话
-        session.messages = messages
-        session.message_count = len(messages)
-        session.last_activity_at = datetime.now(timezone.utc)
-
+        message_id = generate_uuid()
+        await self.db.execute(insert(Message).values(
+            id=message_id,
+            session_id=session_id,
+            user_id=user_id,
+            role=role,
+            content=content,
+            meta=metadata,
+            created_at=datetime.now(timezone.utc),
+        ))
         await self.db.commit()
+        return message_id
 
     async def get_messages(
         self,
@@ -114,27 +139,44 @@ class SessionManager:
         limit: Optional[int] = None
     ) -> List[Dict[str, Any]]:
         """
-        获取会话消息
+        获取会话消息（按时间正序）
+
+        指定 limit 时只取最近 limit 条：按 created_at 倒序走复合索引取前 N 条再翻转，
+        只读取需要的列，不加载 system_prompt 等调试数据。
 
         Args:
             session_id: 会话 ID
-            limit: 限制数量
+            limit: 最近消息条数，None 表示全部
 
         Returns:
             消息列表
         """
-        stmt = select(Session).where(Session.id == session_id)
-        result = await self.db.execute(stmt)
-        session = result.scalar_one_or_none()
-
-        if not session:
-            return []
-
-        messages = session.messages or []
+        stmt = (
+            select(Message.id, Message.role, Message.content, Message.meta, Message.created_at)
+            .where(Message.session_id == session_id)
+            .order_by(Message.created_at.desc(), Message.id.desc())
+        )
         if limit:
-            messages = messages[-limit:]
-
-        return messages
+            stmt = stmt.limit(limit)
+        rows = (await self.db.execute(stmt)).all()
+
+        return [
+            {
+                "id": row.id,
+                "role": row.role,
+                "content": row.content,
+                "timestamp": row.created_at.isoformat() if row.created_at else None,
+                "metadata": row.meta or {},
+            }
+            for row in reversed(rows)
+        ]
+
+    async def get_context(self, session_id: str) -> Dict[str, Any]:
+        """读取会话上下文"""
+        meta = await self.db.scalar(select(Session.meta).where(Session.id == session_id))
+        if isinstance(meta, dict):
+            return meta.get("context") or {}
+        return {}
 
     async def update_context(
         self,
@@ -144,22 +186,22 @@ class SessionManager:
         """
         更新会话上下文
 
+        在数据库端把 context 合并进 sessions.meta["context"]（单条 UPDATE，
+        不先读后写，并发更新不同键不会互相覆盖）。
+
         Args:
             session_id: 会话 ID
-            context: 上下文数据
+            context: 要合并的上下文键值
         """
-        stmt = select(Session).where(Session.id == session_id)
-        result = await self.db.execute(stmt)
-        session = result.scalar_one_or_none()
-
-        if not session:
+        dialect = self.db.bind.dialect.name
+        sql = _CONTEXT_MERGE_SQL.get(dialect, _CONTEXT_MERGE_SQL["postgresql"])
+        result = await self.db.execute(
+            text(sql),
+            {"id": session_id, "ctx": json.dumps(context, ensure_ascii=False, default=str)},
+        )
+        if not result.rowcount:
+            await self.db.rollback()
             raise ValueError(f"会话不存在: {session_id}")
-
-        # 合并上下文
-        current_context = session.context or {}
-        current_context.update(context)
-        session.context = current_context
-
         await self.db.commit()
 
     async def end_session(self, session_id: str) -> None:
@@ -171,36 +213,181 @@ class SessionManager:
         """
         stmt = update(Session).where(
             Session.id == session_id
-        ).values(
-            is_active=False,
-            ended_at=datetime.now(timezone.utc)
-        )
+        ).values(is_active=False)
         await self.db.execute(stmt)
         await self.db.commit()
         logger.info(f"会话已结束: {session_id}")
 
-    async def cleanup_old_sessions(self, days: int = 7) -> int:
+    @staticmethod
+    def _cleanup_filter(threshold: datetime):
+        """可清理的会话：已结束且超过保留期未活跃"""
+        return and_(Session.is_active == False, Session.last_active_at < threshold)  # noqa: E712
+
+    async def cleanup_old_sessions(
+        self,
+        days: Optional[int] = None,
+        batch_size: Optional[int] = None,
+        batch_sleep: Optional[float] = None,
+        dry_run: bool = False,
+        max_batches: Optional[int] = None,
+    ) -> Dict[str, Any]:
         """
-        清理旧会话
+        分批清理旧会话（消息随 CASCADE 一并删除）
+
+        按 (last_active_at, id) 键集顺序每批删除 batch_size 个会话，每批单独提交，
+        批次之间休眠 batch_sleep 秒，避免长事务锁住 messages 影响聊天请求。
+        游标与进度和每批删除在同一事务中写入 jobs 表，中断后再次调用会沿用
+        原截止时间从游标处继续。
 
         Args:
-            days: 保留天数
+            days: 保留天数（默认 SESSION_CLEANUP_DAYS）
+            batch_size: 每批删除的会话数
+            batch_sleep: 批次间休眠（秒）
+            dry_run: 只统计待清理的会话数和消息数，不删除
+            max_batches: 本次最多处理的批次数，达到后任务暂停，下次继续
 
         Returns:
-            清理数量
+            清理报告
         """
-        threshold = datetime.now(timezone.utc) - timedelta(days=days)
-        stmt = select(Session).where(
-            Session.is_active == False,
-            Session.ended_at < threshold
+        days = days if days is not None else settings.SESSION_CLEANUP_DAYS
+        batch_size = batch_size or settings.SESSION_CLEANUP_BATCH_SIZE
+        batch_sleep = settings.SESSION_CLEANUP_BATCH_SLEEP if batch_sleep is None else batch_sleep
+
+        if dry_run:
+            threshold = datetime.now(timezone.utc) - timedelta(days=days)
+            sessions, messages = (await self.db.execute(
+                select(
+                    func.count(func.distinct(Session.id)),
+                    func.count(Message.id),
+                )
+                .select_from(Session)
+                .outerjoin(Message, Message.session_id == Session.id)
+                .where(self._cleanup_filter(threshold))
+            )).one()
+            return {
+                "dry_run": True,
+                "days": days,
+                "threshold": threshold.isoformat(),
+                "sessions": int(sessions or 0),
+                "messages": int(messages or 0),
+            }
+
+        store = JobStore(self.db)
+        job = await store.get_resumable(CLEANUP_JOB_KIND)
+        if job is not None:
+            threshold = datetime.fromisoformat(job.params["threshold"])
+            logger.info(f"继续未完成的会话清理任务: {job.id}")
+        else:
+            threshold = datetime.now(timezone.utc) - timedelta(days=days)
+            job = await store.create(CLEANUP_JOB_KIND, {
+                "days": days,
+                "threshold": threshold.isoformat(),
+            })
+
+        progress = {"sessions": 0, "messages": 0, "batches": 0, **(job.progress or {})}
+        cursor = job.cursor
+        started = time.time()
+        run_batches = 0
+        status = "completed"
+        metrics = MetricsCollector()
+
+        try:
+            while True:
+                if max_batches is not None and run_batches >= max_batches:
+                    status = "paused"
+                    break
+
+                stmt = (
+                    select(Session.id, Session.last_active_at)
+                    .where(self._cleanup_filter(threshold))
+                    .order_by(Session.last_active_at, Session.id)
+                    .limit(batch_size)
+                )
+                if cursor:
+                    stmt = stmt.where(
+                        tuple_(Session.last_active_at, Session.id)
+                        > tuple_(datetime.fromisoformat(cursor[0]), cursor[1])
+                    )
+                rows = (await self.db.execute(stmt)).all()
+                if not rows:
+                    break
+
+                ids = [r.id for r in rows]
+                message_count = await self.db.scalar(
+                    select(func.count(Message.id)).where(Message.session_id.in_(ids))
+                )
+                # 删除时再次校验条件，期间被重新激活的会话不会被删除
+                result = await self.db.execute(
+                    delete(Session)
+                    .where(Session.id.in_(ids), self._cleanup_filter(threshold))
+                    .execution_options(synchronize_session=False)
+                )
+
+                cursor = [rows[-1].last_active_at.isoformat(), rows[-1].id]
+                progress["sessions"] += result.rowcount or 0
+                progress["messages"] += message_count or 0
+                progress["batches"] += 1
+                run_batches += 1
+                store.save_progress(job, progress, cursor)
+                await self.db.commit()
+
+                metrics.record_job_progress(CLEANUP_JOB_KIND, job_id=job.id, **progress)
+
+                if len(rows) < batch_size:
+                    break
+                if batch_sleep > 0:
+                    await asyncio.sleep(batch_sleep)
+        except Exception as e:
+            await self.db.rollback()
+            status = "failed"
+            await store.finish(job, status, error=str(e))
+            raise
+        finally:
+            metrics.record_job(
+                CLEANUP_JOB_KIND,
+                processed=progress["sessions"],
+                batches=run_batches,
+                duration_ms=(time.time() - started) * 1000,
+                status=status,
+            )
+
+        await store.finish(job, status)
+        logger.info(
+            f"会话清理{'完成' if status == 'completed' else '暂停'}: "
+            f"{progress['sessions']} 个会话, {progress['messages']} 条消息, {progress['batches']} 批"
         )
-        result = await self.db.execute(stmt)
-        sessions = result.scalars().all()
+        return {
+            "dry_run": False,
+            "job_id": job.id,
+            "status": status,
+            "days": job.params.get("days", days),
+            "threshold": threshold.isoformat(),
+            **progress,
+            "duration_seconds": round(time.time() - started, 3),
+        }
 
-        for session in sessions:
-            await self.db.delete(session)
 
-        await self.db.commit()
-        count = len(sessions)
-        logger.info(f"清理了 {count} 个旧会话")
-        return count
+async def run_session_cleanup_job(**kwargs) -> Optional[Dict[str, Any]]:
+    """使用独立数据库会话执行一次会话清理（定时任务 / 管理命令共用）"""
+    if _cleanup_lock.locked():
+        logger.info("会话清理任务正在运行，跳过本次触发")
+        return None
+
+    from app.db.database import AsyncSessionLocal
+
+    async with _cleanup_lock:
+        async with AsyncSessionLocal() as db:
+            return await SessionManager(db).cleanup_old_sessions(**kwargs)
+
+
+def is_cleanup_running() -> bool:
+    return _cleanup_lock.locked() or bool(_cleanup_task and not _cleanup_task.done())
+
+
+def trigger_session_cleanup_job(**kwargs) -> bool:
+    """在后台启动会话清理，已在运行时返回 False"""
+    global _cleanup_task
+    if is_cleanup_running():
+        return False
+    _cleanup_task = asyncio.create_task(run_session_cleanup_job(**kwargs))
+    return True
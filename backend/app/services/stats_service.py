@@ -0,0 +1,230 @@
+"""
+管理后台统计快照
+
+仪表盘需要的全局计数（用户、会话、消息、记忆、图谱）由定时任务 dashboard_stats
+每 STATS_REFRESH_INTERVAL 秒计算一次，写入 stats_snapshots 的一行；打开仪表盘只按主键
+读取这一行，并返回 refreshed_at 供前端显示数据时间。
+
+STATS_USE_ESTIMATES 开启时，行数超过 STATS_ESTIMATE_THRESHOLD 的大表（messages、
+embeddings、graph_*）用 pg_class.reltuples 估算总数，embeddings 的按类型分布用 pg_stats
+的高频值比例估算，避免全表扫描；估算的字段列在结果的 estimated 中。
+"""
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Optional
+
+from sqlalchemy import select, func, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.db.models import User, Session, Message, MessageArchive, StatsSnapshot
+
+logger = logging.getLogger(__name__)
+
+DASHBOARD = "dashboard"
+
+_run_lock = asyncio.Lock()
+
+# 表及其所有分区的 reltuples 之和；从未 ANALYZE 的表（reltuples < 0）返回 NULL
+_RELTUPLES_SQL = text("""
+    SELECT SUM(c.reltuples) FILTER (WHERE c.reltuples >= 0)::bigint
+    FROM pg_class c
+    WHERE c.oid = to_regclass(:table)
+       OR c.oid IN (SELECT inhrelid FROM pg_inherits WHERE inhparent = to_regclass(:table))
+""")
+
+_MEMORY_TYPE_MCV_SQL = text("""
+    SELECT most_common_vals::text::text[] AS vals, most_common_freqs AS freqs, null_frac
+    FROM pg_stats
+    WHERE tablename = 'embeddings' AND attname = 'memory_type'
+    LIMIT 1
+""")
+
+
+class StatsService:
+    """统计快照的计算与读取"""
+
+    def __init__(self, db: AsyncSession):
+        self.db = db
+        self._estimated: list[str] = []
+
+    @property
+    def _is_postgres(self) -> bool:
+        return self.db.get_bind().dialect.name == "postgresql"
+
+    async def _estimate_rows(self, table: str) -> Optional[int]:
+        """大表的行数估算；未开启、非 PostgreSQL 或表较小时返回 None（由调用方精确计数）"""
+        if not settings.STATS_USE_ESTIMATES or not self._is_postgres:
+            return None
+        estimate = await self.db.scalar(_RELTUPLES_SQL, {"table": table})
+        if estimate is None or estimate < settings.STATS_ESTIMATE_THRESHOLD:
+            return None
+        return int(estimate)
+
+    async def _count_table(self, table: str, key: str) -> int:
+        estimate = await self._estimate_rows(table)
+        if estimate is not None:
+            self._estimated.append(key)
+            return estimate
+        return await self.db.scalar(text(f"SELECT COUNT(*) FROM {table}")) or 0
+
+    async def _memory_stats(self) -> dict[str, Any]:
+        stats: dict[str, Any] = {"total": 0, "by_type": {}, "graph_nodes": 0, "graph_edges": 0}
+
+        # NeuroMemory 管理的表可能不存在，逐项容错
+        try:
+            estimate = await self._estimate_rows("embeddings")
+            mcv = (await self.db.execute(_MEMORY_TYPE_MCV_SQL)).first() if estimate is not None else None
+            if estimate is not None and mcv is not None and mcv.vals:
+                stats["total"] = estimate
+                stats["by_type"] = {
+                    value: int(freq * estimate) for value, freq in zip(mcv.vals, mcv.freqs)
+                }
+                if mcv.null_frac:
+                    stats["by_type"]["unknown"] = int(mcv.null_frac * estimate)
+                self._estimated.append("memories")
+            else:
+                result = await self.db.execute(
+                    text("SELECT memory_type, COUNT(*) FROM embeddings GROUP BY memory_type")
+                )
+                for memory_type, count in result.all():
+                    stats["by_type"][memory_type or "unknown"] = count
+                stats["total"] = sum(stats["by_type"].values())
+        except Exception:
+            await self.db.rollback()
+
+        for table in ("graph_nodes", "graph_edges"):
+            try:
+                stats[table] = await self._count_table(table, f"memories.{table}")
+            except Exception:
+                await self.db.rollback()
+
+        return stats
+
+    async def compute_dashboard_stats(self) -> dict[str, Any]:
+        """计算仪表盘统计（每张表一条聚合查询，大表可用估算）"""
+        self._estimated = []
+        seven_days_ago = datetime.now(timezone.utc) - timedelta(days=7)
+
+        users = (await self.db.execute(
+            select(
+                func.count(User.id),
+                func.count(User.id).filter(User.last_login >= seven_days_ago),
+                func.count(User.id).filter(User.is_admin == True),  # noqa: E712
+            )
+        )).one()
+
+        sessions = (await self.db.execute(
+            select(
+                func.count(Session.id),
+                func.count(Session.id).filter(Session.last_active_at >= seven_days_ago),
+            )
+        )).one()
+
+        # 最近 7 天走 created_at 索引（分区表只扫描最近的分区），总数可用估算
+        messages_7d = await self.db.scalar(
+            select(func.count(Message.id)).where(Message.created_at >= seven_days_ago)
+        ) or 0
+        hot_messages = await self._count_table("messages", "messages.total")
+        archived_messages = await self.db.scalar(
+            select(func.coalesce(func.sum(MessageArchive.message_count), 0))
+        ) or 0
+
+        return {
+            "users": {
+                "total": users[0],
+                "active_7d": users[1],
+                "admin_count": users[2],
+            },
+            "sessions": {
+                "total": sessions[0],
+                "active_7d": sessions[1],
+            },
+            "messages": {
+                "total": hot_messages + archived_messages,
+                "last_7d": messages_7d,
+                "archived": archived_messages,
+            },
+            "memories": await self._memory_stats(),
+            "estimated": list(self._estimated),
+        }
+
+    async def refresh_dashboard_stats(self) -> dict[str, Any]:
+        """重新计算并保存仪表盘快照"""
+        started = time.perf_counter()
+        data = await self.compute_dashboard_stats()
+        duration_ms = round((time.perf_counter() - started) * 1000, 1)
+
+        snapshot = await self.db.get(StatsSnapshot, DASHBOARD)
+        if snapshot is None:
+            snapshot = StatsSnapshot(name=DASHBOARD)
+            self.db.add(snapshot)
+        snapshot.data = data
+        snapshot.refreshed_at = datetime.now(timezone.utc)
+        snapshot.duration_ms = duration_ms
+        await self.db.commit()
+        logger.info(f"📊 仪表盘统计已刷新 ({duration_ms}ms, 估算: {data['estimated'] or '无'})")
+        return self._present(snapshot)
+
+    async def get_dashboard_stats(self) -> dict[str, Any]:
+        """读取仪表盘快照；还没有快照时现场计算一次
+
+        只读副本上的会话（get_read_db）不能写入，只计算不保存，快照由定时任务在主库生成。
+        """
+        snapshot = await self.db.get(StatsSnapshot, DASHBOARD)
+        if snapshot is not None:
+            return self._present(snapshot)
+        if not self.db.info.get("replica"):
+            return await self.refresh_dashboard_stats()
+
+        started = time.perf_counter()
+        data = await self.compute_dashboard_stats()
+        return self._present(StatsSnapshot(
+            name=DASHBOARD,
+            data=data,
+            refreshed_at=datetime.now(timezone.utc),
+            duration_ms=round((time.perf_counter() - started) * 1000, 1),
+        ))
+
+    @staticmethod
+    def _present(snapshot: StatsSnapshot) -> dict[str, Any]:
+        refreshed_at = snapshot.refreshed_at
+        if refreshed_at.tzinfo is None:  # SQLite 不保存时区
+            refreshed_at = refreshed_at.replace(tzinfo=timezone.utc)
+        age = (datetime.now(timezone.utc) - refreshed_at).total_seconds()
+        return {
+            **snapshot.data,
+            "refreshed_at": refreshed_at.isoformat(),
+            "age_seconds": round(age),
+            "refresh_duration_ms": snapshot.duration_ms,
+        }
+
+    async def is_fresh(self, max_age: float) -> bool:
+        refreshed_at = await self.db.scalar(
+            select(StatsSnapshot.refreshed_at).where(StatsSnapshot.name == DASHBOARD)
+        )
+        if refreshed_at is None:
+            return False
+        if refreshed_at.tzinfo is None:
+            refreshed_at = refreshed_at.replace(tzinfo=timezone.utc)
+        return (datetime.now(timezone.utc) - refreshed_at).total_seconds() < max_age
+
+
+async def run_stats_refresh_job(force: bool = False) -> Optional[dict[str, Any]]:
+    """定时任务：刷新仪表盘快照
+
+    多个 worker 都会调度这个任务；快照在半个周期内已被其他进程刷新过时跳过。
+    """
+    if _run_lock.locked():
+        return None
+
+    from app.db.database import AsyncSessionLocal
+
+    async with _run_lock:
+        async with AsyncSessionLocal() as db:
+            service = StatsService(db)
+            if not force and await service.is_fresh(settings.STATS_REFRESH_INTERVAL / 2):
+                return None
+            return await service.refresh_dashboard_stats()
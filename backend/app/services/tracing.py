@@ -0,0 +1,405 @@
+"""
+轻量的进程内请求 trace（基于 contextvars 的 span）
+
+TracingMiddleware 为每个 /api/ 请求创建一个 Trace，请求路径上的代码用
+
+    with span("recall.embedding"):
+        ...
+
+记录一个阶段；不在 trace 中时几乎没有开销（一次 ContextVar 读取）。span 通过 ContextVar 嵌套，
+asyncio.gather 并行执行的召回搜索会以外层 span 为父节点。所有时间取自 time.perf_counter。
+
+输出：
+- Server-Timing 响应头：响应头发出前已结束的 span 按名称汇总，外加 trace id
+  （流式响应只包含首字节之前的阶段，其余随 SSE done 事件下发，见 server_timing()）
+- 导出：超过 TRACE_SLOW_MS 或按 TRACE_SAMPLE_RATE 抽中的 trace 保存在环形缓冲区
+  （/admin/system/traces），并以 JSONL 或 OTLP/JSON 行追加写入 TRACE_EXPORT_PATH。
+  文件由后台线程写入，不阻塞事件循环；队列满时丢弃。请求启动的后台 span（NeuroMemory 同步）
+  结束后才导出，瀑布图中包含它们。
+"""
+import asyncio
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+from typing import Optional
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+MAX_SPANS = 256  # 每个 trace 最多保存的 span 数，超出只计数
+RECENT_TRACES = 100
+EXPORT_QUEUE_SIZE = 1000  # 等待写入文件的 trace 上限
+
+_current_trace: ContextVar[Optional["Trace"]] = ContextVar("current_trace", default=None)
+_current_span: ContextVar[Optional["Span"]] = ContextVar("current_span", default=None)
+
+_recent: deque = deque(maxlen=RECENT_TRACES)
+_export_queue: queue.Queue = queue.Queue(maxsize=EXPORT_QUEUE_SIZE)
+_export_thread: Optional[threading.Thread] = None
+_export_thread_lock = threading.Lock()
+_export_dropped = 0
+
+
+class Span:
+    __slots__ = ("trace", "span_id", "parent_id", "name", "start", "end", "attrs", "background")
+
+    def __init__(self, trace: "Trace", name: str, parent: Optional["Span"], attrs: dict,
+                 background: bool = False):
+        self.trace = trace
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent.span_id if parent is not None else None
+        self.name = name
+        self.start = time.perf_counter()
+        self.end: Optional[float] = None
+        self.attrs = attrs
+        self.background = background
+
+    @property
+    def duration_ms(self) -> float:
+        return ((self.end or time.perf_counter()) - self.start) * 1000
+
+
+class Trace:
+    """一个请求：所有 span，以及导出时需要的墙上时钟起点"""
+
+    def __init__(self, name: str):
+        self.trace_id = os.urandom(16).hex()
+        self.name = name
+        self.start = time.perf_counter()
+        self.start_unix = time.time()
+        self.end: Optional[float] = None
+        self.spans: list[Span] = []
+        self.dropped = 0
+        self.attrs: dict = {}
+        self.force_export = False
+        self._pending_background = 0
+        self._exported = False
+
+    @property
+    def duration_ms(self) -> float:
+        return ((self.end or time.perf_counter()) - self.start) * 1000
+
+    def add(self, span: Span) -> bool:
+        if len(self.spans) >= MAX_SPANS:
+            self.dropped += 1
+            return False
+        self.spans.append(span)
+        if span.background:
+            self._pending_background += 1
+        return True
+
+    def span_finished(self, span: Span) -> None:
+        if span.background:
+            self._pending_background -= 1
+            if self.end is not None and self._pending_background == 0:
+                _maybe_export(self)
+
+    def finish(self) -> None:
+        self.end = time.perf_counter()
+        if self._pending_background == 0:
+            _maybe_export(self)
+
+    def to_dict(self) -> dict:
+        return {
+            "trace_id": self.trace_id,
+            "name": self.name,
+            "start": self.start_unix,
+            "duration_ms": round(self.duration_ms, 2),
+            "attrs": self.attrs,
+            "dropped_spans": self.dropped,
+            "spans": [
+                {
+                    "span_id": s.span_id,
+                    "parent_id": s.parent_id,
+                    "name": s.name,
+                    "offset_ms": round((s.start - self.start) * 1000, 2),
+                    "duration_ms": round(s.duration_ms, 2),
+                    **({"attrs": s.attrs} if s.attrs else {}),
+                }
+                for s in self.spans
+            ],
+        }
+
+
+class span:
+    """记录当前 trace 中一个阶段耗时的 context manager
+
+    timings：同时把耗时（秒）写入该 dict 的 key（默认为 name）下（debug_mode / Message.meta
+    中的 timings），不在 trace 中时也会写入。
+    """
+
+    __slots__ = ("name", "attrs", "timings", "key", "background", "_span", "_parent", "_start")
+
+    def __init__(self, name: str, timings: Optional[dict] = None, key: Optional[str] = None,
+                 background: bool = False, **attrs):
+        self.name = name
+        self.attrs = attrs
+        self.timings = timings
+        self.key = key or name
+        self.background = background
+        self._span: Optional[Span] = None
+
+    def __enter__(self) -> "span":
+        self._start = time.perf_counter()
+        trace = _current_trace.get()
+        if trace is not None:
+            self._parent = _current_span.get()
+            s = Span(trace, self.name, self._parent, self.attrs, self.background)
+            s.start = self._start
+            if trace.add(s):
+                self._span = s
+                if not self.background:
+                    _current_span.set(s)
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        end = time.perf_counter()
+        if self.timings is not None:
+            self.timings[self.key] = end - self._start
+        s = self._span
+        if s is not None:
+            s.end = end
+            if exc_type is not None:
+                s.attrs = {**s.attrs, "error": exc_type.__name__}
+            if not self.background:
+                # 用 set() 而不是 Token.reset()：生成器可能在另一个 context 中退出
+                _current_span.set(self._parent)
+            s.trace.span_finished(s)
+
+    def set(self, **attrs) -> None:
+        if self._span is not None:
+            self._span.attrs = {**self._span.attrs, **attrs}
+
+
+def create_background_task(name: str, coro) -> asyncio.Task:
+    """asyncio.create_task(coro)，并作为当前 trace 的后台 span 计时
+
+    span 在任务开始前登记，trace 要等任务结束后才导出。
+    """
+    s = span(name, background=True)
+    s.__enter__()
+
+    async def run():
+        try:
+            result = await coro
+        except BaseException as e:
+            s.__exit__(type(e), e, e.__traceback__)
+            raise
+        s.__exit__(None, None, None)
+        return result
+
+    return asyncio.create_task(run())
+
+
+def record_span(name: str, start: float, end: float, **attrs) -> None:
+    """添加一个已测量好的 span（perf_counter 起止时间），例如来自 SQLAlchemy 事件"""
+    trace = _current_trace.get()
+    if trace is None:
+        return
+    s = Span(trace, name, _current_span.get(), attrs)
+    s.start = start
+    s.end = end
+    trace.add(s)
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+def start_trace(name: str) -> Trace:
+    trace = Trace(name)
+    _current_trace.set(trace)
+    _current_span.set(None)
+    return trace
+
+
+def server_timing(trace: Optional[Trace] = None) -> dict[str, dict]:
+    """已结束 span 的 {名称: {"dur": 总毫秒, "count": 次数}}，外加 total 项"""
+    trace = trace or _current_trace.get()
+    if trace is None:
+        return {}
+    totals: dict[str, dict] = {}
+    for s in trace.spans:
+        if s.end is None:
+            continue
+        entry = totals.setdefault(s.name, {"dur": 0.0, "count": 0})
+        entry["dur"] += s.duration_ms
+        entry["count"] += 1
+    for entry in totals.values():
+        entry["dur"] = round(entry["dur"], 1)
+    totals["total"] = {"dur": round(trace.duration_ms, 1), "count": 1}
+    return totals
+
+
+def server_timing_header(trace: Trace) -> str:
+    parts = [f'trace;desc="{trace.trace_id}"']
+    for name, entry in server_timing(trace).items():
+        part = f"{name};dur={entry['dur']}"
+        if entry["count"] > 1:
+            part += f';desc="x{entry["count"]}"'
+        parts.append(part)
+    return ", ".join(parts)
+
+
+def recent_traces(limit: int = 20) -> list[dict]:
+    """最近导出的（慢或被抽中的）trace，最新的在前"""
+    return list(_recent)[-limit:][::-1]
+
+
+def _maybe_export(trace: Trace) -> None:
+    if trace._exported:
+        return
+    slow = trace.duration_ms >= settings.TRACE_SLOW_MS
+    if not (slow or trace.force_export or random.random() < settings.TRACE_SAMPLE_RATE):
+        return
+    trace._exported = True
+    data = trace.to_dict()
+    data["slow"] = slow
+    _recent.append(data)
+    if settings.TRACE_EXPORT_PATH:
+        line = json.dumps(_otlp(data) if settings.TRACE_EXPORT_FORMAT == "otlp" else data, ensure_ascii=False)
+        _enqueue_export(settings.TRACE_EXPORT_PATH, line)
+
+
+def _enqueue_export(path: str, line: str) -> None:
+    """交给写入线程；队列满时丢弃（不在事件循环中等待磁盘）"""
+    global _export_thread, _export_dropped
+    if _export_thread is None or not _export_thread.is_alive():
+        with _export_thread_lock:
+            if _export_thread is None or not _export_thread.is_alive():
+                _export_thread = threading.Thread(target=_export_worker, name="trace-export", daemon=True)
+                _export_thread.start()
+    try:
+        _export_queue.put_nowait((path, line))
+    except queue.Full:
+        _export_dropped += 1
+        if _export_dropped % 1000 == 1:
+            logger.warning(f"⚠️  trace 写入队列已满，已丢弃 {_export_dropped} 条")
+
+
+def _export_worker() -> None:
+    """写入线程：每次取出队列中已有的所有 trace，按文件批量追加"""
+    while True:
+        batch = [_export_queue.get()]
+        while len(batch) < EXPORT_QUEUE_SIZE:
+            try:
+                batch.append(_export_queue.get_nowait())
+            except queue.Empty:
+                break
+        lines: dict[str, list[str]] = {}
+        for item in batch:
+            if isinstance(item, threading.Event):
+                continue
+            path, line = item
+            lines.setdefault(path, []).append(line)
+        for path, path_lines in lines.items():
+            try:
+                with open(path, "a", encoding="utf-8") as f:
+                    f.write("\n".join(path_lines) + "\n")
+            except OSError as e:
+                logger.warning(f"⚠️  写入 trace 文件失败: {e}")
+        for item in batch:
+            if isinstance(item, threading.Event):
+                item.set()
+
+
+def flush_exports(timeout: float = 5.0) -> bool:
+    """等待已排队的 trace 写入文件（进程退出前调用），超时返回 False"""
+    if _export_thread is None or not _export_thread.is_alive():
+        return True
+    done = threading.Event()
+    try:
+        _export_queue.put(done, timeout=timeout)
+    except queue.Full:
+        return False
+    return done.wait(timeout)
+
+
+def _otlp_value(value) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _otlp(data: dict) -> dict:
+    """OTLP/JSON 的 ExportTraceServiceRequest（OpenTelemetry 文件导出的行格式）"""
+    start_ns = int(data["start"] * 1e9)
+    root_id = data["trace_id"][:16]
+
+    def ns(offset_ms: float) -> str:
+        return str(start_ns + int(offset_ms * 1e6))
+
+    spans = [{
+        "traceId": data["trace_id"],
+        "spanId": root_id,
+        "name": data["name"],
+        "kind": 2,  # SERVER
+        "startTimeUnixNano": ns(0),
+        "endTimeUnixNano": ns(data["duration_ms"]),
+        "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in data["attrs"].items()],
+    }]
+    for s in data["spans"]:
+        spans.append({
+            "traceId": data["trace_id"],
+            "spanId": s["span_id"],
+            "parentSpanId": s["parent_id"] or root_id,
+            "name": s["name"],
+            "kind": 1,  # INTERNAL
+            "startTimeUnixNano": ns(s["offset_ms"]),
+            "endTimeUnixNano": ns(s["offset_ms"] + s["duration_ms"]),
+            "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in s.get("attrs", {}).items()],
+        })
+    return {"resourceSpans": [{
+        "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": settings.APP_NAME}}]},
+        "scopeSpans": [{"scope": {"name": "app.services.tracing"}, "spans": spans}],
+    }]}
+
+
+class TracingMiddleware:
+    """Pure ASGI middleware：每个请求一个 Trace，响应头带 Server-Timing"""
+
+    def __init__(self, app, path_prefix: str = "/api/"):
+        self.app = app
+        self.path_prefix = path_prefix
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http"
+            or not settings.TRACING_ENABLED
+            or not scope["path"].startswith(self.path_prefix)
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        trace = start_trace(f"{scope['method']} {scope['path']}")
+        trace.attrs["http.method"] = scope["method"]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                trace.attrs["http.status_code"] = message["status"]
+                if settings.TRACE_SERVER_TIMING:
+                    headers = list(message.get("headers", []))
+                    headers.append((b"server-timing", server_timing_header(trace).encode("latin-1")))
+                    # 前端跨域访问，没有这个头浏览器不会暴露 Server-Timing
+                    headers.append((b"timing-allow-origin", b"*"))
+                    message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            from app.services.request_metrics import route_template
+
+            trace.name = f"{scope['method']} {route_template(scope)}"
+            trace.finish()
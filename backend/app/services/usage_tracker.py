@@ -0,0 +1,376 @@
+"""
+LLM 用量记账（按用户 / 接口 / 模型）
+
+LLMClient 每次调用结束后 record() 把一条用量事件放进进程内缓冲区（不访问数据库）。
+流式调用被中途取消（客户端断开、停止生成）时收不到服务商的 usage，按已发送的内容估算。
+用户和接口取自当前请求的上下文：get_current_user 设置的 current_user_id 和匹配到的路由模板；
+请求之外的调用（定时任务等）记为 background，用户为空。
+
+定时任务 usage_flush 每 USAGE_FLUSH_INTERVAL 秒（缓冲区达到 USAGE_BATCH_SIZE 条时提前）
+在一个事务里：
+- 批量写入 llm_usage_events（明细，保留 USAGE_EVENT_RETENTION_DAYS 天）
+- 按 (UTC 日期, 用户, 接口, 模型) 累加到 llm_usage_daily（日汇总，长期保留，多 worker 并发写入安全）
+
+写入失败时事件放回缓冲区下次重试；缓冲区超过 USAGE_MAX_BUFFER 条时丢弃最旧的事件并计数。
+/admin/usage/top-users 与 /admin/usage/users/{user_id} 读取日汇总。
+
+tokens_used_today() 供每日配额（LLM_DAILY_TOKEN_QUOTA）使用：日汇总 + 本进程尚未写入的事件
+作为基数（每个用户每天查一次，RATE_LIMIT_SHARED 时每 RATE_LIMIT_SYNC_INTERVAL 秒重新查询，
+以计入其他 worker 的用量），之后本进程的调用直接在内存中累加。
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Optional
+
+from sqlalchemy import and_, case, delete, func, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.db.models import LLMUsageDaily, LLMUsageEvent, User
+from app.db.pool_monitor import request_scope
+from app.db.replica import current_user_id
+from app.services.metrics_collector import MetricsCollector
+
+logger = logging.getLogger(__name__)
+
+NO_USER = "(none)"  # llm_usage_daily 主键不能为空
+BACKGROUND = "background"
+RETENTION_BATCH_SIZE = 5000
+
+_buffer: deque = deque()
+_dropped = 0
+_run_lock = asyncio.Lock()
+_flush_scheduled = False
+
+MAX_QUOTA_USERS = 50_000
+_local_day: Optional[date] = None
+_local_tokens: dict[str, int] = {}  # user_id -> 本进程今天记录的 tokens
+_quota_base: dict[str, tuple[int, int, float]] = {}  # user_id -> (基数, 查询时的本地累计, 查询时间)
+
+
+def cache_hit_tokens(usage) -> int:
+    """命中前缀缓存的 prompt tokens（DeepSeek: prompt_cache_hit_tokens，OpenAI: prompt_tokens_details.cached_tokens）"""
+    if usage is None:
+        return 0
+    hits = getattr(usage, "prompt_cache_hit_tokens", None)
+    if hits is None:
+        details = getattr(usage, "prompt_tokens_details", None)
+        hits = getattr(details, "cached_tokens", None) if details is not None else None
+    return int(hits or 0)
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估计 token 数：中文按字符数，其他按 4 个字符 1 个 token"""
+    ascii_chars = sum(1 for ch in text if ord(ch) < 128)
+    return (len(text) - ascii_chars) + (ascii_chars + 3) // 4
+
+
+def estimate_prompt_tokens(messages: list[dict]) -> int:
+    """估计 prompt tokens（每条消息另加 4 个 token 的格式开销）"""
+    return sum(estimate_tokens(str(m.get("content") or "")) + 4 for m in messages)
+
+
+def _current_endpoint() -> str:
+    scope = request_scope.get()
+    if scope is None or scope.get("type") != "http":
+        return BACKGROUND
+    from app.services.request_metrics import route_template
+
+    return f"{scope['method']} {route_template(scope)}"
+
+
+def record(
+    model: str,
+    prompt_tokens: int,
+    completion_tokens: int,
+    duration_ms: float,
+    success: bool,
+    cache_hits: int = 0,
+    user_id: Optional[str] = None,
+) -> None:
+    """记录一次 LLM 调用（只写内存缓冲区）；user_id 默认取当前请求的用户"""
+    global _dropped, _flush_scheduled
+    if not settings.USAGE_TRACKING_ENABLED:
+        return
+    now = datetime.now(timezone.utc)
+    user_id = user_id or current_user_id.get()
+    if user_id:
+        local = _local_today(now.date())
+        local[user_id] = local.get(user_id, 0) + prompt_tokens + completion_tokens
+    _buffer.append({
+        "created_at": now,
+        "user_id": user_id,
+        "endpoint": _current_endpoint(),
+        "model": model,
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "cache_hit_tokens": cache_hits,
+        "duration_ms": round(duration_ms, 1),
+        "success": success,
+    })
+    while len(_buffer) > settings.USAGE_MAX_BUFFER:
+        _buffer.popleft()
+        _dropped += 1
+    if len(_buffer) >= settings.USAGE_BATCH_SIZE and not _flush_scheduled:
+        _flush_scheduled = True
+        try:
+            task = asyncio.get_running_loop().create_task(run_usage_flush_job())
+        except RuntimeError:  # 没有事件循环（同步调用方），等定时任务写入
+            _flush_scheduled = False
+        else:
+            MetricsCollector().track_background("usage_flush", task)
+
+
+def buffer_stats() -> dict[str, int]:
+    return {"buffered": len(_buffer), "dropped": _dropped}
+
+
+def _local_today(today: date) -> dict[str, int]:
+    global _local_day
+    if _local_day != today:
+        _local_day = today
+        _local_tokens.clear()
+        _quota_base.clear()
+    return _local_tokens
+
+
+async def _load_tokens_today(user_id: str, today: date) -> int:
+    from app.db.database import AsyncSessionLocal
+
+    async with AsyncSessionLocal() as db:
+        total = await db.scalar(
+            select(func.sum(LLMUsageDaily.prompt_tokens + LLMUsageDaily.completion_tokens))
+            .where(LLMUsageDaily.day == today, LLMUsageDaily.user_id == user_id)
+        )
+    return int(total or 0)
+
+
+async def tokens_used_today(user_id: str) -> int:
+    """该用户今天（UTC）已用的 LLM tokens；数据库不可用时只计本进程的用量"""
+    today = datetime.now(timezone.utc).date()
+    local = _local_today(today)
+    base = _quota_base.get(user_id)
+    stale = base is None or (
+        settings.RATE_LIMIT_SHARED and time.monotonic() - base[2] >= settings.RATE_LIMIT_SYNC_INTERVAL
+    )
+    if stale:
+        # 本进程尚未写入数据库的部分，与本地累计在同一时刻取值
+        local_at = local.get(user_id, 0)
+        pending = sum(
+            e["prompt_tokens"] + e["completion_tokens"]
+            for e in _buffer
+            if e["user_id"] == user_id and e["created_at"].date() == today
+        )
+        try:
+            stored = await _load_tokens_today(user_id, today)
+        except Exception as e:
+            logger.warning(f"⚠️  读取 LLM 用量失败: {e}")
+            return local_at
+        if len(_quota_base) >= MAX_QUOTA_USERS:
+            _quota_base.clear()
+        base = _quota_base[user_id] = (stored + pending, local_at, time.monotonic())
+    return base[0] + local.get(user_id, 0) - base[1]
+
+
+def _rollup_rows(events: list[dict]) -> list[dict]:
+    rows: dict[tuple, dict] = {}
+    for e in events:
+        key = (e["created_at"].date(), e["user_id"] or NO_USER, e["endpoint"], e["model"])
+        row = rows.get(key)
+        if row is None:
+            row = rows[key] = {
+                "day": key[0], "user_id": key[1], "endpoint": key[2], "model": key[3],
+                "calls": 0, "failures": 0, "prompt_tokens": 0, "completion_tokens": 0,
+                "cache_hit_tokens": 0, "duration_ms_total": 0.0, "duration_ms_max": 0.0,
+            }
+        row["calls"] += 1
+        row["failures"] += 0 if e["success"] else 1
+        row["prompt_tokens"] += e["prompt_tokens"]
+        row["completion_tokens"] += e["completion_tokens"]
+        row["cache_hit_tokens"] += e["cache_hit_tokens"]
+        row["duration_ms_total"] += e["duration_ms"]
+        row["duration_ms_max"] = max(row["duration_ms_max"], e["duration_ms"])
+    return list(rows.values())
+
+
+def _totals_columns(model) -> list:
+    calls = func.sum(model.calls)
+    prompt = func.sum(model.prompt_tokens)
+    completion = func.sum(model.completion_tokens)
+    return [
+        calls.label("calls"),
+        func.sum(model.failures).label("failures"),
+        prompt.label("prompt_tokens"),
+        completion.label("completion_tokens"),
+        (prompt + completion).label("total_tokens"),
+        func.sum(model.cache_hit_tokens).label("cache_hit_tokens"),
+        (func.sum(model.duration_ms_total) / calls).label("avg_ms"),
+        func.max(model.duration_ms_max).label("max_ms"),
+    ]
+
+
+def _totals_dict(row) -> dict[str, Any]:
+    return {
+        "calls": int(row.calls or 0),
+        "failures": int(row.failures or 0),
+        "prompt_tokens": int(row.prompt_tokens or 0),
+        "completion_tokens": int(row.completion_tokens or 0),
+        "total_tokens": int(row.total_tokens or 0),
+        "cache_hit_tokens": int(row.cache_hit_tokens or 0),
+        "avg_ms": round(float(row.avg_ms or 0), 1),
+        "max_ms": round(float(row.max_ms or 0), 1),
+    }
+
+
+def _day(value) -> date:
+    # SQLite 按日分组后返回字符串
+    return date.fromisoformat(value) if isinstance(value, str) else value
+
+
+class UsageService:
+    """用量明细写入、日汇总累加与查询"""
+
+    ORDER_BY = ("total_tokens", "prompt_tokens", "completion_tokens", "calls", "avg_ms")
+
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    def _insert(self):
+        dialect = self.db.get_bind().dialect.name
+        return (sqlite if dialect == "sqlite" else postgresql).insert
+
+    async def write(self, events: list[dict]) -> None:
+        """一个事务内写入明细并累加日汇总"""
+        if not events:
+            return
+        await self.db.execute(LLMUsageEvent.__table__.insert(), events)
+
+        stmt = self._insert()(LLMUsageDaily).values(_rollup_rows(events))
+        t, new = LLMUsageDaily, stmt.excluded
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["day", "user_id", "endpoint", "model"],
+            set_={
+                "calls": t.calls + new.calls,
+                "failures": t.failures + new.failures,
+                "prompt_tokens": t.prompt_tokens + new.prompt_tokens,
+                "completion_tokens": t.completion_tokens + new.completion_tokens,
+                "cache_hit_tokens": t.cache_hit_tokens + new.cache_hit_tokens,
+                "duration_ms_total": t.duration_ms_total + new.duration_ms_total,
+                "duration_ms_max": case(
+                    (new.duration_ms_max > t.duration_ms_max, new.duration_ms_max),
+                    else_=t.duration_ms_max,
+                ),
+            },
+        )
+        await self.db.execute(stmt)
+        await self.db.commit()
+
+    async def top_users(self, days: int = 7, limit: int = 20, order_by: str = "total_tokens") -> dict[str, Any]:
+        """最近 days 天（含今天）用量最高的用户"""
+        if order_by not in self.ORDER_BY:
+            raise ValueError(f"order_by 必须是 {', '.join(self.ORDER_BY)} 之一")
+        since = datetime.now(timezone.utc).date() - timedelta(days=days - 1)
+        totals = select(LLMUsageDaily.user_id, *_totals_columns(LLMUsageDaily)).where(
+            LLMUsageDaily.day >= since, LLMUsageDaily.user_id != NO_USER,
+        ).group_by(LLMUsageDaily.user_id).subquery()
+        rows = (await self.db.execute(
+            select(totals, User.username)
+            .outerjoin(User, User.id == totals.c.user_id)
+            .order_by(totals.c[order_by].desc())
+            .limit(limit)
+        )).all()
+        return {
+            "since": since.isoformat(),
+            "order_by": order_by,
+            "users": [
+                {"user_id": row.user_id, "username": row.username, **_totals_dict(row)}
+                for row in rows
+            ],
+        }
+
+    async def user_usage(self, user_id: str, days: int = 30) -> dict[str, Any]:
+        """单个用户最近 days 天的按日序列，以及按接口 / 模型的合计"""
+        since = datetime.now(timezone.utc).date() - timedelta(days=days - 1)
+        where = and_(LLMUsageDaily.user_id == user_id, LLMUsageDaily.day >= since)
+
+        async def grouped(column) -> list:
+            return (await self.db.execute(
+                select(column, *_totals_columns(LLMUsageDaily)).where(where)
+                .group_by(column).order_by(column)
+            )).all()
+
+        series = [
+            {"day": _day(row.day).isoformat(), **_totals_dict(row)}
+            for row in await grouped(LLMUsageDaily.day)
+        ]
+        by_endpoint = sorted(
+            ({"endpoint": row.endpoint, **_totals_dict(row)} for row in await grouped(LLMUsageDaily.endpoint)),
+            key=lambda e: e["total_tokens"], reverse=True,
+        )
+        by_model = sorted(
+            ({"model": row.model, **_totals_dict(row)} for row in await grouped(LLMUsageDaily.model)),
+            key=lambda e: e["total_tokens"], reverse=True,
+        )
+        return {
+            "user_id": user_id,
+            "since": since.isoformat(),
+            "series": series,
+            "by_endpoint": by_endpoint,
+            "by_model": by_model,
+        }
+
+    async def delete_expired_events(self) -> int:
+        """分批删除超过保留期的明细（日汇总不受影响）"""
+        cutoff = datetime.now(timezone.utc) - timedelta(days=settings.USAGE_EVENT_RETENTION_DAYS)
+        deleted = 0
+        while True:
+            ids = select(LLMUsageEvent.id).where(
+                LLMUsageEvent.created_at < cutoff
+            ).limit(RETENTION_BATCH_SIZE).scalar_subquery()
+            result = await self.db.execute(
+                delete(LLMUsageEvent).where(LLMUsageEvent.id.in_(ids))
+                .execution_options(synchronize_session=False)
+            )
+            await self.db.commit()
+            deleted += result.rowcount or 0
+            if (result.rowcount or 0) < RETENTION_BATCH_SIZE:
+                return deleted
+
+
+async def run_usage_flush_job() -> Optional[int]:
+    """定时任务：把缓冲区的用量事件写入数据库，返回写入条数"""
+    global _flush_scheduled
+    if _run_lock.locked():
+        return None
+
+    from app.db.database import AsyncSessionLocal
+
+    async with _run_lock:
+        _flush_scheduled = False
+        written = 0
+        while _buffer:
+            batch = [_buffer.popleft() for _ in range(min(len(_buffer), settings.USAGE_BATCH_SIZE))]
+            try:
+                async with AsyncSessionLocal() as db:
+                    await UsageService(db).write(batch)
+            except Exception as e:
+                _buffer.extendleft(reversed(batch))
+                logger.warning(f"⚠️  LLM 用量写入失败，{len(_buffer)} 条待重试: {e}")
+                break
+            written += len(batch)
+    return written
+
+
+async def run_usage_retention_job() -> int:
+    """定时任务：删除过期的用量明细"""
+    from app.db.database import AsyncSessionLocal
+
+    async with AsyncSessionLocal() as db:
+        deleted = await UsageService(db).delete_expired_events()
+    if deleted:
+        logger.info(f"🧹 已删除 {deleted} 条过期 LLM 用量明细")
+    return deleted
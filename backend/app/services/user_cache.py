@@ -0,0 +1,121 @@
+"""
+认证用户缓存
+
+get_current_user 每个请求都要解码 JWT 并查询 users 表。这里缓存两样东西：
+- token → payload：按 token 的 sha256 记忆化，直到 token 的 exp 过期
+- user_id → 用户列快照：短 TTL（USER_CACHE_TTL 秒）
+
+两者都是进程内、有容量上限的 LRU。AdminService 修改/删除用户时会显式失效本进程缓存；
+多 worker 部署时其他进程最多在 TTL 内看到旧数据（如刚被取消的管理员权限），
+把 USER_CACHE_TTL 设为 0 可关闭用户缓存。
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.db.models import User
+from app.services.auth_service import verify_token
+from app.services.metrics_collector import MetricsCollector
+
+_USER_COLUMNS = [c.key for c in User.__table__.columns]
+
+
+class TTLCache:
+    """有容量上限的 LRU + 过期时间缓存（线程安全）"""
+
+    def __init__(self, name: str, maxsize: int, ttl: float):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and item[0] > now:
+                self._data.move_to_end(key)
+                value = item[1]
+            else:
+                if item is not None:
+                    del self._data[key]
+                value = None
+        MetricsCollector().record_cache(self.name, hit=value is not None)
+        return value
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        ttl = self.ttl if ttl is None else ttl
+        if ttl <= 0 or self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, key: str) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+user_cache = TTLCache("user", settings.USER_CACHE_MAX_SIZE, settings.USER_CACHE_TTL)
+token_cache = TTLCache("token", settings.TOKEN_CACHE_MAX_SIZE, 0)
+
+
+def _token_key(token: str) -> str:
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+def get_token_payload(token: str) -> Optional[dict]:
+    """解码 JWT，结果按 token 哈希缓存到 exp（无效 token 不缓存）"""
+    key = _token_key(token)
+    payload = token_cache.get(key)
+    if payload is not None:
+        return payload
+
+    payload = verify_token(token)
+    if payload:
+        exp = payload.get("exp")
+        if isinstance(exp, (int, float)):
+            token_cache.set(key, payload, ttl=exp - time.time())
+    return payload
+
+
+async def get_user(db: AsyncSession, user_id: str) -> Optional[User]:
+    """按 ID 获取用户，命中缓存时不访问数据库
+
+    返回每次新建的游离 User 对象（不属于任何 Session），只用于读取属性。
+    """
+    snapshot = user_cache.get(user_id)
+    if snapshot is None:
+        result = await db.execute(select(User).where(User.id == user_id))
+        user = result.scalar_one_or_none()
+        if user is None:
+            return None
+        snapshot = {key: getattr(user, key) for key in _USER_COLUMNS}
+        user_cache.set(user_id, snapshot)
+    return User(**snapshot)
+
+
+def invalidate_user(user_id: str) -> None:
+    """用户被修改或删除后调用"""
+    user_cache.invalidate(user_id)
+
+
+def clear() -> None:
+    user_cache.clear()
+    token_cache.clear()
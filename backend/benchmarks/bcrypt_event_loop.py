@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+bcrypt 对事件循环的影响
+
+模拟一个 worker 上同时有 SSE 流（每 10ms 需要被调度一次）和一批登录请求：
+- sync:  在事件循环里直接调用 verify_password（改造前 /auth/login 的做法）
+- async: 调用 verify_password_async（线程池 + 并发上限）
+
+输出心跳的调度延迟（事件循环被阻塞的时间）。在 backend 目录下运行:
+    python benchmarks/bcrypt_event_loop.py [--logins 20] [--concurrency 10]
+"""
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.services.auth_service import (  # noqa: E402
+    get_password_hash,
+    shutdown_hash_executor,
+    verify_password,
+    verify_password_async,
+)
+
+TICK = 0.01
+
+
+async def heartbeat(stop: asyncio.Event, lags: list[float]) -> None:
+    """每 TICK 秒醒来一次，记录实际醒来时间比预期晚了多少"""
+    while not stop.is_set():
+        expected = time.perf_counter() + TICK
+        await asyncio.sleep(TICK)
+        lags.append(max(0.0, time.perf_counter() - expected) * 1000)
+
+
+async def run(mode: str, hashed: str, logins: int, concurrency: int) -> dict:
+    lags: list[float] = []
+    stop = asyncio.Event()
+    hb = asyncio.create_task(heartbeat(stop, lags))
+    await asyncio.sleep(0.05)
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def login() -> None:
+        async with semaphore:
+            if mode == "sync":
+                verify_password("wrong-password", hashed)
+                await asyncio.sleep(0)
+            else:
+                await verify_password_async("wrong-password", hashed)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(login() for _ in range(logins)))
+    elapsed = time.perf_counter() - started
+
+    stop.set()
+    await hb
+    lags.sort()
+    return {
+        "mode": mode,
+        "logins": logins,
+        "elapsed_s": round(elapsed, 2),
+        "heartbeats": len(lags),
+        "lag_p50_ms": round(statistics.median(lags), 1) if lags else 0.0,
+        "lag_p99_ms": round(lags[int(len(lags) * 0.99) - 1], 1) if lags else 0.0,
+        "lag_max_ms": round(lags[-1], 1) if lags else 0.0,
+    }
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--logins", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=10)
+    args = parser.parse_args()
+
+    hashed = get_password_hash("correct-password")
+    print(f"{'mode':<6} {'logins':>6} {'elapsed':>8} {'beats':>6} {'p50 lag':>9} {'p99 lag':>9} {'max lag':>9}")
+    for mode in ("sync", "async"):
+        r = await run(mode, hashed, args.logins, args.concurrency)
+        print(
+            f"{r['mode']:<6} {r['logins']:>6} {r['elapsed_s']:>7}s {r['heartbeats']:>6} "
+            f"{r['lag_p50_ms']:>7}ms {r['lag_p99_ms']:>7}ms {r['lag_max_ms']:>7}ms"
+        )
+    shutdown_hash_executor()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+"""
+本地替身 LLM / Embedding 服务（OpenAI 兼容接口），用于压测
+
+不调用真实模型、不产生费用、没有服务商限流，延迟可配置且可复现：
+- POST /v1/chat/completions  流式与非流式；首 token 延迟 --ttft-ms，之后按 --tokens-per-sec 输出，
+  回复长度 min(max_tokens, --completion-tokens)；流式在 stream_options.include_usage 时返回 usage
+- POST /v1/embeddings        确定性向量（字符二元组哈希后归一化，相似文本的向量相近），
+  维度取请求的 dimensions，延迟 --embed-ms；支持 float 与 base64 两种 encoding_format
+- GET  /v1/models、GET /stats（请求数、进行中、按接口的平均耗时）
+
+--jitter 按比例随机放大/缩小每次延迟，随机数由 --seed 固定，同样的请求序列得到同样的延迟。
+要求 JSON 输出的请求（response_format=json_object，如 NeuroMemory 的记忆提取）返回 "{}"。
+
+在 backend 目录下运行:
+    python benchmarks/fake_llm_server.py [--port 9100] [--ttft-ms 400] [--tokens-per-sec 40]
+
+然后让后端指向它（.env 或环境变量，API Key 任意非空值）:
+    DEEPSEEK_BASE_URL=http://127.0.0.1:9100/v1
+    OPENAI_BASE_URL=http://127.0.0.1:9100/v1
+    EMBEDDING_PROVIDER=remote
+"""
+import argparse
+import asyncio
+import base64
+import json
+import random
+import struct
+import time
+import zlib
+from collections import defaultdict
+from dataclasses import dataclass
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+# 输出文本按 token 循环取自这段话（约 1 个汉字/标点 = 1 token）
+REPLY = (
+    "听起来你今天过得挺充实的，我记得你之前也提到过类似的事情。"
+    "慢慢来，不用着急，有什么想聊的随时告诉我，我一直都在。"
+)
+
+
+@dataclass
+class Config:
+    ttft_ms: float = 400
+    tokens_per_sec: float = 40
+    completion_tokens: int = 120
+    embed_ms: float = 30
+    dimensions: int = 1536
+    jitter: float = 0.0
+    seed: int = 42
+
+
+config = Config()
+_rng = random.Random(config.seed)
+_stats = {"inflight": 0, "requests": defaultdict(int), "total_ms": defaultdict(float)}
+
+app = FastAPI(title="Me2 fake LLM")
+
+
+def _jittered(ms: float) -> float:
+    if config.jitter <= 0 or ms <= 0:
+        return ms
+    return ms * max(0.0, 1 + _rng.uniform(-config.jitter, config.jitter))
+
+
+def _count_tokens(text: str) -> int:
+    """粗略估计：中文按字符数，英文按 4 个字符 1 个 token"""
+    ascii_chars = sum(1 for ch in text if ord(ch) < 128)
+    return (len(text) - ascii_chars) + (ascii_chars + 3) // 4
+
+
+def _prompt_tokens(messages: list[dict]) -> int:
+    return sum(_count_tokens(str(m.get("content") or "")) + 4 for m in messages)
+
+
+def _tokens(n: int) -> list[str]:
+    return [REPLY[i % len(REPLY)] for i in range(n)]
+
+
+def embed(text: str, dimensions: int) -> list[float]:
+    """确定性向量：字符二元组哈希到维度上（带符号），再做 L2 归一化"""
+    vec = [0.0] * dimensions
+    padded = f" {text} "
+    for i in range(len(padded) - 1):
+        h = zlib.crc32(padded[i:i + 2].encode("utf-8"))
+        vec[h % dimensions] += 1.0 if h & 0x80000000 else -1.0
+    norm = sum(v * v for v in vec) ** 0.5
+    if norm == 0:
+        vec[0], norm = 1.0, 1.0
+    return [v / norm for v in vec]
+
+
+def _track(endpoint: str, started: float) -> None:
+    _stats["requests"][endpoint] += 1
+    _stats["total_ms"][endpoint] += (time.perf_counter() - started) * 1000
+
+
+@app.get("/v1/models")
+async def models():
+    return {"object": "list", "data": [{"id": "fake-chat", "object": "model"}, {"id": "fake-embedding", "object": "model"}]}
+
+
+@app.get("/stats")
+async def stats():
+    return {
+        "inflight": _stats["inflight"],
+        "endpoints": {
+            name: {"requests": n, "avg_ms": round(_stats["total_ms"][name] / n, 1)}
+            for name, n in _stats["requests"].items()
+        },
+    }
+
+
+@app.post("/v1/embeddings")
+async def embeddings(request: Request):
+    started = time.perf_counter()
+    body = await request.json()
+    inputs = body.get("input", "")
+    if isinstance(inputs, str):
+        inputs = [inputs]
+    dimensions = body.get("dimensions") or config.dimensions
+
+    _stats["inflight"] += 1
+    try:
+        await asyncio.sleep(_jittered(config.embed_ms) / 1000)
+        data = []
+        for i, text in enumerate(inputs):
+            vector = embed(str(text), dimensions)
+            if body.get("encoding_format") == "base64":
+                vector = base64.b64encode(struct.pack(f"<{dimensions}f", *vector)).decode()
+            data.append({"object": "embedding", "index": i, "embedding": vector})
+    finally:
+        _stats["inflight"] -= 1
+        _track("embeddings", started)
+
+    tokens = sum(_count_tokens(str(t)) for t in inputs)
+    return {
+        "object": "list",
+        "model": body.get("model", "fake-embedding"),
+        "data": data,
+        "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+    }
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    started = time.perf_counter()
+    body = await request.json()
+    model = body.get("model", "fake-chat")
+    messages = body.get("messages", [])
+    prompt_tokens = _prompt_tokens(messages)
+    max_tokens = body.get("max_tokens") or config.completion_tokens
+    wants_json = (body.get("response_format") or {}).get("type") == "json_object"
+    tokens = ["{}"] if wants_json else _tokens(min(max_tokens, config.completion_tokens))
+    usage = {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": len(tokens),
+        "total_tokens": prompt_tokens + len(tokens),
+    }
+    completion_id = f"chatcmpl-fake-{int(time.time() * 1000)}"
+    # 首 token 和之后每个 token 的时间点在请求开始时确定，与调度抖动无关
+    ttft = _jittered(config.ttft_ms) / 1000
+    interval = _jittered(1000 / config.tokens_per_sec) / 1000 if config.tokens_per_sec > 0 else 0.0
+
+    if not body.get("stream"):
+        _stats["inflight"] += 1
+        try:
+            await asyncio.sleep(ttft + interval * (len(tokens) - 1))
+        finally:
+            _stats["inflight"] -= 1
+            _track("chat", started)
+        return {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": "".join(tokens)},
+                "finish_reason": "stop",
+            }],
+            "usage": usage,
+        }
+
+    include_usage = (body.get("stream_options") or {}).get("include_usage", False)
+
+    def chunk(delta: dict, finish_reason=None, with_usage=None) -> str:
+        payload = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [] if with_usage else [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            "usage": with_usage,
+        }
+        return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+    async def stream():
+        _stats["inflight"] += 1
+        try:
+            loop_started = time.perf_counter()
+            yield chunk({"role": "assistant", "content": ""})
+            for i, token in enumerate(tokens):
+                delay = loop_started + ttft + interval * i - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                yield chunk({"content": token})
+            yield chunk({}, finish_reason="stop")
+            if include_usage:
+                yield chunk({}, with_usage=usage)
+            yield "data: [DONE]\n\n"
+        finally:
+            _stats["inflight"] -= 1
+            _track("chat_stream", started)
+
+    return StreamingResponse(stream(), media_type="text/event-stream")
+
+
+@app.exception_handler(json.JSONDecodeError)
+async def _bad_json(request: Request, exc: json.JSONDecodeError):
+    return JSONResponse({"error": {"message": "invalid JSON body", "type": "invalid_request_error"}}, status_code=400)
+
+
+def main() -> None:
+    global _rng
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--ttft-ms", type=float, default=config.ttft_ms, help="首 token 延迟（毫秒）")
+    parser.add_argument("--tokens-per-sec", type=float, default=config.tokens_per_sec, help="首 token 之后的输出速度，0 为一次输出")
+    parser.add_argument("--completion-tokens", type=int, default=config.completion_tokens, help="回复长度上限（再受请求的 max_tokens 限制）")
+    parser.add_argument("--embed-ms", type=float, default=config.embed_ms, help="每次 embedding 请求的延迟（毫秒）")
+    parser.add_argument("--dimensions", type=int, default=config.dimensions, help="请求未指定 dimensions 时的向量维度")
+    parser.add_argument("--jitter", type=float, default=config.jitter, help="延迟随机浮动比例，如 0.2 为 ±20%%")
+    parser.add_argument("--seed", type=int, default=config.seed)
+    args = parser.parse_args()
+
+    config.ttft_ms = args.ttft_ms
+    config.tokens_per_sec = args.tokens_per_sec
+    config.completion_tokens = args.completion_tokens
+    config.embed_ms = args.embed_ms
+    config.dimensions = args.dimensions
+    config.jitter = args.jitter
+    config.seed = args.seed
+    _rng = random.Random(args.seed)
+
+    print(
+        f"fake LLM on http://{args.host}:{args.port}/v1  "
+        f"ttft={args.ttft_ms}ms  {args.tokens_per_sec} tok/s  embed={args.embed_ms}ms  jitter={args.jitter}"
+    )
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning", access_log=False)
+
+
+if __name__ == "__main__":
+    main()
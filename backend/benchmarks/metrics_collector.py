@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+MetricsCollector：deque 原始数据点 vs 流式直方图
+
+- deque:     改造前的实现，每次 record_api 追加一个 ApiMetric，get_api_stats
+             过滤全部数据点并对每个接口排序求 p95
+- streaming: 当前实现，按 (method, path, 状态码类别) 累加到每分钟的对数直方图
+
+输出每次记录的耗时、一次 get_api_stats 的耗时和占用内存。在 backend 目录下运行:
+    python benchmarks/metrics_collector.py [--points 100000] [--endpoints 30]
+"""
+import argparse
+import random
+import sys
+import time
+import tracemalloc
+from collections import defaultdict, deque
+from dataclasses import dataclass, field
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.services.metrics_collector import MetricsCollector  # noqa: E402
+
+
+@dataclass
+class ApiMetric:
+    path: str
+    method: str
+    status_code: int
+    duration_ms: float
+    timestamp: float = field(default_factory=time.time)
+
+
+class DequeCollector:
+    """改造前的 record_api / get_api_stats"""
+
+    def __init__(self, max_points: int = 100_000):
+        self._api_metrics = deque(maxlen=max_points)
+
+    def record_api(self, path: str, method: str, status_code: int, duration_ms: float):
+        self._api_metrics.append(ApiMetric(path, method, status_code, duration_ms))
+
+    def get_api_stats(self, last_seconds: int = 86400) -> dict:
+        cutoff = time.time() - last_seconds
+        recent = [m for m in self._api_metrics if m.timestamp > cutoff]
+        by_endpoint: dict[str, list[float]] = defaultdict(list)
+        for m in recent:
+            by_endpoint[f"{m.method} {m.path}"].append(m.duration_ms)
+        endpoints = {}
+        for key, durations in sorted(by_endpoint.items(), key=lambda x: -len(x[1])):
+            sorted_d = sorted(durations)
+            p95_idx = int(len(sorted_d) * 0.95)
+            endpoints[key] = {
+                "count": len(durations),
+                "avg_ms": round(sum(durations) / len(durations), 1),
+                "p95_ms": round(sorted_d[min(p95_idx, len(sorted_d) - 1)], 1),
+            }
+        return {
+            "total_requests": len(recent),
+            "error_count": sum(1 for m in recent if m.status_code >= 400),
+            "endpoints": endpoints,
+        }
+
+
+def make_samples(points: int, endpoints: int) -> list[tuple[str, str, int, float]]:
+    rng = random.Random(0)
+    paths = [f"/api/v1/endpoint_{i}" for i in range(endpoints)]
+    return [
+        (
+            rng.choice(paths),
+            rng.choice(("GET", "POST")),
+            500 if rng.random() < 0.01 else 200,
+            rng.lognormvariate(3.5, 1.0),
+        )
+        for _ in range(points)
+    ]
+
+
+def fresh_metrics_collector() -> MetricsCollector:
+    MetricsCollector._instance = None  # 单例，基准测试里每次重新创建
+    return MetricsCollector()
+
+
+def run(name: str, factory, samples, queries: int) -> dict:
+    collector = factory()
+    started = time.perf_counter()
+    for path, method, status, duration in samples:
+        collector.record_api(path, method, status, duration)
+    record_ns = (time.perf_counter() - started) / len(samples) * 1e9
+
+    # 内存单独测（tracemalloc 会拖慢记录），用新实例重新写入同样的数据
+    collector = factory()
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    for path, method, status, duration in samples:
+        collector.record_api(path, method, status, duration)
+    memory_kb = (tracemalloc.get_traced_memory()[0] - base) / 1024
+    tracemalloc.stop()
+
+    started = time.perf_counter()
+    for _ in range(queries):
+        stats = collector.get_api_stats()
+    query_ms = (time.perf_counter() - started) / queries * 1000
+
+    p95 = sorted(e["p95_ms"] for e in stats["endpoints"].values())
+    return {
+        "name": name,
+        "record_ns": record_ns,
+        "query_ms": query_ms,
+        "memory_kb": memory_kb,
+        "requests": stats["total_requests"],
+        "median_p95": p95[len(p95) // 2],
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--points", type=int, default=100_000)
+    parser.add_argument("--endpoints", type=int, default=30)
+    parser.add_argument("--queries", type=int, default=20)
+    args = parser.parse_args()
+
+    samples = make_samples(args.points, args.endpoints)
+    results = [
+        run("deque", DequeCollector, samples, args.queries),
+        run("streaming", fresh_metrics_collector, samples, args.queries),
+    ]
+
+    print(f"{args.points} 个请求, {args.endpoints} 个接口")
+    print(f"{'实现':<10} {'记录 ns/次':>12} {'查询 ms':>10} {'内存 KB':>10} {'请求数':>8} {'p95 中位数':>10}")
+    for r in results:
+        print(
+            f"{r['name']:<10} {r['record_ns']:>12.0f} {r['query_ms']:>10.2f} "
+            f"{r['memory_kb']:>10.0f} {r['requests']:>8} {r['median_p95']:>10.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
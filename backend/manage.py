@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+"""
+Me2 管理命令
+
+在 backend 目录下运行:
+    python manage.py indexes                    # 幂等创建托管索引（CREATE INDEX CONCURRENTLY）
+    python manage.py indexes --drop-redundant   # 同时删除被复合索引覆盖的旧单列索引
+    python manage.py indexes --check            # EXPLAIN 热点查询，标记顺序扫描
+    python manage.py migrate                    # 升级数据库到最新版本（Alembic）
+    python manage.py migrate --status           # 查看当前版本 / 最新版本
+    python manage.py migrate --stamp <rev>      # 只记录版本号，不执行迁移
+    python manage.py partition-messages         # 在线把 messages 转换为按月分区表
+    python manage.py partition-messages --status  # 查看分区列表
+    python manage.py archive-sessions           # 把长期不活跃会话的消息移入冷归档表
+    python manage.py archive-sessions --dry-run # 只统计待归档的会话和消息
+    python manage.py cleanup-sessions           # 分批删除已结束的旧会话（中断后可继续）
+    python manage.py cleanup-sessions --dry-run # 只统计待清理的会话和消息
+    python manage.py delete-user-data <user_id> # 分批删除用户及其数据（--keep-account 保留账号）
+    python manage.py delete-user-data --resume  # 继续所有未完成的删除任务
+"""
+import argparse
+import asyncio
+import sys
+
+
+async def cmd_indexes(args) -> int:
+    from app.db.database import engine
+    from app.db import indexes
+
+    try:
+        if args.check:
+            print("🔍 检查热点查询执行计划...\n")
+            checks = await indexes.check_hot_queries(engine, min_rows=args.min_rows)
+            flagged = 0
+            for c in checks:
+                if c.error:
+                    flagged += 1
+                    print(f"   ❌ {c.name}: {c.error}")
+                elif c.seq_scans:
+                    flagged += 1
+                    tables = ", ".join(
+                        f"{s['table']} (~{s['estimated_table_rows']} 行)" for s in c.seq_scans
+                    )
+                    print(f"   ⚠️  {c.name}: 顺序扫描 {tables}")
+                    print(f"        来源: {c.source}")
+                else:
+                    used = ", ".join(c.indexes_used) or "-"
+                    print(f"   ✅ {c.name}: {used} (cost={c.total_cost:.1f})")
+            print(f"\n{len(checks)} 个查询，{flagged} 个需要关注")
+            return 1 if flagged else 0
+
+        print("🔧 创建托管索引...\n")
+        results = await indexes.ensure_indexes(engine, drop_redundant=args.drop_redundant)
+        icons = {"created": "✅", "rebuilt": "🔁", "exists": "•", "dropped": "🗑", "failed": "❌"}
+        for r in results:
+            detail = f" - {r.detail}" if r.detail else ""
+            print(f"   {icons.get(r.status, '?')} {r.name}: {r.status}{detail}")
+        return 1 if any(r.status == "failed" for r in results) else 0
+    finally:
+        await engine.dispose()
+
+
+async def cmd_migrate(args) -> int:
+    from app.db.database import engine
+    from app.db import migrations
+
+    try:
+        head = migrations.get_head_revision()
+        if args.status:
+            async with engine.connect() as conn:
+                current = await migrations.get_current_revision(conn)
+            state = "✅ 已是最新" if current == head else "⚠️  需要升级"
+            print(f"当前版本: {current}\n最新版本: {head}\n{state}")
+            return 0 if current == head else 1
+
+        if args.stamp:
+            await migrations.stamp(engine, args.stamp)
+            print(f"✅ 已记录版本: {args.stamp}")
+            return 0
+
+        print(f"📦 升级数据库到 {args.revision}...")
+        before, after = await migrations.run_migrations(engine, args.revision)
+        if before == after:
+            print(f"✅ 数据库已是最新 ({after})")
+        else:
+            print(f"✅ 迁移完成: {before} → {after}")
+        return 0
+    finally:
+        await engine.dispose()
+
+
+async def cmd_partition_messages(args) -> int:
+    from app.db.database import engine
+    from app.db import partitions
+
+    try:
+        if args.status:
+            async with engine.connect() as conn:
+                if not await partitions.is_partitioned(conn):
+                    print("messages 尚未分区")
+                    return 1
+                for p in await partitions.list_partitions(conn):
+                    print(f"   {p['name']}: {p['bound']} (~{p['estimated_rows']} 行)")
+            return 0
+
+        print("🔧 转换 messages 为按月分区表...")
+        result = await partitions.convert_messages_to_partitioned(
+            engine,
+            batch_size=args.batch_size,
+            progress=lambda n: print(f"   已复制 {n} 行", flush=True),
+        )
+        if result["status"] == "already_partitioned":
+            print("✅ messages 已是分区表")
+            created = await partitions.ensure_partitions(engine)
+            if created:
+                print(f"   新建分区: {', '.join(created)}")
+            return 0
+        print(f"✅ 转换完成: {result['copied_rows']} 行, {len(result['partitions'])} 个分区")
+        print(f"   旧表保留为 {result['legacy_table']}，确认无误后可手动 DROP TABLE")
+        return 0
+    finally:
+        await engine.dispose()
+
+
+async def cmd_archive_sessions(args) -> int:
+    from app.db.database import engine, AsyncSessionLocal
+    from app.services.archive_service import ArchiveService
+
+    try:
+        async with AsyncSessionLocal() as db:
+            service = ArchiveService(db)
+            if args.dry_run:
+                preview = await service.preview(days=args.days)
+                print(
+                    f"超过 {preview['days']} 天未活跃: "
+                    f"{preview['sessions']} 个会话, {preview['messages']} 条消息"
+                )
+                return 0
+            report = await service.run(days=args.days, max_batches=args.max_batches)
+        print(
+            f"✅ 归档 {report['sessions']} 个会话, {report['messages']} 条消息"
+            f"（{report['duration_seconds']}s）"
+        )
+        if report["dropped_partitions"]:
+            print(f"   删除空分区: {', '.join(report['dropped_partitions'])}")
+        return 0
+    finally:
+        await engine.dispose()
+
+
+async def cmd_cleanup_sessions(args) -> int:
+    from app.db.database import engine, AsyncSessionLocal
+    from app.services.session_manager import SessionManager
+
+    try:
+        async with AsyncSessionLocal() as db:
+            report = await SessionManager(db).cleanup_old_sessions(
+                days=args.days,
+                batch_size=args.batch_size,
+                dry_run=args.dry_run,
+                max_batches=args.max_batches,
+            )
+        if report["dry_run"]:
+            print(
+                f"已结束且超过 {report['days']} 天未活跃: "
+                f"{report['sessions']} 个会话, {report['messages']} 条消息"
+            )
+            return 0
+        state = "✅ 清理完成" if report["status"] == "completed" else "⏸  已暂停（再次运行继续）"
+        print(
+            f"{state}: {report['sessions']} 个会话, {report['messages']} 条消息, "
+            f"{report['batches']} 批（任务 {report['job_id']}）"
+        )
+        return 0
+    finally:
+        await engine.dispose()
+
+
+async def cmd_delete_user_data(args) -> int:
+    from app.db.database import engine, AsyncSessionLocal
+    from app.db.models import User
+    from app.services import data_lifecycle
+
+    try:
+        if args.user_id:
+            async with AsyncSessionLocal() as db:
+                user = await db.get(User, args.user_id)
+                if user is None:
+                    print(f"❌ 用户不存在: {args.user_id}")
+                    return 1
+                job = await data_lifecycle.enqueue_user_deletion(
+                    db, user, delete_account=not args.keep_account
+                )
+                print(f"已登记删除任务 {job.id}（{user.username}）")
+        elif not args.resume:
+            print("❌ 需要指定 user_id 或 --resume")
+            return 1
+
+        reports = await data_lifecycle.run_user_deletion_jobs() or []
+        for report in reports:
+            state = "✅ 删除完成" if report["status"] == "completed" else "⏸  已暂停（再次运行继续）"
+            print(
+                f"{state}: {report['user_id']} 共 {report['deleted']} 行, "
+                f"{report['batches']} 批（任务 {report['job_id']}）"
+            )
+            for table, count in report["tables"].items():
+                print(f"   {table}: {count}")
+        if not reports:
+            print("没有可执行的删除任务（可能正被其他进程执行）")
+        return 0
+    finally:
+        await engine.dispose()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="manage.py", description="Me2 管理命令")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_idx = sub.add_parser("indexes", help="创建托管索引 / 检查热点查询")
+    p_idx.add_argument("--check", action="store_true", help="只 EXPLAIN 热点查询，不建索引")
+    p_idx.add_argument("--min-rows", type=int, default=1000,
+                       help="表行数达到该值时才把顺序扫描视为问题（默认 1000）")
+    p_idx.add_argument("--drop-redundant", action="store_true",
+                       help="删除被复合索引覆盖的旧单列索引")
+    p_idx.set_defaults(func=cmd_indexes)
+
+    p_mig = sub.add_parser("migrate", help="执行数据库版本化迁移")
+    p_mig.add_argument("revision", nargs="?", default="head", help="目标版本（默认 head）")
+    p_mig.add_argument("--status", action="store_true", help="只显示当前版本和最新版本")
+    p_mig.add_argument("--stamp", metavar="REV", help="只写入版本号，不执行迁移")
+    p_mig.set_defaults(func=cmd_migrate)
+
+    p_part = sub.add_parser("partition-messages", help="把 messages 转换为按月分区表")
+    p_part.add_argument("--batch-size", type=int, default=5000, help="每批回填的行数（默认 5000）")
+    p_part.add_argument("--status", action="store_true", help="只列出现有分区")
+    p_part.set_defaults(func=cmd_partition_messages)
+
+    p_arch = sub.add_parser("archive-sessions", help="归档长期不活跃的会话")
+    p_arch.add_argument("--days", type=int, default=None,
+                        help="未活跃天数阈值（默认 MESSAGE_ARCHIVE_AFTER_DAYS）")
+    p_arch.add_argument("--max-batches", type=int, default=None, help="最多处理的批次数")
+    p_arch.add_argument("--dry-run", action="store_true", help="只统计，不修改数据")
+    p_arch.set_defaults(func=cmd_archive_sessions)
+
+    p_clean = sub.add_parser("cleanup-sessions", help="分批删除已结束的旧会话")
+    p_clean.add_argument("--days", type=int, default=None,
+                         help="保留天数（默认 SESSION_CLEANUP_DAYS；继续未完成任务时沿用原值）")
+    p_clean.add_argument("--batch-size", type=int, default=None, help="每批删除的会话数")
+    p_clean.add_argument("--max-batches", type=int, default=None, help="最多处理的批次数")
+    p_clean.add_argument("--dry-run", action="store_true", help="只统计，不删除")
+    p_clean.set_defaults(func=cmd_cleanup_sessions)
+
+    p_del = sub.add_parser("delete-user-data", help="分批删除用户数据（后台删除任务的命令行入口）")
+    p_del.add_argument("user_id", nargs="?", help="要删除的用户 ID")
+    p_del.add_argument("--keep-account", action="store_true", help="只清空数据，保留账号")
+    p_del.add_argument("--resume", action="store_true", help="继续所有未完成的删除任务")
+    p_del.set_defaults(func=cmd_delete_user_data)
+
+    args = parser.parse_args(argv)
+    return asyncio.run(args.func(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,80 @@
+"""
+Alembic 迁移环境
+
+两种运行方式：
+- 应用内（app.db.migrations.run_migrations / python manage.py migrate）：
+  调用方通过 config.attributes["connection"] 传入已建立的同步连接
+- alembic 命令行：按 settings.DATABASE_URL 自建异步引擎
+"""
+import asyncio
+from logging.config import fileConfig
+
+from sqlalchemy import pool
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from alembic import context
+
+from app.config import settings
+from app.db.database import Base
+import app.db.models  # noqa: F401  注册模型
+
+config = context.config
+
+if config.config_file_name is not None and config.attributes.get("configure_logger", True):
+    fileConfig(config.config_file_name, disable_existing_loggers=False)
+
+target_metadata = Base.metadata
+
+# NeuroMemory 管理的表不参与 autogenerate
+ME2_TABLES = set(target_metadata.tables)
+
+
+def include_object(obj, name, type_, reflected, compare_to):
+    if type_ == "table":
+        return name in ME2_TABLES
+    table = getattr(obj, "table", None)
+    if table is not None:
+        return table.name in ME2_TABLES
+    return True
+
+
+def _configure(**kwargs) -> None:
+    context.configure(
+        target_metadata=target_metadata,
+        include_object=include_object,
+        transaction_per_migration=True,
+        **kwargs,
+    )
+
+
+def run_migrations_offline() -> None:
+    """离线模式：只输出 SQL"""
+    _configure(
+        url=settings.DATABASE_URL,
+        literal_binds=True,
+        dialect_opts={"paramstyle": "named"},
+    )
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def do_run_migrations(connection: Connection) -> None:
+    _configure(connection=connection)
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+async def run_async_migrations() -> None:
+    connectable = create_async_engine(settings.DATABASE_URL, poolclass=pool.NullPool)
+    async with connectable.connect() as connection:
+        await connection.run_sync(do_run_migrations)
+    await connectable.dispose()
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+elif config.attributes.get("connection") is not None:
+    do_run_migrations(config.attributes["connection"])
+else:
+    asyncio.run(run_async_migrations())
@@ -0,0 +1,99 @@
+"""baseline: users / sessions / messages
+
+对应引入 Alembic 之前 main.lifespan 里 create_all + ALTER TABLE 的结果。
+已有数据库执行时会跳过已存在的表和列，可直接升级。
+
+Revision ID: 0001_baseline
+Revises:
+Create Date: 2026-10-18 00:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0001_baseline"
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# neuromemory 0.6.0 新增的 emotion_profiles 列（表本身由 nm.init() 创建）
+EMOTION_PROFILE_COLUMNS = [
+    ("last_reflected_at", "TIMESTAMPTZ"),
+    ("latest_state_period", "VARCHAR(50)"),
+    ("latest_state_valence", "FLOAT"),
+    ("latest_state_arousal", "FLOAT"),
+    ("latest_state_updated_at", "TIMESTAMPTZ"),
+    ("valence_avg", "FLOAT"),
+    ("arousal_avg", "FLOAT"),
+    ("emotion_triggers", "JSONB"),
+    ("source_memory_ids", "UUID[]"),
+    ("source_count", "INTEGER"),
+]
+
+
+def _has_table(name: str) -> bool:
+    return sa.inspect(op.get_bind()).has_table(name)
+
+
+def upgrade() -> None:
+    if not _has_table("users"):
+        op.create_table(
+            "users",
+            sa.Column("id", sa.String(), primary_key=True),
+            sa.Column("username", sa.String(100), nullable=False),
+            sa.Column("email", sa.String(255), nullable=False, unique=True),
+            sa.Column("hashed_password", sa.String(255), nullable=False),
+            sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+            sa.Column("updated_at", sa.DateTime(timezone=True)),
+            sa.Column("last_login", sa.DateTime(timezone=True)),
+            sa.Column("is_admin", sa.Boolean(), nullable=False, server_default=sa.false()),
+        )
+        op.create_index("ix_users_username", "users", ["username"], unique=True)
+    else:
+        op.execute("ALTER TABLE users ADD COLUMN IF NOT EXISTS is_admin BOOLEAN DEFAULT FALSE NOT NULL")
+
+    if not _has_table("sessions"):
+        op.create_table(
+            "sessions",
+            sa.Column("id", sa.String(), primary_key=True),
+            sa.Column("user_id", sa.String(), sa.ForeignKey("users.id", ondelete="CASCADE"), nullable=False),
+            sa.Column("title", sa.String(200)),
+            sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+            sa.Column("updated_at", sa.DateTime(timezone=True)),
+            sa.Column("last_active_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+            sa.Column("is_active", sa.Boolean(), nullable=False),
+            sa.Column("meta", sa.JSON()),
+        )
+        op.create_index("ix_sessions_user_id", "sessions", ["user_id"])
+        op.create_index("ix_sessions_last_active_at", "sessions", ["last_active_at"])
+
+    if not _has_table("messages"):
+        op.create_table(
+            "messages",
+            sa.Column("id", sa.String(), primary_key=True),
+            sa.Column("session_id", sa.String(), sa.ForeignKey("sessions.id", ondelete="CASCADE"), nullable=False),
+            sa.Column("user_id", sa.String(), sa.ForeignKey("users.id", ondelete="CASCADE"), nullable=False),
+            sa.Column("role", sa.String(20), nullable=False),
+            sa.Column("content", sa.Text(), nullable=False),
+            sa.Column("system_prompt", sa.Text()),
+            sa.Column("recalled_memories", sa.JSON()),
+            sa.Column("insights_used", sa.JSON()),
+            sa.Column("meta", sa.JSON()),
+            sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+        )
+        op.create_index("ix_messages_session_id", "messages", ["session_id"])
+        op.create_index("ix_messages_created_at", "messages", ["created_at"])
+
+    if _has_table("emotion_profiles"):
+        for column, type_ in EMOTION_PROFILE_COLUMNS:
+            op.execute(f"ALTER TABLE emotion_profiles ADD COLUMN IF NOT EXISTS {column} {type_}")
+
+
+def downgrade() -> None:
+    op.drop_table("messages")
+    op.drop_table("sessions")
+    op.drop_table("users")
@@ -0,0 +1,26 @@
+"""messages.debug_archive: 过期调试数据的压缩归档
+
+Revision ID: 0002_messages_debug_archive
+Revises: 0001_baseline
+Create Date: 2026-10-18 00:00:01
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0002_messages_debug_archive"
+down_revision: Union[str, None] = "0001_baseline"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.execute("ALTER TABLE messages ADD COLUMN IF NOT EXISTS debug_archive BYTEA")
+
+
+def downgrade() -> None:
+    op.drop_column("messages", "debug_archive")
@@ -0,0 +1,39 @@
+"""热点查询复合索引（见 app/db/indexes.py）
+
+CREATE INDEX CONCURRENTLY 不能在事务中执行，放在 autocommit_block 里，
+避免在大表上建索引时阻塞写入。构建中断留下的 INVALID 索引可用
+python manage.py indexes 修复。
+
+Revision ID: 0003_composite_indexes
+Revises: 0002_messages_debug_archive
+Create Date: 2026-10-18 00:00:02
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0003_composite_indexes"
+down_revision: Union[str, None] = "0002_messages_debug_archive"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+INDEXES = [
+    ("ix_messages_session_created", "messages", "session_id, created_at"),
+    ("ix_messages_user_created", "messages", "user_id, created_at"),
+    ("ix_sessions_user_last_active", "sessions", "user_id, last_active_at"),
+]
+
+
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table} ({columns})")
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, _table, _columns in INDEXES:
+            op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
@@ -0,0 +1,41 @@
+"""冷会话归档：sessions.archived_at + messages_archive
+
+Revision ID: 0004_messages_archive
+Revises: 0003_composite_indexes
+Create Date: 2026-10-18 00:00:03
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0004_messages_archive"
+down_revision: Union[str, None] = "0003_composite_indexes"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.execute("ALTER TABLE sessions ADD COLUMN IF NOT EXISTS archived_at TIMESTAMPTZ")
+
+    if not sa.inspect(op.get_bind()).has_table("messages_archive"):
+        op.create_table(
+            "messages_archive",
+            sa.Column("session_id", sa.String(), sa.ForeignKey("sessions.id", ondelete="CASCADE"), primary_key=True),
+            sa.Column("user_id", sa.String(), sa.ForeignKey("users.id", ondelete="CASCADE"), nullable=False),
+            sa.Column("message_count", sa.Integer(), nullable=False),
+            sa.Column("first_message_at", sa.DateTime(timezone=True)),
+            sa.Column("last_message_at", sa.DateTime(timezone=True)),
+            sa.Column("payload", sa.LargeBinary(), nullable=False),
+            sa.Column("archived_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+        )
+        op.create_index("ix_messages_archive_user_id", "messages_archive", ["user_id"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_messages_archive_user_id", table_name="messages_archive")
+    op.drop_table("messages_archive")
+    op.drop_column("sessions", "archived_at")
@@ -0,0 +1,42 @@
+"""jobs: 可恢复的后台批量任务
+
+Revision ID: 0005_jobs
+Revises: 0004_messages_archive
+Create Date: 2026-10-18 00:00:04
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0005_jobs"
+down_revision: Union[str, None] = "0004_messages_archive"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    if sa.inspect(op.get_bind()).has_table("jobs"):
+        return
+    op.create_table(
+        "jobs",
+        sa.Column("id", sa.String(), primary_key=True),
+        sa.Column("kind", sa.String(50), nullable=False),
+        sa.Column("status", sa.String(20), nullable=False),
+        sa.Column("params", sa.JSON()),
+        sa.Column("progress", sa.JSON()),
+        sa.Column("cursor", sa.JSON()),
+        sa.Column("error", sa.Text()),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+        sa.Column("updated_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+        sa.Column("finished_at", sa.DateTime(timezone=True)),
+    )
+    op.create_index("ix_jobs_kind_status", "jobs", ["kind", "status"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_jobs_kind_status", table_name="jobs")
+    op.drop_table("jobs")
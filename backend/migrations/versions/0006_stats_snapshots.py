@@ -0,0 +1,34 @@
+"""stats_snapshots: 预先计算的管理后台统计
+
+Revision ID: 0006_stats_snapshots
+Revises: 0005_jobs
+Create Date: 2026-10-18 00:00:05
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0006_stats_snapshots"
+down_revision: Union[str, None] = "0005_jobs"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    if sa.inspect(op.get_bind()).has_table("stats_snapshots"):
+        return
+    op.create_table(
+        "stats_snapshots",
+        sa.Column("name", sa.String(50), primary_key=True),
+        sa.Column("data", sa.JSON(), nullable=False),
+        sa.Column("refreshed_at", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("duration_ms", sa.Float()),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("stats_snapshots")
@@ -0,0 +1,48 @@
+"""metric_workers / metric_windows: 多 worker 指标汇总
+
+Revision ID: 0007_metric_windows
+Revises: 0006_stats_snapshots
+Create Date: 2026-10-18 00:00:06
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0007_metric_windows"
+down_revision: Union[str, None] = "0006_stats_snapshots"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    inspector = sa.inspect(op.get_bind())
+    if not inspector.has_table("metric_workers"):
+        op.create_table(
+            "metric_workers",
+            sa.Column("worker_id", sa.String(100), primary_key=True),
+            sa.Column("started_at", sa.DateTime(timezone=True), nullable=False),
+            sa.Column("last_flush_at", sa.DateTime(timezone=True), nullable=False),
+            sa.Column("counters", sa.JSON()),
+            sa.Column("gauges", sa.JSON()),
+        )
+    if not inspector.has_table("metric_windows"):
+        op.create_table(
+            "metric_windows",
+            sa.Column("worker_id", sa.String(100), primary_key=True),
+            sa.Column("kind", sa.String(20), primary_key=True),
+            sa.Column("resolution", sa.Integer(), primary_key=True),
+            sa.Column("window_start", sa.Integer(), primary_key=True),
+            sa.Column("window_end", sa.Integer(), nullable=False),
+            sa.Column("series", sa.JSON(), nullable=False),
+        )
+        op.create_index("ix_metric_windows_end", "metric_windows", ["kind", "window_end"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_metric_windows_end", table_name="metric_windows")
+    op.drop_table("metric_windows")
+    op.drop_table("metric_workers")
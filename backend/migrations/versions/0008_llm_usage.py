@@ -0,0 +1,62 @@
+"""llm_usage_events / llm_usage_daily: 按用户的 LLM 用量记账
+
+Revision ID: 0008_llm_usage
+Revises: 0007_metric_windows
+Create Date: 2026-10-18 00:00:07
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0008_llm_usage"
+down_revision: Union[str, None] = "0007_metric_windows"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    inspector = sa.inspect(op.get_bind())
+    if not inspector.has_table("llm_usage_events"):
+        op.create_table(
+            "llm_usage_events",
+            sa.Column("id", sa.BigInteger().with_variant(sa.Integer(), "sqlite"), primary_key=True, autoincrement=True),
+            sa.Column("created_at", sa.DateTime(timezone=True), nullable=False),
+            sa.Column("user_id", sa.String(36)),
+            sa.Column("endpoint", sa.String(200), nullable=False),
+            sa.Column("model", sa.String(100), nullable=False),
+            sa.Column("prompt_tokens", sa.Integer(), nullable=False),
+            sa.Column("completion_tokens", sa.Integer(), nullable=False),
+            sa.Column("cache_hit_tokens", sa.Integer(), nullable=False),
+            sa.Column("duration_ms", sa.Float(), nullable=False),
+            sa.Column("success", sa.Boolean(), nullable=False),
+        )
+        op.create_index("ix_llm_usage_events_user_created", "llm_usage_events", ["user_id", "created_at"])
+        op.create_index("ix_llm_usage_events_created", "llm_usage_events", ["created_at"])
+    if not inspector.has_table("llm_usage_daily"):
+        op.create_table(
+            "llm_usage_daily",
+            sa.Column("day", sa.Date(), primary_key=True),
+            sa.Column("user_id", sa.String(36), primary_key=True),
+            sa.Column("endpoint", sa.String(200), primary_key=True),
+            sa.Column("model", sa.String(100), primary_key=True),
+            sa.Column("calls", sa.Integer(), nullable=False),
+            sa.Column("failures", sa.Integer(), nullable=False),
+            sa.Column("prompt_tokens", sa.BigInteger(), nullable=False),
+            sa.Column("completion_tokens", sa.BigInteger(), nullable=False),
+            sa.Column("cache_hit_tokens", sa.BigInteger(), nullable=False),
+            sa.Column("duration_ms_total", sa.Float(), nullable=False),
+            sa.Column("duration_ms_max", sa.Float(), nullable=False),
+        )
+        op.create_index("ix_llm_usage_daily_user_day", "llm_usage_daily", ["user_id", "day"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_llm_usage_daily_user_day", table_name="llm_usage_daily")
+    op.drop_table("llm_usage_daily")
+    op.drop_index("ix_llm_usage_events_created", table_name="llm_usage_events")
+    op.drop_index("ix_llm_usage_events_user_created", table_name="llm_usage_events")
+    op.drop_table("llm_usage_events")
@@ -0,0 +1,36 @@
+"""rate_limit_buckets: 多 worker 共享的限流令牌桶
+
+Revision ID: 0009_rate_limit_buckets
+Revises: 0008_llm_usage
+Create Date: 2026-10-18 00:00:08
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0009_rate_limit_buckets"
+down_revision: Union[str, None] = "0008_llm_usage"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    inspector = sa.inspect(op.get_bind())
+    if not inspector.has_table("rate_limit_buckets"):
+        op.create_table(
+            "rate_limit_buckets",
+            sa.Column("key", sa.String(255), primary_key=True),
+            sa.Column("tokens", sa.Float(), nullable=False),
+            sa.Column("capacity", sa.Float(), nullable=False),
+            sa.Column("rate", sa.Float(), nullable=False),
+            sa.Column("allowed", sa.Boolean(), nullable=False),
+            sa.Column("updated_at", sa.DateTime(timezone=True), nullable=False),
+        )
+
+
+def downgrade() -> None:
+    op.drop_table("rate_limit_buckets")
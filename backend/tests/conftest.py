@@ -26,10 +26,9 @@ def event_loop() -> Generator:
 
 
 @pytest.fixture
-async def test_engine():
-    """测试数据库引擎"""
-    # Use shared memory database so tables persist across connections
-    test_db_url = "sqlite+aiosqlite:///:memory:?cache=shared&uri=true"
+async def test_engine(tmp_path):
+    """测试数据库引擎（每个用例一个新的 sqlite 文件，提交的数据不会带到其他用例）"""
+    test_db_url = f"sqlite+aiosqlite:///{tmp_path / 'test.db'}"
 
     engine = create_async_engine(
         test_db_url,
@@ -73,6 +72,13 @@ async def client(db_session) -> AsyncGenerator[AsyncClient, None]:
 
     app.dependency_overrides[get_db] = override_get_db
 
+    # 进程内限流与用户缓存跨用例共享，每个用例从干净状态开始
+    from app.api.v1 import auth as auth_api
+    from app.services import user_cache
+    auth_api.ip_limiter.reset()
+    auth_api.username_limiter.reset()
+    user_cache.clear()
+
     transport = ASGITransport(app=app)
     async with AsyncClient(transport=transport, base_url="http://test") as client:
         yield client
@@ -0,0 +1,95 @@
+"""
+管理后台用户列表测试
+"""
+import pytest
+from sqlalchemy import event
+
+from app.db.models import User, Session, Message, MessageArchive
+from app.services.admin_service import AdminService
+
+
+async def _seed_user(db_session, name: str, sessions: int, messages: int, archived: int = 0) -> User:
+    user = User(username=f"list_{name}", email=f"list_{name}@test.com", hashed_password="x")
+    db_session.add(user)
+    await db_session.flush()
+    for _ in range(sessions):
+        session = Session(user_id=user.id)
+        db_session.add(session)
+        await db_session.flush()
+        for i in range(messages):
+            db_session.add(Message(session_id=session.id, user_id=user.id, role="user", content=f"m{i}"))
+    if archived:
+        session = Session(user_id=user.id, is_active=False)
+        db_session.add(session)
+        await db_session.flush()
+        db_session.add(MessageArchive(
+            session_id=session.id, user_id=user.id, message_count=archived, payload=b"",
+        ))
+    await db_session.commit()
+    return user
+
+
+@pytest.mark.asyncio
+async def test_user_list_runs_fixed_number_of_queries(db_session, test_engine):
+    for i in range(5):
+        await _seed_user(db_session, str(i), sessions=2, messages=i)
+
+    statements = []
+
+    def _count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(test_engine.sync_engine, "before_cursor_execute", _count)
+    try:
+        result = await AdminService(db_session).get_user_list(limit=5)
+    finally:
+        event.remove(test_engine.sync_engine, "before_cursor_execute", _count)
+
+    assert len(result["items"]) == 5
+    # 总数 + 一条带统计的列表查询（外加首次检查 embeddings 表是否存在）
+    assert len([s for s in statements if s.lstrip().upper().startswith("SELECT")]) <= 3
+    assert sorted(item["message_count"] for item in result["items"]) == [0, 2, 4, 6, 8]
+
+
+@pytest.mark.asyncio
+async def test_user_list_sorts_by_message_count_with_keyset_pages(db_session):
+    heavy = await _seed_user(db_session, "heavy", sessions=1, messages=2, archived=10)
+    medium = await _seed_user(db_session, "medium", sessions=2, messages=3)
+    light = await _seed_user(db_session, "light", sessions=1, messages=1)
+    idle = await _seed_user(db_session, "idle", sessions=0, messages=0)
+    service = AdminService(db_session)
+
+    first = await service.get_user_list(limit=2, sort="message_count")
+    assert [item["id"] for item in first["items"]] == [heavy.id, medium.id]
+    assert first["items"][0]["message_count"] == 12  # 热表 + 已归档
+    assert first["items"][1]["session_count"] == 2
+    assert first["next_cursor"]
+
+    second = await service.get_user_list(limit=2, sort="message_count", cursor=first["next_cursor"])
+    assert [item["id"] for item in second["items"]] == [light.id, idle.id]
+    assert second["next_cursor"] is None
+
+    ascending = await service.get_user_list(limit=10, sort="last_active", order="asc")
+    assert ascending["items"][0]["id"] == idle.id  # 没有会话的用户排在最前
+    assert ascending["items"][0]["last_active"] is None
+
+
+@pytest.mark.asyncio
+async def test_user_list_rejects_unknown_sort_and_bad_cursor(db_session):
+    service = AdminService(db_session)
+    with pytest.raises(ValueError):
+        await service.get_user_list(sort="password")
+    with pytest.raises(ValueError):
+        await service.get_user_list(cursor="not-a-cursor")
+
+
+@pytest.mark.asyncio
+async def test_user_detail_counts_recent_sessions(db_session):
+    user = await _seed_user(db_session, "detail", sessions=2, messages=3, archived=4)
+
+    detail = await AdminService(db_session).get_user_detail(user.id)
+
+    assert detail["session_count"] == 3
+    assert detail["message_count"] == 10
+    assert sorted(s["message_count"] for s in detail["recent_sessions"]) == [3, 3, 4]
+    assert await AdminService(db_session).get_user_detail("missing") is None
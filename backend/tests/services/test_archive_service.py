@@ -0,0 +1,87 @@
+"""
+冷会话归档测试
+"""
+import pytest
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import select, func
+
+from app.db.models import User, Session, Message, MessageArchive
+from app.services.archive_service import ArchiveService
+
+
+async def _seed(db_session, name: str, inactive_days: int, count: int = 3) -> str:
+    user = User(username=f"archive_{name}", email=f"a_{name}@test.com", hashed_password="x")
+    db_session.add(user)
+    await db_session.flush()
+
+    last_active = datetime.now(timezone.utc) - timedelta(days=inactive_days)
+    session = Session(user_id=user.id, last_active_at=last_active)
+    db_session.add(session)
+    await db_session.flush()
+
+    for i in range(count):
+        db_session.add(Message(
+            session_id=session.id,
+            user_id=user.id,
+            role="user" if i % 2 == 0 else "assistant",
+            content=f"消息 {i}",
+            meta={"memories_count": i},
+            debug_archive=b"\x78\x9c\x00" if i == 1 else None,
+            created_at=last_active - timedelta(minutes=count - i),
+        ))
+    await db_session.commit()
+    return session.id
+
+
+async def _message_count(db_session, session_id: str) -> int:
+    return await db_session.scalar(
+        select(func.count(Message.id)).where(Message.session_id == session_id)
+    )
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+class TestArchiveService:
+    """冷会话归档测试类"""
+
+    async def test_run_archives_only_inactive_sessions(self, db_session):
+        cold_id = await _seed(db_session, "cold", inactive_days=400, count=4)
+        hot_id = await _seed(db_session, "hot", inactive_days=1, count=2)
+
+        report = await ArchiveService(db_session).run(days=180, batch_size=1, batch_sleep=0)
+
+        assert report["completed"] is True
+        assert report["sessions"] == 1
+        assert report["messages"] == 4
+        assert await _message_count(db_session, cold_id) == 0
+        assert await _message_count(db_session, hot_id) == 2
+
+        archive = await db_session.get(MessageArchive, cold_id)
+        assert archive.message_count == 4
+        cold = await db_session.get(Session, cold_id)
+        assert cold.archived_at is not None
+
+    async def test_ensure_hot_restores_messages_unchanged(self, db_session):
+        session_id = await _seed(db_session, "restore", inactive_days=400, count=3)
+        before = (await db_session.execute(
+            select(Message.id, Message.content, Message.meta, Message.debug_archive)
+            .where(Message.session_id == session_id)
+            .order_by(Message.created_at)
+        )).all()
+
+        service = ArchiveService(db_session)
+        assert await service.archive_session(session_id) == 3
+        assert await service.archive_session(session_id) == 0  # 已归档
+
+        session = await db_session.get(Session, session_id)
+        assert await service.ensure_hot(session) == 3
+        assert session.archived_at is None
+        assert await db_session.get(MessageArchive, session_id) is None
+
+        after = (await db_session.execute(
+            select(Message.id, Message.content, Message.meta, Message.debug_archive)
+            .where(Message.session_id == session_id)
+            .order_by(Message.created_at)
+        )).all()
+        assert after == before
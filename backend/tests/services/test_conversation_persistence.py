@@ -0,0 +1,51 @@
+"""
+对话写入路径测试（ConversationEngine._persist_turn）
+"""
+import pytest
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import select
+
+from app.db.models import User, Session, Message
+from app.services.conversation_engine import ConversationEngine
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+class TestPersistTurn:
+    """一轮对话的批量写入"""
+
+    async def test_writes_both_messages_and_touches_session(self, db_session):
+        user = User(username="persist", email="persist@test.com", hashed_password="x")
+        db_session.add(user)
+        await db_session.flush()
+        old_active = datetime.now(timezone.utc) - timedelta(days=3)
+        session = Session(user_id=user.id, last_active_at=old_active)
+        db_session.add(session)
+        await db_session.commit()
+
+        engine = ConversationEngine()
+        await engine._persist_turn(
+            db_session,
+            user_id=user.id,
+            session_id=session.id,
+            message="你好",
+            response="你好呀",
+            system_prompt="prompt",
+            memories=[{"content": "记忆", "score": 0.5, "memory_type": "fact"}],
+            history_count=0,
+            timings={"total": 0.1},
+            user_created_at=datetime.now(timezone.utc),
+        )
+
+        result = await db_session.execute(
+            select(Message).where(Message.session_id == session.id).order_by(Message.created_at)
+        )
+        messages = result.scalars().all()
+        assert [m.role for m in messages] == ["user", "assistant"]
+        assert messages[0].system_prompt is None
+        assert messages[1].system_prompt == "prompt"
+        assert messages[1].meta["memories_count"] == 1
+
+        await db_session.refresh(session)
+        assert session.last_active_at.replace(tzinfo=timezone.utc) > old_active
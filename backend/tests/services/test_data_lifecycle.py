@@ -0,0 +1,108 @@
+"""
+数据生命周期（重置 / 用户数据删除任务）测试
+"""
+import pytest
+from sqlalchemy import select, func
+
+from app.db.models import User, Session, Message
+from app.services import data_lifecycle
+from app.services.data_lifecycle import UserDataDeleter, enqueue_user_deletion
+from app.services.job_store import JobStore
+
+
+class FakeNeuroMemory:
+    def __init__(self):
+        self.deleted_users = []
+
+    async def delete_user_data(self, user_id):
+        self.deleted_users.append(user_id)
+        return {"deleted": {"embeddings": 2}}
+
+
+async def _seed(db_session, name: str, sessions: int, messages: int) -> User:
+    user = User(username=f"dl_{name}", email=f"dl_{name}@test.com", hashed_password="x")
+    db_session.add(user)
+    await db_session.flush()
+    for _ in range(sessions):
+        session = Session(user_id=user.id)
+        db_session.add(session)
+        await db_session.flush()
+        for i in range(messages):
+            db_session.add(Message(session_id=session.id, user_id=user.id, role="user", content=f"m{i}"))
+    await db_session.commit()
+    return user
+
+
+async def _count(db_session, model, user_id):
+    return await db_session.scalar(select(func.count()).select_from(model).where(model.user_id == user_id))
+
+
+@pytest.mark.asyncio
+async def test_deletion_job_runs_in_batches_and_resumes(db_session):
+    victim = await _seed(db_session, "victim", sessions=2, messages=5)
+    bystander = await _seed(db_session, "bystander", sessions=1, messages=3)
+    nm = FakeNeuroMemory()
+
+    job = await enqueue_user_deletion(db_session, victim, delete_account=True)
+    assert job.status == "queued"
+    # 重复提交返回同一个任务
+    assert (await enqueue_user_deletion(db_session, victim, delete_account=True)).id == job.id
+
+    # 第一次运行只处理 2 批后暂停（模拟中断）
+    report = await UserDataDeleter(db_session, nm=nm).run(job, batch_size=3, batch_sleep=0, max_batches=2)
+    assert report["status"] == "paused"
+    assert report["tables"]["messages"] == 6
+    assert await _count(db_session, Message, victim.id) == 4
+    assert nm.deleted_users == []
+
+    job = await JobStore(db_session).get(job.id)
+    assert job.status == "paused" and job.cursor == data_lifecycle.USER_TABLES.index("messages")
+
+    report = await UserDataDeleter(db_session, nm=nm).run(job, batch_size=3, batch_sleep=0)
+    assert report["status"] == "completed"
+    assert report["tables"]["messages"] == 10
+    assert report["tables"]["sessions"] == 2
+    assert report["tables"]["embeddings"] == 2  # NeuroMemory 公开 API 的统计合并进来
+    assert nm.deleted_users == [victim.id]
+    assert await db_session.get(User, victim.id) is None
+
+    # 其他用户的数据不受影响
+    assert await _count(db_session, Message, bystander.id) == 3
+    assert await _count(db_session, Session, bystander.id) == 1
+
+
+@pytest.mark.asyncio
+async def test_clear_data_keeps_account(db_session):
+    user = await _seed(db_session, "keep", sessions=1, messages=2)
+    job = await enqueue_user_deletion(db_session, user, delete_account=False)
+
+    report = await UserDataDeleter(db_session, nm=FakeNeuroMemory()).run(job, batch_sleep=0)
+
+    assert report["status"] == "completed"
+    assert await db_session.get(User, user.id) is not None
+    assert await _count(db_session, Message, user.id) == 0
+
+
+@pytest.mark.asyncio
+async def test_claim_allows_single_runner(db_session):
+    user = await _seed(db_session, "claim", sessions=0, messages=0)
+    job = await enqueue_user_deletion(db_session, user, delete_account=False)
+    store = JobStore(db_session)
+
+    assert await store.claim(job, stale_after=300)
+    # 已在运行且有新进度，其他 worker 不能接管
+    assert not await store.claim(job, stale_after=300)
+    # 长时间没有进度视为原进程中断
+    assert await store.claim(job, stale_after=-1)
+
+
+@pytest.mark.asyncio
+async def test_reset_all_data_recreates_admin(db_session):
+    await _seed(db_session, "reset", sessions=1, messages=2)
+
+    result = await data_lifecycle.reset_all_data(db_session)
+
+    assert "users" in result["truncated"] and "embeddings" not in result["truncated"]
+    assert result["deleted"]["messages"] == 2
+    users = (await db_session.execute(select(User.username))).scalars().all()
+    assert users == ["admin"]
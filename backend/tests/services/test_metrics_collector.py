@@ -0,0 +1,89 @@
+"""
+MetricsCollector 流式聚合测试
+"""
+import random
+
+from app.services.metrics_collector import MetricsCollector
+from app.services.metrics_streaming import StreamingHistogram, WindowedAggregates
+
+
+class FakeClock:
+    def __init__(self, now: float = 1_700_000_000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_histogram_quantiles_within_relative_error():
+    rng = random.Random(42)
+    values = [rng.lognormvariate(4, 1) for _ in range(20_000)]
+    hist = StreamingHistogram()
+    for v in values:
+        hist.record(v)
+
+    values.sort()
+    for q, estimate in zip((0.5, 0.9, 0.99), hist.quantiles((0.5, 0.9, 0.99))):
+        exact = values[int(q * len(values)) - 1]
+        assert abs(estimate - exact) / exact < 0.03
+    assert hist.count == len(values)
+    assert hist.max == values[-1]
+
+
+def test_histogram_merge_equals_single_histogram():
+    a, b, both = StreamingHistogram(), StreamingHistogram(), StreamingHistogram()
+    for i in range(1, 1000):
+        (a if i % 2 else b).record(i)
+        both.record(i)
+    a.merge(b)
+    assert a.buckets == both.buckets
+    assert a.quantiles((0.5, 0.99)) == both.quantiles((0.5, 0.99))
+
+
+def test_windows_roll_up_and_expire():
+    clock = FakeClock()
+    windows = WindowedAggregates(StreamingHistogram, clock=clock)
+
+    windows.get("GET /a").record(10)
+    clock.now += 90 * 60  # 90 分钟后：第一条已滚入小时窗口
+    windows.get("GET /a").record(20)
+
+    assert windows.collect(last_seconds=3600)["GET /a"].count == 1
+    assert windows.collect(last_seconds=2 * 3600)["GET /a"].count == 2
+
+    clock.now += 26 * 3600
+    assert windows.collect(last_seconds=86400) == {}
+
+
+def test_series_limit_folds_into_overflow_key():
+    windows = WindowedAggregates(StreamingHistogram, max_series=2, clock=FakeClock())
+    for path in ("/a", "/b", "/c", "/d"):
+        windows.get(path).record(1)
+    assert sorted(windows.collect(last_seconds=60)) == ["/a", "/b", "other"]
+    assert windows.collect(last_seconds=60)["other"].count == 2
+
+
+def test_api_stats_report_quantiles_and_errors():
+    collector = MetricsCollector()
+    path = "/api/v1/test-metrics-collector"
+    for i in range(1, 101):
+        collector.record_api(path, "GET", 200 if i <= 95 else 500, float(i))
+
+    stats = collector.get_api_stats(last_seconds=60)["endpoints"][f"GET {path}"]
+    assert stats["count"] == 100
+    assert stats["errors"] == 5
+    assert abs(stats["p50_ms"] - 50) <= 1.5
+    assert abs(stats["p99_ms"] - 99) <= 3
+    assert stats["max_ms"] == 100
+
+
+def test_totals_keep_counting_after_windows_expire():
+    clock = FakeClock()
+    windows = WindowedAggregates(StreamingHistogram, clock=clock)
+    windows.get("GET /a").record(10)
+    clock.now += 60
+    windows.get("GET /a").record(20)
+    clock.now += 30 * 3600  # 24 小时窗口已过期
+
+    assert windows.collect(last_seconds=86400) == {}
+    assert windows.totals()["GET /a"].count == 2
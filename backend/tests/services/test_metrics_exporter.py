@@ -0,0 +1,60 @@
+"""
+/metrics 导出格式测试（Prometheus 文本格式 / OpenMetrics）
+"""
+import re
+
+from app.services.metrics_collector import MetricsCollector
+from app.services.metrics_exporter import render_metrics
+
+_SAMPLE = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(\{.*\})? (\S+)$')
+
+
+def _samples(text: str) -> list[tuple[str, str, float]]:
+    samples = []
+    for line in text.splitlines():
+        if line.startswith("#"):
+            continue
+        match = _SAMPLE.match(line)
+        assert match, line
+        samples.append((match.group(1), match.group(2) or "", float(match.group(3))))
+    return samples
+
+
+def _record_some():
+    collector = MetricsCollector()
+    for i in range(1, 101):
+        collector.record_api("/api/v1/test-exporter/{item_id}", "GET", 200, float(i))
+    collector.record_llm("test-exporter-model", 100, 20, 1500.0, True)
+    collector.record_recall({"embedding": 0.02, "vector_search": 0.05, "vector_count": 7})
+
+
+def test_histogram_buckets_are_cumulative_and_end_at_count():
+    _record_some()
+    samples = _samples(render_metrics(jobs={("user_data_delete", "queued"): 3}))
+
+    route = 'route="/api/v1/test-exporter/{item_id}"'
+    buckets = [(labels, v) for name, labels, v in samples
+               if name == "me2_http_request_duration_seconds_bucket" and route in labels]
+    values = [v for _, v in buckets]
+    assert values == sorted(values)
+    assert 'le="+Inf"' in buckets[-1][0] and values[-1] == 100
+    le_50ms = next(v for labels, v in buckets if 'le="0.05"' in labels)
+    assert 49 <= le_50ms <= 51
+
+    by_name = {(name, labels): v for name, labels, v in samples}
+    assert by_name[("me2_llm_tokens_total", '{model="test-exporter-model",type="prompt"}')] >= 100
+    assert by_name[("me2_jobs_unfinished", '{kind="user_data_delete",status="queued"}')] == 3
+    stages = {labels for name, labels, _ in samples if name == "me2_recall_stage_duration_seconds_count"}
+    assert '{stage="embedding"}' in stages and '{stage="vector_count"}' not in stages
+
+
+def test_openmetrics_format_names_counter_families_without_total():
+    _record_some()
+    text = render_metrics(openmetrics=True)
+    assert text.endswith("# EOF\n")
+    assert "# TYPE me2_llm_tokens counter" in text
+    assert "me2_llm_tokens_total{" in text
+
+    plain = render_metrics(openmetrics=False)
+    assert "# EOF" not in plain
+    assert "# TYPE me2_llm_tokens_total counter" in plain
@@ -0,0 +1,73 @@
+"""
+多 worker 指标汇总测试（metric_windows / metric_workers）
+"""
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import select
+
+from app.config import settings
+from app.db.models import MetricWindow, MetricWorker
+from app.services import metrics_store
+from app.services.metrics_collector import MetricsCollector
+from app.services.metrics_store import RETIRED, MetricsStore
+
+PATH = "/api/v1/test-metrics-store"
+
+
+@pytest.fixture(autouse=True)
+def _fresh_flush_marks(monkeypatch):
+    monkeypatch.setattr(metrics_store, "_flushed_fine", {})
+    monkeypatch.setattr(metrics_store, "_flushed_coarse", {})
+
+
+def _as_worker(monkeypatch, worker_id: str):
+    monkeypatch.setattr(metrics_store, "worker_id", lambda: worker_id)
+
+
+def _api_count(collector: MetricsCollector) -> int:
+    return collector.get_api_stats(last_seconds=3600)["endpoints"][f"GET {PATH}"]["count"]
+
+
+@pytest.mark.asyncio
+async def test_fleet_view_adds_other_workers(db_session, monkeypatch):
+    collector = MetricsCollector()
+    for i in range(10):
+        collector.record_api(PATH, "GET", 200, float(i + 1))
+    local = _api_count(collector)
+
+    # 同一份数据以另一个 worker 的身份写入，汇总后应翻倍
+    _as_worker(monkeypatch, "worker-a")
+    assert await MetricsStore(db_session).flush(collector) >= 1
+    _as_worker(monkeypatch, "worker-b")
+    view, pools = await MetricsStore(db_session).fleet_view(collector, ("api",))
+
+    assert _api_count(view) == 2 * local
+    assert _api_count(collector) == local
+    totals = view.get_totals()["api"][("GET", PATH, "2xx")]
+    assert totals.count == 2 * collector.get_totals()["api"][("GET", PATH, "2xx")].count
+    assert isinstance(pools, dict)
+
+
+@pytest.mark.asyncio
+async def test_stale_worker_totals_are_retired(db_session, monkeypatch):
+    monkeypatch.setattr(settings, "METRICS_PERSIST", True)
+    collector = MetricsCollector()
+    collector.record_api(PATH, "GET", 200, 5.0)
+    _as_worker(monkeypatch, "worker-gone")
+    await MetricsStore(db_session).flush(collector)
+    worker = await db_session.get(MetricWorker, "worker-gone")
+    worker.last_flush_at = datetime.now(timezone.utc) - timedelta(hours=1)
+    await db_session.commit()
+
+    _as_worker(monkeypatch, "worker-live")
+    assert await MetricsStore(db_session).retire_stale_workers() == 1
+    assert await db_session.get(MetricWorker, "worker-gone") is None
+    owners = set((await db_session.execute(
+        select(MetricWindow.worker_id).where(MetricWindow.resolution == 0)
+    )).scalars())
+    assert owners == {RETIRED}
+
+    view, _ = await MetricsStore(db_session).fleet_view(collector, ("api",), totals_only=True)
+    gone = view.get_totals()["api"][("GET", PATH, "2xx")].count
+    assert gone == 2 * collector.get_totals()["api"][("GET", PATH, "2xx")].count
@@ -0,0 +1,106 @@
+"""
+过载降级测试（级别计算 / 降级方案 / 冷却 / 503 拒绝）
+"""
+import pytest
+from fastapi import HTTPException
+
+from app.api.v1 import chat
+from app.config import settings
+from app.services import overload
+from app.services.metrics_exporter import render_metrics
+from app.services.overload import OverloadController, plan_for
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def controller(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(overload.time, "monotonic", clock)
+    monkeypatch.setattr(settings, "OVERLOAD_ENABLED", True)
+    monkeypatch.setattr(settings, "OVERLOAD_MAX_INFLIGHT", 10)
+    monkeypatch.setattr(settings, "OVERLOAD_LLM_LATENCY_MS", 1000)
+    monkeypatch.setattr(settings, "OVERLOAD_POOL_WAIT_MS", 100)
+    monkeypatch.setattr(settings, "OVERLOAD_COOLDOWN", 10)
+    c = OverloadController()
+    c.clock = clock
+    return c
+
+
+def test_plan_degrades_step_by_step(monkeypatch):
+    monkeypatch.setattr(settings, "SESSION_HISTORY_LIMIT", 20)
+    plans = [plan_for(level) for level in range(6)]
+    assert [p.skip_graph for p in plans] == [False, True, True, True, True, True]
+    assert [p.recall_k for p in plans] == [20, 20, 10, 10, 10, 10]
+    assert [p.history_limit for p in plans] == [20, 20, 20, 10, 10, 10]
+    assert [p.max_tokens for p in plans] == [500, 500, 500, 500, 250, 250]
+    # 已开始的对话最多按 4 级执行
+    assert plans[5].level == 4
+
+
+def test_inflight_raises_level_and_sheds(controller):
+    turns = [controller.begin() for _ in range(13)]
+    assert turns[0].level == 0
+    controller.clock.now += 1
+    assert controller.level() == 5
+    assert controller.should_shed()
+    assert controller.begin().level == 4
+
+    for t in turns:
+        t.end()
+        t.end()  # 重复调用无效
+    assert controller.signals()["inflight"] == 1
+    assert controller.status()["shed"] == 1
+
+
+def test_latency_needs_samples_and_cools_down_one_level_at_a_time(controller):
+    controller.observe_llm(5000)
+    controller.observe_llm(5000)
+    assert controller.level() == 0  # 样本不足
+
+    for _ in range(3):
+        controller.observe_pool_wait(95)  # 0.95 -> 3 级
+    controller.clock.now += 1
+    assert controller.level() == 3
+    controller.observe_llm(5000)
+    controller.clock.now += 1
+    assert controller.level() == 5  # LLM 均值 5 倍于上限，取最高者
+
+    # 窗口过去后信号消失，每个冷却期只降一级
+    levels = []
+    for _ in range(6):
+        controller.clock.now += settings.OVERLOAD_WINDOW
+        levels.append(controller.level())
+    assert levels == [4, 3, 2, 1, 0, 0]
+
+
+def test_disabled_and_503(controller, monkeypatch):
+    monkeypatch.setattr(chat, "overload_controller", controller)
+    for _ in range(20):
+        controller.begin()
+    controller.clock.now += 1
+    with pytest.raises(HTTPException) as exc:
+        chat._reject_if_overloaded()
+    assert exc.value.status_code == 503
+    assert exc.value.headers["Retry-After"] == "10"
+
+    monkeypatch.setattr(settings, "OVERLOAD_ENABLED", False)
+    controller.clock.now += 1
+    chat._reject_if_overloaded()
+    assert controller.level() == 0
+
+
+def test_metrics_expose_level(monkeypatch):
+    c = OverloadController()
+    c.begin()
+    monkeypatch.setattr("app.services.metrics_exporter.overload_controller", c)
+    text = render_metrics()
+    assert "me2_overload_level 0" in text
+    assert "me2_overload_chat_inflight 1" in text
+    assert 'me2_overload_chat_turns_total{level="0"} 1' in text
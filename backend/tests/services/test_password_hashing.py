@@ -0,0 +1,78 @@
+"""
+密码哈希线程池与登录限流测试
+"""
+import asyncio
+
+import pytest
+from starlette.requests import Request
+
+from app.config import settings
+from app.services import auth_service, rate_limiter
+from app.services.auth_service import (
+    PasswordHashBusy,
+    get_password_hash,
+    get_password_hash_async,
+    verify_password_async,
+)
+
+
+def test_rate_limiter_refills_and_reports_retry_after(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(rate_limiter.time, "monotonic", lambda: now[0])
+    limiter = rate_limiter.RateLimiter("test", capacity=2, period=60)
+
+    assert limiter.hit("1.2.3.4") == 0
+    assert limiter.hit("1.2.3.4") == 0
+    assert limiter.hit("1.2.3.4") == pytest.approx(30)
+    assert limiter.hit("5.6.7.8") == 0  # 不同 key 独立计数
+
+    now[0] += 30  # 补回一个令牌
+    assert limiter.hit("1.2.3.4") == 0
+    assert limiter.hit("1.2.3.4") > 0
+
+    limiter.reset("1.2.3.4")
+    assert limiter.hit("1.2.3.4") == 0
+
+
+def _request(peer: str, forwarded: str | None = None) -> Request:
+    headers = [(b"x-forwarded-for", forwarded.encode())] if forwarded else []
+    return Request({"type": "http", "headers": headers, "client": (peer, 1234)})
+
+
+def test_client_ip_only_trusts_forwarded_from_proxies(monkeypatch):
+    monkeypatch.setattr(settings, "TRUSTED_PROXIES", [])
+    # 没有配置代理：伪造的 X-Forwarded-For 不起作用
+    assert rate_limiter.client_ip(_request("203.0.113.9", "1.1.1.1")) == "203.0.113.9"
+
+    monkeypatch.setattr(settings, "TRUSTED_PROXIES", ["10.0.0.0/8"])
+    assert rate_limiter.client_ip(_request("203.0.113.9", "1.1.1.1")) == "203.0.113.9"
+    # 客户端自带的值在最左边，取最右边的非代理地址
+    assert rate_limiter.client_ip(_request("10.0.0.2", "1.1.1.1, 198.51.100.7, 10.0.0.3")) == "198.51.100.7"
+    assert rate_limiter.client_ip(_request("10.0.0.2")) == "10.0.0.2"
+
+
+@pytest.mark.asyncio
+async def test_async_hash_and_verify_run_off_loop():
+    hashed = await get_password_hash_async("secret-password")
+    assert await verify_password_async("secret-password", hashed) is True
+    assert await verify_password_async("wrong-password", hashed) is False
+
+
+@pytest.mark.asyncio
+async def test_hash_pool_rejects_when_queue_full(monkeypatch):
+    monkeypatch.setattr(auth_service.settings, "PASSWORD_HASH_MAX_PENDING", 1)
+    monkeypatch.setattr(auth_service.settings, "PASSWORD_HASH_QUEUE_TIMEOUT", 0.01)
+    auth_service.shutdown_hash_executor()
+    hashed = get_password_hash("secret-password")
+
+    try:
+        results = await asyncio.gather(
+            verify_password_async("secret-password", hashed),
+            verify_password_async("secret-password", hashed),
+            return_exceptions=True,
+        )
+    finally:
+        auth_service.shutdown_hash_executor()
+
+    assert results.count(True) == 1
+    assert sum(isinstance(r, PasswordHashBusy) for r in results) == 1
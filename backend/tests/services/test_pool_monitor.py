@@ -0,0 +1,40 @@
+"""
+连接池监控测试
+"""
+import pytest
+
+from sqlalchemy import text
+
+from app.db import pool_monitor
+from app.services.metrics_collector import MetricsCollector
+
+
+def test_plan_pool_size_splits_budget_across_workers(monkeypatch):
+    monkeypatch.setattr(pool_monitor.settings, "WEB_CONCURRENCY", 4)
+    monkeypatch.setattr(pool_monitor.settings, "APP_INSTANCES", 1)
+    monkeypatch.setattr(pool_monitor.settings, "DB_POOL_DEPLOY_OVERLAP", 2)
+    monkeypatch.setattr(pool_monitor.settings, "DB_RESERVED_CONNECTIONS", 10)
+
+    # (100 - 10) // (4 × 2) = 11，扣除 NeuroMemory 的 2 个 → 9 = 3 常驻 + 6 溢出
+    assert pool_monitor.plan_pool_size(100, other_pools=2) == (3, 6)
+    # 预算不足时至少保留 1 个连接
+    assert pool_monitor.plan_pool_size(20, other_pools=5) == (1, 0)
+
+
+@pytest.mark.asyncio
+async def test_instrumented_pool_records_wait_and_hold(test_engine):
+    pool_monitor.instrument_engine(test_engine, "test_pool")
+    try:
+        token = pool_monitor.request_scope.set({"endpoint": test_plan_pool_size_splits_budget_across_workers})
+        try:
+            async with test_engine.connect() as conn:
+                await conn.execute(text("SELECT 1"))
+        finally:
+            pool_monitor.request_scope.reset(token)
+
+        stats = MetricsCollector().get_pool_stats()["pools"]["test_pool"]
+        assert stats["checkouts"] >= 1
+        assert sum(stats["wait"]["histogram"].values()) == stats["checkouts"] + stats["timeouts"]
+        assert stats["hold_by_endpoint"]["test_pool_monitor.test_plan_pool_size_splits_budget_across_workers"]["count"] == 1
+    finally:
+        pool_monitor._engines.pop("test_pool", None)
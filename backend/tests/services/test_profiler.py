@@ -0,0 +1,99 @@
+"""
+采样分析器与事件循环阻塞监控测试
+"""
+import asyncio
+import threading
+import time
+
+import pytest
+
+from app.services import profiler
+from app.services.profiler import LoopMonitor
+
+
+def _busy_wait(seconds: float) -> None:
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+
+@pytest.mark.asyncio
+async def test_profile_samples_the_event_loop_thread():
+    async def blocker():
+        await asyncio.sleep(0.05)
+        _busy_wait(0.2)
+
+    task = asyncio.create_task(blocker())
+    result = await profiler.profile(seconds=0.5, hz=200)
+    await task
+
+    assert result.samples > 20
+    collapsed = result.collapsed()
+    assert "_busy_wait" in collapsed
+    # 每行都是 "栈 次数"
+    for line in collapsed.splitlines():
+        stack, count = line.rsplit(" ", 1)
+        assert int(count) > 0 and stack
+    top = {entry["function"]: entry for entry in result.top_functions()}
+    busy = next(f for f in top if f.endswith(":_busy_wait"))
+    assert top[busy]["self"] > 0
+
+
+@pytest.mark.asyncio
+async def test_profile_all_threads_prefixes_thread_name_and_rejects_overlap():
+    stop = threading.Event()
+    worker = threading.Thread(target=stop.wait, name="test-worker", daemon=True)
+    worker.start()
+    try:
+        running = asyncio.create_task(profiler.profile(seconds=0.2, hz=50, all_threads=True))
+        await asyncio.sleep(0.02)
+        assert profiler.profiling()
+        with pytest.raises(RuntimeError):
+            await profiler.profile(seconds=0.1)
+        result = await running
+    finally:
+        stop.set()
+
+    assert any(stack.startswith("test-worker;") for stack in result.stacks)
+    assert not any(stack.startswith("me2-profiler;") for stack in result.stacks)
+    with pytest.raises(ValueError):
+        await profiler.profile(seconds=0)
+
+
+@pytest.mark.asyncio
+async def test_cancelled_profile_keeps_lock_until_sampling_ends():
+    running = asyncio.create_task(profiler.profile(seconds=0.2, hz=50))
+    await asyncio.sleep(0.02)
+    running.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await running
+
+    # 采样线程仍在运行，不能开始第二次分析
+    assert profiler.profiling()
+    with pytest.raises(RuntimeError):
+        await profiler.profile(seconds=0.1)
+
+    await asyncio.sleep(0.3)
+    assert not profiler.profiling()
+    assert (await profiler.profile(seconds=0.05, hz=50)).samples > 0
+
+
+@pytest.mark.asyncio
+async def test_loop_monitor_records_blocking_stack():
+    monitor = LoopMonitor(threshold_ms=50, interval_ms=20)
+    monitor.start()
+    try:
+        await asyncio.sleep(0.05)
+        _busy_wait(0.2)
+        await asyncio.sleep(0.05)
+    finally:
+        await monitor.stop()
+
+    stats = monitor.stats()
+    assert stats["stalls"] == 1
+    assert stats["max_lag_ms"] >= 150
+    stall = stats["recent"][0]
+    assert "_busy_wait" in stall["frame"]
+    assert "test_loop_monitor_records_blocking_stack" in stall["stack"]
+    assert monitor.top_frames()[0]["count"] == 1
+    assert monitor.stats(limit=0)["recent"] == []
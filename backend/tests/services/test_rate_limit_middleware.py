@@ -0,0 +1,154 @@
+"""
+接口限流与 LLM 每日配额中间件测试
+"""
+from types import SimpleNamespace
+
+import pytest
+from fastapi import FastAPI
+from httpx import ASGITransport, AsyncClient
+from pydantic import ValidationError
+
+from app.config import Settings, settings
+from app.db.replica import current_user_id
+from app.services import llm_client, rate_limit_middleware, usage_tracker
+from app.services.auth_service import create_access_token
+from app.services.rate_limit_middleware import RateLimitMiddleware
+from app.services.rate_limiter import RateLimiter
+
+STREAM = "POST /api/v1/test-rl/chat/{session_id}/stream"
+
+
+@pytest.fixture
+def limits(monkeypatch):
+    monkeypatch.setattr(settings, "RATE_LIMIT_ROUTES", {STREAM: 2})
+    monkeypatch.setattr(settings, "LLM_QUOTA_ROUTES", [STREAM])
+    monkeypatch.setattr(settings, "RATE_LIMIT_SHARED", False)
+    monkeypatch.setattr(rate_limit_middleware, "user_limiter", RateLimiter("api_user", 5, period=60))
+    monkeypatch.setattr(rate_limit_middleware, "_route_limiters", {})
+
+
+def _make_app() -> FastAPI:
+    app = FastAPI()
+    app.add_middleware(RateLimitMiddleware)
+
+    @app.post("/api/v1/test-rl/chat/{session_id}/stream")
+    async def rl_stream(session_id: str):
+        return {"ok": True}
+
+    @app.get("/api/v1/test-rl/other")
+    async def rl_other():
+        return {"ok": True}
+
+    return app
+
+
+def _auth(user_id: str) -> dict:
+    return {"Authorization": f"Bearer {create_access_token({'sub': user_id})}"}
+
+
+@pytest.mark.asyncio
+async def test_route_bucket_is_per_user_and_returns_retry_after(limits):
+    async with AsyncClient(transport=ASGITransport(app=_make_app()), base_url="http://test") as client:
+        codes = [
+            (await client.post(f"/api/v1/test-rl/chat/s{i}/stream", headers=_auth("u1"))).status_code
+            for i in range(3)
+        ]
+        assert codes == [200, 200, 429]
+        rejected = await client.post("/api/v1/test-rl/chat/s9/stream", headers=_auth("u1"))
+        # 其他用户和其他接口不受影响
+        assert (await client.post("/api/v1/test-rl/chat/s1/stream", headers=_auth("u2"))).status_code == 200
+        assert (await client.get("/api/v1/test-rl/other", headers=_auth("u1"))).status_code == 200
+
+    assert rejected.status_code == 429
+    assert 1 <= int(rejected.headers["retry-after"]) <= 30
+    assert "detail" in rejected.json()
+
+
+@pytest.mark.asyncio
+async def test_user_bucket_covers_all_routes_and_anonymous_by_ip(limits, monkeypatch):
+    monkeypatch.setattr(settings, "TRUSTED_PROXIES", [])
+    async with AsyncClient(transport=ASGITransport(app=_make_app()), base_url="http://test") as client:
+        codes = [(await client.get("/api/v1/test-rl/other")).status_code for _ in range(6)]
+        assert codes == [200] * 5 + [429]
+        # 直连地址不是可信代理时，伪造 X-Forwarded-For 不能换一个桶
+        forwarded = {"X-Forwarded-For": "10.0.0.8"}
+        assert (await client.get("/api/v1/test-rl/other", headers=forwarded)).status_code == 429
+
+        # 经可信代理转发的不同 IP 重新计数
+        monkeypatch.setattr(settings, "TRUSTED_PROXIES", ["127.0.0.1"])
+        assert (await client.get("/api/v1/test-rl/other", headers=forwarded)).status_code == 200
+
+
+@pytest.mark.asyncio
+async def test_daily_token_quota(limits, monkeypatch):
+    monkeypatch.setattr(settings, "LLM_DAILY_TOKEN_QUOTA", 1000)
+    monkeypatch.setattr(settings, "RATE_LIMIT_ROUTES", {})
+    monkeypatch.setattr(usage_tracker, "_quota_base", {})
+    monkeypatch.setattr(usage_tracker, "_local_tokens", {})
+    monkeypatch.setattr(usage_tracker, "_buffer", usage_tracker.deque())
+
+    async def stored(user_id, today):
+        return {"heavy": 900}.get(user_id, 0)
+
+    monkeypatch.setattr(usage_tracker, "_load_tokens_today", stored)
+
+    async with AsyncClient(transport=ASGITransport(app=_make_app()), base_url="http://test") as client:
+        assert (await client.post("/api/v1/test-rl/chat/s/stream", headers=_auth("heavy"))).status_code == 200
+        # 本进程之后记录的用量直接累加到数据库中的基数上
+        usage_tracker.record("m", 80, 20, 1.0, success=True, user_id="heavy")
+        assert await usage_tracker.tokens_used_today("heavy") == 1000
+        over = await client.post("/api/v1/test-rl/chat/s/stream", headers=_auth("heavy"))
+        assert (await client.post("/api/v1/test-rl/chat/s/stream", headers=_auth("light"))).status_code == 200
+        # 配额只限 LLM 接口
+        assert (await client.get("/api/v1/test-rl/other", headers=_auth("heavy"))).status_code == 200
+
+    assert over.status_code == 429
+    assert int(over.headers["retry-after"]) <= 24 * 3600
+
+
+@pytest.mark.asyncio
+async def test_aborted_stream_counts_toward_quota(limits, monkeypatch):
+    monkeypatch.setattr(settings, "LLM_DAILY_TOKEN_QUOTA", 1000)
+    monkeypatch.setattr(settings, "USAGE_TRACKING_ENABLED", True)
+    monkeypatch.setattr(settings, "RATE_LIMIT_ROUTES", {})
+    monkeypatch.setattr(usage_tracker, "_quota_base", {})
+    monkeypatch.setattr(usage_tracker, "_local_tokens", {})
+    monkeypatch.setattr(usage_tracker, "_buffer", usage_tracker.deque())
+
+    async def stored(user_id, today):
+        return 995
+
+    monkeypatch.setattr(usage_tracker, "_load_tokens_today", stored)
+
+    async def chunks():
+        for ch in "你好呀":
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=ch))], usage=None)
+
+    async def create(**kwargs):
+        return chunks()
+
+    llm = llm_client.LLMClient()
+    monkeypatch.setattr(llm, "client", SimpleNamespace(
+        chat=SimpleNamespace(completions=SimpleNamespace(create=create))
+    ))
+
+    async with AsyncClient(transport=ASGITransport(app=_make_app()), base_url="http://test") as client:
+        assert (await client.post("/api/v1/test-rl/chat/s/stream", headers=_auth("quitter"))).status_code == 200
+        # 每次都在回复结束前停止生成，用量照样计入配额
+        token = current_user_id.set("quitter")
+        try:
+            stream = await llm.generate("在吗", stream=True)
+            assert await stream.__anext__() == "你"
+            await stream.aclose()
+        finally:
+            current_user_id.reset(token)
+        assert await usage_tracker.tokens_used_today("quitter") >= 1000
+        over = await client.post("/api/v1/test-rl/chat/s/stream", headers=_auth("quitter"))
+
+    assert over.status_code == 429
+
+
+def test_quota_requires_usage_tracking():
+    with pytest.raises(ValidationError, match="USAGE_TRACKING_ENABLED"):
+        Settings(LLM_DAILY_TOKEN_QUOTA=1000, USAGE_TRACKING_ENABLED=False)
+    assert Settings(LLM_DAILY_TOKEN_QUOTA=0, USAGE_TRACKING_ENABLED=False).LLM_DAILY_TOKEN_QUOTA == 0
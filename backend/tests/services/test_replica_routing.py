@@ -0,0 +1,71 @@
+"""
+读写分离路由测试
+"""
+import pytest
+
+from app.db import replica
+from app.db.models import User
+
+
+@pytest.fixture
+def fake_replica(monkeypatch):
+    """假装配置了副本且延迟检查成功"""
+    monkeypatch.setattr(replica, "read_engine", object())
+    monkeypatch.setattr(replica, "_recent_writes", type(replica._recent_writes)())
+    monkeypatch.setattr(replica, "_lag_state", {
+        "healthy": True, "lag_seconds": 0.0, "checked_at": None, "error": None,
+    })
+    monkeypatch.setattr(replica.settings, "REPLICA_MAX_LAG", 2.0)
+    monkeypatch.setattr(replica.settings, "READ_YOUR_WRITES_WINDOW", 5.0)
+
+
+def test_no_replica_configured_reads_primary(monkeypatch):
+    monkeypatch.setattr(replica, "read_engine", None)
+    assert replica.use_replica("user-1") is False
+
+
+def test_lagging_replica_falls_back_to_primary(fake_replica):
+    assert replica.use_replica("user-1") is True
+
+    replica._lag_state["lag_seconds"] = 10.0
+    assert replica.use_replica("user-1") is False
+
+    replica._lag_state.update(healthy=False, lag_seconds=None)
+    assert replica.use_replica("user-1") is False
+
+
+def test_recent_write_reads_primary(fake_replica, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(replica.time, "monotonic", lambda: now[0])
+
+    replica.mark_write("user-1")
+    assert replica.use_replica("user-1") is False
+    assert replica.use_replica("user-2") is True
+
+    now[0] += 6
+    assert replica.use_replica("user-1") is True
+
+
+@pytest.mark.asyncio
+async def test_commit_marks_current_user_as_writer(fake_replica, db_session):
+    token = replica.current_user_id.set("writer")
+    try:
+        db_session.add(User(username="rw", email="rw@test.com", hashed_password="x"))
+        await db_session.commit()
+    finally:
+        replica.current_user_id.reset(token)
+
+    assert replica.has_recent_write("writer")
+    assert replica.use_replica("writer") is False
+
+
+@pytest.mark.asyncio
+async def test_failed_lag_check_marks_replica_unavailable(fake_replica, monkeypatch, test_engine):
+    # sqlite 没有 pg_is_in_recovery()，检查失败
+    monkeypatch.setattr(replica, "read_engine", test_engine)
+
+    status = await replica.check_replica_lag()
+
+    assert status["available"] is False
+    assert status["error"]
+    assert replica.use_replica("user-1") is False
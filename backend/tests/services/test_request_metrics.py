@@ -0,0 +1,60 @@
+"""
+请求指标中间件测试（路由模板归类 / 流式响应）
+"""
+import asyncio
+
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from httpx import ASGITransport, AsyncClient
+
+from app.services.metrics_collector import MetricsCollector
+from app.services.request_metrics import RequestMetricsMiddleware, UNMATCHED
+
+
+def _make_app() -> FastAPI:
+    app = FastAPI()
+    app.add_middleware(RequestMetricsMiddleware)
+
+    @app.get("/api/v1/test-rm/sessions/{session_id}/messages")
+    async def rm_messages(session_id: str):
+        return {"session_id": session_id}
+
+    @app.get("/api/v1/test-rm/stream")
+    async def rm_stream():
+        async def events():
+            await asyncio.sleep(0.02)
+            for i in range(3):
+                yield f"data: {i}\n\n"
+                await asyncio.sleep(0.02)
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return app
+
+
+@pytest.mark.asyncio
+async def test_requests_are_labelled_by_route_template():
+    async with AsyncClient(transport=ASGITransport(app=_make_app()), base_url="http://test") as client:
+        for session_id in ("a1", "b2", "c3"):
+            assert (await client.get(f"/api/v1/test-rm/sessions/{session_id}/messages")).status_code == 200
+        assert (await client.get("/api/v1/test-rm/nope/123")).status_code == 404
+
+    endpoints = MetricsCollector().get_api_stats(last_seconds=60)["endpoints"]
+    assert endpoints["GET /api/v1/test-rm/sessions/{session_id}/messages"]["count"] == 3
+    assert not any("a1" in key for key in endpoints)
+    assert endpoints[f"GET {UNMATCHED}"]["errors"] >= 1
+
+
+@pytest.mark.asyncio
+async def test_streaming_response_records_ttfb_and_total_duration():
+    async with AsyncClient(transport=ASGITransport(app=_make_app()), base_url="http://test") as client:
+        response = await client.get("/api/v1/test-rm/stream")
+        assert response.text.count("data:") == 3
+
+    stream = MetricsCollector().get_stream_stats(last_seconds=60)["GET /api/v1/test-rm/stream"]
+    assert stream["count"] == 1
+    assert stream["avg_chunks"] == 3
+    assert stream["ttfb"]["max_ms"] >= 15
+    # 总时长覆盖到最后一个 chunk，而不是响应头发出时
+    assert stream["duration"]["max_ms"] >= stream["ttfb"]["max_ms"] + 30
@@ -0,0 +1,92 @@
+"""
+调试数据保留策略测试
+"""
+import pytest
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import select
+
+from app.db.models import User, Session, Message
+from app.services.retention_service import (
+    RetentionService,
+    decompress_debug_payload,
+)
+
+
+async def _seed(db_session, age_days: int, count: int = 3) -> str:
+    user = User(username=f"retention_{age_days}", email=f"r{age_days}@test.com", hashed_password="x")
+    db_session.add(user)
+    await db_session.flush()
+    session = Session(user_id=user.id)
+    db_session.add(session)
+    await db_session.flush()
+
+    created_at = datetime.now(timezone.utc) - timedelta(days=age_days)
+    for i in range(count):
+        db_session.add(Message(
+            session_id=session.id,
+            user_id=user.id,
+            role="assistant",
+            content=f"回复 {i}",
+            system_prompt="你是一个温暖、懂 ta 的朋友。" * 20,
+            recalled_memories=[{"content": "记忆" * 100, "score": 0.9, "memory_type": "fact", "metadata": {"k": "v"}}],
+            meta={"memories_count": 1, "timings": {"total": 1.2, "llm_generate": 0.8}},
+            created_at=created_at + timedelta(seconds=i),
+        ))
+    await db_session.commit()
+    return session.id
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+class TestRetentionService:
+    """调试数据保留策略测试类"""
+
+    async def test_preview_counts_only_expired(self, db_session):
+        await _seed(db_session, age_days=60, count=3)
+        await _seed(db_session, age_days=1, count=2)
+
+        preview = await RetentionService(db_session).preview(days=30)
+
+        assert preview["messages"] == 3
+        assert preview["estimated_bytes"]["total"] > 0
+
+    async def test_compress_keeps_debug_info_recoverable(self, db_session):
+        session_id = await _seed(db_session, age_days=60, count=3)
+
+        report = await RetentionService(db_session).run(
+            days=30, mode="compress", batch_size=2, batch_sleep=0
+        )
+
+        assert report["messages"] == 3
+        assert report["batches"] == 2
+        assert report["completed"] is True
+        assert report["reclaimed_bytes"] > 0
+
+        result = await db_session.execute(select(Message).where(Message.session_id == session_id))
+        for msg in result.scalars().all():
+            assert msg.system_prompt is None
+            assert "timings" not in msg.meta
+            assert msg.meta["memories_count"] == 1
+            assert msg.recalled_memories[0]["content"] == ("记忆" * 100)[:100]
+            archived = decompress_debug_payload(msg.debug_archive)
+            assert archived["timings"]["total"] == 1.2
+            assert archived["system_prompt"].startswith("你是")
+
+        # 再次运行不会重复处理
+        again = await RetentionService(db_session).run(days=30, mode="compress", batch_sleep=0)
+        assert again["messages"] == 0
+
+    async def test_strip_drops_payload(self, db_session):
+        session_id = await _seed(db_session, age_days=60, count=1)
+
+        await RetentionService(db_session).run(days=30, mode="strip", batch_sleep=0)
+
+        result = await db_session.execute(select(Message).where(Message.session_id == session_id))
+        msg = result.scalar_one()
+        assert msg.system_prompt is None
+        assert msg.debug_archive is None
+
+    async def test_unknown_mode_rejected(self, db_session):
+        with pytest.raises(ValueError):
+            await RetentionService(db_session).run(mode="shred")
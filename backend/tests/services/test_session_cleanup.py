@@ -0,0 +1,74 @@
+"""
+会话分批清理测试
+"""
+import pytest
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import select, func
+
+from app.db.models import User, Session, Message, Job
+from app.services.session_manager import SessionManager, CLEANUP_JOB_KIND
+
+
+async def _seed(db_session, name: str, inactive_days: int, is_active: bool, count: int) -> list[str]:
+    user = User(username=f"cleanup_{name}", email=f"c_{name}@test.com", hashed_password="x")
+    db_session.add(user)
+    await db_session.flush()
+
+    last_active = datetime.now(timezone.utc) - timedelta(days=inactive_days)
+    ids = []
+    for i in range(count):
+        session = Session(
+            user_id=user.id,
+            is_active=is_active,
+            last_active_at=last_active - timedelta(minutes=i),
+        )
+        db_session.add(session)
+        await db_session.flush()
+        db_session.add(Message(session_id=session.id, user_id=user.id, role="user", content="hi"))
+        ids.append(session.id)
+    await db_session.commit()
+    return ids
+
+
+async def _remaining(db_session, ids: list[str]) -> int:
+    return await db_session.scalar(select(func.count(Session.id)).where(Session.id.in_(ids)))
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+class TestSessionCleanup:
+    """会话分批清理测试类"""
+
+    async def test_dry_run_counts_without_deleting(self, db_session):
+        old = await _seed(db_session, "dry", inactive_days=30, is_active=False, count=3)
+        await _seed(db_session, "dry_active", inactive_days=30, is_active=True, count=2)
+
+        report = await SessionManager(db_session).cleanup_old_sessions(days=7, dry_run=True)
+
+        assert report["sessions"] == 3
+        assert report["messages"] == 3
+        assert await _remaining(db_session, old) == 3
+
+    async def test_pause_and_resume_from_cursor(self, db_session):
+        old = await _seed(db_session, "old", inactive_days=30, is_active=False, count=5)
+        recent = await _seed(db_session, "recent", inactive_days=1, is_active=False, count=2)
+        manager = SessionManager(db_session)
+
+        first = await manager.cleanup_old_sessions(days=7, batch_size=2, batch_sleep=0, max_batches=1)
+        assert first["status"] == "paused"
+        assert first["sessions"] == 2
+        assert await _remaining(db_session, old) == 3
+
+        second = await manager.cleanup_old_sessions(batch_size=2, batch_sleep=0)
+        assert second["job_id"] == first["job_id"]
+        assert second["status"] == "completed"
+        assert second["sessions"] == 5
+        assert second["batches"] == 3
+        assert await _remaining(db_session, old) == 0
+        assert await _remaining(db_session, recent) == 2
+
+        job = await db_session.get(Job, first["job_id"])
+        assert job.kind == CLEANUP_JOB_KIND
+        assert job.status == "completed"
+        assert job.progress["sessions"] == 5
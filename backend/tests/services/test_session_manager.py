@@ -0,0 +1,70 @@
+"""
+会话管理器测试
+"""
+import pytest
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import select, func
+
+from app.db.models import User, Session, Message
+from app.services.session_manager import SessionManager
+
+
+async def _user(db_session, name: str) -> User:
+    user = User(username=f"sm_{name}", email=f"sm_{name}@test.com", hashed_password="x")
+    db_session.add(user)
+    await db_session.commit()
+    return user
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+class TestSessionManager:
+    """会话管理器测试类"""
+
+    async def test_add_message_appends_rows(self, db_session):
+        user = await _user(db_session, "append")
+        manager = SessionManager(db_session)
+        session = await manager.get_or_create_session(user.id)
+
+        for i in range(5):
+            await manager.add_message(session.id, "user" if i % 2 == 0 else "assistant", f"消息 {i}")
+
+        count = await db_session.scalar(
+            select(func.count(Message.id)).where(Message.session_id == session.id)
+        )
+        assert count == 5
+
+        latest = await manager.get_messages(session.id, limit=2)
+        assert [m["content"] for m in latest] == ["消息 3", "消息 4"]
+        assert len(await manager.get_messages(session.id)) == 5
+
+    async def test_add_message_unknown_session(self, db_session):
+        with pytest.raises(ValueError):
+            await SessionManager(db_session).add_message("missing", "user", "hi")
+
+    async def test_update_context_merges_keys(self, db_session):
+        user = await _user(db_session, "context")
+        session = Session(user_id=user.id, meta={"pinned": True})
+        db_session.add(session)
+        await db_session.commit()
+        manager = SessionManager(db_session)
+
+        await manager.update_context(session.id, {"topic": "旅行"})
+        await manager.update_context(session.id, {"mood": "开心"})
+
+        assert await manager.get_context(session.id) == {"topic": "旅行", "mood": "开心"}
+        meta = await db_session.scalar(select(Session.meta).where(Session.id == session.id))
+        assert meta["pinned"] is True
+
+    async def test_get_or_create_session_ends_timed_out(self, db_session):
+        user = await _user(db_session, "timeout")
+        stale = Session(user_id=user.id, last_active_at=datetime.now(timezone.utc) - timedelta(days=1))
+        db_session.add(stale)
+        await db_session.commit()
+
+        session = await SessionManager(db_session).get_or_create_session(user.id)
+
+        assert session.id != stale.id
+        is_active = await db_session.scalar(select(Session.is_active).where(Session.id == stale.id))
+        assert is_active is False
@@ -0,0 +1,44 @@
+"""
+SQL 监控测试
+"""
+import pytest
+
+from sqlalchemy import text
+
+from app.db import sql_monitor
+from app.services.metrics_collector import MetricsCollector
+
+
+def test_fingerprint_ignores_literals_params_and_list_length():
+    a = sql_monitor.fingerprint("SELECT * FROM messages WHERE id IN ($1::VARCHAR) AND role = 'user' LIMIT 20")
+    b = sql_monitor.fingerprint("SELECT * FROM  messages WHERE id IN ($1::VARCHAR, $2::VARCHAR) AND role = 'assistant' LIMIT 50")
+    assert a == b
+    assert a[1] == "SELECT * FROM messages WHERE id IN (...) AND role = ? LIMIT ?"
+
+    # 类型转换与表名中的数字不受影响
+    _, normalized = sql_monitor.fingerprint("SELECT relkind::text FROM messages_2026_01 WHERE x = :x")
+    assert normalized == "SELECT relkind::text FROM messages_2026_01 WHERE x = ?"
+
+
+def test_redact_parameters_keeps_only_types():
+    redacted = sql_monitor.redact_parameters(("my password", 3, None))
+    assert redacted == "(<str:11>, <int>, NULL)"
+    assert "secret" not in sql_monitor.redact_parameters({"content": "secret"})
+    assert sql_monitor.redact_parameters([("a",), ("b",)]) == "(<str:1>) ×2"
+
+
+@pytest.mark.asyncio
+async def test_slow_statement_logged_and_aggregated(test_engine, monkeypatch, caplog):
+    monkeypatch.setattr(sql_monitor.settings, "SQL_SLOW_MS", 0)
+    sql_monitor.instrument_engine(test_engine, "test_sql")
+    try:
+        async with test_engine.connect() as conn:
+            await conn.execute(text("SELECT :v AS secret_value"), {"v": "hunter2"})
+    finally:
+        sql_monitor._instrumented.discard("test_sql")
+
+    assert "SELECT ? AS secret_value" in [
+        t["statement"] for t in MetricsCollector().get_sql_stats(limit=100)["top"] if t["engine"] == "test_sql"
+    ]
+    slow = [r.getMessage() for r in caplog.records if r.name == "app.sql"]
+    assert slow and "hunter2" not in slow[-1]
@@ -0,0 +1,56 @@
+"""
+管理后台统计快照测试
+"""
+import pytest
+
+from app.db.models import User, Session, Message, StatsSnapshot
+from app.services.stats_service import StatsService, DASHBOARD
+
+
+async def _seed(db_session, name: str, messages: int) -> None:
+    user = User(username=f"stats_{name}", email=f"stats_{name}@test.com", hashed_password="x")
+    db_session.add(user)
+    await db_session.flush()
+    session = Session(user_id=user.id)
+    db_session.add(session)
+    await db_session.flush()
+    for i in range(messages):
+        db_session.add(Message(session_id=session.id, user_id=user.id, role="user", content=f"m{i}"))
+    await db_session.commit()
+
+
+@pytest.mark.asyncio
+async def test_dashboard_reads_snapshot_until_refreshed(db_session):
+    await _seed(db_session, "a", messages=3)
+    service = StatsService(db_session)
+
+    first = await service.get_dashboard_stats()
+    assert first["users"]["total"] == 1
+    assert first["messages"]["total"] == 3
+    assert first["estimated"] == []
+    assert first["refreshed_at"]
+    assert await db_session.get(StatsSnapshot, DASHBOARD) is not None
+
+    # 新数据在下一次刷新前不可见
+    await _seed(db_session, "b", messages=2)
+    assert (await service.get_dashboard_stats())["messages"]["total"] == 3
+
+    refreshed = await service.refresh_dashboard_stats()
+    assert refreshed["users"]["total"] == 2
+    assert refreshed["sessions"]["total"] == 2
+    assert refreshed["messages"]["total"] == 5
+    assert refreshed["messages"]["last_7d"] == 5
+
+
+@pytest.mark.asyncio
+async def test_dashboard_on_replica_computes_without_saving(db_session):
+    await _seed(db_session, "replica", messages=2)
+    db_session.info["replica"] = True
+    try:
+        stats = await StatsService(db_session).get_dashboard_stats()
+    finally:
+        db_session.info.pop("replica")
+
+    assert stats["messages"]["total"] == 2
+    assert stats["age_seconds"] == 0
+    assert await db_session.get(StatsSnapshot, DASHBOARD) is None
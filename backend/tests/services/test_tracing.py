@@ -0,0 +1,133 @@
+"""
+请求 trace 测试（span 嵌套 / Server-Timing 响应头 / 慢请求导出）
+"""
+import asyncio
+import json
+
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from httpx import ASGITransport, AsyncClient
+
+from app.config import settings
+from app.services import tracing
+from app.services.tracing import TracingMiddleware, create_background_task, record_span, span
+
+
+def _make_app() -> FastAPI:
+    app = FastAPI()
+    app.add_middleware(TracingMiddleware)
+
+    @app.get("/api/v1/test-trace/items/{item_id}")
+    async def trace_item(item_id: str):
+        with span("load", item=item_id):
+            with span("db.query"):
+                await asyncio.sleep(0.01)
+        return {"item_id": item_id}
+
+    @app.get("/api/v1/test-trace/stream")
+    async def trace_stream():
+        async def events():
+            with span("generate"):
+                await asyncio.sleep(0.01)
+                yield "data: 1\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return app
+
+
+@pytest.mark.asyncio
+async def test_spans_nest_and_fill_timings():
+    trace = tracing.start_trace("test")
+    timings = {}
+    with span("outer", timings) as outer:
+        with span("inner", timings, key="inner_s"):
+            await asyncio.sleep(0.005)
+
+        async def child():
+            with span("child"):
+                await asyncio.sleep(0)
+
+        await asyncio.gather(child(), child())
+        outer.set(rows=3)
+    trace.finish()
+
+    spans = {s.name: s for s in trace.spans}
+    assert spans["inner"].parent_id == spans["outer"].span_id
+    children = [s for s in trace.spans if s.name == "child"]
+    assert len(children) == 2
+    assert all(s.parent_id == spans["outer"].span_id for s in children)
+    assert spans["outer"].attrs == {"rows": 3}
+    assert timings["inner_s"] >= 0.004
+    assert timings["outer"] >= timings["inner_s"]
+    assert tracing.server_timing(trace)["child"]["count"] == 2
+
+
+@pytest.mark.asyncio
+async def test_span_without_trace_only_fills_timings():
+    tracing._current_trace.set(None)
+    timings = {}
+    with span("solo", timings):
+        pass
+    record_span("ignored", 0.0, 1.0)
+    assert "solo" in timings
+    assert tracing.current_trace() is None
+
+
+@pytest.mark.asyncio
+async def test_server_timing_header_and_route_template_name(monkeypatch):
+    monkeypatch.setattr(settings, "TRACE_SAMPLE_RATE", 1.0)
+    async with AsyncClient(transport=ASGITransport(app=_make_app()), base_url="http://test") as client:
+        response = await client.get("/api/v1/test-trace/items/abc")
+        assert response.status_code == 200
+
+    header = response.headers["server-timing"]
+    assert header.startswith('trace;desc="')
+    assert "load;dur=" in header and "db.query;dur=" in header
+    assert response.headers["timing-allow-origin"] == "*"
+
+    exported = tracing.recent_traces(limit=1)[0]
+    assert exported["trace_id"] in header
+    assert exported["name"] == "GET /api/v1/test-trace/items/{item_id}"
+    assert exported["attrs"]["http.status_code"] == 200
+
+
+@pytest.mark.asyncio
+async def test_streamed_response_header_only_has_stages_before_first_byte(monkeypatch):
+    monkeypatch.setattr(settings, "TRACE_SAMPLE_RATE", 1.0)
+    async with AsyncClient(transport=ASGITransport(app=_make_app()), base_url="http://test") as client:
+        response = await client.get("/api/v1/test-trace/stream")
+        assert response.text == "data: 1\n\n"
+
+    assert "generate" not in response.headers["server-timing"]
+    exported = tracing.recent_traces(limit=1)[0]
+    assert [s["name"] for s in exported["spans"]] == ["generate"]
+
+
+@pytest.mark.asyncio
+async def test_slow_trace_waits_for_background_span_and_exports_otlp(monkeypatch, tmp_path):
+    path = tmp_path / "traces.jsonl"
+    monkeypatch.setattr(settings, "TRACE_SLOW_MS", 0)
+    monkeypatch.setattr(settings, "TRACE_EXPORT_PATH", str(path))
+    monkeypatch.setattr(settings, "TRACE_EXPORT_FORMAT", "otlp")
+
+    trace = tracing.start_trace("POST /api/v1/chat/stream")
+    with span("llm_generate"):
+        pass
+    gate = asyncio.Event()
+    task = create_background_task("neuromemory_sync", gate.wait())
+    trace.finish()
+    # 后台任务未结束前不导出
+    assert not path.exists()
+
+    gate.set()
+    await task
+    # 文件由写入线程追加
+    assert tracing.flush_exports()
+    lines = path.read_text().splitlines()
+    assert len(lines) == 1
+    spans = json.loads(lines[0])["resourceSpans"][0]["scopeSpans"][0]["spans"]
+    assert [s["name"] for s in spans] == ["POST /api/v1/chat/stream", "llm_generate", "neuromemory_sync"]
+    assert all(s["traceId"] == trace.trace_id for s in spans)
+    assert spans[2]["parentSpanId"] == spans[0]["spanId"]
@@ -0,0 +1,186 @@
+"""
+LLM 用量记账测试（事件归属 / 日汇总累加 / 管理后台查询）
+"""
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import func, select
+
+from app.config import settings
+from app.db.models import LLMUsageDaily, LLMUsageEvent, User
+from app.db.pool_monitor import request_scope
+from app.db.replica import current_user_id
+from app.services import usage_tracker
+from app.services.usage_tracker import NO_USER, UsageService
+
+
+def _event(user_id, prompt=100, completion=20, duration=500.0, success=True, days_ago=0,
+           endpoint="POST /api/v1/chat/stream", model="deepseek-chat"):
+    return {
+        "created_at": datetime.now(timezone.utc) - timedelta(days=days_ago),
+        "user_id": user_id,
+        "endpoint": endpoint,
+        "model": model,
+        "prompt_tokens": prompt,
+        "completion_tokens": completion,
+        "cache_hit_tokens": prompt // 2,
+        "duration_ms": duration,
+        "success": success,
+    }
+
+
+@pytest.fixture
+def fresh_buffer(monkeypatch):
+    monkeypatch.setattr(usage_tracker, "_buffer", usage_tracker.deque())
+    monkeypatch.setattr(usage_tracker, "_dropped", 0)
+    return usage_tracker._buffer
+
+
+def test_record_attributes_current_user_and_route(fresh_buffer, monkeypatch):
+    monkeypatch.setattr(settings, "USAGE_BATCH_SIZE", 1000)
+    user_token = current_user_id.set("user-1")
+    scope_token = request_scope.set({"type": "http", "method": "POST", "endpoint": None})
+    try:
+        usage_tracker.record("deepseek-chat", 10, 5, 123.4, success=True, cache_hits=8)
+    finally:
+        request_scope.reset(scope_token)
+        current_user_id.reset(user_token)
+    usage_tracker.record("deepseek-chat", 1, 1, 1.0, success=False)
+
+    in_request, background = list(fresh_buffer)
+    assert in_request["user_id"] == "user-1"
+    assert in_request["endpoint"] == "POST (unmatched)"
+    assert in_request["cache_hit_tokens"] == 8
+    assert background["user_id"] is None
+    assert background["endpoint"] == usage_tracker.BACKGROUND
+
+
+def test_buffer_is_bounded(fresh_buffer, monkeypatch):
+    monkeypatch.setattr(settings, "USAGE_MAX_BUFFER", 3)
+    monkeypatch.setattr(settings, "USAGE_BATCH_SIZE", 1000)
+    for i in range(5):
+        usage_tracker.record("m", i, 0, 1.0, success=True)
+    assert [e["prompt_tokens"] for e in fresh_buffer] == [2, 3, 4]
+    assert usage_tracker.buffer_stats() == {"buffered": 3, "dropped": 2}
+
+
+def test_cache_hit_tokens_reads_provider_fields():
+    assert usage_tracker.cache_hit_tokens(SimpleNamespace(prompt_cache_hit_tokens=64)) == 64
+    openai_usage = SimpleNamespace(prompt_tokens_details=SimpleNamespace(cached_tokens=32))
+    assert usage_tracker.cache_hit_tokens(openai_usage) == 32
+    assert usage_tracker.cache_hit_tokens(None) == 0
+
+
+def _stub_stream(monkeypatch, client, with_usage):
+    """把 LLMClient 的 OpenAI 客户端换成按字输出"你好呀"的假流"""
+    def chunk(content=None, usage=None):
+        choices = [] if content is None else [SimpleNamespace(delta=SimpleNamespace(content=content))]
+        return SimpleNamespace(choices=choices, usage=usage)
+
+    async def chunks():
+        for ch in "你好呀":
+            yield chunk(ch)
+        if with_usage:
+            yield chunk(usage=SimpleNamespace(prompt_tokens=50, completion_tokens=3))
+
+    async def create(**kwargs):
+        return chunks()
+
+    monkeypatch.setattr(client, "client", SimpleNamespace(
+        chat=SimpleNamespace(completions=SimpleNamespace(create=create))
+    ))
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("read_all", [True, False])
+async def test_stream_records_usage_even_when_aborted(fresh_buffer, monkeypatch, read_all):
+    from app.services import llm_client as llm_module
+
+    monkeypatch.setattr(settings, "USAGE_BATCH_SIZE", 1000)
+    observed = []
+    monkeypatch.setattr(llm_module.overload_controller, "observe_llm", observed.append)
+    client = llm_module.LLMClient()
+    _stub_stream(monkeypatch, client, with_usage=True)
+
+    stream = await client.generate("在吗", system_prompt="你是助手", stream=True)
+    if read_all:
+        assert [c async for c in stream] == ["你", "好", "呀"]
+    else:
+        assert await stream.__anext__() == "你"
+        await stream.aclose()  # 客户端断开 / 停止生成
+
+    (event,) = fresh_buffer
+    assert len(observed) == 1
+    assert event["success"] is True
+    if read_all:
+        assert (event["prompt_tokens"], event["completion_tokens"]) == (50, 3)
+    else:
+        # 没等到 usage 块，按已发送的内容估算
+        assert event["completion_tokens"] == 1
+        assert event["prompt_tokens"] == usage_tracker.estimate_prompt_tokens(
+            [{"content": "你是助手"}, {"content": "在吗"}]
+        )
+
+
+@pytest.mark.asyncio
+async def test_write_accumulates_daily_rollups(db_session):
+    svc = UsageService(db_session)
+    await svc.write([_event("u1"), _event("u1", duration=900.0), _event(None)])
+    await svc.write([_event("u1", success=False, duration=100.0)])
+
+    assert await db_session.scalar(select(func.count()).select_from(LLMUsageEvent)) == 4
+    row = await db_session.get(
+        LLMUsageDaily,
+        (datetime.now(timezone.utc).date(), "u1", "POST /api/v1/chat/stream", "deepseek-chat"),
+    )
+    assert row.calls == 3
+    assert row.failures == 1
+    assert row.prompt_tokens == 300
+    assert row.cache_hit_tokens == 150
+    assert row.duration_ms_total == 1500.0
+    assert row.duration_ms_max == 900.0
+    background = (await db_session.execute(
+        select(LLMUsageDaily).where(LLMUsageDaily.user_id == NO_USER)
+    )).scalar_one()
+    assert background.calls == 1
+
+
+@pytest.mark.asyncio
+async def test_top_users_and_user_series(db_session):
+    db_session.add(User(id="u-heavy", username="heavy", email="h@example.com", hashed_password="x"))
+    await db_session.commit()
+    svc = UsageService(db_session)
+    await svc.write(
+        [_event("u-heavy", prompt=1000) for _ in range(3)]
+        + [_event("u-heavy", prompt=500, days_ago=2, model="deepseek-reasoner")]
+        + [_event("u-light", prompt=10), _event(None, prompt=99999)]
+        + [_event("u-old", prompt=99999, days_ago=30)]
+    )
+
+    top = await svc.top_users(days=7, limit=10)
+    assert [u["user_id"] for u in top["users"]] == ["u-heavy", "u-light"]
+    heavy = top["users"][0]
+    assert heavy["username"] == "heavy"
+    assert heavy["calls"] == 4
+    assert heavy["total_tokens"] == 3 * 1020 + 520
+    assert heavy["avg_ms"] == 500.0
+
+    usage = await svc.user_usage("u-heavy", days=7)
+    assert [d["calls"] for d in usage["series"]] == [1, 3]
+    assert [m["model"] for m in usage["by_model"]] == ["deepseek-chat", "deepseek-reasoner"]
+    assert usage["by_endpoint"][0]["calls"] == 4
+
+    with pytest.raises(ValueError):
+        await svc.top_users(order_by="user_id; DROP TABLE users")
+
+
+@pytest.mark.asyncio
+async def test_delete_expired_events_keeps_rollups(db_session, monkeypatch):
+    monkeypatch.setattr(settings, "USAGE_EVENT_RETENTION_DAYS", 7)
+    svc = UsageService(db_session)
+    await svc.write([_event("u1", days_ago=10), _event("u1")])
+
+    assert await svc.delete_expired_events() == 1
+    assert await db_session.scalar(select(func.count()).select_from(LLMUsageEvent)) == 1
+    assert await db_session.scalar(select(func.sum(LLMUsageDaily.calls))) == 2
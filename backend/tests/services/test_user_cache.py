@@ -0,0 +1,66 @@
+"""
+认证用户缓存测试
+"""
+import pytest
+
+from sqlalchemy import delete
+
+from app.db.models import User
+from app.services import user_cache
+from app.services.auth_service import create_access_token
+from app.services.metrics_collector import MetricsCollector
+
+
+@pytest.fixture(autouse=True)
+def _clear_cache():
+    user_cache.clear()
+    yield
+    user_cache.clear()
+
+
+def test_ttl_cache_expires_and_evicts(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(user_cache.time, "monotonic", lambda: now[0])
+    cache = user_cache.TTLCache("test", maxsize=2, ttl=10)
+
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)  # 超出容量，淘汰最久未使用的 b
+    assert cache.get("b") is None
+    assert cache.get("c") == 3
+
+    now[0] += 11
+    assert cache.get("a") is None
+
+
+def test_token_payload_memoized_until_expiry():
+    token = create_access_token({"sub": "user-1"})
+    before = MetricsCollector().get_cache_stats()["caches"].get("token", {"hits": 0})["hits"]
+
+    assert user_cache.get_token_payload(token)["sub"] == "user-1"
+    assert user_cache.get_token_payload(token)["sub"] == "user-1"
+    assert user_cache.get_token_payload("not-a-token") is None
+
+    after = MetricsCollector().get_cache_stats()["caches"]["token"]["hits"]
+    assert after == before + 1
+
+
+@pytest.mark.asyncio
+async def test_get_user_served_from_cache_until_invalidated(db_session):
+    user = User(username="cached", email="cached@test.com", hashed_password="x", is_admin=True)
+    db_session.add(user)
+    await db_session.commit()
+
+    first = await user_cache.get_user(db_session, user.id)
+    assert first.username == "cached" and first.is_admin is True
+
+    # 绕过缓存直接删除，缓存仍命中
+    await db_session.execute(delete(User).where(User.id == user.id))
+    await db_session.commit()
+    cached = await user_cache.get_user(db_session, user.id)
+    assert cached.id == user.id
+    assert cached is not first  # 每次返回新的游离对象
+
+    user_cache.invalidate_user(user.id)
+    assert await user_cache.get_user(db_session, user.id) is None
@@ -13,6 +13,24 @@ function getAuthHeaders(): Record<string, string> {
   return { Authorization: `Bearer ${token}` };
 }
 
+const JOB_POLL_INTERVAL = 1000;
+
+// 删除用户 / 清空数据是后台分批任务，轮询直到结束，返回各表删除行数
+async function waitForJob(
+  jobId: string,
+  onProgress: (deleted: number) => void,
+): Promise<Record<string, number>> {
+  for (;;) {
+    const res = await fetch(`${API_BASE}/admin/data-jobs/${jobId}`, { headers: getAuthHeaders() });
+    if (!res.ok) throw new Error(`HTTP ${res.status}`);
+    const job = await res.json();
+    onProgress(job.progress?.deleted ?? 0);
+    if (job.status === 'completed') return job.progress?.tables ?? {};
+    if (job.status === 'failed' && !job.running) throw new Error(job.error || '删除任务失败');
+    await new Promise((resolve) => setTimeout(resolve, JOB_POLL_INTERVAL));
+  }
+}
+
 interface UserItem {
   id: string;
   username: string;
@@ -36,6 +54,8 @@ export default function DatabasePage() {
   const [confirmText, setConfirmText] = useState('');
   const [actionError, setActionError] = useState('');
   const [actionResult, setActionResult] = useState<Record<string, number> | null>(null);
+  const [resultEstimated, setResultEstimated] = useState(false);
+  const [jobDeleted, setJobDeleted] = useState<number | null>(null);
 
   const fetchUsers = useCallback(async () => {
     try {
@@ -70,12 +90,14 @@ export default function DatabasePage() {
         throw new Error(err.detail || `HTTP ${res.status}`);
       }
       const data = await res.json();
-      setActionResult(data.deleted);
+      setResultEstimated(false);
+      setActionResult(await waitForJob(data.job.id, setJobDeleted));
       fetchUsers();
     } catch (e: any) {
       setActionError(e.message || '操作失败');
     } finally {
       setActionLoading(null);
+      setJobDeleted(null);
     }
   };
 
@@ -91,13 +113,16 @@ export default function DatabasePage() {
         const err = await res.json().catch(() => ({ detail: '请求失败' }));
         throw new Error(err.detail || `HTTP ${res.status}`);
       }
-      setConfirmAction(null);
+      const data = await res.json();
+      setResultEstimated(false);
+      setActionResult(await waitForJob(data.job.id, setJobDeleted));
       setConfirmText('');
       fetchUsers();
     } catch (e: any) {
       setActionError(e.message || '操作失败');
     } finally {
       setActionLoading(null);
+      setJobDeleted(null);
     }
   };
 
@@ -115,6 +140,7 @@ export default function DatabasePage() {
         throw new Error(err.detail || `HTTP ${res.status}`);
       }
       const data = await res.json();
+      setResultEstimated(!!data.estimated);
       setActionResult(data.deleted);
       setConfirmText('');
       fetchUsers();
@@ -311,7 +337,9 @@ export default function DatabasePage() {
 
             {actionResult ? (
               <div className="space-y-3">
-                <p className="text-sm text-green-400 font-medium">操作完成！已删除数据：</p>
+                <p className="text-sm text-green-400 font-medium">
+                  操作完成！已删除数据{resultEstimated && '（行数为估算）'}：
+                </p>
                 <div className="bg-black/20 rounded-lg p-3 space-y-1">
                   {Object.entries(actionResult).map(([table, count]) => (
                     <div key={table} className="flex justify-between text-xs">
@@ -361,7 +389,9 @@ export default function DatabasePage() {
                     className="flex-1 px-4 py-2 rounded-lg text-sm font-medium bg-red-600 text-white hover:bg-red-700 transition-colors disabled:opacity-50 flex items-center justify-center gap-2"
                   >
                     {actionLoading && <Loader2 className="w-4 h-4 animate-spin" />}
-                    {actionLoading ? '执行中...' : '确认'}
+                    {actionLoading
+                      ? jobDeleted !== null ? `已删除 ${jobDeleted} 行...` : '执行中...'
+                      : '确认'}
                   </button>
                 </div>
               </>
@@ -107,6 +107,12 @@ export default function AdminDashboard() {
           <h2 className="text-sm font-medium text-muted-foreground flex items-center gap-2">
             <BarChart3 className="w-4 h-4" />
             数据总览
+            {stats.refreshed_at && (
+              <span className="text-xs font-normal text-muted-foreground/50">
+                统计于 {new Date(stats.refreshed_at).toLocaleTimeString('zh-CN')}
+                {stats.estimated?.length > 0 && '（大表为估算值）'}
+              </span>
+            )}
           </h2>
           <div className="grid grid-cols-1 sm:grid-cols-2 lg:grid-cols-4 gap-4">
             <StatsCard
@@ -44,7 +44,9 @@ interface EmbeddingStatsData {
 interface ApiStatsData {
   total_requests: number;
   error_count: number;
-  endpoints: Record<string, { count: number; avg_ms: number; p95_ms: number }>;
+  endpoints: Record<string, {
+    count: number; avg_ms: number; p50_ms?: number; p95_ms: number; p99_ms?: number; errors?: number;
+  }>;
 }
 
 export default function UsagePage() {
@@ -295,7 +297,9 @@ export default function UsagePage() {
                       <th className="text-left px-4 py-3 text-muted-foreground font-medium">接口</th>
                       <th className="text-right px-4 py-3 text-muted-foreground font-medium">次数</th>
                       <th className="text-right px-4 py-3 text-muted-foreground font-medium">平均 (ms)</th>
+                      <th className="text-right px-4 py-3 text-muted-foreground font-medium">P50 (ms)</th>
                       <th className="text-right px-4 py-3 text-muted-foreground font-medium">P95 (ms)</th>
+                      <th className="text-right px-4 py-3 text-muted-foreground font-medium">P99 (ms)</th>
                     </tr>
                   </thead>
                   <tbody>
@@ -306,7 +310,9 @@ export default function UsagePage() {
                           <td className="px-4 py-3 font-mono text-xs text-foreground">{endpoint}</td>
                           <td className="px-4 py-3 text-right text-foreground tabular-nums">{formatNumber(s.count)}</td>
                           <td className="px-4 py-3 text-right text-foreground tabular-nums">{s.avg_ms?.toFixed(1) ?? '-'}</td>
+                          <td className="px-4 py-3 text-right text-foreground tabular-nums">{s.p50_ms?.toFixed(1) ?? '-'}</td>
                           <td className="px-4 py-3 text-right text-foreground tabular-nums">{s.p95_ms?.toFixed(1) ?? '-'}</td>
+                          <td className="px-4 py-3 text-right text-foreground tabular-nums">{s.p99_ms?.toFixed(1) ?? '-'}</td>
                         </tr>
                       ))}
                   </tbody>
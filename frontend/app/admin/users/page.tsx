@@ -2,7 +2,7 @@
 
 import { useEffect, useState, useCallback } from 'react';
 import { useRouter } from 'next/navigation';
-import { Loader2, ShieldCheck, ShieldOff } from 'lucide-react';
+import { Loader2, ShieldCheck, ShieldOff, ArrowDown, ArrowUp } from 'lucide-react';
 import { useAuth } from '@/contexts/AuthContext';
 
 const API_BASE = process.env.NEXT_PUBLIC_API_URL || '/api/v1';
@@ -15,10 +15,16 @@ interface UserItem {
   is_admin: boolean;
   created_at: string | null;
   last_login: string | null;
+  last_active: string | null;
   session_count: number;
   message_count: number;
+  memory_count: number;
 }
 
+type SortField =
+  | 'created_at' | 'last_login' | 'last_active'
+  | 'session_count' | 'message_count' | 'memory_count';
+
 function getAuthHeaders(): Record<string, string> {
   const token = localStorage.getItem('me2_access_token');
   if (!token) return {};
@@ -50,33 +56,70 @@ export default function UsersListPage() {
   const [users, setUsers] = useState<UserItem[]>([]);
   const [total, setTotal] = useState(0);
   const [page, setPage] = useState(0);
+  const [sort, setSort] = useState<SortField>('created_at');
+  const [order, setOrder] = useState<'asc' | 'desc'>('desc');
+  // keyset 分页：cursors[n] 是第 n 页的游标（第 0 页为 null）
+  const [cursors, setCursors] = useState<(string | null)[]>([null]);
   const [loading, setLoading] = useState(true);
   const [togglingId, setTogglingId] = useState<string | null>(null);
 
-  const fetchUsers = useCallback(async (pageNum: number) => {
+  const fetchUsers = useCallback(async (pageNum: number, cursor: string | null) => {
     setLoading(true);
     try {
-      const offset = pageNum * PAGE_SIZE;
+      const params = new URLSearchParams({ limit: String(PAGE_SIZE), sort, order });
+      if (cursor) params.set('cursor', cursor);
       const res = await fetch(
-        `${API_BASE}/admin/users?limit=${PAGE_SIZE}&offset=${offset}`,
+        `${API_BASE}/admin/users?${params}`,
         { headers: getAuthHeaders() }
       );
       if (res.ok) {
         const data = await res.json();
         setUsers(data.items || data.users || []);
         setTotal(data.total || 0);
+        setCursors((prev) => {
+          const next = prev.slice(0, pageNum + 1);
+          if (data.next_cursor) next.push(data.next_cursor);
+          return next;
+        });
       }
     } catch (e) {
       console.error('Failed to load users:', e);
     } finally {
       setLoading(false);
     }
-  }, []);
+  }, [sort, order]);
 
   useEffect(() => {
-    fetchUsers(page);
+    fetchUsers(page, cursors[page] ?? null);
+    // eslint-disable-next-line react-hooks/exhaustive-deps
   }, [page, fetchUsers]);
 
+  const handleSort = (field: SortField) => {
+    if (field === sort) {
+      setOrder((o) => (o === 'desc' ? 'asc' : 'desc'));
+    } else {
+      setSort(field);
+      setOrder('desc');
+    }
+    setCursors([null]);
+    setPage(0);
+  };
+
+  const sortHeader = (field: SortField, label: string, align: 'left' | 'right') => (
+    <th className={`text-${align} px-4 py-3 text-muted-foreground font-medium`}>
+      <button
+        onClick={() => handleSort(field)}
+        className={`inline-flex items-center gap-1 hover:text-foreground transition-colors ${
+          sort === field ? 'text-foreground' : ''
+        }`}
+      >
+        {label}
+        {sort === field &&
+          (order === 'desc' ? <ArrowDown className="w-3 h-3" /> : <ArrowUp className="w-3 h-3" />)}
+      </button>
+    </th>
+  );
+
   const handleToggleAdmin = async (user: UserItem) => {
     if (user.id === userId) return;
     setTogglingId(user.id);
@@ -127,10 +170,11 @@ export default function UsersListPage() {
               <tr className="border-b border-white/5">
                 <th className="text-left px-4 py-3 text-muted-foreground font-medium">用户名</th>
                 <th className="text-left px-4 py-3 text-muted-foreground font-medium">邮箱</th>
-                <th className="text-left px-4 py-3 text-muted-foreground font-medium">注册时间</th>
-                <th className="text-left px-4 py-3 text-muted-foreground font-medium">最后活跃</th>
-                <th className="text-right px-4 py-3 text-muted-foreground font-medium">会话</th>
-                <th className="text-right px-4 py-3 text-muted-foreground font-medium">消息</th>
+                {sortHeader('created_at', '注册时间', 'left')}
+                {sortHeader('last_active', '最后活跃', 'left')}
+                {sortHeader('session_count', '会话', 'right')}
+                {sortHeader('message_count', '消息', 'right')}
+                {sortHeader('memory_count', '记忆', 'right')}
                 <th className="text-center px-4 py-3 text-muted-foreground font-medium">角色</th>
               </tr>
             </thead>
@@ -155,9 +199,10 @@ export default function UsersListPage() {
                     </td>
                     <td className="px-4 py-3 text-muted-foreground">{user.email || '-'}</td>
                     <td className="px-4 py-3 text-muted-foreground">{formatDate(user.created_at)}</td>
-                    <td className="px-4 py-3 text-muted-foreground">{formatDateTime(user.last_login)}</td>
+                    <td className="px-4 py-3 text-muted-foreground">{formatDateTime(user.last_active || user.last_login)}</td>
                     <td className="px-4 py-3 text-right text-foreground tabular-nums">{user.session_count}</td>
                     <td className="px-4 py-3 text-right text-foreground tabular-nums">{user.message_count}</td>
+                    <td className="px-4 py-3 text-right text-foreground tabular-nums">{user.memory_count}</td>
                     <td className="px-4 py-3 text-center">
                       <button
                         onClick={() => handleToggleAdmin(user)}
@@ -194,7 +239,7 @@ export default function UsersListPage() {
               })}
               {users.length === 0 && !loading && (
                 <tr>
-                  <td colSpan={7} className="px-4 py-8 text-center text-muted-foreground">
+                  <td colSpan={8} className="px-4 py-8 text-center text-muted-foreground">
                     暂无用户
                   </td>
                 </tr>
@@ -217,8 +262,8 @@ export default function UsersListPage() {
             {page + 1} / {totalPages}
           </span>
           <button
-            onClick={() => setPage(p => Math.min(totalPages - 1, p + 1))}
-            disabled={page >= totalPages - 1}
+            onClick={() => setPage(p => p + 1)}
+            disabled={!cursors[page + 1]}
             className="px-3 py-1.5 rounded-lg text-sm text-muted-foreground hover:text-foreground hover:bg-white/5 disabled:opacity-50 disabled:cursor-not-allowed"
           >
             下一页